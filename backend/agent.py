@@ -5,17 +5,18 @@ LangGraph Agent for Experiment Notes Search
 """
 import operator
 import json
+import logging
 import re
+import threading
 import time
 from typing import TypedDict, List, Annotated, Optional
 
 from langgraph.graph import StateGraph, END
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_chroma import Chroma
 from langchain_core.messages import HumanMessage, BaseMessage
-import cohere
 
 from config import config
+from storage import storage
 from utils import load_master_dict, normalize_text, normalize_text_with_suffix
 from prompts import get_default_prompt
 from dictionary import get_dictionary_manager
@@ -25,6 +26,24 @@ from chroma_sync import (
     get_team_chroma_vectorstore,
     get_team_multi_collection_vectorstores
 )
+from chroma_pool import get_chroma_pool
+from metrics import timed_call, timed_node
+from providers import create_chat_model, create_embeddings, create_rerank_client
+from tracing import traced_node, record_candidates, record_fusion
+from fusion import hybrid_combine, merge_max_scores, fuse_axes
+
+
+logger = logging.getLogger(__name__)
+
+
+def _note_key(doc) -> str:
+    """3軸の統合・同義語展開のマージで使うドキュメントの識別子"""
+    return doc.metadata.get('note_id', doc.metadata.get('source', doc.page_content[:50]))
+
+
+def _source_key(doc) -> str:
+    """ハイブリッド検索の統合で使うドキュメントの識別子"""
+    return doc.metadata.get('source', doc.metadata.get('note_id', doc.page_content[:50]))
 
 
 # --- State定義 ---
@@ -112,28 +131,27 @@ class SearchAgent:
         self.cohere_api_key = cohere_api_key
         self.team_id = team_id
 
-        # モデル設定（v3.0: 2段階選択対応）
-        self.embedding_model = embedding_model or config.DEFAULT_EMBEDDING_MODEL
-        # 後方互換性: llm_modelが指定されていればそれを使用
-        self.search_llm_model = search_llm_model or llm_model or config.DEFAULT_SEARCH_LLM_MODEL
-        self.summary_llm_model = summary_llm_model or llm_model or config.DEFAULT_SUMMARY_LLM_MODEL
-
-        # 検索モード設定（v3.0.1）
-        self.search_mode = search_mode or config.DEFAULT_SEARCH_MODE
-        self.hybrid_alpha = hybrid_alpha if hybrid_alpha is not None else config.DEFAULT_HYBRID_ALPHA
-
-        # 3軸分離検索設定（v3.1.0）
-        self.multi_axis_enabled = multi_axis_enabled if multi_axis_enabled is not None else config.MULTI_AXIS_ENABLED
-        self.fusion_method = fusion_method or config.FUSION_METHOD
-        self.axis_weights = axis_weights or config.AXIS_WEIGHTS
-        self.rerank_position = rerank_position or config.RERANK_POSITION
-        self.rerank_enabled = rerank_enabled if rerank_enabled is not None else config.RERANK_ENABLED
+        settings = self.resolve_settings(
+            embedding_model=embedding_model,
+            llm_model=llm_model,
+            search_llm_model=search_llm_model,
+            summary_llm_model=summary_llm_model,
+            search_mode=search_mode,
+            hybrid_alpha=hybrid_alpha,
+            multi_axis_enabled=multi_axis_enabled,
+            fusion_method=fusion_method,
+            axis_weights=axis_weights,
+            rerank_position=rerank_position,
+            rerank_enabled=rerank_enabled
+        )
+        for name, value in settings.items():
+            setattr(self, name, value)
 
         # プロンプト設定（カスタムまたはデフォルト）
         self.prompts = prompts or {}
 
         # Cohere クライアント
-        self.cohere_client = cohere.Client(cohere_api_key)
+        self.cohere_client = create_rerank_client(cohere_api_key)
 
         # 正規化辞書
         self.norm_map, _ = load_master_dict()
@@ -147,27 +165,46 @@ class SearchAgent:
         self.synonym_dict = get_synonym_dictionary(team_id)
 
         # Embedding関数
-        self.embedding_function = OpenAIEmbeddings(
-            model=self.embedding_model,
-            api_key=self.openai_api_key
-        )
+        self.embedding_function = create_embeddings(self.embedding_model, self.openai_api_key)
 
         # Vector Store（v3.1.1: 3コレクション対応）
-        if team_id and self.multi_axis_enabled:
+        # v3.3.0: 同期でファイルが差し替えられた場合は run() で取り直す
+        self.chroma_path = storage.get_team_path(team_id, 'chroma') if team_id else config.CHROMA_DB_FOLDER
+        self._vectorstores_lock = threading.Lock()
+        self._load_vectorstores()
+
+        # LLM（v3.0: 2段階選択対応）
+        # temperatureをサポートしないモデルではtemperatureを指定しない（providers.supports_temperature）
+        # 検索・判定用LLM（正規化、クエリ生成に使用）
+        self.search_llm = create_chat_model(self.search_llm_model, self.openai_api_key, temperature=0)
+
+        # 要約生成用LLM（比較ノードに使用）
+        self.summary_llm = create_chat_model(self.summary_llm_model, self.openai_api_key, temperature=0)
+        # 後方互換性: self.llmはsearch_llmを参照
+        self.llm = self.search_llm
+
+        # グラフを構築
+        self.graph = self._build_graph()
+
+    def _load_vectorstores(self) -> None:
+        """vectorstoreを取得（v3.1.1: 3コレクション対応）"""
+        # 取得前の値を記録（取得中に解放された場合も次回の run() で取り直す）
+        self._vectorstores_epoch = get_chroma_pool().epoch(self.chroma_path)
+        if self.team_id and self.multi_axis_enabled:
             # 3コレクションモード: 材料/方法/総合の3つのvectorstoreを使用
             self.vectorstores = get_team_multi_collection_vectorstores(
-                team_id=team_id,
+                team_id=self.team_id,
                 embeddings=self.embedding_function,
                 embedding_model=self.embedding_model
             )
             # 後方互換性: vectorstoreはcombinedを参照
             self.vectorstore = self.vectorstores["combined"]
-            print(f"3コレクションモード: materials, methods, combined vectorstores初期化完了")
-        elif team_id:
+            logger.debug("3コレクションモード: materials, methods, combined vectorstores初期化完了")
+        elif self.team_id:
             # 単一コレクションモード（チーム）
             self.vectorstores = None
             self.vectorstore = get_team_chroma_vectorstore(
-                team_id=team_id,
+                team_id=self.team_id,
                 embeddings=self.embedding_function,
                 embedding_model=self.embedding_model
             )
@@ -179,35 +216,41 @@ class SearchAgent:
                 embedding_model=self.embedding_model
             )
 
-        # LLM（v3.0: 2段階選択対応）
-        # temperatureをサポートしないモデルの判定
-        def supports_temperature(model_name: str) -> bool:
-            """temperatureパラメータをサポートするモデルかどうか判定"""
-            no_temp_models = ['o1', 'o1-mini', 'o1-preview', 'o3-mini', 'gpt-5-mini', 'gpt-5-nano']
-            return not any(m in model_name for m in no_temp_models)
-
-        # 検索・判定用LLM（正規化、クエリ生成に使用）
-        search_llm_kwargs = {
-            "model": self.search_llm_model,
-            "api_key": self.openai_api_key
-        }
-        if supports_temperature(self.search_llm_model):
-            search_llm_kwargs["temperature"] = 0
-        self.search_llm = ChatOpenAI(**search_llm_kwargs)
+    @staticmethod
+    def resolve_settings(
+        embedding_model: str = None,
+        llm_model: str = None,
+        search_llm_model: str = None,
+        summary_llm_model: str = None,
+        search_mode: str = None,
+        hybrid_alpha: float = None,
+        multi_axis_enabled: bool = None,
+        fusion_method: str = None,
+        axis_weights: dict = None,
+        rerank_position: str = None,
+        rerank_enabled: bool = None
+    ) -> dict:
+        """未指定の検索設定に既定値を適用（v3.3.0: 検索結果キャッシュのキーと共通）
 
-        # 要約生成用LLM（比較ノードに使用）
-        summary_llm_kwargs = {
-            "model": self.summary_llm_model,
-            "api_key": self.openai_api_key
+        Returns:
+            {設定名: 値}（SearchAgentの同名の属性に設定される）
+        """
+        return {
+            # モデル設定（v3.0: 2段階選択対応）
+            "embedding_model": embedding_model or config.DEFAULT_EMBEDDING_MODEL,
+            # 後方互換性: llm_modelが指定されていればそれを使用
+            "search_llm_model": search_llm_model or llm_model or config.DEFAULT_SEARCH_LLM_MODEL,
+            "summary_llm_model": summary_llm_model or llm_model or config.DEFAULT_SUMMARY_LLM_MODEL,
+            # 検索モード設定（v3.0.1）
+            "search_mode": search_mode or config.DEFAULT_SEARCH_MODE,
+            "hybrid_alpha": hybrid_alpha if hybrid_alpha is not None else config.DEFAULT_HYBRID_ALPHA,
+            # 3軸分離検索設定（v3.1.0）
+            "multi_axis_enabled": multi_axis_enabled if multi_axis_enabled is not None else config.MULTI_AXIS_ENABLED,
+            "fusion_method": fusion_method or config.FUSION_METHOD,
+            "axis_weights": axis_weights or config.AXIS_WEIGHTS,
+            "rerank_position": rerank_position or config.RERANK_POSITION,
+            "rerank_enabled": rerank_enabled if rerank_enabled is not None else config.RERANK_ENABLED,
         }
-        if supports_temperature(self.summary_llm_model):
-            summary_llm_kwargs["temperature"] = 0
-        self.summary_llm = ChatOpenAI(**summary_llm_kwargs)
-        # 後方互換性: self.llmはsearch_llmを参照
-        self.llm = self.search_llm
-
-        # グラフを構築
-        self.graph = self._build_graph()
 
     def _get_prompt(self, prompt_type: str) -> str:
         """プロンプトを取得（カスタムまたはデフォルト）"""
@@ -219,12 +262,10 @@ class SearchAgent:
         evaluation_mode = state.get("evaluation_mode", False)
 
         if evaluation_mode:
-            print("\n" + "="*80)
-            print("🔬 [評価モード] 性能評価実行中")
-            print("="*80)
-            print("\n--- 🚀 [1/3] 正規化 & JSON解析 ---")
+            logger.debug("🔬 [評価モード] 性能評価実行中")
+            logger.debug("--- 🚀 [1/3] 正規化 & JSON解析 ---")
         else:
-            print("\n--- 🚀 [1/4] 正規化 & JSON解析 ---")
+            logger.debug("--- 🚀 [1/4] 正規化 & JSON解析 ---")
 
         updates = {}
         messages = state.get("messages", [])
@@ -262,7 +303,7 @@ class SearchAgent:
                         updates["input_methods"] = data.get("methods", "")
 
                 except json.JSONDecodeError:
-                    print("  > ⚠️ JSON Decode Error")
+                    logger.warning("⚠️ JSON Decode Error")
 
         # 正規化処理
         raw_materials = updates.get("input_materials", state.get("input_materials", ""))
@@ -298,16 +339,16 @@ class SearchAgent:
 
         # 評価モード時に入力情報を詳細表示
         if evaluation_mode:
-            print("\n  📋 [入力情報]")
-            print(f"  目的: {updates.get('input_purpose', state.get('input_purpose', ''))}")
-            print(f"  材料: {updates.get('input_materials', state.get('input_materials', ''))}")
-            print(f"  実験手法: {updates.get('input_methods', state.get('input_methods', ''))}")
-            print(f"  重点指示: {updates.get('user_focus_instruction', state.get('user_focus_instruction', ''))}")
-            print(f"\n  📝 [正規化後の材料]")
-            print(f"  {normalized_str}")
+            logger.debug("📋 [入力情報]")
+            logger.debug("目的: %s", updates.get('input_purpose', state.get('input_purpose', '')))
+            logger.debug("材料: %s", updates.get('input_materials', state.get('input_materials', '')))
+            logger.debug("実験手法: %s", updates.get('input_methods', state.get('input_methods', '')))
+            logger.debug("重点指示: %s", updates.get('user_focus_instruction', state.get('user_focus_instruction', '')))
+            logger.debug("📝 [正規化後の材料]")
+            logger.debug("%s", normalized_str)
 
         elapsed_time = time.time() - start_time
-        print(f"  ⏱️ Execution Time: {elapsed_time:.4f} sec")
+        logger.debug("⏱️ Execution Time: %.4f sec", elapsed_time)
         return updates
 
     def _generate_query_node(self, state: AgentState):
@@ -316,9 +357,9 @@ class SearchAgent:
         evaluation_mode = state.get("evaluation_mode", False)
 
         if evaluation_mode:
-            print("\n--- 🧠 [2/3] 多角的検索クエリ生成 ---")
+            logger.debug("--- 🧠 [2/3] 多角的検索クエリ生成 ---")
         else:
-            print("--- 🧠 [2/4] 多角的検索クエリ生成 ---")
+            logger.debug("--- 🧠 [2/4] 多角的検索クエリ生成 ---")
 
         instruction = state.get('user_focus_instruction', '特になし')
 
@@ -333,7 +374,7 @@ class SearchAgent:
             user_focus_instruction=instruction
         )
 
-        response = self.llm.invoke(prompt)
+        response = timed_call("openai_chat", self.llm.invoke, prompt)
 
         content = response.content.strip()
 
@@ -363,24 +404,24 @@ class SearchAgent:
 
             # 評価モード時はクエリ全体を表示
             if evaluation_mode:
-                print(f"\n  🔍 [生成されたクエリ]")
-                print(f"  統合クエリ（{len(queries)}個のクエリを結合）:")
-                print(f"  {combined_query}")
-                print(f"\n  各クエリの詳細:")
+                logger.debug("🔍 [生成されたクエリ]")
+                logger.debug("統合クエリ（%s個のクエリを結合）:", len(queries))
+                logger.debug("%s", combined_query)
+                logger.debug("各クエリの詳細:")
                 for i, q in enumerate(queries, 1):
-                    print(f"    {i}. {q}")
+                    logger.debug("%s. %s", i, q)
             else:
-                print(f"  > Generated Query: {combined_query[:100]}...")
+                logger.debug("Generated Query: %s...", combined_query[:100])
 
         except Exception as e:
-            print(f"  > ⚠️ Query Parse Error: {e}")
-            print(f"  > Raw response: {response.content[:200]}...")
+            logger.warning("⚠️ Query Parse Error: %s", e)
+            logger.debug("Raw response: %s...", response.content[:200])
             # フォールバック: 入力をそのままクエリとして使用
             combined_query = f"{state.get('input_purpose')} {state.get('normalized_materials')} {instruction}"
-            print(f"  > Fallback query: {combined_query[:100]}...")
+            logger.debug("Fallback query: %s...", combined_query[:100])
 
         elapsed_time = time.time() - start_time
-        print(f"  ⏱️ Execution Time: {elapsed_time:.4f} sec")
+        logger.debug("⏱️ Execution Time: %.4f sec", elapsed_time)
         return {"search_query": combined_query}
 
     def _expand_query_with_synonyms(self, query: str) -> List[str]:
@@ -420,13 +461,13 @@ class SearchAgent:
         expanded_queries = self._expand_query_with_synonyms(query)
 
         if len(expanded_queries) > 1:
-            print(f"    > 同義語展開: {len(expanded_queries)}クエリに展開")
+            logger.debug("同義語展開: %sクエリに展開", len(expanded_queries))
             for i, eq in enumerate(expanded_queries):
                 if eq != query:
-                    print(f"      展開{i+1}: {eq[:60]}...")
+                    logger.debug("展開%s: %s...", i+1, eq[:60])
 
         # 各クエリで検索し、結果をマージ
-        all_results = {}  # {note_id: (doc, max_score)}
+        result_lists = []
 
         for eq in expanded_queries:
             # 検索モードに応じた検索実行
@@ -436,19 +477,12 @@ class SearchAgent:
                 results = self._hybrid_search_on_vectorstore(vectorstore, eq, alpha=hybrid_alpha, k=k)
             else:
                 # セマンティック検索
-                docs = vectorstore.similarity_search_with_relevance_scores(eq, k=k)
+                docs = timed_call("chroma_query", vectorstore.similarity_search_with_relevance_scores, eq, k=k)
                 results = [(doc, score) for doc, score in docs]
+            result_lists.append(results)
 
-            # 結果をマージ（同じノートは最高スコアを採用）
-            for doc, score in results:
-                note_id = doc.metadata.get('note_id', doc.metadata.get('source', doc.page_content[:50]))
-                if note_id not in all_results or score > all_results[note_id][1]:
-                    all_results[note_id] = (doc, score)
-
-        # スコア降順でソート
-        merged_results = list(all_results.values())
-        merged_results.sort(key=lambda x: x[1], reverse=True)
-        return merged_results[:k]
+        # 同じノートは最高スコアを採用し、スコア降順で上位k件
+        return merge_max_scores(result_lists, k, key=_note_key)
 
     def _keyword_search(self, query: str, k: int = 30) -> List[tuple]:
         """キーワード検索（BM25ベース）
@@ -465,7 +499,7 @@ class SearchAgent:
 
         # ChromaDBから全ドキュメントを取得
         collection = self.vectorstore._collection
-        all_docs = collection.get(include=["documents", "metadatas"])
+        all_docs = timed_call("chroma_query", collection.get, include=["documents", "metadatas"])
 
         if not all_docs["documents"]:
             return []
@@ -562,51 +596,16 @@ class SearchAgent:
             List of (doc, score) tuples sorted by combined score descending
         """
         # セマンティック検索
-        semantic_results = self.vectorstore.similarity_search_with_relevance_scores(query, k=k)
+        semantic_results = timed_call("chroma_query", self.vectorstore.similarity_search_with_relevance_scores, query, k=k)
 
         # キーワード検索
         keyword_results = self._keyword_search(query, k=k)
 
         # スコアの正規化と統合
-        doc_scores = {}
-
-        # セマンティック検索結果をスコア付け
-        if semantic_results:
-            max_semantic = max(score for _, score in semantic_results)
-            min_semantic = min(score for _, score in semantic_results)
-            range_semantic = max_semantic - min_semantic if max_semantic != min_semantic else 1
-
-            for doc, score in semantic_results:
-                # 0-1に正規化
-                normalized_score = (score - min_semantic) / range_semantic if range_semantic > 0 else 0.5
-                doc_id = doc.metadata.get('source', doc.page_content[:50])
-                if doc_id not in doc_scores:
-                    doc_scores[doc_id] = {'doc': doc, 'semantic': 0, 'keyword': 0}
-                doc_scores[doc_id]['semantic'] = normalized_score
-
-        # キーワード検索結果をスコア付け
-        if keyword_results:
-            max_keyword = max(score for _, score in keyword_results)
-            min_keyword = min(score for _, score in keyword_results)
-            range_keyword = max_keyword - min_keyword if max_keyword != min_keyword else 1
-
-            for doc, score in keyword_results:
-                # 0-1に正規化
-                normalized_score = (score - min_keyword) / range_keyword if range_keyword > 0 else 0.5
-                doc_id = doc.metadata.get('source', doc.page_content[:50])
-                if doc_id not in doc_scores:
-                    doc_scores[doc_id] = {'doc': doc, 'semantic': 0, 'keyword': 0}
-                doc_scores[doc_id]['keyword'] = normalized_score
-
-        # 統合スコア計算
-        combined_results = []
-        for doc_id, scores in doc_scores.items():
-            combined_score = alpha * scores['semantic'] + (1 - alpha) * scores['keyword']
-            combined_results.append((scores['doc'], combined_score))
-
-        # スコア降順でソート
-        combined_results.sort(key=lambda x: x[1], reverse=True)
-        return combined_results[:k]
+        return hybrid_combine(
+            semantic_results, keyword_results, alpha, k,
+            key=lambda doc: doc.metadata.get('source', doc.page_content[:50])
+        )
 
     def _search_node(self, state: AgentState):
         """検索 & Cohereリランキングノード（v3.0.1: 検索モード対応）"""
@@ -624,18 +623,18 @@ class SearchAgent:
         }.get(search_mode, "セマンティック")
 
         if evaluation_mode:
-            print(f"--- 🔍 [3/3] {mode_label}検索 & Cohereリランキング実行（評価モード）---")
+            logger.debug("--- 🔍 [3/3] %s検索 & Cohereリランキング実行（評価モード）---", mode_label)
         else:
-            print(f"--- 🔍 [3/4] {mode_label}検索 & Cohereリランキング実行 ---")
+            logger.debug("--- 🔍 [3/4] %s検索 & Cohereリランキング実行 ---", mode_label)
 
         query = state["search_query"]
 
         try:
             # ChromaDBのドキュメント数を確認
-            collection = self.vectorstore._collection
-            doc_count = collection.count()
-            print(f"  > ChromaDB Collection: {doc_count} documents")
-            print(f"  > Search Mode: {search_mode}")
+            # v3.3.0: ドキュメント数はプールのキャッシュを使用（毎回のcount()を避ける）
+            doc_count = get_chroma_pool().count(self.vectorstore)
+            logger.debug("ChromaDB Collection: %s documents", doc_count)
+            logger.debug("Search Mode: %s", search_mode)
 
             # v3.2.1: 同義語展開を適用した検索
             search_results = self._search_with_synonym_expansion(
@@ -646,29 +645,34 @@ class SearchAgent:
                 k=config.VECTOR_SEARCH_K
             )
             candidates = [doc for doc, score in search_results]
-            print(f"  > Retrieved {len(candidates)} candidates (with synonym expansion).")
+            logger.info("Retrieved %s candidates (with synonym expansion).", len(candidates))
 
             if not candidates:
-                print("  > No candidates found.")
-                print(f"  ⏱️ Execution Time: {time.time() - start_time:.4f} sec")
+                logger.debug("No candidates found.")
+                logger.debug("⏱️ Execution Time: %.4f sec", time.time() - start_time)
                 return {"retrieved_docs": [], "iteration": state.get("iteration", 0) + 1}
 
             # Cohere Rerank
             documents_content = [doc.page_content for doc in candidates]
 
-            rerank_results = self.cohere_client.rerank(
+            rerank_results = timed_call(
+                "cohere_rerank",
+                self.cohere_client.rerank,
                 model=config.DEFAULT_RERANK_MODEL,
                 query=query,
                 documents=documents_content,
                 top_n=config.RERANK_TOP_N
             )
 
+            record_candidates(
+                "search", query, search_results,
+                reranked=[(candidates[r.index], r.relevance_score) for r in rerank_results.results]
+            )
+
             if evaluation_mode:
-                print(f"\n  📊 [リランキング結果] Top {config.RERANK_TOP_N} 件")
-                print(f"  " + "="*76)
+                logger.debug("📊 [リランキング結果] Top %s 件", config.RERANK_TOP_N)
             else:
-                print(f"\n  📊 [Console Log] Top {config.RERANK_TOP_N} Cohere Rerank Results:")
-                print(f"  --------------------------------------------------")
+                logger.debug("📊 [Console Log] Top %s Cohere Rerank Results:", config.RERANK_TOP_N)
 
             docs_for_ui = []
             seen_source_ids = set()  # 重複除去用
@@ -690,33 +694,29 @@ class SearchAgent:
                 rank_counter += 1
 
                 if evaluation_mode:
-                    print(f"  Rank {rank_counter:2d} | Score: {score:.6f} | ノートID: {source_id}")
+                    logger.debug("Rank %2d | Score: %.6f | ノートID: %s", rank_counter, score, source_id)
                 else:
-                    print(f"  Rank {rank_counter:2d} | Score: {score:.4f} | ID: {source_id} | {snippet}...")
+                    logger.debug("Rank %2d | Score: %.4f | ID: %s | %s...", rank_counter, score, source_id, snippet)
 
                 # 評価モードなら全件、通常モードなら上位3件のみ保存
                 if rank_counter <= display_limit:
                     docs_for_ui.append(f"【実験ノートID: {source_id}】\n{original_doc.page_content}")
 
             if evaluation_mode:
-                print(f"  " + "="*76)
-                print(f"  ✅ 評価用に上位 {len(docs_for_ui)} 件を返却します。")
+                logger.debug("✅ 評価用に上位 %s 件を返却します。", len(docs_for_ui))
             else:
-                print(f"  --------------------------------------------------")
-                print(f"  > UI向けに上位 {len(docs_for_ui)} 件を選択しました。")
+                logger.info("UI向けに上位 %s 件を選択しました。", len(docs_for_ui))
 
         except Exception as e:
-            print(f"  > ⚠️ Search/Rerank Error: {e}")
+            logger.warning("⚠️ Search/Rerank Error: %s", e)
             docs_for_ui = []
 
         elapsed_time = time.time() - start_time
-        print(f"  ⏱️ Execution Time: {elapsed_time:.4f} sec")
+        logger.debug("⏱️ Execution Time: %.4f sec", elapsed_time)
 
         # 評価モード時は終了メッセージを表示
         if evaluation_mode:
-            print("\n" + "="*80)
-            print("✅ 評価モード終了 - 比較ノードをスキップして結果を返却します")
-            print("="*80 + "\n")
+            logger.debug("✅ 評価モード終了 - 比較ノードをスキップして結果を返却します")
 
         return {
             "retrieved_docs": docs_for_ui,
@@ -748,17 +748,17 @@ class SearchAgent:
         evaluation_mode = state.get("evaluation_mode", False)
 
         if evaluation_mode:
-            print("\n--- 🏷️ [2/6] 重点指示分類 ---")
+            logger.debug("--- 🏷️ [2/6] 重点指示分類 ---")
         else:
-            print("--- 🏷️ [2/7] 重点指示分類 ---")
+            logger.debug("--- 🏷️ [2/7] 重点指示分類 ---")
 
         instruction = state.get('user_focus_instruction', '')
 
         # 重点指示が空の場合は"none"
         if not instruction or instruction.strip() in ['', '特になし', 'なし']:
-            print(f"  > 重点指示が空のため、分類をスキップ: none")
+            logger.debug("重点指示が空のため、分類をスキップ: none")
             elapsed_time = time.time() - start_time
-            print(f"  ⏱️ Execution Time: {elapsed_time:.4f} sec")
+            logger.debug("⏱️ Execution Time: %.4f sec", elapsed_time)
             return {"focus_classification": "none"}
 
         # LLMで分類
@@ -766,7 +766,7 @@ class SearchAgent:
         prompt = prompt_template.format(user_focus_instruction=instruction)
 
         try:
-            response = self.search_llm.invoke(prompt)
+            response = timed_call("openai_chat", self.search_llm.invoke, prompt)
             content = self._extract_json_from_response(response.content.strip())
             data = json.loads(content)
             classification = data.get("classification", "both")
@@ -776,16 +776,16 @@ class SearchAgent:
             if classification not in ["materials", "methods", "both", "none"]:
                 classification = "both"
 
-            print(f"  > 分類結果: {classification}")
-            print(f"  > 理由: {reason}")
+            logger.info("分類結果: %s", classification)
+            logger.debug("理由: %s", reason)
 
         except Exception as e:
-            print(f"  > ⚠️ 分類エラー: {e}")
-            print(f"  > フォールバック: both")
+            logger.warning("⚠️ 分類エラー: %s", e)
+            logger.debug("フォールバック: both")
             classification = "both"
 
         elapsed_time = time.time() - start_time
-        print(f"  ⏱️ Execution Time: {elapsed_time:.4f} sec")
+        logger.debug("⏱️ Execution Time: %.4f sec", elapsed_time)
         return {"focus_classification": classification}
 
     def _generate_multi_axis_queries_node(self, state: AgentState):
@@ -797,9 +797,9 @@ class SearchAgent:
         evaluation_mode = state.get("evaluation_mode", False)
 
         if evaluation_mode:
-            print("\n--- 🧠 [3/6] 3軸クエリ生成 ---")
+            logger.debug("--- 🧠 [3/6] 3軸クエリ生成 ---")
         else:
-            print("--- 🧠 [3/7] 3軸クエリ生成 ---")
+            logger.debug("--- 🧠 [3/7] 3軸クエリ生成 ---")
 
         focus_class = state.get('focus_classification', 'none')
         instruction = state.get('user_focus_instruction', '')
@@ -816,69 +816,67 @@ class SearchAgent:
 
         # 材料軸クエリ生成
         try:
-            print("  📦 材料軸クエリを生成中...")
+            logger.debug("📦 材料軸クエリを生成中...")
             material_prompt = self._get_prompt("material_query_generation").format(
                 normalized_materials=state.get('normalized_materials', ''),
                 user_focus_instruction=material_instruction or "特になし"
             )
-            response = self.search_llm.invoke(material_prompt)
+            response = timed_call("openai_chat", self.search_llm.invoke, material_prompt)
             content = self._extract_json_from_response(response.content.strip())
             data = json.loads(content)
             queries["material"] = data.get("query", state.get('normalized_materials', ''))
-            print(f"    > {queries['material'][:80]}...")
+            logger.debug("%s...", queries['material'][:80])
         except Exception as e:
-            print(f"    > ⚠️ 材料軸クエリ生成エラー: {e}")
+            logger.warning("⚠️ 材料軸クエリ生成エラー: %s", e)
             queries["material"] = state.get('normalized_materials', '')
 
         # 方法軸クエリ生成
         try:
-            print("  🔧 方法軸クエリを生成中...")
+            logger.debug("🔧 方法軸クエリを生成中...")
             # v3.2.0: デバッグログ追加
             materials_for_method = state.get('normalized_materials', '')
             methods_input = state.get('input_methods', '')
-            print(f"    [DEBUG] 材料情報: {materials_for_method[:100]}..." if materials_for_method else "    [DEBUG] 材料情報: なし")
-            print(f"    [DEBUG] 方法入力: {methods_input[:100]}..." if methods_input else "    [DEBUG] 方法入力: なし")
+            logger.debug("材料情報: %s", f"{materials_for_method[:100]}..." if materials_for_method else "なし")
+            logger.debug("方法入力: %s", f"{methods_input[:100]}..." if methods_input else "なし")
 
             method_prompt = self._get_prompt("method_query_generation").format(
                 normalized_materials=materials_for_method,  # v3.2.0: 材料情報を追加
                 input_methods=methods_input,
                 user_focus_instruction=method_instruction or "特になし"
             )
-            print(f"    [DEBUG] プロンプト長: {len(method_prompt)}文字")
+            logger.debug("プロンプト長: %s文字", len(method_prompt))
 
-            response = self.search_llm.invoke(method_prompt)
+            response = timed_call("openai_chat", self.search_llm.invoke, method_prompt)
             content = self._extract_json_from_response(response.content.strip())
-            print(f"    [DEBUG] LLM応答: {content[:200]}...")
+            logger.debug("LLM応答: %s...", content[:200])
             data = json.loads(content)
             queries["method"] = data.get("query", state.get('input_methods', ''))
-            print(f"    > {queries['method'][:80]}...")
+            logger.debug("%s...", queries['method'][:80])
         except Exception as e:
-            print(f"    > ⚠️ 方法軸クエリ生成エラー: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.warning("⚠️ 方法軸クエリ生成エラー: %s", e, exc_info=True)
             queries["method"] = state.get('input_methods', '')
 
         # 総合軸クエリ生成
         try:
-            print("  🎯 総合軸クエリを生成中...")
+            logger.debug("🎯 総合軸クエリを生成中...")
             combined_prompt = self._get_prompt("combined_query_generation").format(
                 input_purpose=state.get('input_purpose', ''),
                 normalized_materials=state.get('normalized_materials', ''),
                 input_methods=state.get('input_methods', ''),
                 user_focus_instruction=instruction or "特になし"
             )
-            response = self.search_llm.invoke(combined_prompt)
+            response = timed_call("openai_chat", self.search_llm.invoke, combined_prompt)
             content = self._extract_json_from_response(response.content.strip())
             data = json.loads(content)
             combined_queries = data.get("queries", [])
             queries["combined"] = " ".join(combined_queries) if combined_queries else f"{state.get('input_purpose', '')} {state.get('normalized_materials', '')} {state.get('input_methods', '')}"
-            print(f"    > {queries['combined'][:80]}...")
+            logger.debug("%s...", queries['combined'][:80])
         except Exception as e:
-            print(f"    > ⚠️ 総合軸クエリ生成エラー: {e}")
+            logger.warning("⚠️ 総合軸クエリ生成エラー: %s", e)
             queries["combined"] = f"{state.get('input_purpose', '')} {state.get('normalized_materials', '')} {state.get('input_methods', '')}"
 
         elapsed_time = time.time() - start_time
-        print(f"  ⏱️ Execution Time: {elapsed_time:.4f} sec")
+        logger.debug("⏱️ Execution Time: %.4f sec", elapsed_time)
 
         return {
             "material_query": queries["material"],
@@ -886,6 +884,14 @@ class SearchAgent:
             "combined_query": queries["combined"]
         }
 
+    def axis_vectorstores(self) -> dict:
+        """各軸の検索対象vectorstore（v3.1.1: 3コレクションモードではセクション別コレクション）"""
+        return {
+            "material": self.vectorstores["materials"] if self.vectorstores else self.vectorstore,
+            "method": self.vectorstores["methods"] if self.vectorstores else self.vectorstore,
+            "combined": self.vectorstores["combined"] if self.vectorstores else self.vectorstore
+        }
+
     def _multi_axis_search_node(self, state: AgentState):
         """3軸検索実行ノード（v3.1.1: セクション別コレクション対応）
 
@@ -900,22 +906,16 @@ class SearchAgent:
         rerank_enabled = state.get("rerank_enabled", self.rerank_enabled)
 
         if evaluation_mode:
-            print("\n--- 🔍 [4/6] 3軸検索実行（セクション別コレクション）---")
+            logger.debug("--- 🔍 [4/6] 3軸検索実行（セクション別コレクション）---")
         else:
-            print("--- 🔍 [4/7] 3軸検索実行（セクション別コレクション）---")
+            logger.debug("--- 🔍 [4/7] 3軸検索実行（セクション別コレクション）---")
 
         search_mode = state.get("search_mode", self.search_mode)
         hybrid_alpha = state.get("hybrid_alpha", self.hybrid_alpha)
 
         results = {}
 
-        # v3.1.1: 各軸に対応するvectorstoreを決定
-        # vectorstoresが利用可能な場合（3コレクションモード）
-        axis_vectorstores = {
-            "material": self.vectorstores["materials"] if self.vectorstores else self.vectorstore,
-            "method": self.vectorstores["methods"] if self.vectorstores else self.vectorstore,
-            "combined": self.vectorstores["combined"] if self.vectorstores else self.vectorstore
-        }
+        axis_vectorstores = self.axis_vectorstores()
 
         # 各軸で検索を実行
         for axis, query in [
@@ -928,16 +928,14 @@ class SearchAgent:
 
             # v3.1.1: コレクション名を表示
             collection_name = target_vectorstore._collection.name if hasattr(target_vectorstore, '_collection') else "unknown"
-            print(f"\n  {'='*70}")
-            print(f"  📊 {axis_label}軸検索 (コレクション: {collection_name})")
-            print(f"  {'='*70}")
+            logger.debug("📊 %s軸検索 (コレクション: %s)", axis_label, collection_name)
 
             # v3.1.2: 検索クエリを省略せずに表示
-            print(f"  🔍 検索クエリ:")
-            print(f"     {query}")
+            logger.debug("🔍 検索クエリ:")
+            logger.debug("%s", query)
 
             if not query:
-                print(f"    > クエリが空のためスキップ")
+                logger.debug("クエリが空のためスキップ")
                 results[axis] = []
                 continue
 
@@ -951,13 +949,15 @@ class SearchAgent:
                     k=config.VECTOR_SEARCH_K
                 )
 
-                print(f"  📋 候補数: {len(search_results)}件")
+                logger.debug("📋 候補数: %s件", len(search_results))
 
                 # per_axisモードの場合、各軸でリランク
                 if rerank_position == "per_axis" and rerank_enabled and search_results:
-                    print(f"  🔄 リランキング実行中...")
+                    logger.debug("🔄 リランキング実行中...")
                     docs_content = [doc.page_content for doc, _ in search_results]
-                    rerank_results = self.cohere_client.rerank(
+                    rerank_results = timed_call(
+                        "cohere_rerank",
+                        self.cohere_client.rerank,
                         model=config.DEFAULT_RERANK_MODEL,
                         query=query,
                         documents=docs_content,
@@ -969,13 +969,14 @@ class SearchAgent:
                         original_doc = search_results[r.index][0]
                         reranked.append((original_doc, r.relevance_score))
                     results[axis] = reranked
+                    record_candidates(axis, query, search_results, reranked=reranked)
                 else:
                     results[axis] = search_results
+                    record_candidates(axis, query, search_results)
 
                 # v3.1.2: 上位10件の詳細を表示
                 final_results = results[axis]
-                print(f"\n  📊 {axis_label}軸 上位10件:")
-                print(f"  {'-'*60}")
+                logger.debug("📊 %s軸 上位10件:", axis_label)
                 seen_ids = set()
                 rank_counter = 0
                 for doc, score in final_results:
@@ -984,17 +985,16 @@ class SearchAgent:
                         continue
                     seen_ids.add(note_id)
                     rank_counter += 1
-                    print(f"  Rank {rank_counter:2d} | Score: {score:.6f} | ノートID: {note_id}")
+                    logger.debug("Rank %2d | Score: %.6f | ノートID: %s", rank_counter, score, note_id)
                     if rank_counter >= 10:
                         break
-                print(f"  {'-'*60}")
 
             except Exception as e:
-                print(f"    > ⚠️ {axis_label}軸検索エラー: {e}")
+                logger.warning("⚠️ %s軸検索エラー: %s", axis_label, e)
                 results[axis] = []
 
         elapsed_time = time.time() - start_time
-        print(f"  ⏱️ Execution Time: {elapsed_time:.4f} sec")
+        logger.debug("⏱️ Execution Time: %.4f sec", elapsed_time)
 
         return {
             "material_axis_results": results.get("material", []),
@@ -1009,7 +1009,7 @@ class SearchAgent:
         from langchain_core.documents import Document
 
         collection = vectorstore._collection
-        all_docs = collection.get(include=["documents", "metadatas"])
+        all_docs = timed_call("chroma_query", collection.get, include=["documents", "metadatas"])
 
         if not all_docs["documents"]:
             return []
@@ -1056,42 +1056,9 @@ class SearchAgent:
 
     def _hybrid_search_on_vectorstore(self, vectorstore, query: str, alpha: float, k: int = 30) -> List[tuple]:
         """指定されたvectorstoreでハイブリッド検索（v3.1.1追加）"""
-        semantic_results = vectorstore.similarity_search_with_relevance_scores(query, k=k)
+        semantic_results = timed_call("chroma_query", vectorstore.similarity_search_with_relevance_scores, query, k=k)
         keyword_results = self._keyword_search_on_vectorstore(vectorstore, query, k=k)
-
-        doc_scores = {}
-
-        if semantic_results:
-            max_semantic = max(score for _, score in semantic_results)
-            min_semantic = min(score for _, score in semantic_results)
-            range_semantic = max_semantic - min_semantic if max_semantic != min_semantic else 1
-
-            for doc, score in semantic_results:
-                normalized_score = (score - min_semantic) / range_semantic if range_semantic > 0 else 0.5
-                doc_id = doc.metadata.get('source', doc.metadata.get('note_id', doc.page_content[:50]))
-                if doc_id not in doc_scores:
-                    doc_scores[doc_id] = {'doc': doc, 'semantic': 0, 'keyword': 0}
-                doc_scores[doc_id]['semantic'] = normalized_score
-
-        if keyword_results:
-            max_keyword = max(score for _, score in keyword_results)
-            min_keyword = min(score for _, score in keyword_results)
-            range_keyword = max_keyword - min_keyword if max_keyword != min_keyword else 1
-
-            for doc, score in keyword_results:
-                normalized_score = (score - min_keyword) / range_keyword if range_keyword > 0 else 0.5
-                doc_id = doc.metadata.get('source', doc.metadata.get('note_id', doc.page_content[:50]))
-                if doc_id not in doc_scores:
-                    doc_scores[doc_id] = {'doc': doc, 'semantic': 0, 'keyword': 0}
-                doc_scores[doc_id]['keyword'] = normalized_score
-
-        combined_results = []
-        for doc_id, scores in doc_scores.items():
-            combined_score = alpha * scores['semantic'] + (1 - alpha) * scores['keyword']
-            combined_results.append((scores['doc'], combined_score))
-
-        combined_results.sort(key=lambda x: x[1], reverse=True)
-        return combined_results[:k]
+        return hybrid_combine(semantic_results, keyword_results, alpha, k, key=_source_key)
 
     def _score_fusion_node(self, state: AgentState):
         """スコア統合ノード（v3.1.1: note_idでの結果マージ対応）
@@ -1108,75 +1075,32 @@ class SearchAgent:
         rerank_enabled = state.get("rerank_enabled", self.rerank_enabled)
 
         if evaluation_mode:
-            print("\n--- 🔀 [5/6] スコア統合（note_idでマージ）---")
+            logger.debug("--- 🔀 [5/6] スコア統合（note_idでマージ）---")
         else:
-            print("--- 🔀 [5/7] スコア統合（note_idでマージ）---")
+            logger.debug("--- 🔀 [5/7] スコア統合（note_idでマージ）---")
 
-        print(f"  > 統合方式: {fusion_method}")
-        print(f"  > ウエイト: 材料={axis_weights.get('material', 0.3)}, 方法={axis_weights.get('method', 0.4)}, 総合={axis_weights.get('combined', 0.3)}")
+        logger.info("統合方式: %s", fusion_method)
+        logger.debug("ウエイト: 材料=%s, 方法=%s, 総合=%s", axis_weights.get('material', 0.3), axis_weights.get('method', 0.4), axis_weights.get('combined', 0.3))
 
         # 各軸の結果を取得
         material_results = state.get("material_axis_results", [])
         method_results = state.get("method_axis_results", [])
         combined_results = state.get("combined_axis_results", [])
 
-        # v3.1.1: note_idでマージするためのディクショナリ
-        # {note_id: {"docs": {axis: doc}, "scores": {axis: score}, "ranks": {axis: rank}}}
-        doc_scores = {}
-
-        for axis, results in [
-            ("material", material_results),
-            ("method", method_results),
-            ("combined", combined_results)
-        ]:
-            for rank, (doc, score) in enumerate(results):
-                # v3.1.1: note_idを優先的に使用（セクション別コレクションで統一されたID）
-                note_id = doc.metadata.get('note_id', doc.metadata.get('source', doc.page_content[:50]))
-                if note_id not in doc_scores:
-                    doc_scores[note_id] = {
-                        "docs": {"material": None, "method": None, "combined": None},
-                        "scores": {"material": None, "method": None, "combined": None},
-                        "ranks": {"material": None, "method": None, "combined": None}
-                    }
-                # 各軸のdocを保存（combined優先で最終的なdocを決定）
-                doc_scores[note_id]["docs"][axis] = doc
-                doc_scores[note_id]["scores"][axis] = score
-                doc_scores[note_id]["ranks"][axis] = rank + 1  # 1-indexed
-
-        # スコア統合
-        final_scores = []
-        rrf_k = config.RRF_K
-
-        for note_id, data in doc_scores.items():
-            if fusion_method == "rrf":
-                # RRF (Reciprocal Rank Fusion)
-                score = 0
-                for axis in ["material", "method", "combined"]:
-                    rank = data["ranks"][axis]
-                    weight = axis_weights.get(axis, 0.33)
-                    if rank is not None:
-                        score += weight / (rrf_k + rank)
-            else:
-                # 線形結合
-                score = 0
-                for axis in ["material", "method", "combined"]:
-                    axis_score = data["scores"][axis]
-                    weight = axis_weights.get(axis, 0.33)
-                    if axis_score is not None:
-                        # スコアを0-1に正規化（すでに正規化されている前提）
-                        score += weight * axis_score
-
-            # v3.1.1: 最終的なdocはcombinedを優先、なければ他の軸から取得
-            final_doc = data["docs"]["combined"] or data["docs"]["method"] or data["docs"]["material"]
-            if final_doc:
-                final_scores.append((final_doc, score, note_id))
-
-        # スコア降順でソート
-        final_scores.sort(key=lambda x: x[1], reverse=True)
+        # v3.1.1: note_idでマージし、同じノートが複数軸でヒットした場合は各軸のスコアを統合
+        # v3.3.0: 統合処理は fusion.py（評価のリプレイと共通）
+        final_scores = fuse_axes(
+            {"material": material_results, "method": method_results, "combined": combined_results},
+            method=fusion_method,
+            axis_weights=axis_weights,
+            rrf_k=config.RRF_K,
+            key=_note_key
+        )
+        fused_scores = final_scores
 
         # after_fusionモードの場合、統合後にリランク
         if rerank_position == "after_fusion" and rerank_enabled and final_scores:
-            print(f"  > 統合後リランキング実行中...")
+            logger.debug("統合後リランキング実行中...")
             # 上位候補に対してリランク
             top_candidates = final_scores[:config.RERANK_TOP_N * 2]  # 余裕を持って取得
             if top_candidates:
@@ -1185,7 +1109,9 @@ class SearchAgent:
                 docs_content = [doc.page_content for doc, _, _ in top_candidates]
 
                 try:
-                    rerank_results = self.cohere_client.rerank(
+                    rerank_results = timed_call(
+                        "cohere_rerank",
+                        self.cohere_client.rerank,
                         model=config.DEFAULT_RERANK_MODEL,
                         query=combined_query,
                         documents=docs_content,
@@ -1197,17 +1123,18 @@ class SearchAgent:
                         doc, _, source_id = top_candidates[r.index]
                         reranked.append((doc, r.relevance_score, source_id))
                     final_scores = reranked
-                    print(f"  > リランク後: {len(final_scores)}件")
+                    logger.debug("リランク後: %s件", len(final_scores))
                 except Exception as e:
-                    print(f"  > ⚠️ リランクエラー: {e}")
+                    logger.warning("⚠️ リランクエラー: %s", e)
+
+        record_fusion(fusion_method, fused_scores, reranked=final_scores if final_scores is not fused_scores else None)
 
         # 重複除去してUI用の結果を作成
         docs_for_ui = []
         seen_source_ids = set()
         display_limit = config.RERANK_TOP_N if evaluation_mode else config.UI_DISPLAY_TOP_N
 
-        print(f"\n  📊 [最終ランキング]")
-        print(f"  " + "="*60)
+        logger.debug("📊 [最終ランキング]")
 
         rank_counter = 0
         for doc, score, source_id in final_scores:
@@ -1217,10 +1144,10 @@ class SearchAgent:
             rank_counter += 1
 
             if evaluation_mode:
-                print(f"  Rank {rank_counter:2d} | Score: {score:.6f} | ノートID: {source_id}")
+                logger.debug("Rank %2d | Score: %.6f | ノートID: %s", rank_counter, score, source_id)
             else:
                 snippet = doc.page_content[:50].replace('\n', ' ')
-                print(f"  Rank {rank_counter:2d} | Score: {score:.4f} | ID: {source_id} | {snippet}...")
+                logger.debug("Rank %2d | Score: %.4f | ID: %s | %s...", rank_counter, score, source_id, snippet)
 
             if rank_counter <= display_limit:
                 docs_for_ui.append(f"【実験ノートID: {source_id}】\n{doc.page_content}")
@@ -1228,21 +1155,17 @@ class SearchAgent:
             if rank_counter >= config.RERANK_TOP_N:
                 break
 
-        print(f"  " + "="*60)
-
         if evaluation_mode:
-            print(f"  ✅ 評価用に上位 {len(docs_for_ui)} 件を返却します。")
+            logger.debug("✅ 評価用に上位 %s 件を返却します。", len(docs_for_ui))
         else:
-            print(f"  > UI向けに上位 {len(docs_for_ui)} 件を選択しました。")
+            logger.info("UI向けに上位 %s 件を選択しました。", len(docs_for_ui))
 
         # 評価モード時は終了メッセージを表示
         if evaluation_mode:
-            print("\n" + "="*80)
-            print("✅ 評価モード終了 - 比較ノードをスキップして結果を返却します")
-            print("="*80 + "\n")
+            logger.debug("✅ 評価モード終了 - 比較ノードをスキップして結果を返却します")
 
         elapsed_time = time.time() - start_time
-        print(f"  ⏱️ Execution Time: {elapsed_time:.4f} sec")
+        logger.debug("⏱️ Execution Time: %.4f sec", elapsed_time)
 
         return {
             "retrieved_docs": docs_for_ui,
@@ -1256,7 +1179,7 @@ class SearchAgent:
     def _compare_node(self, state: AgentState):
         """比較・要約生成ノード"""
         start_time = time.time()
-        print("--- 📝 [4/4] 比較・要約生成 (Deep Analysis) ---")
+        logger.debug("--- 📝 [4/4] 比較・要約生成 (Deep Analysis) ---")
 
         input_purpose = state.get('input_purpose')
         input_materials = state.get('normalized_materials')
@@ -1266,7 +1189,7 @@ class SearchAgent:
         docs_str = "\n\n".join(state.get("retrieved_docs", []))
 
         if not docs_str:
-            print(f"  ⏱️ Execution Time: {time.time() - start_time:.4f} sec")
+            logger.debug("⏱️ Execution Time: %.4f sec", time.time() - start_time)
             return {"messages": [HumanMessage(content="該当するノートが見つかりませんでした。")]}
 
         # カスタムプロンプトまたはデフォルトプロンプトを取得
@@ -1282,10 +1205,10 @@ class SearchAgent:
         )
 
         # v3.0: 要約生成用LLMを使用
-        response = self.summary_llm.invoke(prompt)
+        response = timed_call("openai_chat", self.summary_llm.invoke, prompt)
 
         elapsed_time = time.time() - start_time
-        print(f"  ⏱️ Execution Time: {elapsed_time:.4f} sec (using {self.summary_llm_model})")
+        logger.debug("⏱️ Execution Time: %.4f sec (using %s)", elapsed_time, self.summary_llm_model)
         return {"messages": [response]}
 
     def _should_compare(self, state: AgentState):
@@ -1312,23 +1235,28 @@ class SearchAgent:
         else:
             return "compare"
 
+    @staticmethod
+    def _instrument_node(name: str, fn):
+        """ノードにメトリクス計測とトレース記録を付与（v3.3.0）"""
+        return timed_node(name, traced_node(name, fn))
+
     def _build_graph(self):
-        """グラフを構築（v3.1.0: 3軸分離検索対応）"""
+        """グラフを構築（v3.1.0: 3軸分離検索対応、v3.3.0: ノードごとのレイテンシを計測）"""
         workflow = StateGraph(AgentState)
 
         # 共通ノード
-        workflow.add_node("normalize", self._normalize_node)
-        workflow.add_node("compare", self._compare_node)
+        workflow.add_node("normalize", self._instrument_node("normalize", self._normalize_node))
+        workflow.add_node("compare", self._instrument_node("compare", self._compare_node))
 
         # 従来の単一クエリ検索ノード
-        workflow.add_node("generate_query", self._generate_query_node)
-        workflow.add_node("search", self._search_node)
+        workflow.add_node("generate_query", self._instrument_node("generate_query", self._generate_query_node))
+        workflow.add_node("search", self._instrument_node("search", self._search_node))
 
         # 3軸分離検索ノード（v3.1.0）
-        workflow.add_node("classify_focus", self._classify_focus_node)
-        workflow.add_node("generate_multi_axis_queries", self._generate_multi_axis_queries_node)
-        workflow.add_node("multi_axis_search", self._multi_axis_search_node)
-        workflow.add_node("score_fusion", self._score_fusion_node)
+        workflow.add_node("classify_focus", self._instrument_node("classify_focus", self._classify_focus_node))
+        workflow.add_node("generate_multi_axis_queries", self._instrument_node("generate_multi_axis_queries", self._generate_multi_axis_queries_node))
+        workflow.add_node("multi_axis_search", self._instrument_node("multi_axis_search", self._multi_axis_search_node))
+        workflow.add_node("score_fusion", self._instrument_node("score_fusion", self._score_fusion_node))
 
         # エントリーポイント
         workflow.set_entry_point("normalize")
@@ -1372,14 +1300,9 @@ class SearchAgent:
 
         return workflow.compile()
 
-    def run(self, input_data: dict, evaluation_mode: bool = False):
-        """エージェントを実行
-
-        Args:
-            input_data: 検索条件（purpose, materials, methods等）
-            evaluation_mode: 評価モード（True: 比較省略、Top10返却、False: 通常動作）
-        """
-        initial_state = {
+    def _initial_state(self, input_data: dict, evaluation_mode: bool) -> dict:
+        """グラフの初期状態"""
+        return {
             "messages": [HumanMessage(content=json.dumps(input_data, ensure_ascii=False))],
             "input_purpose": "",
             "input_materials": "",
@@ -1409,5 +1332,45 @@ class SearchAgent:
             "combined_axis_results": []
         }
 
-        result = self.graph.invoke(initial_state)
-        return result
+    def generate_axis_queries(self, input_data: dict) -> dict:
+        """3軸のクエリ生成までを実行（検索・統合・リランクは行わない）（v3.3.0）
+
+        評価アーティファクトの収集用。収集側が全検索モードの候補を自前で取得するため、
+        グラフ全体を実行して同じ検索を二重に行わないようにする。
+
+        Args:
+            input_data: 検索条件（purpose, materials, methods等）
+
+        Returns:
+            {"material": クエリ, "method": クエリ, "combined": クエリ}
+        """
+        state = self._initial_state(input_data, evaluation_mode=True)
+        for name, node in [
+            ("normalize", self._normalize_node),
+            ("classify_focus", self._classify_focus_node),
+            ("generate_multi_axis_queries", self._generate_multi_axis_queries_node),
+        ]:
+            state.update(self._instrument_node(name, node)(state) or {})
+        return {axis: state.get(f"{axis}_query", "") for axis in ("material", "method", "combined")}
+
+    def run(self, input_data: dict, evaluation_mode: bool = False):
+        """エージェントを実行
+
+        Args:
+            input_data: 検索条件（purpose, materials, methods等）
+            evaluation_mode: 評価モード（True: 比較省略、Top10返却、False: 通常動作）
+        """
+        initial_state = self._initial_state(input_data, evaluation_mode)
+
+        # v3.3.0: 検索中は同期・退避によるファイルの差し替えを待たせる
+        pool = get_chroma_pool()
+        while True:
+            if pool.epoch(self.chroma_path) != self._vectorstores_epoch:
+                with self._vectorstores_lock:
+                    if pool.epoch(self.chroma_path) != self._vectorstores_epoch:
+                        self._load_vectorstores()
+            with pool.reading(self.chroma_path):
+                # ゲート取得までの間に差し替えられた場合は取り直す
+                if pool.epoch(self.chroma_path) != self._vectorstores_epoch:
+                    continue
+                return self.graph.invoke(initial_state)
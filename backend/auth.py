@@ -2,10 +2,100 @@
 認証ユーティリティ
 
 Firebase ID Tokenの検証を行います。
+
+v3.3.0:
+- 検証済みトークンをトークンのハッシュをキーにメモリへキャッシュ（exp まで有効、件数上限あり）
+- 失効確認は AUTH_REVOCATION_CHECK_INTERVAL 秒ごとに実施
+- キャッシュミス時の検証はスレッドで実行（イベントループをブロックしない）
+- 署名検証用の公開鍵をバックグラウンドで定期的に更新
 """
 
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
 from firebase_init import verify_id_token as firebase_verify_token
+from firebase_init import refresh_public_keys
 from fastapi import HTTPException
+from config import config
+
+
+# exp直前のトークンをキャッシュから返さないための余裕（秒）
+TOKEN_EXPIRY_SKEW_SECONDS = 30
+
+
+class TokenCache:
+    """検証済みID Tokenのキャッシュ（LRU、トークン本体は保持しない）"""
+
+    def __init__(self, max_size: Optional[int] = None):
+        """
+        Args:
+            max_size: 最大保持数（デフォルト: config.AUTH_TOKEN_CACHE_SIZE）
+        """
+        self.max_size = max_size or config.AUTH_TOKEN_CACHE_SIZE
+        # {token_hash: (decoded_token, expires_at, revocation_checked_at)}（時刻はいずれも time.time）
+        self._entries: "OrderedDict[str, Tuple[Dict, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(id_token: str) -> str:
+        return hashlib.sha256(id_token.encode('utf-8')).hexdigest()
+
+    def get(self, id_token: str) -> Optional[Tuple[Dict, float]]:
+        """
+        キャッシュ済みの検証結果を取得
+
+        Returns:
+            (decoded_token, revocation_checked_at)（未キャッシュ・期限切れの場合はNone）
+        """
+        key = self._key(id_token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            decoded_token, expires_at, checked_at = entry
+            if now >= expires_at - TOKEN_EXPIRY_SKEW_SECONDS:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return decoded_token, checked_at
+
+    def put(self, id_token: str, decoded_token: Dict) -> None:
+        """検証結果を保存（expクレームがないトークンは保存しない）"""
+        expires_at = decoded_token.get("exp")
+        if not expires_at:
+            return
+        key = self._key(id_token)
+        with self._lock:
+            self._entries[key] = (decoded_token, float(expires_at), time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, id_token: str) -> None:
+        with self._lock:
+            self._entries.pop(self._key(id_token), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_token_cache = TokenCache()
+
+
+def get_token_cache() -> TokenCache:
+    """トークンキャッシュのシングルトンインスタンスを取得"""
+    return _token_cache
+
+
+def _verify_uncached(id_token: str) -> dict:
+    check_revoked = config.AUTH_REVOCATION_CHECK_INTERVAL > 0
+    return firebase_verify_token(id_token, check_revoked=check_revoked)
 
 
 async def verify_firebase_token(id_token: str) -> dict:
@@ -21,11 +111,39 @@ async def verify_firebase_token(id_token: str) -> dict:
     Raises:
         HTTPException: トークンが無効または期限切れ
     """
+    cached = _token_cache.get(id_token)
+    if cached is not None:
+        decoded_token, checked_at = cached
+        interval = config.AUTH_REVOCATION_CHECK_INTERVAL
+        if interval <= 0 or time.time() - checked_at < interval:
+            return decoded_token
+
     try:
-        decoded_token = firebase_verify_token(id_token)
-        return decoded_token
+        decoded_token = await asyncio.to_thread(_verify_uncached, id_token)
     except Exception as e:
+        _token_cache.discard(id_token)
         raise HTTPException(
             status_code=401,
             detail=f"Invalid or expired Firebase ID Token: {str(e)}"
         )
+
+    _token_cache.put(id_token, decoded_token)
+    return decoded_token
+
+
+async def refresh_public_keys_periodically() -> None:
+    """署名検証用の公開鍵をFIREBASE_KEY_REFRESH_INTERVAL秒ごとに更新（サーバー起動時にタスクとして開始）"""
+    interval = config.FIREBASE_KEY_REFRESH_INTERVAL
+    if interval <= 0:
+        return
+
+    while True:
+        try:
+            await asyncio.to_thread(refresh_public_keys)
+        except FileNotFoundError:
+            # Firebase未設定（開発環境）の場合は更新しない
+            print("Firebase未設定のため、公開鍵の定期更新を停止します")
+            return
+        except Exception as e:
+            print(f"⚠️  Firebase公開鍵の更新エラー: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,12 @@
+"""
+ベンチマーク（v3.3.0）
+
+APIキーや実データなしで検索・取り込みの性能を計測するためのツール群。
+
+- synthetic: 実験ノート形式（目的・背景 / 材料 / 方法 / 結果）の合成ノート生成
+- stub_providers: 決定的なEmbedding・チャットLLM・リランカーのスタブ（レイテンシ指定可）
+- e2e: 取り込みスループットと検索モード別のレイテンシを計測
+
+実行例（backend ディレクトリで）:
+    python -m benchmarks.e2e --notes 1000 --queries 20
+"""
@@ -0,0 +1,260 @@
+"""
+オフラインE2Eベンチマーク
+
+合成ノートをローカルストレージに書き出し、スタブプロバイダーで取り込み・検索を実行して
+以下を計測する（APIキー・ネットワーク不要）。
+
+- 取り込みスループット（ノート/秒、3コレクション / 単一コレクション）
+- 検索レイテンシの p50 / p95 / p99（semantic / keyword / hybrid × 3軸検索 on / off）
+
+実行例（backend ディレクトリで）:
+    python -m benchmarks.e2e --notes 1000 --queries 20
+    python -m benchmarks.e2e --notes 10000 --chat-latency-ms 800 --embed-latency-ms 150 --output bench.json
+
+--providers live を指定するとスタブの代わりに providers.py の本番プロバイダーを使用する
+（APIキーは OPENAI_API_KEY / COHERE_API_KEY）。PROVIDER_MODE=record / replay と組み合わせると、
+一度記録した呼び出しをオフラインで同じ結果のまま再実行できる:
+    PROVIDER_MODE=record PROVIDER_CASSETTE=bench.jsonl python -m benchmarks.e2e --providers live --notes 200
+    PROVIDER_MODE=replay PROVIDER_CASSETTE=bench.jsonl python -m benchmarks.e2e --providers live --notes 200
+
+作業ディレクトリ（--workdir、未指定時は一時ディレクトリ）にストレージとChromaDBを作成する。
+config はインポート時に環境変数を読むため、環境変数を設定してからバックエンドのモジュールを読み込む。
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+BENCH_TEAM_ID = "bench"
+SEARCH_MODES = ("semantic", "keyword", "hybrid")
+
+
+def percentile(values: List[float], p: float) -> float:
+    """最近傍順位法によるパーセンタイル"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(-(-p * len(ordered) // 100)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    """レイテンシ（秒）のリストをミリ秒の統計値に変換"""
+    return {
+        "count": len(latencies),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark for ingest and SearchAgent")
+    parser.add_argument("--notes", type=int, default=1000, help="number of synthetic notes (default: 1000)")
+    parser.add_argument("--queries", type=int, default=20, help="queries per search configuration (default: 20)")
+    parser.add_argument("--warmup", type=int, default=2, help="unmeasured queries per configuration (default: 2)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--modes", default=",".join(SEARCH_MODES), help="comma separated search modes")
+    parser.add_argument("--multi-axis", choices=("both", "on", "off"), default="both")
+    parser.add_argument("--no-rerank", action="store_true", help="disable reranking")
+    parser.add_argument("--evaluation-mode", action="store_true", help="skip the summary node (same as /evaluate)")
+    parser.add_argument("--no-expand-shortcuts", action="store_true", help="disable shortcut expansion on ingest")
+    parser.add_argument("--batch-size", type=int, default=None, help="INGEST_BATCH_SIZE override")
+    parser.add_argument("--providers", choices=("stub", "live"), default="stub",
+                        help="stub: deterministic local stand-ins, live: OpenAI/Cohere (honours PROVIDER_MODE)")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="stub latency per embedding call")
+    parser.add_argument("--embed-per-text-ms", type=float, default=0.0, help="stub latency per embedded text")
+    parser.add_argument("--chat-latency-ms", type=float, default=0.0, help="stub latency per chat call")
+    parser.add_argument("--rerank-latency-ms", type=float, default=0.0, help="stub latency per rerank call")
+    parser.add_argument("--workdir", default=None, help="working directory (default: temporary directory)")
+    parser.add_argument("--keep", action="store_true", help="keep the working directory")
+    parser.add_argument("--output", default=None, help="write results as JSON to this path")
+    return parser.parse_args(argv)
+
+
+def prepare_environment(args: argparse.Namespace, workdir: Path) -> None:
+    """バックエンドのモジュールを読み込む前に、作業ディレクトリを向くよう環境変数を設定"""
+    os.environ["STORAGE_TYPE"] = "local"
+    os.environ["STORAGE_BASE_PATH"] = str(workdir)
+    os.environ["CHROMA_DB_FOLDER"] = str(workdir / "chroma_db")
+    os.environ.setdefault("MASTER_DICTIONARY_PATH", str(BACKEND_DIR / "master_dictionary.yaml"))
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    # カセットのパスは作業ディレクトリへ移動する前のカレントディレクトリ基準で解決
+    if os.getenv("PROVIDER_CASSETTE"):
+        os.environ["PROVIDER_CASSETTE"] = str(Path(os.environ["PROVIDER_CASSETTE"]).resolve())
+    if args.batch_size:
+        os.environ["INGEST_BATCH_SIZE"] = str(args.batch_size)
+
+    # チームのChromaDBはカレントディレクトリ相対（teams/{team_id}/chroma-db）に作られる
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+    os.chdir(workdir)
+
+
+def run(args: argparse.Namespace) -> Dict:
+    workdir = Path(args.workdir).resolve() if args.workdir else Path(tempfile.mkdtemp(prefix="jikkennote-bench-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    prepare_environment(args, workdir)
+
+    from providers import set_providers
+    from storage import storage
+    from ingest import ingest_notes
+    from agent import SearchAgent
+    from benchmarks.synthetic import generate_notes, generate_note, generate_query, vocabulary
+    from benchmarks.stub_providers import StubLatency, StubProviders
+
+    latency = StubLatency(
+        embed=args.embed_latency_ms / 1000,
+        embed_per_text=args.embed_per_text_ms / 1000,
+        chat=args.chat_latency_ms / 1000,
+        rerank=args.rerank_latency_ms / 1000,
+    )
+    if args.providers == "stub":
+        previous_providers = set_providers(StubProviders(latency=latency, vocabulary=vocabulary()))
+        openai_api_key = cohere_api_key = "stub"
+    else:
+        previous_providers = None
+        openai_api_key = os.getenv("OPENAI_API_KEY", "")
+        cohere_api_key = os.getenv("COHERE_API_KEY", "")
+
+    axis_settings = {"both": (True, False), "on": (True,), "off": (False,)}[args.multi_axis]
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+
+    results = {
+        "config": {
+            "notes": args.notes,
+            "providers": args.providers,
+            "provider_mode": os.getenv("PROVIDER_MODE", "live"),
+            "queries": args.queries,
+            "seed": args.seed,
+            "modes": modes,
+            "multi_axis": [bool(a) for a in axis_settings],
+            "rerank": not args.no_rerank,
+            "evaluation_mode": args.evaluation_mode,
+            "expand_shortcuts": not args.no_expand_shortcuts,
+            "stub_latency_ms": {
+                "embed": args.embed_latency_ms,
+                "embed_per_text": args.embed_per_text_ms,
+                "chat": args.chat_latency_ms,
+                "rerank": args.rerank_latency_ms,
+            },
+            "workdir": str(workdir),
+        },
+        "ingest": {},
+        "search": [],
+    }
+
+    try:
+        # === 合成ノートの書き出し ===
+        notes_folder = storage.get_team_path(BENCH_TEAM_ID, "notes_new")
+        storage.mkdir(notes_folder)
+        start = time.perf_counter()
+        for note in generate_notes(args.notes, seed=args.seed):
+            storage.write_file(f"{notes_folder}/{note.note_id}.md", note.content)
+        write_seconds = time.perf_counter() - start
+        print(f"Generated {args.notes} notes in {write_seconds:.2f}s ({workdir})")
+
+        # === 取り込み（3軸検索用の3コレクション、単一軸検索用の単一コレクション） ===
+        for multi_collection in axis_settings:
+            label = "multi_collection" if multi_collection else "single_collection"
+            start = time.perf_counter()
+            new_ids, skipped_ids = ingest_notes(
+                api_key=openai_api_key,
+                source_folder=notes_folder,
+                post_action="keep",
+                team_id=BENCH_TEAM_ID,
+                multi_collection=multi_collection,
+                expand_shortcuts=not args.no_expand_shortcuts,
+            )
+            seconds = time.perf_counter() - start
+            results["ingest"][label] = {
+                "notes": len(new_ids),
+                "skipped": len(skipped_ids),
+                "seconds": round(seconds, 3),
+                "notes_per_second": round(len(new_ids) / seconds, 2) if seconds > 0 else 0.0,
+            }
+            print(f"Ingest [{label}]: {len(new_ids)} notes in {seconds:.2f}s "
+                  f"({results['ingest'][label]['notes_per_second']} notes/s)")
+
+        # === 検索 ===
+        # クエリは合成ノートから作り、正解ノートが上位に来るかも記録する
+        query_sources = [generate_note(i * 7919 % max(args.notes, 1), seed=args.seed)
+                         for i in range(args.warmup + args.queries)]
+        queries = [generate_query(i, seed=args.seed, source=source) for i, source in enumerate(query_sources)]
+
+        for multi_axis in axis_settings:
+            for mode in modes:
+                init_latencies: List[float] = []
+                run_latencies: List[float] = []
+                total_latencies: List[float] = []
+                hits = 0
+                for i, (query, source) in enumerate(zip(queries, query_sources)):
+                    start = time.perf_counter()
+                    agent = SearchAgent(
+                        openai_api_key=openai_api_key,
+                        cohere_api_key=cohere_api_key,
+                        search_mode=mode,
+                        team_id=BENCH_TEAM_ID,
+                        multi_axis_enabled=multi_axis,
+                        rerank_enabled=not args.no_rerank,
+                    )
+                    initialized = time.perf_counter()
+                    result = agent.run(query, evaluation_mode=args.evaluation_mode)
+                    end = time.perf_counter()
+                    if i < args.warmup:
+                        continue
+                    init_latencies.append(initialized - start)
+                    run_latencies.append(end - initialized)
+                    total_latencies.append(end - start)
+                    if any(source.note_id in doc for doc in result.get("retrieved_docs", [])):
+                        hits += 1
+
+                entry = {
+                    "search_mode": mode,
+                    "multi_axis": multi_axis,
+                    "total": summarize(total_latencies),
+                    "agent_init": summarize(init_latencies),
+                    "run": summarize(run_latencies),
+                    "source_note_hit_rate": round(hits / len(total_latencies), 3) if total_latencies else 0.0,
+                }
+                results["search"].append(entry)
+                total = entry["total"]
+                print(f"Search [{mode:<8} multi_axis={'on ' if multi_axis else 'off'}]: "
+                      f"p50={total['p50_ms']}ms p95={total['p95_ms']}ms p99={total['p99_ms']}ms "
+                      f"hit_rate={entry['source_note_hit_rate']}")
+    finally:
+        if previous_providers is not None:
+            set_providers(previous_providers)
+        if not args.keep and not args.workdir:
+            os.chdir(BACKEND_DIR)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return results
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    output = Path(args.output).resolve() if args.output else None
+    logging.basicConfig(level=logging.WARNING)
+
+    results = run(args)
+
+    if output:
+        output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
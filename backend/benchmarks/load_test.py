@@ -0,0 +1,369 @@
+"""
+FastAPIサーバーの負荷試験
+
+実際の FastAPI アプリ（server.app）に httpx.ASGITransport 経由でリクエストを送り、
+エンドポイント別のスループット・レイテンシ（p50 / p95 / p99）・エラー率と、
+イベントループの遅延（ラグ）を計測する。外部APIはスタブプロバイダーに差し替える。
+
+認証:
+- stub（既定）: 負荷試験用トークンの検証結果とチームメンバーシップをキャッシュに登録し、
+  本番と同じ AuthMiddleware / TeamMiddleware を通す
+- bypass: 認証・チーム確認のミドルウェアを外し、X-Team-ID をそのまま request.state に設定する
+
+実行例（backend ディレクトリで）:
+    python -m benchmarks.load_test --notes 1000 --concurrency 16 --duration 30 --profile mixed
+    python -m benchmarks.load_test --profile "search=8,ingest=1,health=1" --chat-latency-ms 500
+
+トラフィックプロファイル（エンドポイント=重み）:
+    search:  search=1
+    mixed:   search=8,ingest=1,health=1
+    ingest:  search=1,ingest=1
+    read:    search=4,dictionary=2,synonyms=2,health=2
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List
+
+from benchmarks.e2e import BENCH_TEAM_ID, BACKEND_DIR, SEARCH_MODES, prepare_environment, summarize
+
+
+LOAD_TEST_USER_ID = "loadtest-user"
+LOAD_TEST_TOKEN = "loadtest-token"
+
+PROFILES = {
+    "search": "search=1",
+    "mixed": "search=8,ingest=1,health=1",
+    "ingest": "search=1,ingest=1",
+    "read": "search=4,dictionary=2,synonyms=2,health=2",
+}
+
+ENDPOINTS = ("search", "ingest", "health", "dictionary", "synonyms", "metrics")
+
+
+@dataclass
+class EndpointStats:
+    """エンドポイント別の集計"""
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+    status_codes: Dict[str, int] = field(default_factory=dict)
+
+    def record(self, seconds: float, status: str, error: bool) -> None:
+        self.latencies.append(seconds)
+        self.status_codes[status] = self.status_codes.get(status, 0) + 1
+        if error:
+            self.errors += 1
+
+
+def parse_profile(spec: str) -> Dict[str, float]:
+    """ "search=8,ingest=1" 形式（またはプロファイル名）を {エンドポイント: 重み} に変換"""
+    spec = PROFILES.get(spec, spec)
+    weights = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint in profile: {name} (choose from {', '.join(ENDPOINTS)})")
+        weights[name] = float(weight or 1)
+    if not weights:
+        raise ValueError("Empty traffic profile")
+    return weights
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Load test for the FastAPI app with stubbed providers")
+    parser.add_argument("--notes", type=int, default=1000, help="notes ingested before the test (default: 1000)")
+    parser.add_argument("--profile", default="mixed", help=f"traffic profile ({', '.join(PROFILES)}) or endpoint=weight list")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent virtual users (default: 8)")
+    parser.add_argument("--duration", type=float, default=30.0, help="test duration in seconds (default: 30)")
+    parser.add_argument("--think-time-ms", type=float, default=0.0, help="pause between requests per user")
+    parser.add_argument("--auth", choices=("stub", "bypass"), default="stub")
+    parser.add_argument("--modes", default=",".join(SEARCH_MODES), help="search modes to cycle through")
+    parser.add_argument("--multi-axis", choices=("on", "off"), default="on")
+    parser.add_argument("--no-rerank", action="store_true")
+    parser.add_argument("--ingest-notes", type=int, default=5, help="new notes per /ingest request (default: 5)")
+    parser.add_argument("--threads", type=int, default=None, help="default thread pool size for asyncio.to_thread")
+    parser.add_argument("--lag-interval-ms", type=float, default=10.0, help="event-loop lag sampling interval")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=None, help="INGEST_BATCH_SIZE override")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--embed-per-text-ms", type=float, default=0.0)
+    parser.add_argument("--chat-latency-ms", type=float, default=0.0)
+    parser.add_argument("--rerank-latency-ms", type=float, default=0.0)
+    parser.add_argument("--workdir", default=None, help="working directory (default: temporary directory)")
+    parser.add_argument("--keep", action="store_true", help="keep the working directory")
+    parser.add_argument("--output", default=None, help="write results as JSON to this path")
+    return parser.parse_args(argv)
+
+
+class _BypassAuthMiddleware:
+    """認証・チーム確認の代わりに固定ユーザーと X-Team-ID を request.state に設定（--auth bypass）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            from logging_config import team_id_var
+            from starlette.datastructures import Headers
+
+            state = scope.setdefault("state", {})
+            state["user"] = {"uid": LOAD_TEST_USER_ID}
+            team_id = Headers(scope=scope).get("X-Team-ID")
+            if team_id:
+                state["team_id"] = team_id
+                team_id_var.set(team_id)
+        await self.app(scope, receive, send)
+
+
+def _configure_auth(app, mode: str) -> None:
+    """認証方式を設定（ミドルウェアスタックは最初のリクエストで構築されるため、その前に呼ぶ）"""
+    from starlette.middleware import Middleware
+    from middleware import AuthMiddleware, TeamMiddleware
+
+    if mode == "bypass":
+        replaced = []
+        for entry in app.user_middleware:
+            if entry.cls is AuthMiddleware:
+                continue
+            replaced.append(Middleware(_BypassAuthMiddleware) if entry.cls is TeamMiddleware else entry)
+        app.user_middleware = replaced
+        app.middleware_stack = None
+        return
+
+    # stub: 本番のミドルウェアをそのまま通し、検証結果とメンバーシップをキャッシュから返させる
+    from auth import get_token_cache
+    import teams
+
+    get_token_cache().put(LOAD_TEST_TOKEN, {"uid": LOAD_TEST_USER_ID, "exp": time.time() + 7 * 24 * 3600})
+    teams._cache_membership(LOAD_TEST_USER_ID, BENCH_TEAM_ID, True)
+
+
+class LoadTest:
+    """仮想ユーザーの実行と集計"""
+
+    def __init__(self, args: argparse.Namespace, client, weights: Dict[str, float]):
+        self.args = args
+        self.client = client
+        self.weights = weights
+        self.stats: Dict[str, EndpointStats] = {name: EndpointStats() for name in weights}
+        self.lags: List[float] = []
+        self.modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+        self._next_note_index = args.notes
+        self._ingest_lock = asyncio.Lock()
+
+    async def _request(self, endpoint: str, rng: random.Random, request_index: int):
+        from benchmarks.synthetic import generate_query
+
+        if endpoint == "search":
+            body = generate_query(request_index, seed=self.args.seed)
+            body.update({
+                "openai_api_key": "stub",
+                "cohere_api_key": "stub",
+                "search_mode": self.modes[request_index % len(self.modes)],
+                "multi_axis_enabled": self.args.multi_axis == "on",
+                "rerank_enabled": not self.args.no_rerank,
+            })
+            return await self.client.post("/search", json=body)
+        if endpoint == "ingest":
+            await self._write_new_notes(self.args.ingest_notes)
+            return await self.client.post("/ingest", json={"openai_api_key": "stub"})
+        if endpoint == "health":
+            return await self.client.get("/health")
+        if endpoint == "dictionary":
+            return await self.client.get("/dictionary")
+        if endpoint == "synonyms":
+            return await self.client.get("/synonyms")
+        return await self.client.get("/metrics")
+
+    async def _write_new_notes(self, count: int) -> None:
+        """アップロード済みの新規ノートを用意（/upload/notes の代わりにストレージへ直接書き込む）"""
+        from storage import storage
+        from benchmarks.synthetic import generate_note
+
+        async with self._ingest_lock:
+            start = self._next_note_index
+            self._next_note_index += count
+        folder = storage.get_team_path(BENCH_TEAM_ID, "notes_new")
+
+        def write():
+            for index in range(start, start + count):
+                note = generate_note(index, seed=self.args.seed)
+                storage.write_file(f"{folder}/{note.note_id}.md", note.content)
+
+        await asyncio.to_thread(write)
+
+    async def _user(self, user_index: int, deadline: float) -> None:
+        rng = random.Random(self.args.seed * 1_000 + user_index)
+        names = list(self.weights)
+        weights = [self.weights[n] for n in names]
+        request_index = user_index
+        while time.perf_counter() < deadline:
+            endpoint = rng.choices(names, weights=weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await self._request(endpoint, rng, request_index)
+                status = str(response.status_code)
+                error = response.status_code >= 400
+            except Exception as e:
+                status = type(e).__name__
+                error = True
+            self.stats[endpoint].record(time.perf_counter() - start, status, error)
+            request_index += self.args.concurrency
+            if self.args.think_time_ms > 0:
+                await asyncio.sleep(self.args.think_time_ms / 1000)
+
+    async def _monitor_lag(self, stop: asyncio.Event) -> None:
+        """sleep の予定時刻からの遅れ（イベントループがブロックされていた時間）を記録"""
+        interval = self.args.lag_interval_ms / 1000
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.lags.append(max(0.0, time.perf_counter() - start - interval))
+
+    async def run(self) -> float:
+        stop = asyncio.Event()
+        monitor = asyncio.create_task(self._monitor_lag(stop))
+        start = time.perf_counter()
+        deadline = start + self.args.duration
+        await asyncio.gather(*(self._user(i, deadline) for i in range(self.args.concurrency)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await monitor
+        return elapsed
+
+    def report(self, elapsed: float) -> Dict:
+        endpoints = {}
+        for name, stats in self.stats.items():
+            count = len(stats.latencies)
+            endpoints[name] = {
+                "requests": count,
+                "throughput_rps": round(count / elapsed, 2) if elapsed > 0 else 0.0,
+                "error_rate": round(stats.errors / count, 4) if count else 0.0,
+                "status_codes": stats.status_codes,
+                "latency": summarize(stats.latencies),
+            }
+        total = sum(len(s.latencies) for s in self.stats.values())
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "total_requests": total,
+            "throughput_rps": round(total / elapsed, 2) if elapsed > 0 else 0.0,
+            "endpoints": endpoints,
+            "event_loop_lag": summarize(self.lags),
+        }
+
+
+async def _run_async(args: argparse.Namespace, weights: Dict[str, float]) -> Dict:
+    import httpx
+    from server import app
+
+    if args.threads:
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=args.threads))
+
+    _configure_auth(app, args.auth)
+    headers = {"Authorization": f"Bearer {LOAD_TEST_TOKEN}", "X-Team-ID": BENCH_TEAM_ID}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", headers=headers, timeout=None) as client:
+        test = LoadTest(args, client, weights)
+        elapsed = await test.run()
+    return test.report(elapsed)
+
+
+def run(args: argparse.Namespace) -> Dict:
+    weights = parse_profile(args.profile)
+    workdir = Path(args.workdir).resolve() if args.workdir else Path(tempfile.mkdtemp(prefix="jikkennote-load-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    prepare_environment(args, workdir)
+    # キャッシュ済みの認証・メンバーシップが試験中に失効しないようにする
+    os.environ["AUTH_REVOCATION_CHECK_INTERVAL"] = "0"
+    os.environ["TEAM_MEMBERSHIP_CACHE_TTL"] = str(7 * 24 * 3600)
+    os.environ["FIREBASE_KEY_REFRESH_INTERVAL"] = "0"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from providers import set_providers
+    from storage import storage
+    from ingest import ingest_notes
+    from benchmarks.synthetic import generate_notes, vocabulary
+    from benchmarks.stub_providers import StubLatency, StubProviders
+
+    latency = StubLatency(
+        embed=args.embed_latency_ms / 1000,
+        embed_per_text=args.embed_per_text_ms / 1000,
+        chat=args.chat_latency_ms / 1000,
+        rerank=args.rerank_latency_ms / 1000,
+    )
+    previous_providers = set_providers(StubProviders(latency=latency, vocabulary=vocabulary()))
+
+    try:
+        # 試験前のコーパスを取り込み（取り込み済みノートは notes/processed へ移動）
+        folder = storage.get_team_path(BENCH_TEAM_ID, "notes_new")
+        storage.mkdir(folder)
+        for note in generate_notes(args.notes, seed=args.seed):
+            storage.write_file(f"{folder}/{note.note_id}.md", note.content)
+        start = time.perf_counter()
+        ingest_notes(api_key="stub", team_id=BENCH_TEAM_ID, multi_collection=args.multi_axis == "on")
+        print(f"Ingested {args.notes} notes in {time.perf_counter() - start:.2f}s ({workdir})")
+
+        print(f"Running profile {weights} with {args.concurrency} users for {args.duration:.0f}s ...")
+        results = asyncio.run(_run_async(args, weights))
+        results["config"] = {
+            "notes": args.notes,
+            "profile": weights,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "auth": args.auth,
+            "multi_axis": args.multi_axis == "on",
+            "stub_latency_ms": {
+                "embed": args.embed_latency_ms,
+                "embed_per_text": args.embed_per_text_ms,
+                "chat": args.chat_latency_ms,
+                "rerank": args.rerank_latency_ms,
+            },
+        }
+    finally:
+        set_providers(previous_providers)
+        if not args.keep and not args.workdir:
+            os.chdir(BACKEND_DIR)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return results
+
+
+def print_report(results: Dict) -> None:
+    print(f"\n{'endpoint':<12} {'reqs':>7} {'rps':>8} {'err%':>7} {'p50ms':>9} {'p95ms':>9} {'p99ms':>9}")
+    for name, entry in results["endpoints"].items():
+        latency = entry["latency"]
+        print(f"{name:<12} {entry['requests']:>7} {entry['throughput_rps']:>8} {entry['error_rate'] * 100:>6.2f}% "
+              f"{latency['p50_ms']:>9} {latency['p95_ms']:>9} {latency['p99_ms']:>9}")
+    lag = results["event_loop_lag"]
+    print(f"\nTotal: {results['total_requests']} requests, {results['throughput_rps']} rps")
+    print(f"Event-loop lag: p50={lag['p50_ms']}ms p95={lag['p95_ms']}ms p99={lag['p99_ms']}ms max={lag['max_ms']}ms")
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    output = Path(args.output).resolve() if args.output else None
+    logging.basicConfig(level=logging.WARNING)
+
+    results = run(args)
+    print_report(results)
+
+    if output:
+        output.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+テキスト処理のマイクロベンチマーク
+
+正規化・同義語展開・トークン化・省略形展開などのCPUバウンドな関数について、
+辞書サイズ（100〜20,000エントリ）とノート長ごとに ops/sec と1回あたりのピークメモリ割り当てを計測する。
+ベースラインと比較し、閾値を超えて遅く（または割り当てが多く）なったケースがあれば終了コード1で終了する。
+
+実行例（backend ディレクトリで）:
+    python -m benchmarks.micro --save-baseline          # ベースラインを保存
+    python -m benchmarks.micro                          # ベースラインと比較（既定の閾値: 20%）
+    python -m benchmarks.micro --sizes 100,1000 --filter normalize_text
+
+ベースラインはマシン依存のため、同じマシン・同じPythonで保存したものと比較すること。
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import yaml
+
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE_PATH = BACKEND_DIR / "benchmarks" / "micro_baseline.json"
+DEFAULT_SIZES = (100, 1000, 5000, 20000)
+
+# 割り当てはこのバイト数未満の増加を誤差として扱う
+ALLOCATION_NOISE_BYTES = 1024
+
+PREFIXES = ["メチル", "エチル", "プロピル", "ブチル", "フェニル", "ベンジル", "クロロ", "ブロモ",
+            "ヒドロキシ", "アミノ", "ニトロ", "シアノ", "フルオロ", "メトキシ", "アセチル", "トリフルオロ"]
+BASES = ["ベンゼン", "アセテート", "アミン", "エーテル", "ケトン", "アルデヒド", "ピリジン", "フラン",
+         "チオフェン", "スルホン酸", "カルボン酸", "アミド", "抗体", "緩衝液", "触媒", "ポリマー"]
+
+
+@dataclass
+class Case:
+    """1つの計測ケース"""
+    case_id: str  # 例: "normalize_text[dict=1000,text=long]"
+    fn: Callable[[], object]
+
+
+@dataclass
+class Fixture:
+    """辞書サイズごとの入力データ"""
+    size: int
+    replace_map: Dict[str, str]
+    suffix_maps: Dict[str, Dict[str, str]]
+    canonicals: List[str]
+    dictionary_manager: object
+    synonym_dictionary: object
+    texts: Dict[str, str]  # {"short": 材料セクション程度, "long": ノート数件分}
+    query: str
+    term: str
+
+
+# ============================================
+# 入力データの生成
+# ============================================
+
+def generate_dictionary_entries(size: int, seed: int = 0) -> List[Dict]:
+    """正規化辞書（master_dictionary.yaml形式）のエントリを生成"""
+    from benchmarks.synthetic import MATERIALS
+
+    rng = random.Random(seed + size)
+    entries = [{"canonical": canonical, "variants": list(variants)} for canonical, variants in MATERIALS]
+    index = 0
+    while len(entries) < size:
+        canonical = f"{rng.choice(PREFIXES)}{rng.choice(PREFIXES)}{rng.choice(BASES)}{index}"
+        entry = {
+            "canonical": canonical,
+            "variants": [f"CMP-{index}", f"{canonical[:4]}-{index}"],
+        }
+        # 5件に1件はサフィックス同等グループ付き（例: 抗体A = 抗体1）
+        if index % 5 == 0:
+            entry["suffix_equivalents"] = [["1", "A", "a"], ["2", "B", "b"]]
+        entries.append(entry)
+        index += 1
+    return entries[:size]
+
+
+def generate_synonym_groups(entries: List[Dict]) -> Dict:
+    """同義語辞書（synonym_dictionary.yaml形式）を正規化辞書のエントリから生成"""
+    return {"groups": [{"canonical": e["canonical"], "variants": e["variants"]} for e in entries]}
+
+
+def _pick_terms(rng: random.Random, entries: List[Dict], count: int) -> List[str]:
+    terms = []
+    for entry in rng.sample(entries, min(count, len(entries))):
+        term = rng.choice([entry["canonical"]] + entry["variants"])
+        if entry.get("suffix_equivalents"):
+            term += rng.choice(["A", "B", "1", "2"])
+        terms.append(term)
+    return terms
+
+
+def generate_texts(entries: List[Dict], seed: int = 0) -> Dict[str, str]:
+    """辞書の語を含むノート風テキスト（short: 材料セクション程度、long: ノート数件分）"""
+    from benchmarks.synthetic import generate_note
+
+    rng = random.Random(seed)
+    short = "\n".join(f"- {term}: {rng.randint(1, 100)} mL" for term in _pick_terms(rng, entries, 8))
+
+    parts = []
+    for i in range(6):
+        note = generate_note(i, seed=seed)
+        terms = "、".join(_pick_terms(rng, entries, 10))
+        parts.append(f"{note.content}\n## 備考\n{terms}を併用した（ロットA、ロットB）。\n")
+    return {"short": short, "long": "\n".join(parts)}
+
+
+def build_fixture(size: int, workdir: Path, seed: int = 0) -> Fixture:
+    """辞書ファイルを書き出し、実際の読み込み処理で辞書オブジェクトを構築"""
+    from utils import load_master_dict
+    from dictionary import DictionaryManager
+    from synonym_dictionary import SynonymDictionary
+
+    entries = generate_dictionary_entries(size, seed=seed)
+    dictionary_path = workdir / f"master_dictionary_{size}.yaml"
+    synonym_path = workdir / f"synonym_dictionary_{size}.yaml"
+    dictionary_path.write_text(yaml.safe_dump(entries, allow_unicode=True), encoding="utf-8")
+    synonym_path.write_text(yaml.safe_dump(generate_synonym_groups(entries), allow_unicode=True), encoding="utf-8")
+
+    replace_map, _ = load_master_dict(str(dictionary_path))
+    dictionary_manager = DictionaryManager(dictionary_path=str(dictionary_path))
+    synonym_dictionary = SynonymDictionary(dict_path=str(synonym_path))
+
+    rng = random.Random(seed + 1)
+    query_terms = _pick_terms(rng, entries, 4)
+    return Fixture(
+        size=size,
+        replace_map=replace_map,
+        suffix_maps=dictionary_manager.get_all_suffix_maps(),
+        canonicals=dictionary_manager.get_all_canonicals(),
+        dictionary_manager=dictionary_manager,
+        synonym_dictionary=synonym_dictionary,
+        texts=generate_texts(entries, seed=seed),
+        query=" ".join(query_terms) + " 合成条件 収率",
+        # 表記ゆれを含む語（1文字欠け）で類似語検索
+        term=query_terms[0][:-1] if len(query_terms[0]) > 2 else query_terms[0],
+    )
+
+
+# ============================================
+# ケース定義
+# ============================================
+
+def build_cases(fixtures: List[Fixture], seed: int = 0) -> List[Case]:
+    from utils import normalize_text, normalize_text_with_suffix
+    from agent import SearchAgent
+    from ingest import extract_sections
+    from experimenter_profile import apply_suffix_mapping, expand_shortcuts_in_text
+    from benchmarks.synthetic import generate_note, CIRCLED
+
+    cases: List[Case] = []
+
+    # 辞書サイズに依存するケース
+    for f in fixtures:
+        for text_kind, text in f.texts.items():
+            cases.append(Case(
+                f"normalize_text[dict={f.size},text={text_kind}]",
+                lambda f=f, text=text: normalize_text(text, f.replace_map)
+            ))
+            cases.append(Case(
+                f"normalize_text_with_suffix[dict={f.size},text={text_kind}]",
+                lambda f=f, text=text: normalize_text_with_suffix(text, f.replace_map, f.suffix_maps, f.canonicals)
+            ))
+        cases.append(Case(
+            f"SynonymDictionary.expand_query[dict={f.size}]",
+            lambda f=f: f.synonym_dictionary.expand_query(f.query)
+        ))
+        cases.append(Case(
+            f"DictionaryManager.find_similar_terms[dict={f.size}]",
+            lambda f=f: f.dictionary_manager.find_similar_terms(f.term)
+        ))
+
+    # 辞書サイズに依存しないケース（ノート長のみ）
+    texts = fixtures[0].texts if fixtures else generate_texts(generate_dictionary_entries(100, seed), seed)
+    # _tokenize はインスタンスの状態を使わないため、初期化せずに呼び出す
+    agent = SearchAgent.__new__(SearchAgent)
+    note = generate_note(0, seed=seed).content
+    long_note = texts["long"]
+    methods = extract_sections(long_note)["methods"] or long_note
+    shortcuts = {CIRCLED[i]: f"材料{i + 1}" for i in range(len(CIRCLED))}
+    conventions = [["A", "1"], ["B", "2"], ["a", "1"], ["b", "2"]]
+
+    for text_kind, text in texts.items():
+        cases.append(Case(f"SearchAgent._tokenize[text={text_kind}]", lambda text=text: agent._tokenize(text)))
+        cases.append(Case(
+            f"apply_suffix_mapping[text={text_kind}]",
+            lambda text=text: apply_suffix_mapping(text, conventions)
+        ))
+    cases.append(Case("expand_shortcuts_in_text[text=methods]", lambda: expand_shortcuts_in_text(methods, shortcuts)))
+    cases.append(Case("extract_sections[text=note]", lambda: extract_sections(note)))
+    cases.append(Case("extract_sections[text=long]", lambda: extract_sections(long_note)))
+    return cases
+
+
+# ============================================
+# 計測
+# ============================================
+
+def measure_speed(fn: Callable[[], object], min_time: float, repeat: int) -> float:
+    """ops/sec（min_time 秒以上かかる回数に調整し、repeat 回のうち最速）"""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return loops / best if best > 0 else float("inf")
+
+
+def measure_allocations(fn: Callable[[], object]) -> int:
+    """1回の呼び出しでのピーク割り当てバイト数（tracemalloc）"""
+    fn()  # 遅延初期化・キャッシュの影響を除く
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return max(0, peak - baseline)
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """
+    ベースラインとの比較
+
+    Returns:
+        回帰したケースの説明のリスト
+    """
+    regressions = []
+    for case_id, result in results.items():
+        base = baseline.get(case_id)
+        if not base:
+            continue
+        if result["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+            regressions.append(
+                f"{case_id}: {result['ops_per_sec']:.1f} ops/s < baseline {base['ops_per_sec']:.1f} ops/s"
+            )
+        peak, base_peak = result["peak_bytes"], base["peak_bytes"]
+        if peak > base_peak * (1 + threshold) and peak - base_peak > ALLOCATION_NOISE_BYTES:
+            regressions.append(f"{case_id}: {peak} bytes > baseline {base_peak} bytes")
+    return regressions
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for text-processing functions")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES), help="dictionary sizes")
+    parser.add_argument("--filter", default=None, help="run only cases whose id contains this string")
+    parser.add_argument("--min-time", type=float, default=0.2, help="minimum seconds per timing run")
+    parser.add_argument("--repeat", type=int, default=3, help="timing runs per case (best is kept)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE_PATH), help="baseline JSON path")
+    parser.add_argument("--save-baseline", action="store_true", help="write results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed regression ratio (default: 0.2)")
+    parser.add_argument("--output", default=None, help="write results as JSON to this path")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    # 辞書ファイルは一時ディレクトリに書き出してローカルストレージから読み込む
+    os.environ["STORAGE_TYPE"] = "local"
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    workdir = Path(tempfile.mkdtemp(prefix="jikkennote-micro-"))
+    try:
+        fixtures = [build_fixture(size, workdir, seed=args.seed) for size in sizes]
+        cases = build_cases(fixtures, seed=args.seed)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.filter:
+        cases = [c for c in cases if args.filter in c.case_id]
+
+    results: Dict[str, Dict] = {}
+    for case in cases:
+        ops = measure_speed(case.fn, args.min_time, args.repeat)
+        peak = measure_allocations(case.fn)
+        results[case.case_id] = {"ops_per_sec": round(ops, 2), "peak_bytes": peak}
+        print(f"{case.case_id:<60} {ops:>12.1f} ops/s {peak:>12} B")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        # 今回実行しなかったケースは既存のベースラインを残す
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+        baseline.update(results)
+        baseline_path.write_text(json.dumps(baseline, ensure_ascii=False, indent=2, sort_keys=True), encoding="utf-8")
+        print(f"Baseline written to {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        print(f"No baseline at {baseline_path} (run with --save-baseline)")
+        return 0
+
+    regressions = compare(results, json.loads(baseline_path.read_text(encoding="utf-8")), args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"\nNo regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+スタブプロバイダー
+
+providers.set_providers() に渡すと、OpenAI / Cohere の代わりに以下を使用する。
+いずれも入力だけから決定的に結果を返し、指定したレイテンシだけ待機する。
+
+- StubEmbeddings: 文字n-gramのハッシュによる固定次元ベクトル（似た文字列ほどコサイン類似度が高い）
+- StubChatModel: 検索グラフの各プロンプトが期待するJSON（queries / query / classification / shortcuts）を返す
+- StubRerankClient: 文字bigramの重なりで並べ替える cohere.Client.rerank 互換
+"""
+
+import json
+import math
+import time
+import zlib
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Iterable, List, Optional, Set
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage
+
+from metrics import track_call
+
+
+@dataclass
+class StubLatency:
+    """スタブの疑似レイテンシ（秒）"""
+    embed: float = 0.0  # Embedding 1回あたり
+    embed_per_text: float = 0.0  # Embedding 1テキストあたりの追加分
+    chat: float = 0.0  # チャットLLM 1回あたり
+    rerank: float = 0.0  # リランク 1回あたり
+
+
+def _sleep(seconds: float) -> None:
+    if seconds > 0:
+        time.sleep(seconds)
+
+
+def _ngrams(text: str, sizes: Iterable[int] = (2, 3)) -> List[str]:
+    text = "".join(text.split())
+    grams = []
+    for n in sizes:
+        grams.extend(text[i:i + n] for i in range(len(text) - n + 1))
+    return grams or ([text] if text else [])
+
+
+def _bigrams(text: str) -> Set[str]:
+    return set(_ngrams(text, sizes=(2,)))
+
+
+def _prompt_text(prompt) -> str:
+    """invoke() に渡されたプロンプト（文字列 or メッセージのリスト）をテキスト化"""
+    if isinstance(prompt, str):
+        return prompt
+    if isinstance(prompt, list):
+        return "\n".join(_prompt_text(message) for message in prompt)
+    return str(getattr(prompt, "content", prompt))
+
+
+class StubEmbeddings(Embeddings):
+    """文字n-gramのハッシュトリックによる決定的なEmbedding"""
+
+    def __init__(self, dimensions: int = 256, latency: Optional[StubLatency] = None):
+        self.dimensions = dimensions
+        self.latency = latency or StubLatency()
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for gram in _ngrams(text):
+            h = zlib.crc32(gram.encode("utf-8"))
+            vector[h % self.dimensions] += 1.0 if (h >> 31) & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with track_call("openai_embeddings"):
+            _sleep(self.latency.embed + self.latency.embed_per_text * len(texts))
+            return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        with track_call("openai_embeddings"):
+            _sleep(self.latency.embed + self.latency.embed_per_text)
+            return self._embed(text)
+
+
+class StubChatModel:
+    """
+    検索グラフ用のチャットLLMスタブ
+
+    プロンプト中に現れる語彙をクエリとして返す。1つのJSONに全ノードが読むキーを含めるため、
+    どのプロンプトに対しても解析に成功する（比較ノードではこのJSONがそのまま要約になる）。
+    """
+
+    def __init__(self, vocabulary: Optional[List[str]] = None, latency: Optional[StubLatency] = None, max_terms: int = 8):
+        # 長い語を優先して照合（「酢酸エチル」を「酢酸」より先に）
+        self.vocabulary = sorted(set(vocabulary or []), key=len, reverse=True)
+        self.latency = latency or StubLatency()
+        self.max_terms = max_terms
+
+    def _terms(self, text: str) -> List[str]:
+        terms = []
+        for word in self.vocabulary:
+            if word in text and not any(word in t for t in terms):
+                terms.append(word)
+                if len(terms) >= self.max_terms:
+                    break
+        return terms
+
+    def invoke(self, prompt, *args, **kwargs) -> AIMessage:
+        _sleep(self.latency.chat)
+        text = _prompt_text(prompt)
+        terms = self._terms(text) or [text.strip()[-100:]]
+        query = " ".join(terms)
+        content = json.dumps({
+            "queries": [query, " ".join(reversed(terms))],
+            "query": query,
+            "classification": "both",
+            "reason": "stub",
+            "shortcuts": {},
+        }, ensure_ascii=False)
+        input_tokens = len(text) // 2
+        output_tokens = len(content) // 2
+        return AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            }
+        )
+
+
+class StubRerankClient:
+    """cohere.Client.rerank 互換のスタブ（クエリとの文字bigramの重なりでスコア付け）"""
+
+    def __init__(self, latency: Optional[StubLatency] = None):
+        self.latency = latency or StubLatency()
+
+    def rerank(self, query: str, documents: List[str], top_n: Optional[int] = None, model: Optional[str] = None, **kwargs):
+        _sleep(self.latency.rerank)
+        query_grams = _bigrams(query)
+        scored = []
+        for index, document in enumerate(documents):
+            doc_grams = _bigrams(document)
+            overlap = len(query_grams & doc_grams)
+            score = overlap / math.sqrt(len(query_grams) * len(doc_grams)) if query_grams and doc_grams else 0.0
+            scored.append((index, score))
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        if top_n is not None:
+            scored = scored[:top_n]
+        return SimpleNamespace(
+            results=[SimpleNamespace(index=index, relevance_score=score) for index, score in scored],
+            meta=SimpleNamespace(billed_units=SimpleNamespace(search_units=1)),
+        )
+
+
+class StubProviders:
+    """providers.set_providers() 用のスタブ一式"""
+
+    def __init__(self, latency: Optional[StubLatency] = None, vocabulary: Optional[List[str]] = None, dimensions: int = 256):
+        self.latency = latency or StubLatency()
+        self.vocabulary = vocabulary or []
+        self.dimensions = dimensions
+
+    def embeddings(self, model: str, api_key: str) -> StubEmbeddings:
+        return StubEmbeddings(dimensions=self.dimensions, latency=self.latency)
+
+    def chat_model(self, model: str, api_key: str, temperature: Optional[float] = None) -> StubChatModel:
+        return StubChatModel(vocabulary=self.vocabulary, latency=self.latency)
+
+    def rerank_client(self, api_key: str) -> StubRerankClient:
+        return StubRerankClient(latency=self.latency)
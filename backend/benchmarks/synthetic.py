@@ -0,0 +1,208 @@
+"""
+合成実験ノート生成
+
+リポジトリの実験ノート形式（# ID / ## 目的・背景 / ## 材料 / ## 方法 / ## 結果）で
+シードから決定的にノートを生成する。材料には表記ゆれ・丸数字の省略形を含め、
+正規化・省略形展開・キーワード検索が実データに近い負荷になるようにする。
+"""
+
+import random
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+
+# 材料（正式名, 表記ゆれ）
+MATERIALS = [
+    ("エタノール", ["EtOH", "エチルアルコール"]),
+    ("メタノール", ["MeOH"]),
+    ("アセトン", ["acetone"]),
+    ("蒸留水", ["純水", "DW"]),
+    ("水酸化ナトリウム", ["NaOH", "苛性ソーダ"]),
+    ("塩酸", ["HCl"]),
+    ("硫酸", ["H2SO4"]),
+    ("酢酸エチル", ["AcOEt", "EtOAc"]),
+    ("ジクロロメタン", ["DCM", "塩化メチレン"]),
+    ("テトラヒドロフラン", ["THF"]),
+    ("トルエン", ["toluene"]),
+    ("ヘキサン", ["n-ヘキサン"]),
+    ("炭酸カリウム", ["K2CO3"]),
+    ("塩化ナトリウム", ["NaCl", "食塩"]),
+    ("硫酸マグネシウム", ["MgSO4"]),
+    ("酢酸", ["AcOH"]),
+    ("ジメチルスルホキシド", ["DMSO"]),
+    ("N,N-ジメチルホルムアミド", ["DMF"]),
+    ("トリエチルアミン", ["TEA", "Et3N"]),
+    ("パラジウム炭素", ["Pd/C"]),
+    ("水素化ホウ素ナトリウム", ["NaBH4"]),
+    ("過酸化水素", ["H2O2"]),
+    ("アンモニア水", ["NH3aq"]),
+    ("ポリエチレングリコール", ["PEG"]),
+    ("シリカゲル", ["SiO2"]),
+    ("活性炭", ["チャコール"]),
+    ("グルコース", ["ブドウ糖"]),
+    ("クエン酸", ["citric acid"]),
+    ("リン酸緩衝液", ["PBS"]),
+    ("界面活性剤A", ["SurfA"]),
+]
+
+AMOUNTS = ["10 mL", "25 mL", "50 mL", "100 mL", "1.0 g", "2.5 g", "5.0 g", "0.5 mmol", "1.2 eq", "3 滴"]
+
+OPERATIONS = [
+    "{a}に{b}を加えて撹拌した",
+    "{a}と{b}を1:1で混合した",
+    "{a}を{temp}で{time}加熱還流した",
+    "{a}を氷浴で冷却しながら{b}を滴下した",
+    "{a}をロータリーエバポレーターで減圧濃縮した",
+    "{a}で抽出し、{b}で洗浄した",
+    "{a}を{b}で乾燥後、ろ過した",
+    "{a}をカラムクロマトグラフィー（{b}）で精製した",
+    "{a}を{temp}で{time}静置した",
+    "{a}のpHを{b}で調整した",
+]
+
+TEMPERATURES = ["室温", "0 ℃", "40 ℃", "60 ℃", "80 ℃", "100 ℃"]
+DURATIONS = ["10分", "30分", "1時間", "3時間", "12時間", "24時間"]
+
+PURPOSES = [
+    "{a}を用いた{target}の合成条件を検討する",
+    "{target}の収率向上を目的として{a}の添加量を最適化する",
+    "{a}と{b}の溶媒比が{target}の純度に与える影響を調べる",
+    "{target}の再結晶条件を{a}系で確立する",
+    "{target}の安定性を{a}存在下で評価する",
+]
+
+TARGETS = ["化合物A", "中間体B", "ポリマーC", "ナノ粒子D", "錯体E", "誘導体F", "触媒G", "塩H"]
+
+RESULTS = [
+    "{target}を収率{yield_}%で得た。",
+    "{target}の純度は{yield_}%であった（HPLC）。",
+    "反応は完結せず、原料が残存した。{target}の収率は{yield_}%に留まった。",
+    "{target}を白色固体として得た（収率{yield_}%）。",
+]
+
+CIRCLED = "①②③④⑤⑥⑦⑧⑨⑩"
+
+
+@dataclass
+class SyntheticNote:
+    """合成ノート"""
+    note_id: str
+    content: str
+    materials: List[str]  # 正式名（検索クエリ生成・正解判定用）
+    target: str
+
+
+def _material_name(rng: random.Random, canonical: str, variants: List[str], variant_rate: float) -> str:
+    if variants and rng.random() < variant_rate:
+        return rng.choice(variants)
+    return canonical
+
+
+def generate_note(index: int, seed: int = 0, variant_rate: float = 0.3, id_prefix: str = "ID-BENCH") -> SyntheticNote:
+    """
+    1件の合成ノートを生成（同じ index・seed からは常に同じノート）
+
+    Args:
+        index: ノート番号
+        seed: 乱数シード
+        variant_rate: 材料名を表記ゆれで書く割合
+        id_prefix: ノートIDの接頭辞
+
+    Returns:
+        SyntheticNote
+    """
+    rng = random.Random(seed * 1_000_003 + index)
+    picked = rng.sample(MATERIALS, rng.randint(3, 7))
+    names = [_material_name(rng, canonical, variants, variant_rate) for canonical, variants in picked]
+    target = rng.choice(TARGETS)
+
+    lines = [f"# {id_prefix}-{index:06d}", ""]
+
+    lines.append("## 目的・背景")
+    lines.append(rng.choice(PURPOSES).format(a=names[0], b=names[1], target=target))
+    lines.append("")
+
+    lines.append("## 材料")
+    for i, name in enumerate(names):
+        lines.append(f"- {CIRCLED[i]} {name}: {rng.choice(AMOUNTS)}")
+    lines.append("")
+
+    lines.append("## 方法")
+    for step in range(1, rng.randint(4, 8) + 1):
+        a, b = rng.sample(range(len(names)), 2)
+        # 半分程度の手順は省略形（丸数字）で材料を参照する
+        a_ref = CIRCLED[a] if rng.random() < 0.5 else names[a]
+        b_ref = CIRCLED[b] if rng.random() < 0.5 else names[b]
+        operation = rng.choice(OPERATIONS).format(
+            a=a_ref, b=b_ref, temp=rng.choice(TEMPERATURES), time=rng.choice(DURATIONS)
+        )
+        lines.append(f"{step}. {operation}")
+    lines.append("")
+
+    lines.append("## 結果")
+    lines.append(rng.choice(RESULTS).format(target=target, yield_=rng.randint(5, 98)))
+    lines.append("")
+
+    return SyntheticNote(
+        note_id=f"{id_prefix}-{index:06d}",
+        content="\n".join(lines),
+        materials=[canonical for canonical, _ in picked],
+        target=target,
+    )
+
+
+def generate_notes(count: int, seed: int = 0, variant_rate: float = 0.3, id_prefix: str = "ID-BENCH") -> Iterator[SyntheticNote]:
+    """count件の合成ノートを順に生成（全件をメモリに持たない）"""
+    for index in range(count):
+        yield generate_note(index, seed=seed, variant_rate=variant_rate, id_prefix=id_prefix)
+
+
+def generate_query(index: int, seed: int = 0, source: Optional[SyntheticNote] = None) -> Dict[str, str]:
+    """
+    検索条件を生成
+
+    Args:
+        index: クエリ番号
+        seed: 乱数シード
+        source: 指定時はこのノートに似た条件で検索する
+
+    Returns:
+        SearchAgent.run() の入力（{"type", "purpose", "materials", "methods", "instruction"}）
+    """
+    rng = random.Random(seed * 7_919 + index + 1)
+    if source is not None:
+        materials = source.materials
+        target = source.target
+    else:
+        materials = [canonical for canonical, _ in rng.sample(MATERIALS, rng.randint(2, 5))]
+        target = rng.choice(TARGETS)
+
+    purpose = rng.choice(PURPOSES).format(a=materials[0], b=materials[-1], target=target)
+    materials_text = "\n".join(f"- {name}: {rng.choice(AMOUNTS)}" for name in materials)
+    methods_text = "\n".join(
+        f"{i}. " + rng.choice(OPERATIONS).format(
+            a=rng.choice(materials), b=rng.choice(materials),
+            temp=rng.choice(TEMPERATURES), time=rng.choice(DURATIONS)
+        )
+        for i in range(1, 4)
+    )
+    # 半分のクエリは重点指示付きの再検索（分類ノードでLLMを呼ぶ）
+    instruction = "" if index % 2 == 0 else f"{materials[0]}の使用量が近いノートを優先"
+
+    return {
+        "type": "refinement" if instruction else "initial_search",
+        "purpose": purpose,
+        "materials": materials_text,
+        "methods": methods_text,
+        "instruction": instruction,
+    }
+
+
+def vocabulary() -> List[str]:
+    """合成ノートに現れる語彙（スタブLLMがクエリ生成に使う）"""
+    words = []
+    for canonical, variants in MATERIALS:
+        words.append(canonical)
+        words.extend(variants)
+    words.extend(TARGETS)
+    return words
@@ -0,0 +1,226 @@
+"""
+外部API呼び出しの記録・再生モジュール（v3.3.0）
+
+PROVIDER_MODE=record / replay のとき、providers.py が生成するEmbedding・チャットLLM・リランカーを
+このモジュールのラッパーで包み、リクエストとレスポンスの組をカセットファイル（JSON Lines）に保存・再生する。
+
+- record: カセットにあればそれを返し、なければ実際に呼び出して追記する
+- replay: カセットのみを使用する（未記録の呼び出しは CassetteMissError）
+
+キーはリクエスト内容（種別・モデル・入力）のSHA-256。Embeddingはテキスト単位で記録するため、
+バッチサイズが変わっても再生できる。再生時は実クライアントを生成しないため、APIキーは不要。
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage
+
+
+logger = logging.getLogger(__name__)
+
+
+class CassetteMissError(LookupError):
+    """replay モードで未記録の呼び出しが行われた"""
+
+
+class Cassette:
+    """リクエストキー → レスポンスの記録ファイル"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("Skipping corrupt cassette line in %s", self.path)
+                    continue
+                self._entries[entry["key"]] = entry["response"]
+        logger.info("Loaded %s recorded calls from %s", len(self._entries), self.path)
+
+    @staticmethod
+    def key(kind: str, request: Dict) -> str:
+        payload = json.dumps({"kind": kind, "request": request}, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key: str, kind: str, model: Optional[str], response: Dict) -> None:
+        line = json.dumps({"key": key, "kind": kind, "model": model, "response": response}, ensure_ascii=False)
+        with self._lock:
+            self._entries[key] = response
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+_cassettes: Dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(path: str) -> Cassette:
+    """パスごとのカセットのシングルトンインスタンスを取得"""
+    with _cassettes_lock:
+        cassette = _cassettes.get(path)
+        if cassette is None:
+            cassette = Cassette(path)
+            _cassettes[path] = cassette
+        return cassette
+
+
+class _Recorder:
+    """実クライアントを必要になった時点で生成し、記録・再生を行う共通処理"""
+
+    def __init__(self, cassette: Cassette, mode: str, factory: Callable[[], object]):
+        self.cassette = cassette
+        self.mode = mode
+        self._factory = factory
+        self._inner = None
+        self._inner_lock = threading.Lock()
+
+    @property
+    def inner(self):
+        with self._inner_lock:
+            if self._inner is None:
+                self._inner = self._factory()
+            return self._inner
+
+    def lookup(self, kind: str, request: Dict) -> tuple:
+        """(key, 記録済みレスポンス or None)"""
+        key = Cassette.key(kind, request)
+        response = self.cassette.get(key)
+        if response is None and self.mode == "replay":
+            raise CassetteMissError(f"No recorded {kind} call for this request in {self.cassette.path}")
+        return key, response
+
+
+def _prompt_payload(prompt):
+    """invoke() に渡されたプロンプトをキー用に直列化（文字列 or メッセージのリスト）"""
+    if isinstance(prompt, str):
+        return prompt
+    if isinstance(prompt, (list, tuple)):
+        return [_prompt_payload(message) for message in prompt]
+    return {"type": getattr(prompt, "type", type(prompt).__name__), "content": getattr(prompt, "content", str(prompt))}
+
+
+class RecordedEmbeddings(Embeddings):
+    """Embeddingの記録・再生（テキスト単位）"""
+
+    def __init__(self, recorder: _Recorder, model: str):
+        self.recorder = recorder
+        self.model = model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors: List[Optional[List[float]]] = []
+        missing: Dict[str, List[int]] = {}  # {text: [位置]}
+        keys: Dict[str, str] = {}
+        for i, text in enumerate(texts):
+            key, response = self.recorder.lookup("embeddings", {"model": self.model, "text": text})
+            vectors.append(response["vector"] if response is not None else None)
+            if response is None:
+                missing.setdefault(text, []).append(i)
+                keys[text] = key
+
+        if not missing:
+            return vectors
+
+        missing_texts = list(missing)
+        embedded = self.recorder.inner.embed_documents(missing_texts)
+        for text, vector in zip(missing_texts, embedded):
+            self.recorder.cassette.put(keys[text], "embeddings", self.model, {"vector": vector})
+            for i in missing[text]:
+                vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class RecordedChatModel:
+    """チャットLLMの記録・再生（.invoke() のみ対応）"""
+
+    def __init__(self, recorder: _Recorder, model: str, temperature: Optional[float]):
+        self.recorder = recorder
+        self.model = model
+        self.temperature = temperature
+
+    def invoke(self, prompt, *args, **kwargs) -> AIMessage:
+        request = {"model": self.model, "temperature": self.temperature, "prompt": _prompt_payload(prompt)}
+        key, response = self.recorder.lookup("chat", request)
+        if response is None:
+            message = self.recorder.inner.invoke(prompt, *args, **kwargs)
+            response = {
+                "content": message.content,
+                "usage_metadata": dict(getattr(message, "usage_metadata", None) or {}) or None,
+            }
+            self.recorder.cassette.put(key, "chat", self.model, response)
+            return message
+        return AIMessage(content=response["content"], usage_metadata=response.get("usage_metadata"))
+
+
+class RecordedRerankClient:
+    """cohere.Client.rerank の記録・再生"""
+
+    def __init__(self, recorder: _Recorder):
+        self.recorder = recorder
+
+    def rerank(self, query: str, documents: List[str], top_n: Optional[int] = None, model: Optional[str] = None, **kwargs):
+        request = {"model": model, "query": query, "documents": documents, "top_n": top_n}
+        key, response = self.recorder.lookup("rerank", request)
+        if response is None:
+            result = self.recorder.inner.rerank(query=query, documents=documents, top_n=top_n, model=model, **kwargs)
+            billed = getattr(getattr(result, "meta", None), "billed_units", None)
+            response = {
+                "results": [{"index": r.index, "relevance_score": r.relevance_score} for r in result.results],
+                "search_units": getattr(billed, "search_units", None),
+            }
+            self.recorder.cassette.put(key, "rerank", model, response)
+            return result
+        return SimpleNamespace(
+            results=[SimpleNamespace(index=r["index"], relevance_score=r["relevance_score"]) for r in response["results"]],
+            meta=SimpleNamespace(billed_units=SimpleNamespace(search_units=response.get("search_units"))),
+        )
+
+
+class RecordingProviders:
+    """providers のラッパー（実クライアントは未記録の呼び出しがあった時点で inner から生成）"""
+
+    def __init__(self, inner, cassette: Cassette, mode: str):
+        self.inner = inner
+        self.cassette = cassette
+        self.mode = mode
+
+    def embeddings(self, model: str, api_key: str) -> RecordedEmbeddings:
+        recorder = _Recorder(self.cassette, self.mode, lambda: self.inner.embeddings(model, api_key))
+        return RecordedEmbeddings(recorder, model)
+
+    def chat_model(self, model: str, api_key: str, temperature: Optional[float] = None) -> RecordedChatModel:
+        recorder = _Recorder(self.cassette, self.mode, lambda: self.inner.chat_model(model, api_key, temperature))
+        return RecordedChatModel(recorder, model, temperature)
+
+    def rerank_client(self, api_key: str) -> RecordedRerankClient:
+        recorder = _Recorder(self.cassette, self.mode, lambda: self.inner.rerank_client(api_key))
+        return RecordedRerankClient(recorder)
@@ -0,0 +1,364 @@
+"""
+ChromaDB クライアント・コレクションハンドルのプール（v3.3.0）
+
+機能:
+- 永続化ディレクトリごとに PersistentClient を1つだけ作成して共有
+- (コレクション名, embeddingモデル, APIキー) ごとに Chroma vectorstore を再利用
+- コレクションのドキュメント数と chroma_db_config.json をキャッシュ（検索経路でファイル書き込みをしない）
+- アイドル状態のディレクトリ（チーム）を LRU で解放
+- ディレクトリ単位の読み取りゲート（同期によるファイル差し替え前に実行中の検索を待つ）
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Tuple
+
+from config import config
+from tracing import record_cache
+
+logger = logging.getLogger(__name__)
+
+
+# 最終利用からこの秒数以内のディレクトリはLRU解放しない（利用中のハンドルを壊さないため）
+POOL_EVICT_MIN_IDLE_SECONDS = 60
+
+CONFIG_FILE_NAME = "chroma_db_config.json"
+
+# ディレクトリごとに保持するvectorstore数の上限（超えたら最も古く使われたものから破棄）
+MAX_VECTORSTORES_PER_DIRECTORY = 64
+
+
+def _embeddings_fingerprint(embeddings) -> str:
+    """
+    Embedding関数の同一性キー（クラス・モデル名・APIキーのハッシュ）
+
+    インスタンスごとに別キーにすると、リクエストごとに作られるEmbedding関数の数だけ
+    vectorstoreが増えるため、同じクラス・モデル・APIキーのものは同一とみなす。
+    """
+    cls = type(embeddings)
+    model = getattr(embeddings, "model", None)
+    api_key = getattr(embeddings, "openai_api_key", None)
+    if hasattr(api_key, "get_secret_value"):
+        api_key = api_key.get_secret_value()
+    key_hash = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16] if api_key else "-"
+    return f"{cls.__module__}.{cls.__qualname__}:{model}:{key_hash}"
+
+
+class _DirectoryEntry:
+    """永続化ディレクトリ単位のキャッシュ"""
+
+    def __init__(self, client):
+        self.client = client
+        self.vectorstores: "OrderedDict[Tuple[str, str], object]" = OrderedDict()  # {(collection_name, fingerprint): Chroma}（LRU順）
+        self.counts: Dict[str, Tuple[int, float]] = {}  # {collection_name: (count, cached_at)}
+        self.config: Optional[Dict] = None  # chroma_db_config.json の内容
+        self.last_used = time.monotonic()
+
+
+class _DirectoryGate:
+    """
+    ディレクトリの読み取り/排他ゲート
+
+    検索は reading() の間ファイルを参照し、同期・退避は exclusive() で実行中の検索の完了を待つ。
+    排他待ちの間は新しい読み取りを待たせる（ただし既に読み取り中のスレッドの再入は通す）。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._exclusive = False
+        self._waiting = 0
+        self._local = threading.local()
+
+    @property
+    def held_by_current_thread(self) -> bool:
+        return getattr(self._local, "depth", 0) > 0
+
+    @property
+    def busy(self) -> bool:
+        with self._cond:
+            return bool(self._readers or self._exclusive)
+
+    @contextmanager
+    def reading(self) -> Iterator[None]:
+        depth = getattr(self._local, "depth", 0)
+        with self._cond:
+            if depth == 0:
+                while self._exclusive or self._waiting:
+                    self._cond.wait()
+            self._readers += 1
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        with self._cond:
+            self._waiting += 1
+            try:
+                while self._exclusive or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting -= 1
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
+
+
+class ChromaPool:
+    """ChromaDBクライアント・vectorstoreのプール"""
+
+    def __init__(self, max_directories: Optional[int] = None):
+        """
+        Args:
+            max_directories: 同時に保持する永続化ディレクトリ数の上限（デフォルト: config.CHROMA_POOL_MAX_DIRECTORIES）
+        """
+        self.max_directories = max_directories or config.CHROMA_POOL_MAX_DIRECTORIES
+        self._entries: "OrderedDict[str, _DirectoryEntry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._vectorstore_paths: Dict[int, str] = {}  # {id(vectorstore): ディレクトリ}（count() の逆引き用）
+        self._gates: Dict[str, _DirectoryGate] = {}
+        # 解放（ファイル差し替え・削除）の回数。vectorstoreの保持側が取り直しの要否を判定する
+        self._epochs: Dict[str, int] = {}
+
+    # === クライアント・vectorstore ===
+
+    def _entry(self, path: str) -> _DirectoryEntry:
+        """ディレクトリのエントリを取得（なければクライアントを作成）"""
+        path = str(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                import chromadb
+                Path(path).mkdir(parents=True, exist_ok=True)
+                entry = _DirectoryEntry(chromadb.PersistentClient(path=path))
+                self._entries[path] = entry
+                self._evict_idle(keep=path)
+            entry.last_used = time.monotonic()
+            self._entries.move_to_end(path)
+            return entry
+
+    def get_client(self, path: str):
+        """ディレクトリの共有PersistentClientを取得"""
+        return self._entry(path).client
+
+    def get_vectorstore(self, path: str, collection_name: str, embeddings):
+        """
+        共有クライアント上のChroma vectorstoreを取得（同じコレクション・Embedding設定なら再利用）
+
+        Args:
+            path: 永続化ディレクトリ
+            collection_name: コレクション名
+            embeddings: Embedding関数
+
+        Returns:
+            Chroma vectorstore
+        """
+        from langchain_chroma import Chroma
+
+        key = (collection_name, _embeddings_fingerprint(embeddings))
+        with self._lock:
+            entry = self._entry(path)
+            vectorstore = entry.vectorstores.get(key)
+            record_cache("chroma_vectorstore", vectorstore is not None)
+            if vectorstore is None:
+                vectorstore = Chroma(
+                    collection_name=collection_name,
+                    embedding_function=embeddings,
+                    client=entry.client
+                )
+                entry.vectorstores[key] = vectorstore
+                self._vectorstore_paths[id(vectorstore)] = str(path)
+                while len(entry.vectorstores) > MAX_VECTORSTORES_PER_DIRECTORY:
+                    _, evicted = entry.vectorstores.popitem(last=False)
+                    self._vectorstore_paths.pop(id(evicted), None)
+            else:
+                entry.vectorstores.move_to_end(key)
+            return vectorstore
+
+    # === ドキュメント数キャッシュ ===
+
+    def count(self, vectorstore) -> int:
+        """
+        コレクションのドキュメント数（CHROMA_COUNT_CACHE_TTL秒キャッシュ、書き込み時に無効化）
+        """
+        collection = vectorstore._collection
+        path = self._path_of(vectorstore)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(path) if path else None
+            cached = entry.counts.get(collection.name) if entry else None
+            if cached and now - cached[1] < config.CHROMA_COUNT_CACHE_TTL:
+                record_cache("chroma_count", True)
+                return cached[0]
+
+        record_cache("chroma_count", False)
+        count = collection.count()
+        with self._lock:
+            if entry is not None:
+                entry.counts[collection.name] = (count, now)
+        return count
+
+    def invalidate_counts(self, path: Optional[str] = None) -> None:
+        """ドキュメント数キャッシュを無効化（path未指定時は全ディレクトリ）"""
+        with self._lock:
+            entries = [self._entries.get(str(path))] if path else list(self._entries.values())
+            for entry in entries:
+                if entry is not None:
+                    entry.counts.clear()
+
+    def _path_of(self, vectorstore) -> Optional[str]:
+        with self._lock:
+            return self._vectorstore_paths.get(id(vectorstore))
+
+    def _forget_vectorstores(self, entry: Optional[_DirectoryEntry]) -> None:
+        """エントリのvectorstoreの逆引きを削除（ロック内で呼ぶ）"""
+        if entry is None:
+            return
+        for vectorstore in entry.vectorstores.values():
+            self._vectorstore_paths.pop(id(vectorstore), None)
+        entry.vectorstores.clear()
+
+    # === 設定ファイルキャッシュ ===
+
+    def read_config(self, path: str) -> Dict:
+        """chroma_db_config.json を取得（初回のみファイルを読む）"""
+        with self._lock:
+            entry = self._entry(path)
+            if entry.config is None:
+                config_path = Path(path) / CONFIG_FILE_NAME
+                try:
+                    with open(config_path, 'r') as f:
+                        entry.config = json.load(f)
+                except FileNotFoundError:
+                    entry.config = {}
+                except Exception as e:
+                    logger.warning("ChromaDB設定の読み込みに失敗: %s", e)
+                    entry.config = {}
+            return dict(entry.config)
+
+    def update_config(self, path: str, **values) -> Dict:
+        """
+        chroma_db_config.json を更新（値が変わらない場合は書き込まない）
+
+        Returns:
+            更新前の設定
+        """
+        with self._lock:
+            previous = self.read_config(path)
+            if all(previous.get(k) == v for k, v in values.items()):
+                return previous
+
+            updated = {**previous, **values, "updated_at": datetime.now().isoformat()}
+            config_path = Path(path) / CONFIG_FILE_NAME
+            try:
+                config_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(config_path, 'w') as f:
+                    json.dump(updated, f, indent=2)
+                self._entries[str(path)].config = updated
+            except Exception as e:
+                logger.warning("チーム設定の保存に失敗: %s", e)
+            return previous
+
+    # === 読み取りゲート ===
+
+    def _gate(self, path: str) -> _DirectoryGate:
+        with self._lock:
+            return self._gates.setdefault(str(path), _DirectoryGate())
+
+    def reading(self, path: str):
+        """検索中にディレクトリのファイルを差し替えさせない（with文で使用）"""
+        return self._gate(path).reading()
+
+    def is_reading(self, path: str) -> bool:
+        """現在のスレッドがディレクトリを読み取り中か"""
+        with self._lock:
+            gate = self._gates.get(str(path))
+        return gate is not None and gate.held_by_current_thread
+
+    def quiesce(self, path: str):
+        """実行中の検索の完了を待ち、終わるまで新しい検索を待たせる（with文で使用、差し替え・削除時）"""
+        return self._gate(path).exclusive()
+
+    def epoch(self, path: str) -> int:
+        """ディレクトリの解放・ハンドル破棄の回数（変わっていれば取得済みのvectorstoreは無効）"""
+        with self._lock:
+            return self._epochs.get(str(path), 0)
+
+    # === 解放 ===
+
+    def reset_handles(self, path: str) -> None:
+        """コレクション削除後などにvectorstore・キャッシュを破棄（クライアントは維持）"""
+        with self._lock:
+            entry = self._entries.get(str(path))
+            if entry is not None:
+                self._forget_vectorstores(entry)
+                entry.counts.clear()
+                entry.config = None
+            self._epochs[str(path)] = self._epochs.get(str(path), 0) + 1
+
+    def release(self, path: str) -> None:
+        """ディレクトリのクライアントとキャッシュを解放（ディレクトリ削除・差し替え前に呼ぶ）"""
+        with self._lock:
+            self._forget_vectorstores(self._entries.pop(str(path), None))
+            self._epochs[str(path)] = self._epochs.get(str(path), 0) + 1
+        _stop_shared_system(str(path))
+
+    def _evict_idle(self, keep: str) -> None:
+        """上限を超えた分をLRU順に解放（最近利用されたディレクトリは残す）"""
+        now = time.monotonic()
+        for path in list(self._entries):
+            if len(self._entries) <= self.max_directories:
+                return
+            if path == keep or now - self._entries[path].last_used < POOL_EVICT_MIN_IDLE_SECONDS:
+                continue
+            gate = self._gates.get(path)
+            if gate is not None and gate.busy:
+                continue
+            self._forget_vectorstores(self._entries.pop(path))
+            self._epochs[path] = self._epochs.get(path, 0) + 1
+            _stop_shared_system(path)
+            logger.info("ChromaDBクライアントを解放（LRU）: %s", path)
+
+
+def _stop_shared_system(path: str) -> None:
+    """chromadbがプロセス内にキャッシュしているSystemを停止・破棄"""
+    try:
+        from chromadb.api.client import SharedSystemClient
+        system = SharedSystemClient._identifier_to_system.pop(path, None)
+        if system is not None:
+            system.stop()
+    except Exception as e:
+        logger.warning("ChromaDBクライアントの解放に失敗 (%s): %s", path, e)
+
+
+# シングルトンインスタンス
+_chroma_pool = None
+_chroma_pool_lock = threading.Lock()
+
+
+def get_chroma_pool() -> ChromaPool:
+    """ChromaDBプールのシングルトンインスタンスを取得"""
+    global _chroma_pool
+    with _chroma_pool_lock:
+        if _chroma_pool is None:
+            _chroma_pool = ChromaPool()
+        return _chroma_pool
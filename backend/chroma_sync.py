@@ -1,121 +1,978 @@
 """
 ChromaDB の GCS 同期モジュール
 起動時にGCSからダウンロード、更新時にアップロード
+v3.3.0: チャンク単位の差分同期
 """
 import os
+import io
+import gzip
 import json
+import hashlib
+import logging
 import tempfile
 import tarfile
 import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
 from storage import storage
 from config import config
+from chroma_pool import get_chroma_pool
+from generations import bump_generation
 
+logger = logging.getLogger(__name__)
 
-def sync_chroma_from_gcs(local_chroma_path: str = None):
+
+# ============================================
+# 差分同期（v3.3.0）
+# ファイルを固定長チャンクに分割し、SHA-256をキーに保存する（content-addressed）
+#   {prefix}/manifest.json          ... ファイルごとのチャンクハッシュ一覧
+#   {prefix}/objects/{hh}/{hash}    ... チャンク本体
+#   {prefix}/gc_pending.json        ... 参照されなくなったチャンク（1世代後に削除）
+# アップロードはリモートにないチャンクのみ、ダウンロードはローカルにないチャンクのみ転送する。
+# ============================================
+
+# 旧形式（全体tar.gz）のパス。差分マニフェストがない場合の読み込みフォールバック
+LEGACY_TARBALL_NAME = "chroma_db.tar.gz"
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+GC_PENDING_NAME = "gc_pending.json"  # 次回のアップロードで削除するチャンク
+
+
+def _is_gcs_mode() -> bool:
+    return os.getenv("STORAGE_TYPE", "local") == "gcs"
+
+
+def _chunk_size() -> int:
+    return max(1, config.CHROMA_SYNC_CHUNK_MB) * 1024 * 1024
+
+
+def _object_path(remote_prefix: str, chunk_hash: str) -> str:
+    return f"{remote_prefix}/objects/{chunk_hash[:2]}/{chunk_hash}"
+
+
+def _local_state_path(local_chroma_path: str) -> str:
+    """ハッシュキャッシュの保存先（同期対象に含めないようChromaDBフォルダの外に置く）"""
+    return f"{local_chroma_path.rstrip(os.sep)}.sync-state.json"
+
+
+def _load_local_state(local_chroma_path: str) -> Dict:
+    try:
+        with open(_local_state_path(local_chroma_path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def _save_local_state(local_chroma_path: str, state: Dict) -> None:
+    try:
+        with open(_local_state_path(local_chroma_path), 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+    except Exception as e:
+        logger.warning("同期状態の保存に失敗: %s", e)
+
+
+def _hash_file_chunks(file_path: Path) -> List[str]:
+    chunk_size = _chunk_size()
+    hashes = []
+    with open(file_path, 'rb') as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            hashes.append(hashlib.sha256(data).hexdigest())
+    return hashes
+
+
+def build_local_manifest(local_chroma_path: str) -> Dict:
     """
-    GCSからChromaDBをダウンロードしてローカルに展開
+    ローカルのChromaDBフォルダのマニフェストを作成
 
-    Args:
-        local_chroma_path: ローカルのChromaDBパス（デフォルト: config.CHROMA_DB_FOLDER）
+    サイズと更新時刻が前回と同じファイルはハッシュを再計算しない。
+
+    Returns:
+        {"version": 1, "chunk_size": int, "files": {相対パス: {"size": int, "chunks": [hash, ...]}}}
     """
-    local_chroma_path = local_chroma_path or config.CHROMA_DB_FOLDER
+    root = Path(local_chroma_path)
+    state = _load_local_state(local_chroma_path)
+    cached = state.get("files", {}) if state.get("chunk_size") == _chunk_size() else {}
+
+    files = {}
+    new_state_files = {}
+    if root.exists():
+        for file_path in sorted(p for p in root.rglob("*") if p.is_file()):
+            rel = file_path.relative_to(root).as_posix()
+            stat = file_path.stat()
+            entry = cached.get(rel)
+            if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                chunks = entry["chunks"]
+            else:
+                chunks = _hash_file_chunks(file_path)
+            files[rel] = {"size": stat.st_size, "chunks": chunks}
+            new_state_files[rel] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "chunks": chunks}
+
+    _save_local_state(local_chroma_path, {"chunk_size": _chunk_size(), "files": new_state_files})
+    return {"version": MANIFEST_VERSION, "chunk_size": _chunk_size(), "files": files}
+
+
+def _load_remote_manifest(remote_prefix: str) -> Optional[Dict]:
+    manifest_path = f"{remote_prefix}/{MANIFEST_NAME}"
+    if not storage.exists(manifest_path):
+        return None
+    return json.loads(storage.read_file(manifest_path))
+
+
+def _manifest_hashes(manifest: Optional[Dict]) -> Set[str]:
+    if not manifest:
+        return set()
+    return {h for entry in manifest.get("files", {}).values() for h in entry["chunks"]}
+
+
+def _parallel(func, items: List, workers: int = None) -> List:
+    """itemsにfuncを並列適用（例外は呼び出し元に送出）"""
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=min(workers or config.CHROMA_SYNC_WORKERS, len(items))) as executor:
+        return list(executor.map(func, items))
+
+
+class ChromaSyncConflict(RuntimeError):
+    """アップロード中にローカルのファイルが変更された（マニフェストと内容が一致しない）"""
 
-    # ローカルストレージの場合はスキップ
-    if os.getenv("STORAGE_TYPE", "local") != "gcs":
-        print("ローカルストレージモードのため、GCS同期をスキップ")
-        return
 
-    # GCS上のtarballパス
-    gcs_tarball_path = "chroma_db/chroma_db.tar.gz"
+# アップロード中にファイルが変更された場合にマニフェストを作り直して再試行する回数
+PUSH_ATTEMPTS = 3
 
+
+def _load_gc_pending(remote_prefix: str) -> List[str]:
+    """前回のアップロードで参照されなくなったチャンク（次のアップロードで削除する）"""
+    path = f"{remote_prefix}/{GC_PENDING_NAME}"
     try:
-        # GCSにファイルが存在するか確認
-        if not storage.exists(gcs_tarball_path):
-            print(f"GCSにChromaDBが見つかりません: {gcs_tarball_path}")
-            print("新規作成モードで起動します")
-            Path(local_chroma_path).mkdir(parents=True, exist_ok=True)
-            return
+        if storage.exists(path):
+            return json.loads(storage.read_file(path)).get("chunks", [])
+    except Exception as e:
+        logger.warning("削除予定チャンクの読み込みに失敗: %s", e)
+    return []
+
+
+def _push_chroma_delta_once(local_chroma_path: str, remote_prefix: str) -> Dict:
+    manifest = build_local_manifest(local_chroma_path)
+    remote_manifest = _load_remote_manifest(remote_prefix)
+    remote_hashes = _manifest_hashes(remote_manifest)
+
+    # アップロードが必要なチャンク（ハッシュ → ファイル内の位置）
+    chunk_size = manifest["chunk_size"]
+    missing: Dict[str, Tuple[str, int]] = {}
+    for rel, entry in manifest["files"].items():
+        for index, chunk_hash in enumerate(entry["chunks"]):
+            if chunk_hash not in remote_hashes and chunk_hash not in missing:
+                missing[chunk_hash] = (rel, index * chunk_size)
+
+    def upload(item: Tuple[str, Tuple[str, int]]) -> int:
+        chunk_hash, (rel, offset) = item
+        with open(Path(local_chroma_path) / rel, 'rb') as f:
+            f.seek(offset)
+            data = f.read(chunk_size)
+        # ハッシュ計算後に書き換えられたチャンクを誤ったキーで保存しない
+        if hashlib.sha256(data).hexdigest() != chunk_hash:
+            raise ChromaSyncConflict(f"アップロード中にファイルが変更されました: {rel}")
+        storage.write_bytes(_object_path(remote_prefix, chunk_hash), data)
+        return len(data)
+
+    uploaded_bytes = sum(_parallel(upload, list(missing.items())))
+
+    # アップロードしなかったチャンクも含め、マニフェスト作成後にファイルが変わっていないことを確認
+    if build_local_manifest(local_chroma_path)["files"] != manifest["files"]:
+        raise ChromaSyncConflict("アップロード中にChromaDBのファイルが変更されました")
+
+    # チャンクが揃ってからマニフェストを更新（読み手が欠けたチャンクを参照しないように）
+    manifest["generation"] = (remote_manifest or {}).get("generation", 0) + 1
+    manifest["updated_at"] = datetime.now().isoformat()
+    storage.write_file(f"{remote_prefix}/{MANIFEST_NAME}", json.dumps(manifest))
+
+    # 不要チャンクの削除は1世代遅らせる（旧マニフェストを読んだ直後の読み手が参照するため）
+    # 前回参照されなくなったチャンクのうち、今回のマニフェストでも参照されないものを削除し、
+    # 今回参照されなくなったチャンクを次回の削除予定として記録する
+    current_hashes = _manifest_hashes(manifest)
+    garbage = [h for h in _load_gc_pending(remote_prefix) if h not in current_hashes and h not in remote_hashes]
+    retired = sorted(remote_hashes - current_hashes)
+
+    def delete(chunk_hash: str) -> Optional[str]:
+        try:
+            storage.delete_file(_object_path(remote_prefix, chunk_hash))
+            return None
+        except Exception as e:
+            logger.warning("不要チャンクの削除に失敗 (%s): %s", chunk_hash[:12], e)
+            return chunk_hash
+
+    failed = [h for h in _parallel(delete, garbage) if h is not None]
+    try:
+        storage.write_file(
+            f"{remote_prefix}/{GC_PENDING_NAME}",
+            json.dumps({"generation": manifest["generation"], "chunks": retired + failed})
+        )
+    except Exception as e:
+        logger.warning("削除予定チャンクの保存に失敗: %s", e)
+
+    return {
+        "uploaded_chunks": len(missing),
+        "uploaded_bytes": uploaded_bytes,
+        "deleted_chunks": len(garbage) - len(failed)
+    }
+
+
+def push_chroma_delta(local_chroma_path: str, remote_prefix: str) -> Dict:
+    """
+    ローカルのChromaDBを差分アップロード
+
+    リモートにないチャンクのみを並列アップロードし、最後にマニフェストを書き込む。
+    アップロードしたチャンクの内容はハッシュで再確認し、途中でファイルが変更された場合は
+    マニフェストを作り直して再試行する（PUSH_ATTEMPTS回失敗したら ChromaSyncConflict）。
+    参照されなくなったチャンクは次のアップロードで削除する（旧マニフェストの読み手のため1世代残す）。
+
+    Returns:
+        {"uploaded_chunks": int, "uploaded_bytes": int, "deleted_chunks": int}
+    """
+    for attempt in range(1, PUSH_ATTEMPTS + 1):
+        try:
+            return _push_chroma_delta_once(local_chroma_path, remote_prefix)
+        except ChromaSyncConflict as e:
+            if attempt == PUSH_ATTEMPTS:
+                raise
+            logger.warning("%s（再試行 %s/%s）", e, attempt, PUSH_ATTEMPTS - 1)
+
 
-        print(f"GCSからChromaDBをダウンロード中: {gcs_tarball_path}")
+def pull_chroma_delta(local_chroma_path: str, remote_prefix: str, manifest: Dict = None) -> Optional[Dict]:
+    """
+    リモートのマニフェストに合わせてローカルのChromaDBを差分更新
 
-        # 一時ファイルにダウンロード
-        with tempfile.NamedTemporaryFile(suffix='.tar.gz', delete=False) as tmp:
-            tmp_path = tmp.name
+    ローカルのいずれかのファイルに既に存在するチャンクは再利用し、
+    不足するチャンクのみを並列ダウンロードする。
+
+    Returns:
+        {"downloaded_chunks": int, "downloaded_bytes": int, "updated_files": int}
+        リモートにマニフェストがない場合はNone
+    """
+    manifest = manifest or _load_remote_manifest(remote_prefix)
+    if manifest is None:
+        return None
+
+    root = Path(local_chroma_path)
+    root.mkdir(parents=True, exist_ok=True)
+    chunk_size = manifest["chunk_size"]
+
+    # ローカルのチャンク所在（ハッシュ → (ファイル, オフセット)）
+    local_manifest = build_local_manifest(local_chroma_path) if chunk_size == _chunk_size() else {"files": {}}
+    local_chunks: Dict[str, Tuple[str, int]] = {}
+    for rel, entry in local_manifest["files"].items():
+        for index, chunk_hash in enumerate(entry["chunks"]):
+            local_chunks.setdefault(chunk_hash, (rel, index * chunk_size))
+
+    changed = {
+        rel: entry for rel, entry in manifest["files"].items()
+        if local_manifest["files"].get(rel, {}).get("chunks") != entry["chunks"]
+    }
+    needed = {h for entry in changed.values() for h in entry["chunks"]} - set(local_chunks)
 
-        storage.download_to_local(gcs_tarball_path, tmp_path)
+    staging = Path(tempfile.mkdtemp(prefix="chroma-sync-", dir=str(root.parent)))
+    try:
+        def download(chunk_hash: str) -> int:
+            data = storage.read_bytes(_object_path(remote_prefix, chunk_hash))
+            if hashlib.sha256(data).hexdigest() != chunk_hash:
+                raise ValueError(f"チャンクのハッシュが一致しません: {chunk_hash}")
+            (staging / chunk_hash).write_bytes(data)
+            return len(data)
+
+        downloaded_bytes = sum(_parallel(download, sorted(needed)))
+
+        # 変更ファイルを一時ファイルに組み立て（元ファイルがチャンク供給元になるため置換は最後）
+        assembled = []
+        for rel, entry in changed.items():
+            tmp_path = staging / f"file-{len(assembled)}"
+            with open(tmp_path, 'wb') as out:
+                for chunk_hash in entry["chunks"]:
+                    if chunk_hash in local_chunks:
+                        src_rel, offset = local_chunks[chunk_hash]
+                        with open(root / src_rel, 'rb') as src:
+                            src.seek(offset)
+                            out.write(src.read(chunk_size))
+                    else:
+                        out.write((staging / chunk_hash).read_bytes())
+            assembled.append((tmp_path, root / rel))
+
+        for tmp_path, dst_path in assembled:
+            dst_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, dst_path)
+            os.chmod(dst_path, 0o644)
+
+        # リモートに存在しないファイルを削除
+        for rel in set(local_manifest["files"]) - set(manifest["files"]):
+            try:
+                (root / rel).unlink()
+            except FileNotFoundError:
+                pass
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
 
-        # 展開先のディレクトリを作成
-        Path(local_chroma_path).parent.mkdir(parents=True, exist_ok=True)
+    # ハッシュキャッシュを更新
+    build_local_manifest(local_chroma_path)
 
-        # tar.gzを展開
-        print(f"ChromaDBを展開中: {local_chroma_path}")
-        with tarfile.open(tmp_path, 'r:gz') as tar:
+    return {"downloaded_chunks": len(needed), "downloaded_bytes": downloaded_bytes, "updated_files": len(changed)}
+
+
+def _pull_legacy_tarball(local_chroma_path: str, remote_prefix: str) -> bool:
+    """旧形式（全体tar.gz）からの復元。存在しない場合はFalse"""
+    gcs_tarball_path = f"{remote_prefix}/{LEGACY_TARBALL_NAME}"
+    if not storage.exists(gcs_tarball_path):
+        return False
+
+    logger.info("旧形式のChromaDBをダウンロード中: %s", gcs_tarball_path)
+
+    # 展開先のディレクトリを作成
+    Path(local_chroma_path).parent.mkdir(parents=True, exist_ok=True)
+
+    # tar.gzをストリーミング展開（アーカイブ内のフォルダ名はChromaDBフォルダ名）
+    logger.info("ChromaDBを展開中: %s", local_chroma_path)
+    with storage.open_reader(gcs_tarball_path) as raw:
+        with tarfile.open(fileobj=raw, mode='r|gz') as tar:
             tar.extractall(Path(local_chroma_path).parent)
 
+    # パーミッションを修正（書き込み可能に）
+    for root, dirs, files in os.walk(local_chroma_path):
+        for d in dirs:
+            os.chmod(os.path.join(root, d), 0o755)
+        for f in files:
+            os.chmod(os.path.join(root, f), 0o644)
+    return True
+
+
+# ============================================
+# スナップショット同期（v3.3.0、CHROMA_SYNC_MODE=snapshot）
+# tarを圧縮しながらアップロードストリームに直接書き込む（一時ファイルを作らない）。
+# 展開もダウンロードストリームから直接行う。
+# ============================================
+
+SNAPSHOT_EXTENSIONS = {"gzip": "tar.gz", "zstd": "tar.zst"}
+
+
+class _CountingWriter(io.RawIOBase):
+    """書き込みバイト数を数えるラッパー"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.count = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.raw.write(data)
+        self.count += len(data)
+        return len(data)
+
+
+def _zstd_available() -> bool:
+    try:
+        import zstandard  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _snapshot_codec() -> str:
+    """アップロードに使うコーデック（zstd指定でもzstandard未インストールならgzip）"""
+    codec = config.CHROMA_SNAPSHOT_CODEC
+    if codec not in SNAPSHOT_EXTENSIONS:
+        logger.warning("不明なスナップショットコーデック: %s（gzipを使用）", codec)
+        return "gzip"
+    if codec == "zstd" and not _zstd_available():
+        logger.warning("zstandardが未インストールのため、gzipでスナップショットを作成します")
+        return "gzip"
+    return codec
+
+
+def _snapshot_codec_order() -> List[str]:
+    """ダウンロード時に確認するコーデックの順（設定中のコーデックを優先）"""
+    preferred = config.CHROMA_SNAPSHOT_CODEC if config.CHROMA_SNAPSHOT_CODEC in SNAPSHOT_EXTENSIONS else "gzip"
+    return [preferred] + [codec for codec in SNAPSHOT_EXTENSIONS if codec != preferred]
+
+
+def _snapshot_path(remote_prefix: str, codec: str) -> str:
+    return f"{remote_prefix}/snapshot.{SNAPSHOT_EXTENSIONS[codec]}"
+
+
+@contextmanager
+def _compress_stream(raw, codec: str):
+    level = config.CHROMA_SNAPSHOT_LEVEL
+    if codec == "zstd":
+        import zstandard
+        compressor = zstandard.ZstdCompressor(
+            level=level if level is not None else 3,
+            threads=config.CHROMA_SNAPSHOT_THREADS
+        )
+        with compressor.stream_writer(raw, closefd=False) as writer:
+            yield writer
+    else:
+        with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=level if level is not None else 6) as writer:
+            yield writer
+
+
+@contextmanager
+def _decompress_stream(raw, codec: str):
+    if codec == "zstd":
+        import zstandard
+        with zstandard.ZstdDecompressor().stream_reader(raw, closefd=False) as reader:
+            yield reader
+    else:
+        with gzip.GzipFile(fileobj=raw, mode="rb") as reader:
+            yield reader
+
+
+def push_chroma_snapshot(local_chroma_path: str, remote_prefix: str) -> Dict:
+    """
+    ローカルのChromaDBを圧縮アーカイブとしてストリーミングアップロード
+
+    Returns:
+        {"codec": str, "uploaded_bytes": int}
+    """
+    codec = _snapshot_codec()
+    snapshot_path = _snapshot_path(remote_prefix, codec)
+
+    with storage.open_writer(snapshot_path) as raw:
+        counter = _CountingWriter(raw)
+        with _compress_stream(counter, codec) as stream:
+            with tarfile.open(fileobj=stream, mode="w|") as tar:
+                tar.add(local_chroma_path, arcname=".")
+
+    # コーデック変更前の古いスナップショットを削除（ダウンロード時に誤って選ばれないように）
+    for other in SNAPSHOT_EXTENSIONS:
+        if other != codec:
+            try:
+                storage.delete_file(_snapshot_path(remote_prefix, other))
+            except Exception:
+                pass
+
+    return {"codec": codec, "uploaded_bytes": counter.count}
+
+
+def pull_chroma_snapshot(local_chroma_path: str, remote_prefix: str) -> Optional[Dict]:
+    """
+    圧縮アーカイブをストリーミングダウンロードしながら展開し、ローカルのChromaDBを差し替える
+
+    Returns:
+        {"codec": str}（スナップショットがない場合はNone）
+    """
+    for codec in _snapshot_codec_order():
+        snapshot_path = _snapshot_path(remote_prefix, codec)
+        if not storage.exists(snapshot_path):
+            continue
+        if codec == "zstd" and not _zstd_available():
+            logger.error("zstandardが未インストールのため展開できません: %s", snapshot_path)
+            continue
+
+        root = Path(local_chroma_path)
+        root.parent.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(prefix="chroma-snapshot-", dir=str(root.parent)))
+        try:
+            with storage.open_reader(snapshot_path) as raw:
+                with _decompress_stream(raw, codec) as stream:
+                    with tarfile.open(fileobj=stream, mode="r|") as tar:
+                        tar.extractall(staging)
+
+            # 展開が完了してから差し替える（途中失敗で既存のコピーを壊さない）
+            previous = root.with_name(f"{root.name}.previous")
+            shutil.rmtree(previous, ignore_errors=True)
+            if root.exists():
+                os.rename(root, previous)
+            os.rename(staging, root)
+            shutil.rmtree(previous, ignore_errors=True)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
         # パーミッションを修正（書き込み可能に）
-        for root, dirs, files in os.walk(local_chroma_path):
-            for d in dirs:
-                os.chmod(os.path.join(root, d), 0o755)
+        for dir_path, dirs, files in os.walk(local_chroma_path):
+            os.chmod(dir_path, 0o755)
             for f in files:
-                os.chmod(os.path.join(root, f), 0o644)
+                os.chmod(os.path.join(dir_path, f), 0o644)
+        return {"codec": codec}
+
+    return None
+
+
+def _pull_delta_logged(local_chroma_path: str, remote_prefix: str) -> bool:
+    stats = pull_chroma_delta(local_chroma_path, remote_prefix)
+    if stats is None:
+        return False
+    logger.info(
+        "ChromaDBの差分同期完了 (%s): %sファイル更新, %sチャンク (%.1fMB) ダウンロード",
+        local_chroma_path, stats['updated_files'], stats['downloaded_chunks'], stats['downloaded_bytes'] / 1024 / 1024
+    )
+    return True
+
+
+def _pull_snapshot_logged(local_chroma_path: str, remote_prefix: str) -> bool:
+    stats = pull_chroma_snapshot(local_chroma_path, remote_prefix)
+    if stats is None:
+        return False
+    logger.info("ChromaDBのスナップショット同期完了 (%s, %s)", local_chroma_path, stats['codec'])
+    return True
+
+
+def _push_chroma(local_chroma_path: str, remote_prefix: str) -> str:
+    """設定中の方式（CHROMA_SYNC_MODE）でアップロードし、結果の要約を返す"""
+    if config.CHROMA_SYNC_MODE == "snapshot":
+        stats = push_chroma_snapshot(local_chroma_path, remote_prefix)
+        return f"スナップショット {stats['codec']} ({stats['uploaded_bytes'] / 1024 / 1024:.1f}MB)"
+
+    stats = push_chroma_delta(local_chroma_path, remote_prefix)
+    return (
+        f"{stats['uploaded_chunks']}チャンク ({stats['uploaded_bytes'] / 1024 / 1024:.1f}MB), "
+        f"不要チャンク削除 {stats['deleted_chunks']}件"
+    )
+
+
+def _pull_chroma(local_chroma_path: str, remote_prefix: str) -> None:
+    """
+    GCSからローカルに同期（失敗時は例外）
+
+    設定中の方式（差分/スナップショット）→ もう一方の方式 → 旧形式tar.gz → 新規作成の順に試す。
+    """
+    pullers = [_pull_delta_logged, _pull_snapshot_logged]
+    if config.CHROMA_SYNC_MODE == "snapshot":
+        pullers.reverse()
+    for puller in pullers:
+        if puller(local_chroma_path, remote_prefix):
+            return
+
+    if _pull_legacy_tarball(local_chroma_path, remote_prefix):
+        logger.info("ChromaDBの同期完了（旧形式）")
+        return
+
+    logger.info("GCSにChromaDBが見つかりません: %s（新規作成モードで起動します）", remote_prefix)
+    Path(local_chroma_path).mkdir(parents=True, exist_ok=True)
+
 
-        # 一時ファイルを削除
-        os.remove(tmp_path)
+def sync_chroma_from_gcs(local_chroma_path: str = None, remote_prefix: str = None):
+    """
+    GCSからChromaDBをダウンロードしてローカルに展開
 
-        print("ChromaDBの同期完了")
+    v3.3.0: マニフェストに基づく差分ダウンロード（旧形式のtar.gzにもフォールバック）
+    通常の取得経路では ensure_chroma_synced() を使用する（毎回の同期を避けるため）。
 
+    Args:
+        local_chroma_path: ローカルのChromaDBパス（デフォルト: config.CHROMA_DB_FOLDER）
+        remote_prefix: GCS上の保存先（デフォルト: config.CHROMA_SYNC_PREFIX）
+    """
+    local_chroma_path = local_chroma_path or config.CHROMA_DB_FOLDER
+    remote_prefix = remote_prefix or config.CHROMA_SYNC_PREFIX
+
+    # ローカルストレージの場合はスキップ
+    if not _is_gcs_mode():
+        logger.info("ローカルストレージモードのため、GCS同期をスキップ")
+        return
+
+    try:
+        _pull_chroma(local_chroma_path, remote_prefix)
     except Exception as e:
-        print(f"ChromaDB同期エラー: {e}")
-        print("新規作成モードで起動します")
+        logger.exception("ChromaDB同期エラー（新規作成モードで起動します）: %s", e)
         Path(local_chroma_path).mkdir(parents=True, exist_ok=True)
 
 
-def sync_chroma_to_gcs(local_chroma_path: str = None):
+def sync_chroma_to_gcs(local_chroma_path: str = None, remote_prefix: str = None):
     """
-    ローカルのChromaDBをtar.gzに圧縮してGCSにアップロード
+    ローカルのChromaDBをGCSにアップロード
+
+    v3.3.0: 変更されたチャンクのみを差分アップロード
+           （CHROMA_SYNC_MODE=snapshot の場合は圧縮アーカイブをストリーミングアップロード）
 
     Args:
         local_chroma_path: ローカルのChromaDBパス（デフォルト: config.CHROMA_DB_FOLDER）
+        remote_prefix: GCS上の保存先（デフォルト: config.CHROMA_SYNC_PREFIX）
     """
     local_chroma_path = local_chroma_path or config.CHROMA_DB_FOLDER
+    remote_prefix = remote_prefix or config.CHROMA_SYNC_PREFIX
 
     # ローカルストレージの場合はスキップ
-    if os.getenv("STORAGE_TYPE", "local") != "gcs":
-        print("ローカルストレージモードのため、GCS同期をスキップ")
+    if not _is_gcs_mode():
+        logger.info("ローカルストレージモードのため、GCS同期をスキップ")
         return
 
     # ChromaDBが存在しない場合はスキップ
     if not os.path.exists(local_chroma_path):
-        print(f"ローカルにChromaDBが見つかりません: {local_chroma_path}")
+        logger.warning("ローカルにChromaDBが見つかりません: %s", local_chroma_path)
         return
 
-    # GCS上のtarballパス
-    gcs_tarball_path = "chroma_db/chroma_db.tar.gz"
-
     try:
-        print(f"ChromaDBを圧縮中: {local_chroma_path}")
+        logger.info("ChromaDBをアップロード中 (%s): %s -> %s", config.CHROMA_SYNC_MODE, local_chroma_path, remote_prefix)
+        logger.info("ChromaDBのGCSアップロード完了: %s", _push_chroma(local_chroma_path, remote_prefix))
 
-        # 一時ファイルに圧縮
-        with tempfile.NamedTemporaryFile(suffix='.tar.gz', delete=False) as tmp:
-            tmp_path = tmp.name
+    except Exception as e:
+        logger.exception("ChromaDBアップロードエラー: %s", e)
+        raise
+
+    # 自分のアップロードを「同期済み」として記録（次回の確認で再ダウンロードしない）
+    _record_synced_version(local_chroma_path, remote_prefix)
+
+
+# ============================================
+# 同期の一回化とバージョン確認（v3.3.0）
+# 初回のみ同期し、以降はCHROMA_SYNC_CHECK_INTERVAL秒ごとにリモートの
+# バージョン（マニフェストのgeneration）を確認して、変わっていた場合だけ再同期する。
+# ============================================
+
+# {ローカルパス: {"version": 同期済みバージョン, "checked_at": 最終確認時刻(monotonic)}}
+_sync_states: Dict[str, Dict] = {}
+_sync_locks: Dict[str, threading.Lock] = {}
+_sync_states_lock = threading.Lock()
+# {ローカルパス: 参照カウント}（取り込み中など、同期による差し替え・退避を禁止するディレクトリ）
+_chroma_holds: Dict[str, int] = {}
+# このプロセスで書き込み、まだアップロードしていないディレクトリ（退避前にアップロードが必要）
+_dirty_paths: Set[str] = set()
 
-        with tarfile.open(tmp_path, 'w:gz') as tar:
-            # chroma_db フォルダ全体を追加
-            tar.add(local_chroma_path, arcname=os.path.basename(local_chroma_path))
+# 同期失敗時に記録するバージョン（次回の確認で必ず再試行させる）
+_SYNC_FAILED = "__failed__"
 
-        print(f"GCSにアップロード中: {gcs_tarball_path}")
-        storage.upload_from_local(tmp_path, gcs_tarball_path)
 
-        # 一時ファイルを削除
-        os.remove(tmp_path)
+def _path_lock(local_chroma_path: str) -> threading.Lock:
+    """ディレクトリ単位のロック（同期・退避・取り込み開始を直列化）"""
+    with _sync_states_lock:
+        return _sync_locks.setdefault(local_chroma_path, threading.Lock())
 
-        print("ChromaDBのGCSアップロード完了")
 
+def _is_held(local_chroma_path: str) -> bool:
+    with _sync_states_lock:
+        return local_chroma_path in _chroma_holds
+
+
+def get_remote_chroma_version(remote_prefix: str) -> Optional[str]:
+    """リモートのChromaDBのバージョン（_pull_chromaと同じ優先順で確認、存在しない場合はNone）"""
+    candidates = [f"{remote_prefix}/{MANIFEST_NAME}"] + [
+        _snapshot_path(remote_prefix, codec) for codec in _snapshot_codec_order()
+    ]
+    if config.CHROMA_SYNC_MODE == "snapshot":
+        candidates = candidates[1:] + candidates[:1]
+    for path in candidates:
+        version = storage.get_version(path)
+        if version is not None:
+            return f"{path.rsplit('/', 1)[-1]}:{version}"
+    legacy_version = storage.get_version(f"{remote_prefix}/{LEGACY_TARBALL_NAME}")
+    return f"legacy:{legacy_version}" if legacy_version is not None else None
+
+
+def _record_synced_version(local_chroma_path: str, remote_prefix: str) -> None:
+    try:
+        version = get_remote_chroma_version(remote_prefix)
     except Exception as e:
-        print(f"ChromaDBアップロードエラー: {e}")
+        logger.warning("リモートバージョンの取得に失敗: %s", e)
+        return
+    with _sync_states_lock:
+        _sync_states[local_chroma_path] = {"version": version, "checked_at": time.monotonic()}
+
+
+def _forget_sync_state(local_chroma_path: str) -> None:
+    with _sync_states_lock:
+        _sync_states.pop(local_chroma_path, None)
+
+
+def _is_fresh(state: Optional[Dict], now: float) -> bool:
+    return state is not None and now - state["checked_at"] < config.CHROMA_SYNC_CHECK_INTERVAL
+
+
+def sync_chroma_if_stale(local_chroma_path: str, remote_prefix: str, force: bool = False) -> bool:
+    """
+    必要な場合のみGCSからChromaDBを同期する
+
+    - このプロセスで未同期: 同期する
+    - 前回確認からCHROMA_SYNC_CHECK_INTERVAL秒以内: 何もしない
+    - それ以外: リモートのバージョンを確認し、変わっていれば再同期
+
+    Args:
+        local_chroma_path: ローカルのChromaDBパス
+        remote_prefix: GCS上の保存先
+        force: Trueの場合は常に同期
+
+    Returns:
+        bool: 同期を実行したか
+    """
+    with _sync_states_lock:
+        if not force and _is_fresh(_sync_states.get(local_chroma_path), time.monotonic()):
+            return False
+
+    pool = get_chroma_pool()
+    with _path_lock(local_chroma_path):
+        # ロック待ちの間に他のスレッドが同期・確認した場合
+        now = time.monotonic()
+        with _sync_states_lock:
+            state = _sync_states.get(local_chroma_path)
+        if not force and _is_fresh(state, now):
+            return False
+
+        # 取り込み中（書き込み途中のファイルを差し替えない）・このスレッドが検索中（自分の完了を待つことになる）は再同期しない
+        if state is not None and (_is_held(local_chroma_path) or pool.is_reading(local_chroma_path)):
+            return False
+
+        try:
+            version = get_remote_chroma_version(remote_prefix)
+        except Exception as e:
+            logger.warning("リモートバージョンの確認に失敗: %s", e)
+            if state is not None:
+                # 確認できない間は手元のコピーで継続
+                with _sync_states_lock:
+                    state["checked_at"] = now
+                return False
+            version = _SYNC_FAILED
+
+        if not force and state is not None and state["version"] == version:
+            with _sync_states_lock:
+                state["checked_at"] = now
+            return False
+
+        try:
+            # 実行中の検索の完了を待ち、クライアントを解放してからファイルを差し替える
+            with pool.quiesce(local_chroma_path):
+                _release_chroma_system(local_chroma_path)
+                _pull_chroma(local_chroma_path, remote_prefix)
+        except Exception as e:
+            logger.exception("ChromaDB同期エラー: %s", e)
+            Path(local_chroma_path).mkdir(parents=True, exist_ok=True)
+            version = _SYNC_FAILED
+
+        with _sync_states_lock:
+            _sync_states[local_chroma_path] = {"version": version, "checked_at": now}
+            if version != _SYNC_FAILED:
+                # ローカルはリモートと同じ内容になった
+                _dirty_paths.discard(local_chroma_path)
+        return True
+
+
+def ensure_chroma_synced(force: bool = False) -> bool:
+    """
+    グローバルのChromaDBを同期（プロセスで初回のみ、以降はバージョン確認のみ）
+
+    Returns:
+        bool: 同期を実行したか（ローカルストレージモードでは常にFalse）
+    """
+    if not _is_gcs_mode():
+        return False
+    return sync_chroma_if_stale(config.CHROMA_DB_FOLDER, config.CHROMA_SYNC_PREFIX, force=force)
+
+
+# ============================================
+# チーム単位の同期とオンデマンド展開（v3.3.0）
+# チームのChromaDBは初回アクセス時にGCSから差分ダウンロードし、
+# ローカルディスク使用量が上限を超えたらLRUで退避（アップロード後に削除）する。
+# ============================================
+
+# 最終アクセスからこの秒数以内のチームは退避しない（検索中のコレクションを消さないため）
+TEAM_EVICT_MIN_IDLE_SECONDS = 60
+
+_team_lock = threading.Lock()
+_team_last_access: "OrderedDict[str, float]" = OrderedDict()  # 展開済みチーム（LRU順）
+
+
+def get_team_sync_prefix(team_id: str) -> str:
+    """チームのChromaDB同期先（GCS上）"""
+    return storage.get_team_path(team_id, 'chroma_sync')
+
+
+def _directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _release_chroma_system(path: str) -> None:
+    """プール・chromadbがプロセス内にキャッシュしているクライアントを解放（削除・差し替えたフォルダを参照させない）"""
+    get_chroma_pool().release(path)
+
+
+def ensure_team_chroma_local(team_id: str) -> str:
+    """
+    チームのChromaDBをローカルに用意する（GCSモードでは初回に差分ダウンロード）
+
+    Args:
+        team_id: チームID
+
+    Returns:
+        ローカルのChromaDBパス
+    """
+    team_chroma_path = storage.get_team_path(team_id, 'chroma')
+
+    if not _is_gcs_mode():
+        Path(team_chroma_path).mkdir(parents=True, exist_ok=True)
+        return team_chroma_path
+
+    # 同期待ちの間に退避されないよう、先にアクセス時刻を更新
+    with _team_lock:
+        if team_id in _team_last_access:
+            _team_last_access[team_id] = time.monotonic()
+
+    # 初回アクセス時に展開、以降はバージョン確認で他インスタンスの更新を反映
+    # （取り込み中のチームは sync_chroma_if_stale 内で再同期をスキップ）
+    sync_chroma_if_stale(team_chroma_path, get_team_sync_prefix(team_id))
+    Path(team_chroma_path).mkdir(parents=True, exist_ok=True)
+
+    with _team_lock:
+        _team_last_access[team_id] = time.monotonic()
+        _team_last_access.move_to_end(team_id)
+
+    evict_team_chroma_over_budget(keep_team_id=team_id)
+    return team_chroma_path
+
+
+@contextmanager
+def hold_team_chroma(team_id: Optional[str]):
+    """
+    処理中（取り込み等）のChromaDBをローカルから退避させず、同期による差し替えもさせない
+
+    Args:
+        team_id: チームID（Noneの場合はグローバルのChromaDB）
+    """
+    path = storage.get_team_path(team_id, 'chroma') if team_id else config.CHROMA_DB_FOLDER
+    # 実行中の同期・退避が終わるのを待ってから保持する
+    with _path_lock(path):
+        with _sync_states_lock:
+            _chroma_holds[path] = _chroma_holds.get(path, 0) + 1
+    try:
+        yield
+    finally:
+        with _sync_states_lock:
+            _chroma_holds[path] -= 1
+            if _chroma_holds[path] <= 0:
+                del _chroma_holds[path]
+
+
+def mark_team_chroma_dirty(team_id: Optional[str]) -> None:
+    """チームのChromaDBに書き込んだことを記録（退避時にアップロードが必要になる）"""
+    if not team_id:
+        return
+    with _sync_states_lock:
+        _dirty_paths.add(storage.get_team_path(team_id, 'chroma'))
+
+
+def _is_dirty(local_chroma_path: str) -> bool:
+    with _sync_states_lock:
+        return local_chroma_path in _dirty_paths
+
+
+def sync_team_chroma_to_gcs(team_id: str) -> None:
+    """チームのChromaDBをGCSに差分アップロード（ローカルストレージモードでは何もしない）"""
+    if not _is_gcs_mode():
+        return
+
+    team_chroma_path = storage.get_team_path(team_id, 'chroma')
+    if not os.path.exists(team_chroma_path):
+        return
+
+    # アップロード開始前に未アップロードの印を外す（アップロード中の書き込みは再度印が付く）
+    with _sync_states_lock:
+        was_dirty = team_chroma_path in _dirty_paths
+        _dirty_paths.discard(team_chroma_path)
+    try:
+        summary = _push_chroma(team_chroma_path, get_team_sync_prefix(team_id))
+    except Exception:
+        if was_dirty:
+            mark_team_chroma_dirty(team_id)
         raise
+    logger.info("チーム %s のChromaDBをアップロード: %s", team_id, summary)
+    _record_synced_version(team_chroma_path, get_team_sync_prefix(team_id))
+
+
+def evict_team_chroma(team_id: str, min_idle_seconds: float = 0) -> bool:
+    """
+    チームのChromaDBをローカルから削除
+
+    このプロセスで書き込んで未アップロードの場合のみ、削除前にGCSへ差分アップロードする。
+    その場合も、最後に同期した後に他のインスタンスがリモートを更新していれば
+    （上書きすると他インスタンスの更新が失われるため）アップロード・削除とも行わない。
+    書き込んでいない場合はアップロードせずに削除する（リモートの方が新しい可能性があるため）。
+
+    Args:
+        team_id: チームID
+        min_idle_seconds: 最終アクセスからこの秒数以内なら退避しない
+
+    Returns:
+        bool: 削除したか（取り込み中・アクセス直後・アップロード失敗・リモートとの競合時は削除しない）
+    """
+    team_chroma_path = storage.get_team_path(team_id, 'chroma')
+    remote_prefix = get_team_sync_prefix(team_id)
+
+    # 同期（ensure_team_chroma_local）・取り込み開始（hold_team_chroma）と直列化
+    with _path_lock(team_chroma_path):
+        if _is_held(team_chroma_path):
+            return False
+        with _team_lock:
+            last_access = _team_last_access.get(team_id)
+        if last_access is not None and time.monotonic() - last_access < min_idle_seconds:
+            return False
+
+        if _is_dirty(team_chroma_path):
+            with _sync_states_lock:
+                state = _sync_states.get(team_chroma_path)
+            try:
+                remote_version = get_remote_chroma_version(remote_prefix)
+            except Exception as e:
+                logger.warning("チーム %s のリモートバージョンの確認に失敗（退避を中止）: %s", team_id, e)
+                return False
+            if remote_version != (state or {}).get("version"):
+                logger.warning("チーム %s のChromaDBはリモートが更新されているため退避しません（未アップロードの書き込みあり）", team_id)
+                return False
+            try:
+                sync_team_chroma_to_gcs(team_id)
+            except Exception as e:
+                logger.warning("チーム %s の退避前アップロードに失敗（退避を中止）: %s", team_id, e)
+                return False
+
+        with _team_lock:
+            _team_last_access.pop(team_id, None)
+
+        _forget_sync_state(team_chroma_path)
+        # 実行中の検索の完了を待ってから削除
+        with get_chroma_pool().quiesce(team_chroma_path):
+            _release_chroma_system(team_chroma_path)
+            shutil.rmtree(team_chroma_path, ignore_errors=True)
+        try:
+            os.remove(_local_state_path(team_chroma_path))
+        except FileNotFoundError:
+            pass
+
+    logger.info("チーム %s のChromaDBをローカルから退避", team_id)
+    return True
+
+
+def evict_team_chroma_over_budget(keep_team_id: Optional[str] = None) -> None:
+    """ローカルのチームChromaDBの合計がディスク予算を超えていれば、LRU順に退避"""
+    budget_mb = config.CHROMA_LOCAL_DISK_BUDGET_MB
+    if budget_mb <= 0 or not _is_gcs_mode():
+        return
+
+    with _team_lock:
+        teams_lru = list(_team_last_access.items())
+
+    sizes = {team_id: _directory_size(storage.get_team_path(team_id, 'chroma')) for team_id, _ in teams_lru}
+    total = sum(sizes.values())
+    budget = budget_mb * 1024 * 1024
+    now = time.monotonic()
+
+    for team_id, last_access in teams_lru:
+        if total <= budget:
+            break
+        held = _is_held(storage.get_team_path(team_id, 'chroma'))
+        if team_id == keep_team_id or held or now - last_access < TEAM_EVICT_MIN_IDLE_SECONDS:
+            continue
+        # 保持・最終アクセスはロック内で再確認する
+        if evict_team_chroma(team_id, min_idle_seconds=TEAM_EVICT_MIN_IDLE_SECONDS):
+            total -= sizes[team_id]
 
 
 def get_chroma_config_path():
@@ -137,7 +994,7 @@ def get_current_embedding_model():
                 config_data = json.load(f)
                 return config_data.get('embedding_model')
     except Exception as e:
-        print(f"ChromaDB設定読み込みエラー: {e}")
+        logger.warning("ChromaDB設定読み込みエラー: %s", e)
     return None
 
 
@@ -166,9 +1023,9 @@ def save_embedding_model_config(embedding_model: str):
         with open(config_path, 'w', encoding='utf-8') as f:
             json.dump(config_data, f, indent=2, ensure_ascii=False)
 
-        print(f"ChromaDB設定を保存: {embedding_model}")
+        logger.info("ChromaDB設定を保存: %s", embedding_model)
     except Exception as e:
-        print(f"ChromaDB設定保存エラー: {e}")
+        logger.warning("ChromaDB設定保存エラー: %s", e)
 
 
 def reset_chroma_db(local_chroma_path: str = None):
@@ -184,10 +1041,13 @@ def reset_chroma_db(local_chroma_path: str = None):
     local_chroma_path = local_chroma_path or config.CHROMA_DB_FOLDER
 
     try:
-        # ChromaDBフォルダが存在する場合は削除
+        # ChromaDBフォルダが存在する場合は削除（v3.3.0: 先に共有クライアントを解放）
         if os.path.exists(local_chroma_path):
-            print(f"ChromaDBを削除中: {local_chroma_path}")
-            shutil.rmtree(local_chroma_path)
+            logger.info("ChromaDBを削除中: %s", local_chroma_path)
+            # 実行中の検索の完了を待ってから削除
+            with get_chroma_pool().quiesce(local_chroma_path):
+                get_chroma_pool().release(local_chroma_path)
+                shutil.rmtree(local_chroma_path)
 
         # 新しいフォルダを作成
         Path(local_chroma_path).mkdir(parents=True, exist_ok=True)
@@ -196,13 +1056,16 @@ def reset_chroma_db(local_chroma_path: str = None):
         config_path = get_chroma_config_path()
         if os.path.exists(config_path):
             os.remove(config_path)
-            print("ChromaDB設定ファイルを削除")
+            logger.info("ChromaDB設定ファイルを削除")
 
-        print("ChromaDBのリセット完了")
+        # v3.3.0: インデックスの世代を進める（リセット前の検索結果キャッシュ等を無効化）
+        bump_generation(None, "index", reason="reset")
+
+        logger.info("ChromaDBのリセット完了")
         return True
 
     except Exception as e:
-        print(f"ChromaDBリセットエラー: {e}")
+        logger.exception("ChromaDBリセットエラー: %s", e)
         return False
 
 
@@ -221,10 +1084,8 @@ def get_chroma_vectorstore(embeddings, collection_name: str = "experiment_notes"
     Note:
         v3.0: 後方互換性のため維持。新規実装では get_team_chroma_vectorstore() を使用。
     """
-    from langchain_chroma import Chroma
-
-    # GCSから同期（起動時に一度だけ）
-    sync_chroma_from_gcs()
+    # GCSから同期（v3.3.0: プロセスで初回のみ、以降はリモートのバージョン確認のみ）
+    ensure_chroma_synced()
 
     # embeddingモデル設定を保存（提供された場合）
     if embedding_model:
@@ -234,19 +1095,20 @@ def get_chroma_vectorstore(embeddings, collection_name: str = "experiment_notes"
             save_embedding_model_config(embedding_model)
         elif current_model != embedding_model:
             # モデルが変更された場合（警告は呼び出し側で行う）
-            print(f"⚠️  警告: embeddingモデルが変更されました: {current_model} -> {embedding_model}")
-            print("   既存のベクトルDBとの互換性がなくなる可能性があります")
+            logger.warning("embeddingモデルが変更されました: %s -> %s（既存のベクトルDBとの互換性がなくなる可能性があります）", current_model, embedding_model)
             # 新しいモデルを保存
             save_embedding_model_config(embedding_model)
 
-    # Chromaインスタンスを作成
-    vectorstore = Chroma(
-        collection_name=collection_name,
-        embedding_function=embeddings,
-        persist_directory=config.CHROMA_DB_FOLDER
-    )
+    # v3.3.0: 共有クライアント上のvectorstoreをプールから再利用
+    return get_chroma_pool().get_vectorstore(config.CHROMA_DB_FOLDER, collection_name, embeddings)
 
-    return vectorstore
+
+def _update_team_model_config(team_id: str, team_chroma_path: str, embedding_model: str, **flags) -> None:
+    """チームのembeddingモデル設定を更新（v3.3.0: 値が変わった場合のみ書き込み）"""
+    previous = get_chroma_pool().update_config(team_chroma_path, embedding_model=embedding_model, **flags)
+    current_model = previous.get('embedding_model')
+    if current_model and current_model != embedding_model:
+        logger.warning("チーム %s のembeddingモデルが変更されました: %s -> %s", team_id, current_model, embedding_model)
 
 
 def get_team_chroma_vectorstore(team_id: str, embeddings, embedding_model: str = None):
@@ -265,51 +1127,19 @@ def get_team_chroma_vectorstore(team_id: str, embeddings, embedding_model: str =
         - コレクション名: `notes_{team_id}`
         - persist_directory: `teams/{team_id}/chroma-db`
         - v3.1.1: 後方互換性のため維持。3軸検索では get_team_multi_collection_vectorstores() を使用。
+        - v3.3.0: クライアントとvectorstoreはプールから再利用
     """
-    from langchain_chroma import Chroma
-
     # チーム専用のコレクション名
     collection_name = f"notes_{team_id}"
 
-    # チーム専用のpersist_directory
-    team_chroma_path = storage.get_team_path(team_id, 'chroma')
+    # チーム専用のpersist_directory（v3.3.0: GCSモードでは初回アクセス時に展開）
+    team_chroma_path = ensure_team_chroma_local(team_id)
 
-    # ディレクトリが存在しない場合は作成
-    Path(team_chroma_path).mkdir(parents=True, exist_ok=True)
-
-    # Chromaインスタンスを作成
-    vectorstore = Chroma(
-        collection_name=collection_name,
-        embedding_function=embeddings,
-        persist_directory=team_chroma_path
-    )
+    vectorstore = get_chroma_pool().get_vectorstore(team_chroma_path, collection_name, embeddings)
 
     # embedding モデル設定を保存（チームごとに管理）
     if embedding_model:
-        # チーム専用の設定ファイルパス
-        config_path = Path(team_chroma_path) / "chroma_db_config.json"
-        config_path.parent.mkdir(parents=True, exist_ok=True)
-
-        try:
-            if config_path.exists():
-                with open(config_path, 'r') as f:
-                    team_config = json.load(f)
-                    current_model = team_config.get('embedding_model')
-
-                    if current_model and current_model != embedding_model:
-                        print(f"⚠️  警告: チーム {team_id} のembeddingモデルが変更されました: {current_model} -> {embedding_model}")
-            else:
-                # 初回作成時
-                team_config = {}
-
-            team_config['embedding_model'] = embedding_model
-            team_config['updated_at'] = datetime.now().isoformat()
-
-            with open(config_path, 'w') as f:
-                json.dump(team_config, f, indent=2)
-
-        except Exception as e:
-            print(f"警告: チーム設定の保存に失敗: {e}")
+        _update_team_model_config(team_id, team_chroma_path, embedding_model)
 
     return vectorstore
 
@@ -336,14 +1166,10 @@ def get_team_multi_collection_vectorstores(team_id: str, embeddings, embedding_m
             - methods_collection_{team_id}
             - combined_collection_{team_id}
         - persist_directory: `teams/{team_id}/chroma-db`
+        - v3.3.0: 3コレクションとも同じ共有クライアント上のvectorstoreをプールから再利用
     """
-    from langchain_chroma import Chroma
-
-    # チーム専用のpersist_directory
-    team_chroma_path = storage.get_team_path(team_id, 'chroma')
-
-    # ディレクトリが存在しない場合は作成
-    Path(team_chroma_path).mkdir(parents=True, exist_ok=True)
+    # チーム専用のpersist_directory（v3.3.0: GCSモードでは初回アクセス時に展開）
+    team_chroma_path = ensure_team_chroma_local(team_id)
 
     # 3つのコレクション名を定義
     collection_names = {
@@ -352,40 +1178,16 @@ def get_team_multi_collection_vectorstores(team_id: str, embeddings, embedding_m
         "combined": f"{config.COMBINED_COLLECTION_NAME}_{team_id}"
     }
 
-    # 各コレクションのvectorstoreを作成
-    vectorstores = {}
-    for key, collection_name in collection_names.items():
-        vectorstores[key] = Chroma(
-            collection_name=collection_name,
-            embedding_function=embeddings,
-            persist_directory=team_chroma_path
-        )
+    pool = get_chroma_pool()
+    vectorstores = {
+        key: pool.get_vectorstore(team_chroma_path, collection_name, embeddings)
+        for key, collection_name in collection_names.items()
+    }
 
     # embedding モデル設定を保存（チームごとに管理）
     if embedding_model:
-        config_path = Path(team_chroma_path) / "chroma_db_config.json"
-        config_path.parent.mkdir(parents=True, exist_ok=True)
-
-        try:
-            if config_path.exists():
-                with open(config_path, 'r') as f:
-                    team_config = json.load(f)
-                    current_model = team_config.get('embedding_model')
-
-                    if current_model and current_model != embedding_model:
-                        print(f"⚠️  警告: チーム {team_id} のembeddingモデルが変更されました: {current_model} -> {embedding_model}")
-            else:
-                team_config = {}
-
-            team_config['embedding_model'] = embedding_model
-            team_config['multi_collection'] = True  # v3.1.1: 3コレクション対応フラグ
-            team_config['updated_at'] = datetime.now().isoformat()
-
-            with open(config_path, 'w') as f:
-                json.dump(team_config, f, indent=2)
-
-        except Exception as e:
-            print(f"警告: チーム設定の保存に失敗: {e}")
+        # v3.1.1: 3コレクション対応フラグ
+        _update_team_model_config(team_id, team_chroma_path, embedding_model, multi_collection=True)
 
     return vectorstores
 
@@ -400,40 +1202,55 @@ def reset_team_collections(team_id: str):
     Returns:
         bool: リセット成功の可否
     """
-    import chromadb
+    team_chroma_path = ensure_team_chroma_local(team_id)
+    pool = get_chroma_pool()
 
-    team_chroma_path = storage.get_team_path(team_id, 'chroma')
-
-    try:
-        # ChromaDBクライアントを作成
-        client = chromadb.PersistentClient(path=team_chroma_path)
-
-        # 削除対象のコレクション名
-        collection_names_to_delete = [
-            f"{config.MATERIALS_COLLECTION_NAME}_{team_id}",
-            f"{config.METHODS_COLLECTION_NAME}_{team_id}",
-            f"{config.COMBINED_COLLECTION_NAME}_{team_id}",
-            f"notes_{team_id}"  # 後方互換性: 旧コレクション名も削除
-        ]
-
-        # 各コレクションを削除
-        for collection_name in collection_names_to_delete:
+    # v3.3.0: リセット・アップロード中に退避させない
+    with hold_team_chroma(team_id):
+        try:
+            # v3.3.0: 共有クライアントを使用
+            client = pool.get_client(team_chroma_path)
+
+            # 削除対象のコレクション名
+            collection_names_to_delete = [
+                f"{config.MATERIALS_COLLECTION_NAME}_{team_id}",
+                f"{config.METHODS_COLLECTION_NAME}_{team_id}",
+                f"{config.COMBINED_COLLECTION_NAME}_{team_id}",
+                f"notes_{team_id}"  # 後方互換性: 旧コレクション名も削除
+            ]
+
+            # v3.3.0: 実行中の検索の完了を待ってから削除
+            with pool.quiesce(team_chroma_path):
+                # 各コレクションを削除
+                for collection_name in collection_names_to_delete:
+                    try:
+                        client.delete_collection(name=collection_name)
+                        logger.info("コレクションを削除: %s", collection_name)
+                    except Exception:
+                        # コレクションが存在しない場合は無視
+                        pass
+
+                # 設定ファイルを更新（multi_collectionフラグをリセット）
+                config_path = Path(team_chroma_path) / "chroma_db_config.json"
+                if config_path.exists():
+                    os.remove(config_path)
+                    logger.info("設定ファイルを削除: %s", config_path)
+
+                # 削除したコレクションを参照するvectorstore・キャッシュを破棄
+                pool.reset_handles(team_chroma_path)
+            mark_team_chroma_dirty(team_id)
+            # v3.3.0: インデックスの世代を進める（リセット前の検索結果キャッシュ等を無効化）
+            bump_generation(team_id, "index", reason="reset")
+
+            # v3.3.0: リセット後の状態をGCSに反映
             try:
-                client.delete_collection(name=collection_name)
-                print(f"コレクションを削除: {collection_name}")
-            except Exception:
-                # コレクションが存在しない場合は無視
-                pass
+                sync_team_chroma_to_gcs(team_id)
+            except Exception as e:
+                logger.warning("リセット後のアップロードに失敗: %s", e)
 
-        # 設定ファイルを更新（multi_collectionフラグをリセット）
-        config_path = Path(team_chroma_path) / "chroma_db_config.json"
-        if config_path.exists():
-            os.remove(config_path)
-            print(f"設定ファイルを削除: {config_path}")
+            logger.info("チーム %s のコレクションをリセット完了", team_id)
+            return True
 
-        print(f"チーム {team_id} のコレクションをリセット完了")
-        return True
-
-    except Exception as e:
-        print(f"コレクションリセットエラー: {e}")
-        return False
+        except Exception as e:
+            logger.exception("コレクションリセットエラー: %s", e)
+            return False
@@ -53,6 +53,71 @@ class Config:
     # 後方互換性のため、従来のCOLLECTION_NAMEはCOMBINED_COLLECTION_NAMEを参照
     COLLECTION_NAME = COMBINED_COLLECTION_NAME
 
+    # 取り込みパイプライン設定（v3.3.0）
+    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "50"))  # 1回のEmbedding/書き込みで処理するノート数
+    INGEST_QUEUE_MAXSIZE = int(os.getenv("INGEST_QUEUE_MAXSIZE", "100"))  # ステージ間キューの上限（ノート数）
+    INGEST_MAX_IN_FLIGHT = int(os.getenv("INGEST_MAX_IN_FLIGHT", "4"))  # Embedding APIへの同時リクエスト数の上限（プロセス全体）
+    INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", "1"))  # バックグラウンド取り込みジョブの同時実行数
+    INGEST_JOBS_FOLDER = os.getenv("INGEST_JOBS_FOLDER", "ingest_jobs")  # ジョブ状態の保存先（チーム未指定時）
+    INGEST_JOB_LEASE_SECONDS = float(os.getenv("INGEST_JOB_LEASE_SECONDS", "120"))  # 実行中ジョブの更新がこの秒数途絶えたら中断扱い
+    INGEST_JOB_CHECKPOINT_INTERVAL = float(os.getenv("INGEST_JOB_CHECKPOINT_INTERVAL", "10"))  # チェックポイントを保存する最短間隔（秒）
+
+    # フォルダ監視による自動取り込み設定（v3.3.0）
+    INGEST_WATCH_DEBOUNCE_SECONDS = float(os.getenv("INGEST_WATCH_DEBOUNCE_SECONDS", "2.0"))  # 最後の到着からこの秒数静穏で取り込み
+    INGEST_WATCH_MAX_BATCH = int(os.getenv("INGEST_WATCH_MAX_BATCH", "50"))  # 1回のマイクロバッチの最大ノート数
+    INGEST_WATCH_POLL_INTERVAL = float(os.getenv("INGEST_WATCH_POLL_INTERVAL", "5.0"))  # ポーリング間隔（秒）
+    INGEST_WATCH_CURSOR_PATH = os.getenv("INGEST_WATCH_CURSOR_PATH", "ingest_watch.json")  # 監視カーソルの保存先（チーム未指定時）
+
+    # ChromaDB差分同期設定（v3.3.0）
+    CHROMA_SYNC_PREFIX = os.getenv("CHROMA_SYNC_PREFIX", "chroma_db")  # GCS上の保存先
+    CHROMA_SYNC_CHUNK_MB = int(os.getenv("CHROMA_SYNC_CHUNK_MB", "4"))  # チャンクサイズ（MB）
+    CHROMA_SYNC_WORKERS = int(os.getenv("CHROMA_SYNC_WORKERS", "8"))  # 並列転送数
+    CHROMA_SYNC_MODE = os.getenv("CHROMA_SYNC_MODE", "delta")  # "delta"（チャンク差分） | "snapshot"（全体アーカイブ）
+    CHROMA_SNAPSHOT_CODEC = os.getenv("CHROMA_SNAPSHOT_CODEC", "gzip")  # "gzip" | "zstd"（zstandardパッケージが必要）
+    CHROMA_SNAPSHOT_LEVEL = int(os.getenv("CHROMA_SNAPSHOT_LEVEL")) if os.getenv("CHROMA_SNAPSHOT_LEVEL") else None  # 圧縮レベル（未指定: コーデックの既定値）
+    CHROMA_SNAPSHOT_THREADS = int(os.getenv("CHROMA_SNAPSHOT_THREADS", "-1"))  # zstdの圧縮スレッド数（-1: 全コア）
+    CHROMA_SYNC_CHECK_INTERVAL = float(os.getenv("CHROMA_SYNC_CHECK_INTERVAL", "30"))  # リモート更新の確認間隔（秒）
+    CHROMA_LOCAL_DISK_BUDGET_MB = int(os.getenv("CHROMA_LOCAL_DISK_BUDGET_MB", "0"))  # チームChromaDBのローカル保持上限（0: 無制限）
+
+    # ChromaDBクライアントプール設定（v3.3.0）
+    CHROMA_POOL_MAX_DIRECTORIES = int(os.getenv("CHROMA_POOL_MAX_DIRECTORIES", "32"))  # 同時に保持する永続化ディレクトリ（チーム）数
+    CHROMA_COUNT_CACHE_TTL = float(os.getenv("CHROMA_COUNT_CACHE_TTL", "60"))  # ドキュメント数キャッシュの有効秒数
+
+    # ロギング設定（v3.3.0）
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # 既定のログレベル
+    LOG_LEVELS = os.getenv("LOG_LEVELS", "")  # モジュール別レベル（例: "agent=DEBUG,ingest=WARNING"）
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json" | "text"
+
+    # 認証キャッシュ設定（v3.3.0）
+    AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "2048"))  # 検証済みIDトークンの最大保持数
+    AUTH_REVOCATION_CHECK_INTERVAL = float(os.getenv("AUTH_REVOCATION_CHECK_INTERVAL", "0"))  # 失効確認の間隔（秒、0: 確認しない）
+    TEAM_MEMBERSHIP_CACHE_TTL = float(os.getenv("TEAM_MEMBERSHIP_CACHE_TTL", "300"))  # チームメンバーシップのキャッシュ秒数（0: キャッシュしない）
+    TEAM_MEMBERSHIP_NEGATIVE_CACHE_TTL = float(os.getenv("TEAM_MEMBERSHIP_NEGATIVE_CACHE_TTL", "10"))  # 非メンバー判定のキャッシュ秒数
+    FIREBASE_KEY_REFRESH_INTERVAL = float(os.getenv("FIREBASE_KEY_REFRESH_INTERVAL", "1800"))  # 公開鍵のバックグラウンド更新間隔（秒、0: 更新しない）
+
+    # 外部API呼び出しの記録・再生（v3.3.0）
+    PROVIDER_MODE = os.getenv("PROVIDER_MODE", "live")  # "live" | "record"（未記録の呼び出しのみ実行して記録） | "replay"（記録のみ使用）
+    PROVIDER_CASSETTE = os.getenv("PROVIDER_CASSETTE", "provider_cassette.jsonl")  # 記録ファイル（ローカルパス）
+
+    # バッチ評価設定（v3.3.0）
+    EVALUATION_CONCURRENCY = int(os.getenv("EVALUATION_CONCURRENCY", "4"))  # 同時に実行するテストケース数の既定値
+    EVALUATION_MAX_CONCURRENCY = int(os.getenv("EVALUATION_MAX_CONCURRENCY", "16"))  # リクエストで指定できる同時実行数の上限
+    EVALUATION_ARTIFACTS_FOLDER = os.getenv("EVALUATION_ARTIFACTS_FOLDER", "evaluation_artifacts")  # 評価アーティファクトの保存先（チーム未指定時）
+    EVALUATION_RUNS_FOLDER = os.getenv("EVALUATION_RUNS_FOLDER", "evaluation_runs")  # 評価実行の記録の保存先（チーム未指定時）
+    EVALUATION_REPLAY_MAX_POINTS = int(os.getenv("EVALUATION_REPLAY_MAX_POINTS", "5000"))  # 1回のリプレイで評価するグリッド点数の上限
+
+    # 検索結果キャッシュ設定（v3.3.0）
+    SEARCH_CACHE_BACKEND = os.getenv("SEARCH_CACHE_BACKEND", "memory")  # "memory"（プロセス内） | "redis"（共有ストア） | "off"
+    SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "512"))  # プロセス内キャッシュの最大保持数
+    SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "86400"))  # エントリの有効秒数（0: 無期限、世代更新で無効化される）
+    SEARCH_CACHE_REDIS_URL = os.getenv("SEARCH_CACHE_REDIS_URL", "redis://localhost:6379/0")  # redisバックエンドの接続先
+    SEARCH_CACHE_PREFIX = os.getenv("SEARCH_CACHE_PREFIX", "jikkennote:search")  # キーのプレフィックス
+
+    # インデックス・辞書の世代設定（v3.3.0）
+    GENERATIONS_PATH = os.getenv("GENERATIONS_PATH", "generations.json")  # 世代の保存先（チーム未指定時）
+    GENERATIONS_CACHE_TTL = float(os.getenv("GENERATIONS_CACHE_TTL", "2"))  # 保存済みの世代を再読み込みする間隔（秒、他のワーカーの更新の反映遅延）
+    GENERATIONS_FEED_SIZE = int(os.getenv("GENERATIONS_FEED_SIZE", "1000"))  # プロセス内で保持する変更イベント数
+
     @classmethod
     def ensure_folders(cls):
         """必要なフォルダを作成"""
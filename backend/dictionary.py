@@ -20,6 +20,7 @@ from io import StringIO
 
 from config import config
 from storage import storage
+from generations import bump_generation
 
 
 @dataclass
@@ -118,6 +119,9 @@ class DictionaryManager:
             storage.write_file(self.dictionary_path, yaml_content)
 
             print(f"辞書を保存しました: {len(self.entries)}エントリ")
+
+            # v3.3.0: 正規化の結果が変わるため辞書の世代を進める
+            bump_generation(self.team_id, "dictionary", reason="save")
             return True
 
         except Exception as e:
@@ -396,6 +396,39 @@ class Evaluator:
             comparison=comparison
         )
 
+    def individual_result(self, test_case: TestCase, retrieved_results: List[Dict]) -> Dict:
+        """
+        バッチ評価の1件分の結果を作成
+
+        Args:
+            test_case: テストケース
+            retrieved_results: 検索結果
+
+        Returns:
+            {"test_case_id": ..., "test_case_name": ..., "metrics": {...}}
+        """
+        eval_result = self.evaluate(test_case, retrieved_results)
+        return {
+            'test_case_id': test_case.id,
+            'test_case_name': test_case.name,
+            'metrics': asdict(eval_result.metrics)
+        }
+
+    @staticmethod
+    def average_metrics(individual_results: List[Dict]) -> Dict:
+        """individual_result() のリストから各指標の平均を計算"""
+        if not individual_results:
+            return {}
+
+        avg_metrics = {}
+        metric_keys = list(individual_results[0]['metrics'].keys())
+
+        for key in metric_keys:
+            values = [r['metrics'][key] for r in individual_results]
+            avg_metrics[key] = sum(values) / len(values)
+
+        return avg_metrics
+
     def batch_evaluate(self, results: List[Tuple[TestCase, List[Dict]]]) -> Dict:
         """
         バッチ評価
@@ -406,29 +439,13 @@ class Evaluator:
         Returns:
             集計結果 {"average_metrics": {...}, "individual_results": [...]}
         """
-        individual_results = []
-
-        for test_case, retrieved_results in results:
-            eval_result = self.evaluate(test_case, retrieved_results)
-            individual_results.append({
-                'test_case_id': test_case.id,
-                'test_case_name': test_case.name,
-                'metrics': asdict(eval_result.metrics)
-            })
-
-        # 平均を計算
-        if individual_results:
-            avg_metrics = {}
-            metric_keys = list(individual_results[0]['metrics'].keys())
-
-            for key in metric_keys:
-                values = [r['metrics'][key] for r in individual_results]
-                avg_metrics[key] = sum(values) / len(values)
-        else:
-            avg_metrics = {}
+        individual_results = [
+            self.individual_result(test_case, retrieved_results)
+            for test_case, retrieved_results in results
+        ]
 
         return {
-            'average_metrics': avg_metrics,
+            'average_metrics': self.average_metrics(individual_results),
             'individual_results': individual_results
         }
 
@@ -0,0 +1,363 @@
+"""
+評価アーティファクトの保存とリプレイ（v3.3.0）
+
+バッチ評価（save_artifacts=True）で、テストケースごとに検索の中間結果を保存する。
+
+- LLMが生成した3軸のクエリ
+- 軸 × 同義語展開クエリごとのセマンティック / キーワード検索の候補とスコア
+- リランクスコア（軸ごとの候補を各軸のクエリで、全軸の候補を総合クエリで）
+
+リプレイは保存済みの中間結果から、ハイブリッド検索の統合・同義語展開のマージ・3軸のスコア統合・
+リランクの並べ替えを fusion.py の関数（SearchAgentと共通）で再計算する。LLM・Embedding・リランクAPI・
+ChromaDBを呼ばないため、axis_weights / fusion_method / rrf_k / hybrid_alpha / rerank_position などの
+パラメータグリッド全体の評価指標を数ミリ秒〜数秒で得られる。
+
+リランクスコアはドキュメントごとに独立している（同時に渡す他のドキュメントに依存しない）前提で、
+リランクAPIを1回で全候補に対して呼び、リプレイ時に候補の部分集合を並べ替える。
+"""
+
+import itertools
+import json
+import logging
+import re
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from config import config
+from storage import storage
+from metrics import timed_call
+from fusion import AXES, hybrid_combine, merge_max_scores, fuse_axes, rerank_by_scores, unique_ranking
+
+
+logger = logging.getLogger(__name__)
+
+
+ARTIFACT_VERSION = 1
+
+SEARCH_MODES = ("semantic", "keyword", "hybrid")
+RERANK_POSITIONS = ("per_axis", "after_fusion")
+
+# リプレイで変更できるパラメータ
+REPLAY_PARAMETERS = (
+    "search_mode",
+    "hybrid_alpha",
+    "fusion_method",
+    "axis_weights",
+    "rrf_k",
+    "rerank_position",
+    "rerank_enabled",
+)
+
+
+# === パラメータ ===
+
+def default_replay_params(**overrides) -> Dict:
+    """
+    リプレイのパラメータ（未指定・Noneの項目は config の既定値）
+
+    Raises:
+        ValueError: 未知のパラメータ・不正な値
+    """
+    params = {
+        "search_mode": config.DEFAULT_SEARCH_MODE,
+        "hybrid_alpha": config.DEFAULT_HYBRID_ALPHA,
+        "fusion_method": config.FUSION_METHOD,
+        "axis_weights": dict(config.AXIS_WEIGHTS),
+        "rrf_k": config.RRF_K,
+        "rerank_position": config.RERANK_POSITION,
+        "rerank_enabled": config.RERANK_ENABLED,
+    }
+    for name, value in overrides.items():
+        if name not in params:
+            raise ValueError(f"Unknown replay parameter: {name}")
+        if value is not None:
+            params[name] = value
+    _validate_params(params)
+    return params
+
+
+def _validate_params(params: Dict) -> None:
+    if params["search_mode"] not in SEARCH_MODES:
+        raise ValueError(f"search_mode must be one of {', '.join(SEARCH_MODES)}: {params['search_mode']}")
+    if params["rerank_position"] not in RERANK_POSITIONS:
+        raise ValueError(f"rerank_position must be one of {', '.join(RERANK_POSITIONS)}: {params['rerank_position']}")
+    if not isinstance(params["axis_weights"], dict):
+        raise ValueError("axis_weights must be an object like {\"material\": 0.3, \"method\": 0.4, \"combined\": 0.3}")
+
+
+def expand_grid(grid: Dict[str, List], base: Optional[Dict] = None) -> List[Dict]:
+    """
+    パラメータグリッドを全組み合わせのリストに展開
+
+    Args:
+        grid: {パラメータ名: [値, ...]}
+        base: グリッドに含まれないパラメータの値（未指定の項目は config の既定値）
+
+    Returns:
+        [パラメータ]（グリッドが空の場合は base のみ）
+    """
+    names = list(grid)
+    for name in names:
+        if name not in REPLAY_PARAMETERS:
+            raise ValueError(f"Unknown replay parameter: {name} (choose from {', '.join(REPLAY_PARAMETERS)})")
+        if not isinstance(grid[name], list) or not grid[name]:
+            raise ValueError(f"Grid values for {name} must be a non-empty list")
+
+    base_params = default_replay_params(**(base or {}))
+    points = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        params = dict(base_params)
+        params.update(zip(names, values))
+        _validate_params(params)
+        points.append(params)
+    return points
+
+
+# === 収集 ===
+
+def _note_id(doc) -> str:
+    # 取り込み時に source と note_id は同じノートIDで保存される
+    return doc.metadata.get('note_id', doc.metadata.get('source', doc.page_content[:50]))
+
+
+def _rerank_scores(agent, query: str, documents: Dict[str, str]) -> Dict[str, float]:
+    """全ドキュメントのリランクスコア {note_id: score}"""
+    if not query or not documents:
+        return {}
+    note_ids = list(documents)
+    result = timed_call(
+        "cohere_rerank",
+        agent.cohere_client.rerank,
+        model=config.DEFAULT_RERANK_MODEL,
+        query=query,
+        documents=[documents[note_id] for note_id in note_ids],
+        top_n=len(note_ids)
+    )
+    return {note_ids[r.index]: r.relevance_score for r in result.results}
+
+
+def capture_case_artifact(agent, test_case_id: str, input_data: Dict) -> Dict:
+    """
+    1ケース分の中間結果を収集
+
+    Args:
+        agent: 3軸検索を有効にしたSearchAgent（クエリ生成に使用）
+        test_case_id: テストケースID
+        input_data: エージェントの入力
+
+    Returns:
+        アーティファクト（JSONに変換可能なdict）
+    """
+    # クエリ生成までを実行し、検索は下で全モード分を1回ずつ行う（グラフ全体の検索・リランクは不要）
+    queries = agent.generate_axis_queries(input_data)
+    k = config.VECTOR_SEARCH_K
+    vectorstores = agent.axis_vectorstores()
+
+    axes = {}
+    axis_documents: Dict[str, Dict[str, str]] = {}  # {軸: {note_id: 本文}}
+    for axis in AXES:
+        vectorstore = vectorstores[axis]
+        expansions = []
+        documents = {}
+        query = queries[axis]
+        for expanded_query in (agent._expand_query_with_synonyms(query) if query else []):
+            # 検索モードをリプレイで切り替えられるよう、常に両方の検索を実行
+            semantic = timed_call("chroma_query", vectorstore.similarity_search_with_relevance_scores, expanded_query, k=k)
+            keyword = agent._keyword_search_on_vectorstore(vectorstore, expanded_query, k=k)
+            for doc, _ in semantic + keyword:
+                documents.setdefault(_note_id(doc), doc.page_content)
+            expansions.append({
+                "query": expanded_query,
+                "semantic": [[_note_id(doc), float(score)] for doc, score in semantic],
+                "keyword": [[_note_id(doc), float(score)] for doc, score in keyword],
+            })
+        axes[axis] = expansions
+        axis_documents[axis] = documents
+
+    # 軸ごとのリランク（per_axis）と、全軸の候補に対する総合クエリでのリランク（after_fusion）
+    # after_fusion では統合後のドキュメントがどの軸のものかで本文が異なるため、軸ごとにスコアを持つ
+    rerank = {}
+    fusion_rerank = {}
+    try:
+        for axis in AXES:
+            rerank[axis] = _rerank_scores(agent, queries[axis], axis_documents[axis])
+        flat_documents = {
+            f"{axis}\t{note_id}": content
+            for axis in AXES for note_id, content in axis_documents[axis].items()
+        }
+        flat_scores = _rerank_scores(agent, queries["combined"], flat_documents)
+        for flat_id, score in flat_scores.items():
+            axis, note_id = flat_id.split("\t", 1)
+            fusion_rerank.setdefault(axis, {})[note_id] = score
+    except Exception as e:
+        # リランクなしのリプレイはできるよう、スコアなしで保存する
+        logger.warning("Rerank failed while capturing artifacts for %s: %s", test_case_id, e)
+
+    return {
+        "version": ARTIFACT_VERSION,
+        "test_case_id": test_case_id,
+        "created_at": datetime.now().isoformat(),
+        "k": k,
+        "rerank_top_n": config.RERANK_TOP_N,
+        "models": {
+            "embedding": agent.embedding_model,
+            "search_llm": agent.search_llm_model,
+            "rerank": config.DEFAULT_RERANK_MODEL,
+        },
+        "queries": queries,
+        "axes": axes,
+        "rerank": rerank,
+        "fusion_rerank": fusion_rerank,
+    }
+
+
+# === 保存 ===
+
+def _artifact_folder(team_id: Optional[str]) -> str:
+    if team_id:
+        return storage.get_team_path(team_id, 'evaluation_artifacts')
+    return config.EVALUATION_ARTIFACTS_FOLDER
+
+
+def _artifact_path(team_id: Optional[str], test_case_id: str) -> str:
+    safe_id = re.sub(r'[^\w\-.]', '_', test_case_id)
+    return f"{_artifact_folder(team_id)}/{safe_id}.json"
+
+
+def save_artifact(team_id: Optional[str], artifact: Dict) -> None:
+    """アーティファクトを保存（同じテストケースの既存のものは上書き）"""
+    storage.write_file(_artifact_path(team_id, artifact["test_case_id"]), json.dumps(artifact, ensure_ascii=False))
+
+
+def load_artifact(team_id: Optional[str], test_case_id: str) -> Optional[Dict]:
+    """アーティファクトを読み込む（未保存の場合はNone）"""
+    path = _artifact_path(team_id, test_case_id)
+    if not storage.exists(path):
+        return None
+    return json.loads(storage.read_file(path))
+
+
+def list_artifacts(team_id: Optional[str]) -> List[Dict]:
+    """保存済みアーティファクトの一覧 [{"test_case_id", "created_at", "models"}]"""
+    summaries = []
+    for path in storage.list_files(prefix=_artifact_folder(team_id), pattern="*.json"):
+        try:
+            artifact = json.loads(storage.read_file(path))
+        except Exception as e:
+            logger.warning("Skipping unreadable evaluation artifact %s: %s", path, e)
+            continue
+        summaries.append({
+            "test_case_id": artifact.get("test_case_id"),
+            "created_at": artifact.get("created_at"),
+            "models": artifact.get("models", {}),
+        })
+    return summaries
+
+
+# === リプレイ ===
+
+def _axis_candidates(artifact: Dict, axis: str, params: Dict) -> List[Tuple]:
+    """1軸分の検索結果 [((軸, note_id), スコア)] を再計算（検索モード・同義語展開のマージ）"""
+    k = artifact["k"]
+    result_lists = []
+    for expansion in artifact["axes"].get(axis, []):
+        semantic = [((axis, note_id), score) for note_id, score in expansion["semantic"]]
+        keyword = [((axis, note_id), score) for note_id, score in expansion["keyword"]]
+        if params["search_mode"] == "keyword":
+            results = keyword
+        elif params["search_mode"] == "hybrid":
+            results = hybrid_combine(semantic, keyword, params["hybrid_alpha"], k, key=lambda item: item[1])
+        else:
+            results = semantic
+        result_lists.append(results)
+    return merge_max_scores(result_lists, k, key=lambda item: item[1])
+
+
+def replay_ranking(artifact: Dict, params: Dict) -> List[str]:
+    """
+    保存済みの中間結果から最終ランキングを再計算
+
+    Args:
+        artifact: capture_case_artifact() の戻り値
+        params: default_replay_params() 形式のパラメータ
+
+    Returns:
+        ノートIDのランキング（重複除去済み、最大 rerank_top_n 件）
+    """
+    top_n = artifact["rerank_top_n"]
+    rerank_enabled = params["rerank_enabled"]
+
+    axis_results = {}
+    for axis in AXES:
+        results = _axis_candidates(artifact, axis, params)
+        if params["rerank_position"] == "per_axis" and rerank_enabled and results:
+            results = rerank_by_scores(
+                results, artifact["rerank"].get(axis, {}), min(top_n, len(results)), key=lambda item: item[1]
+            )
+        axis_results[axis] = results
+
+    final_scores = fuse_axes(
+        axis_results,
+        method=params["fusion_method"],
+        axis_weights=params["axis_weights"],
+        rrf_k=params["rrf_k"],
+        key=lambda item: item[1]
+    )
+
+    if params["rerank_position"] == "after_fusion" and rerank_enabled and final_scores:
+        top_candidates = final_scores[:top_n * 2]
+        fusion_rerank = artifact["fusion_rerank"]
+        scores = {
+            (axis, note_id): score
+            for axis, axis_scores in fusion_rerank.items() for note_id, score in axis_scores.items()
+        }
+        final_scores = rerank_by_scores(top_candidates, scores, min(top_n, len(top_candidates)))
+
+    return unique_ranking(final_scores, limit=top_n)
+
+
+def ranking_results(note_ids: List[str], limit: int = 10) -> List[Dict]:
+    """ノートIDのランキングを Evaluator.evaluate() の検索結果形式に変換"""
+    return [
+        {
+            'note_id': note_id,
+            'score': 1.0 - (i * 0.05),  # スコアは仮の値
+            'rank': i + 1
+        }
+        for i, note_id in enumerate(note_ids[:limit])
+    ]
+
+
+def replay_grid(cases: List[Tuple], points: List[Dict], evaluator, include_cases: bool = False) -> Dict:
+    """
+    パラメータグリッドの各点で全ケースをリプレイして評価指標を計算
+
+    Args:
+        cases: [(テストケース, アーティファクト)]
+        points: expand_grid() の戻り値
+        evaluator: Evaluator
+        include_cases: Trueの場合は各点のケース別指標も返す
+
+    Returns:
+        {"points": [{"params", "average_metrics", ("cases")}], "elapsed_ms"}
+    """
+    start = time.perf_counter()
+    surface = []
+    for params in points:
+        individual_results = [
+            evaluator.individual_result(test_case, ranking_results(replay_ranking(artifact, params)))
+            for test_case, artifact in cases
+        ]
+        entry = {
+            "params": params,
+            "average_metrics": evaluator.average_metrics(individual_results),
+        }
+        if include_cases:
+            entry["cases"] = individual_results
+        surface.append(entry)
+
+    return {
+        "points": surface,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+    }
@@ -0,0 +1,405 @@
+"""
+評価実行の記録モジュール（v3.3.0）
+
+機能:
+- バッチ評価1回分（設定のフィンガープリント、ケース別の指標・レイテンシ・ノード別所要時間・API使用量）の保存
+- 2つの実行の比較（設定の差分、指標・レイテンシ・トークン数の増減、悪化したケース）
+- 品質とレイテンシのパレート分析（より速く、かつ品質が同等以上の実行が存在しない実行を抽出）
+- storage抽象化レイヤー経由でのJSON永続化
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import uuid
+from dataclasses import dataclass, asdict, field, fields
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import config
+from storage import storage
+
+
+logger = logging.getLogger(__name__)
+
+
+# 比較・パレート分析で使う品質指標とレイテンシ指標の既定値
+DEFAULT_QUALITY_METRIC = "ndcg_10"
+DEFAULT_LATENCY_METRIC = "p50_ms"
+
+# 1件のケースで悪化とみなす品質指標の低下幅の既定値
+DEFAULT_CASE_TOLERANCE = 0.05
+
+
+def _percentile(values: List[float], p: float) -> float:
+    """最近傍順位法によるパーセンタイル"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(-(-p * len(ordered) // 100)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def agent_settings(agent, extra: Optional[Dict] = None) -> Dict:
+    """
+    SearchAgentの解決済みの設定（既定値を適用した後の値）
+
+    Args:
+        agent: SearchAgent
+        extra: 追加で記録する設定（save_artifacts など）
+    """
+    prompts = agent.prompts or {}
+    settings = {
+        "embedding_model": agent.embedding_model,
+        "search_llm_model": agent.search_llm_model,
+        "summary_llm_model": agent.summary_llm_model,
+        "search_mode": agent.search_mode,
+        "hybrid_alpha": agent.hybrid_alpha,
+        "multi_axis_enabled": agent.multi_axis_enabled,
+        "fusion_method": agent.fusion_method,
+        "axis_weights": agent.axis_weights,
+        "rerank_position": agent.rerank_position,
+        "rerank_enabled": agent.rerank_enabled,
+        "rerank_model": config.DEFAULT_RERANK_MODEL,
+        "rrf_k": config.RRF_K,
+        "vector_search_k": config.VECTOR_SEARCH_K,
+        "rerank_top_n": config.RERANK_TOP_N,
+        # プロンプト本文は大きいためハッシュのみ記録
+        "custom_prompts": hashlib.sha256(
+            json.dumps(prompts, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:12] if prompts else None,
+    }
+    if extra:
+        settings.update(extra)
+    return settings
+
+
+def settings_fingerprint(settings: Dict) -> str:
+    """設定のフィンガープリント（同じ設定の実行を識別する）"""
+    payload = json.dumps(settings, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def summarize_trace(trace: Optional[Dict]) -> Dict:
+    """
+    検索トレース（tracing.SearchTrace.to_dict()）をケース単位の集計に変換
+
+    Returns:
+        {"stages": {ノード: ミリ秒}, "calls": {呼び出し: {"count", "duration_ms", "tokens"}}}
+    """
+    stages: Dict[str, float] = {}
+    calls: Dict[str, Dict] = {}
+    if not trace:
+        return {"stages": stages, "calls": calls}
+
+    for node in trace.get("nodes", []):
+        stages[node["node"]] = round(stages.get(node["node"], 0.0) + node["duration_ms"], 3)
+
+    for call in trace.get("calls", []):
+        entry = calls.setdefault(call["call"], {"count": 0, "duration_ms": 0.0, "tokens": {}})
+        entry["count"] += 1
+        entry["duration_ms"] = round(entry["duration_ms"] + call["duration_ms"], 3)
+        for unit, amount in (call.get("tokens") or {}).items():
+            if amount is not None:
+                entry["tokens"][unit] = entry["tokens"].get(unit, 0) + amount
+
+    return {"stages": stages, "calls": calls}
+
+
+@dataclass
+class EvaluationRun:
+    """バッチ評価1回分の記録"""
+    id: str
+    team_id: Optional[str]
+    created_at: str
+    settings: Dict
+    fingerprint: str
+    label: Optional[str] = None
+    wall_seconds: float = 0.0  # バッチ全体の所要時間
+    concurrency: int = 1
+    average_metrics: Dict = field(default_factory=dict)
+    latency: Dict = field(default_factory=dict)  # ケースあたりの検索時間 {"mean_ms", "p50_ms", "p95_ms", "max_ms"}
+    stage_latency: Dict = field(default_factory=dict)  # ノード別の平均所要時間 {ノード: ミリ秒}
+    usage: Dict = field(default_factory=dict)  # 外部呼び出しの合計 {呼び出し: {"count", "duration_ms", "tokens"}}
+    cases: List[Dict] = field(default_factory=list)  # [{"test_case_id", "test_case_name", "metrics", "latency_ms", "stages", "calls"}]
+    failed_cases: List[Dict] = field(default_factory=list)  # [{"test_case_id", "error"}]
+
+    def summary(self) -> Dict:
+        """一覧表示用（ケース別の結果を除く）"""
+        data = asdict(self)
+        data.pop("cases")
+        data["case_count"] = len(self.cases)
+        data["failed_count"] = len(self.failed_cases)
+        return data
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "EvaluationRun":
+        names = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in data.items() if k in names})
+
+
+def build_run(
+    team_id: Optional[str],
+    settings: Dict,
+    cases: List[Dict],
+    failed_cases: List[Dict],
+    average_metrics: Dict,
+    wall_seconds: float,
+    concurrency: int,
+    label: Optional[str] = None
+) -> EvaluationRun:
+    """
+    ケース別の結果から評価実行の記録を作成
+
+    Args:
+        cases: 成功したケース（Evaluator.individual_result() に latency_ms / stages / calls を加えたもの）
+        failed_cases: 失敗したケース
+    """
+    latencies = [case.get("latency_ms", 0.0) for case in cases]
+    latency = {
+        "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "p50_ms": round(_percentile(latencies, 50), 3),
+        "p95_ms": round(_percentile(latencies, 95), 3),
+        "max_ms": round(max(latencies), 3) if latencies else 0.0,
+    }
+
+    stage_totals: Dict[str, float] = {}
+    usage: Dict[str, Dict] = {}
+    for case in cases:
+        for stage, ms in case.get("stages", {}).items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + ms
+        for call, entry in case.get("calls", {}).items():
+            total = usage.setdefault(call, {"count": 0, "duration_ms": 0.0, "tokens": {}})
+            total["count"] += entry["count"]
+            total["duration_ms"] = round(total["duration_ms"] + entry["duration_ms"], 3)
+            for unit, amount in entry.get("tokens", {}).items():
+                total["tokens"][unit] = total["tokens"].get(unit, 0) + amount
+    stage_latency = {stage: round(ms / len(cases), 3) for stage, ms in stage_totals.items()} if cases else {}
+
+    return EvaluationRun(
+        id=str(uuid.uuid4()),
+        team_id=team_id,
+        created_at=datetime.now().isoformat(),
+        settings=settings,
+        fingerprint=settings_fingerprint(settings),
+        label=label,
+        wall_seconds=round(wall_seconds, 3),
+        concurrency=concurrency,
+        average_metrics=average_metrics,
+        latency=latency,
+        stage_latency=stage_latency,
+        usage=usage,
+        cases=cases,
+        failed_cases=failed_cases,
+    )
+
+
+def _delta(base: Dict, target: Dict) -> Dict:
+    """数値項目ごとの {"base", "target", "delta"}"""
+    result = {}
+    for key in sorted(set(base) | set(target)):
+        base_value = base.get(key)
+        target_value = target.get(key)
+        numeric = isinstance(base_value, (int, float)) and isinstance(target_value, (int, float))
+        result[key] = {
+            "base": base_value,
+            "target": target_value,
+            "delta": round(target_value - base_value, 6) if numeric else None,
+        }
+    return result
+
+
+def _total_tokens(usage: Dict) -> Dict[str, float]:
+    """{呼び出し: {...,"tokens": {単位: 数}}} → {"呼び出し.単位": 数}"""
+    totals = {}
+    for call, entry in usage.items():
+        totals[f"{call}.count"] = entry.get("count", 0)
+        for unit, amount in entry.get("tokens", {}).items():
+            totals[f"{call}.{unit}"] = amount
+    return totals
+
+
+def diff_runs(
+    base: EvaluationRun,
+    target: EvaluationRun,
+    quality_metric: str = DEFAULT_QUALITY_METRIC,
+    case_tolerance: float = DEFAULT_CASE_TOLERANCE
+) -> Dict:
+    """
+    2つの実行を比較（target - base）
+
+    Args:
+        base: 基準の実行
+        target: 比較対象の実行
+        quality_metric: ケース別の悪化・改善の判定に使う指標
+        case_tolerance: この値を超えて指標が変化したケースを悪化・改善として列挙
+
+    Returns:
+        設定の差分、平均指標・レイテンシ・ノード別時間・API使用量の増減、ケース別の悪化/改善
+    """
+    changed_settings = {
+        key: {"base": base.settings.get(key), "target": target.settings.get(key)}
+        for key in sorted(set(base.settings) | set(target.settings))
+        if base.settings.get(key) != target.settings.get(key)
+    }
+
+    base_cases = {case["test_case_id"]: case for case in base.cases}
+    regressed = []
+    improved = []
+    common = 0
+    for case in target.cases:
+        base_case = base_cases.get(case["test_case_id"])
+        if base_case is None:
+            continue
+        common += 1
+        delta = case["metrics"].get(quality_metric, 0.0) - base_case["metrics"].get(quality_metric, 0.0)
+        entry = {
+            "test_case_id": case["test_case_id"],
+            "test_case_name": case.get("test_case_name"),
+            "base": base_case["metrics"].get(quality_metric),
+            "target": case["metrics"].get(quality_metric),
+            "delta": round(delta, 6),
+            "latency_delta_ms": round(case.get("latency_ms", 0.0) - base_case.get("latency_ms", 0.0), 3),
+        }
+        if delta < -case_tolerance:
+            regressed.append(entry)
+        elif delta > case_tolerance:
+            improved.append(entry)
+    regressed.sort(key=lambda e: e["delta"])
+    improved.sort(key=lambda e: e["delta"], reverse=True)
+
+    return {
+        "base": base.summary(),
+        "target": target.summary(),
+        "same_settings": base.fingerprint == target.fingerprint,
+        "changed_settings": changed_settings,
+        "metrics": _delta(base.average_metrics, target.average_metrics),
+        "latency": _delta(base.latency, target.latency),
+        "stage_latency": _delta(base.stage_latency, target.stage_latency),
+        "usage": _delta(_total_tokens(base.usage), _total_tokens(target.usage)),
+        "cases": {
+            "quality_metric": quality_metric,
+            "tolerance": case_tolerance,
+            "common": common,
+            "regressed": regressed,
+            "improved": improved,
+        },
+    }
+
+
+def pareto_front(
+    runs: List[EvaluationRun],
+    quality_metric: str = DEFAULT_QUALITY_METRIC,
+    latency_metric: str = DEFAULT_LATENCY_METRIC
+) -> List[Dict]:
+    """
+    品質（高いほど良い）とレイテンシ（低いほど良い）のパレート分析
+
+    Returns:
+        [{"run_id", "label", "created_at", "fingerprint", "settings", "quality", "latency_ms", "pareto", "dominated_by"}]
+        （レイテンシ昇順）。pareto=True は他のどの実行にも支配されない実行
+    """
+    points = []
+    for run in runs:
+        if not run.cases:
+            continue
+        points.append({
+            "run_id": run.id,
+            "label": run.label,
+            "created_at": run.created_at,
+            "fingerprint": run.fingerprint,
+            "settings": run.settings,
+            "quality": run.average_metrics.get(quality_metric, 0.0),
+            "latency_ms": run.latency.get(latency_metric, 0.0),
+        })
+
+    for point in points:
+        dominated_by = None
+        for other in points:
+            if other is point:
+                continue
+            at_least_as_good = other["quality"] >= point["quality"] and other["latency_ms"] <= point["latency_ms"]
+            strictly_better = other["quality"] > point["quality"] or other["latency_ms"] < point["latency_ms"]
+            if at_least_as_good and strictly_better:
+                dominated_by = other["run_id"]
+                break
+        point["pareto"] = dominated_by is None
+        point["dominated_by"] = dominated_by
+
+    points.sort(key=lambda p: (p["latency_ms"], -p["quality"]))
+    return points
+
+
+def _is_run_id(run_id: str) -> bool:
+    """実行IDが build_run() の形式（UUID）か（パスに使うため、それ以外は存在しない扱い）"""
+    try:
+        return str(uuid.UUID(run_id)) == run_id
+    except (ValueError, TypeError, AttributeError):
+        return False
+
+
+class EvaluationRunStore:
+    """評価実行の保存先"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def _folder(self, team_id: Optional[str]) -> str:
+        if team_id:
+            return storage.get_team_path(team_id, 'evaluation_runs')
+        return config.EVALUATION_RUNS_FOLDER
+
+    def _path(self, team_id: Optional[str], run_id: str) -> str:
+        if not _is_run_id(run_id):
+            raise ValueError(f"Invalid evaluation run id: {run_id!r}")
+        return f"{self._folder(team_id)}/{run_id}.json"
+
+    def save(self, run: EvaluationRun) -> None:
+        content = json.dumps(run.to_dict(), ensure_ascii=False)
+        with self._lock:
+            storage.write_file(self._path(run.team_id, run.id), content)
+
+    def get(self, team_id: Optional[str], run_id: str) -> Optional[EvaluationRun]:
+        if not _is_run_id(run_id):
+            return None
+        path = self._path(team_id, run_id)
+        if not storage.exists(path):
+            return None
+        return EvaluationRun.from_dict(json.loads(storage.read_file(path)))
+
+    def list(self, team_id: Optional[str], limit: Optional[int] = None) -> List[EvaluationRun]:
+        """実行の一覧（新しい順）"""
+        runs = []
+        for path in storage.list_files(prefix=self._folder(team_id), pattern="*.json"):
+            try:
+                runs.append(EvaluationRun.from_dict(json.loads(storage.read_file(path))))
+            except Exception as e:
+                logger.warning("Skipping unreadable evaluation run %s: %s", path, e)
+        runs.sort(key=lambda r: r.created_at, reverse=True)
+        return runs[:limit] if limit else runs
+
+    def delete(self, team_id: Optional[str], run_id: str) -> bool:
+        if not _is_run_id(run_id):
+            return False
+        path = self._path(team_id, run_id)
+        with self._lock:
+            if not storage.exists(path):
+                return False
+            storage.delete_file(path)
+        return True
+
+
+# グローバルインスタンス
+_evaluation_run_store = None
+
+
+def get_evaluation_run_store() -> EvaluationRunStore:
+    """評価実行ストアのシングルトンインスタンスを取得"""
+    global _evaluation_run_store
+    if _evaluation_run_store is None:
+        _evaluation_run_store = EvaluationRunStore()
+    return _evaluation_run_store
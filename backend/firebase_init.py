@@ -61,12 +61,13 @@ def get_firestore_client():
     return _db
 
 
-def verify_id_token(id_token: str) -> dict:
+def verify_id_token(id_token: str, check_revoked: bool = False) -> dict:
     """
     Firebase ID Token を検証する
 
     Args:
         id_token: クライアントから送られたFirebase ID Token
+        check_revoked: トークンの失効も確認するか（Firebaseへの問い合わせが発生）
 
     Returns:
         デコードされたトークン情報（uid, email, displayNameなど）
@@ -74,14 +75,42 @@ def verify_id_token(id_token: str) -> dict:
     Raises:
         firebase_admin.auth.InvalidIdTokenError: トークンが無効
         firebase_admin.auth.ExpiredIdTokenError: トークンが期限切れ
+        firebase_admin.auth.RevokedIdTokenError: トークンが失効済み（check_revoked=True の場合）
     """
     if not _initialized:
         initialize_firebase()
 
-    decoded_token = auth.verify_id_token(id_token)
+    decoded_token = auth.verify_id_token(id_token, check_revoked=check_revoked)
     return decoded_token
 
 
+def refresh_public_keys() -> bool:
+    """
+    ID Token 署名検証用の公開鍵を取得し直す（v3.3.0）
+
+    firebase_admin のトークン検証器が使うキャッシュ付きHTTPセッションで
+    証明書URLを強制再取得し、リクエスト処理中に鍵の取得が発生しないようにする。
+
+    Returns:
+        bool: 更新できたか
+    """
+    if not _initialized:
+        initialize_firebase()
+
+    try:
+        from firebase_admin import _token_gen
+        verifier = auth._get_client(firebase_admin.get_app())._token_verifier
+        response = verifier.request(
+            url=_token_gen.ID_TOKEN_CERT_URI,
+            method='GET',
+            headers={'Cache-Control': 'no-cache'}
+        )
+        return response.status == 200
+    except Exception as e:
+        print(f"⚠️  Firebase公開鍵の更新に失敗: {e}")
+        return False
+
+
 # モジュールインポート時に自動初期化を試みる（オプション）
 # 本番環境では、エラーハンドリングのため明示的に initialize_firebase() を呼ぶことを推奨
 try:
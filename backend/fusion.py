@@ -0,0 +1,203 @@
+"""
+検索スコアの統合モジュール（v3.3.0）
+
+ハイブリッド検索の正規化・同義語展開結果のマージ・3軸のスコア統合・リランク結果の適用を
+副作用のない関数として提供する。SearchAgent（ドキュメント単位）と評価のリプレイ
+（evaluation_artifacts.py、ノートID単位）が同じ関数を使うことで、リプレイ結果が本番の検索と一致する。
+
+各関数は (item, score) のリストを受け取り、item の同一性は key(item) で判定する。
+"""
+
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+AXES = ("material", "method", "combined")
+
+# 統合後のドキュメントを選ぶ軸の優先順位
+FUSION_DOC_PRIORITY = ("combined", "method", "material")
+
+DEFAULT_AXIS_WEIGHT = 0.33
+
+
+def _identity(item):
+    return item
+
+
+def _min_max(results: List[Tuple]) -> Tuple[float, float]:
+    """(最小値, 範囲)。全スコアが同じ場合の範囲は1"""
+    scores = [score for _, score in results]
+    max_score = max(scores)
+    min_score = min(scores)
+    return min_score, (max_score - min_score if max_score != min_score else 1)
+
+
+def hybrid_combine(
+    semantic_results: List[Tuple],
+    keyword_results: List[Tuple],
+    alpha: float,
+    k: int,
+    key: Callable[[object], Hashable] = _identity
+) -> List[Tuple]:
+    """
+    セマンティック検索とキーワード検索の結果をmin-max正規化して線形結合
+
+    Args:
+        semantic_results: [(item, 類似度)]
+        keyword_results: [(item, BM25スコア)]
+        alpha: セマンティック側の重み（キーワード側は 1 - alpha）
+        k: 返却する上位件数
+        key: item の同一性を判定する関数
+
+    Returns:
+        [(item, 統合スコア)]（スコア降順）
+    """
+    item_scores = {}  # {key: {"item", "semantic", "keyword"}}
+
+    for name, results in (("semantic", semantic_results), ("keyword", keyword_results)):
+        if not results:
+            continue
+        min_score, score_range = _min_max(results)
+        for item, score in results:
+            normalized_score = (score - min_score) / score_range if score_range > 0 else 0.5
+            item_key = key(item)
+            if item_key not in item_scores:
+                item_scores[item_key] = {"item": item, "semantic": 0, "keyword": 0}
+            item_scores[item_key][name] = normalized_score
+
+    combined_results = [
+        (scores["item"], alpha * scores["semantic"] + (1 - alpha) * scores["keyword"])
+        for scores in item_scores.values()
+    ]
+    combined_results.sort(key=lambda x: x[1], reverse=True)
+    return combined_results[:k]
+
+
+def merge_max_scores(
+    result_lists: Iterable[List[Tuple]],
+    k: int,
+    key: Callable[[object], Hashable] = _identity
+) -> List[Tuple]:
+    """
+    複数クエリ（同義語展開）の検索結果をマージ（同じitemは最高スコアを採用）
+
+    Returns:
+        [(item, スコア)]（スコア降順、上位k件）
+    """
+    all_results = {}  # {key: (item, max_score)}
+    for results in result_lists:
+        for item, score in results:
+            item_key = key(item)
+            if item_key not in all_results or score > all_results[item_key][1]:
+                all_results[item_key] = (item, score)
+
+    merged_results = list(all_results.values())
+    merged_results.sort(key=lambda x: x[1], reverse=True)
+    return merged_results[:k]
+
+
+def fuse_axes(
+    axis_results: Dict[str, List[Tuple]],
+    method: str,
+    axis_weights: Dict[str, float],
+    rrf_k: int,
+    key: Callable[[object], Hashable] = _identity
+) -> List[Tuple]:
+    """
+    3軸の検索結果をitem単位でマージしてスコアを統合
+
+    Args:
+        axis_results: {軸: [(item, スコア)]}（各軸の順位はリストの並び順）
+        method: "rrf"（Reciprocal Rank Fusion） | それ以外は線形結合
+        axis_weights: {軸: ウエイト}
+        rrf_k: RRFのkパラメータ
+        key: item の同一性を判定する関数
+
+    Returns:
+        [(item, 統合スコア, key)]（スコア降順）。item は combined → method → material の順で採用
+    """
+    merged = {}  # {key: {"items": {axis: item}, "scores": {axis: score}, "ranks": {axis: rank}}}
+
+    for axis in AXES:
+        for rank, (item, score) in enumerate(axis_results.get(axis, [])):
+            item_key = key(item)
+            if item_key not in merged:
+                merged[item_key] = {
+                    "items": {a: None for a in AXES},
+                    "scores": {a: None for a in AXES},
+                    "ranks": {a: None for a in AXES}
+                }
+            merged[item_key]["items"][axis] = item
+            merged[item_key]["scores"][axis] = score
+            merged[item_key]["ranks"][axis] = rank + 1  # 1-indexed
+
+    final_scores = []
+    for item_key, data in merged.items():
+        score = 0
+        for axis in AXES:
+            weight = axis_weights.get(axis, DEFAULT_AXIS_WEIGHT)
+            if method == "rrf":
+                rank = data["ranks"][axis]
+                if rank is not None:
+                    score += weight / (rrf_k + rank)
+            else:
+                # スコアは0-1に正規化されている前提
+                axis_score = data["scores"][axis]
+                if axis_score is not None:
+                    score += weight * axis_score
+
+        final_item = next((data["items"][axis] for axis in FUSION_DOC_PRIORITY if data["items"][axis] is not None), None)
+        if final_item is not None:
+            final_scores.append((final_item, score, item_key))
+
+    final_scores.sort(key=lambda x: x[1], reverse=True)
+    return final_scores
+
+
+def rerank_by_scores(
+    candidates: List[Tuple],
+    relevance_scores: Dict[Hashable, float],
+    top_n: int,
+    key: Callable[[object], Hashable] = _identity
+) -> List[Tuple]:
+    """
+    記録済みのリランクスコアで候補を並べ替える（リランクAPIの代わり）
+
+    Args:
+        candidates: [(item, スコア, ...)]
+        relevance_scores: {key: リランクスコア}（スコアのない候補は末尾に元の順で残す）
+        top_n: 返却する上位件数
+
+    Returns:
+        候補と同じ形で、スコアをリランクスコアに置き換えたリスト
+    """
+    scored = []
+    unscored = []
+    for candidate in candidates:
+        score = relevance_scores.get(key(candidate[0]))
+        if score is None:
+            unscored.append(candidate)
+        else:
+            scored.append((candidate[0], score) + tuple(candidate[2:]))
+    scored.sort(key=lambda x: x[1], reverse=True)
+    return (scored + unscored)[:top_n]
+
+
+def unique_ranking(results: List[Tuple], limit: int, key: Optional[Callable[[object], Hashable]] = None) -> List[Hashable]:
+    """
+    重複を除いた上位 limit 件のキー
+
+    Args:
+        results: [(item, スコア, key)]（fuse_axes の戻り値）または [(item, スコア)]
+        key: 3要素目がない場合に item からキーを得る関数
+    """
+    ranking = []
+    seen = set()
+    for result in results:
+        item_key = result[2] if len(result) > 2 else (key or _identity)(result[0])
+        if item_key in seen:
+            continue
+        seen.add(item_key)
+        ranking.append(item_key)
+        if len(ranking) >= limit:
+            break
+    return ranking
@@ -0,0 +1,243 @@
+"""
+インデックス世代と変更フィード（v3.3.0）
+
+チームごとに、ベクトルインデックス・正規化辞書・同義語辞書の世代（単調増加の整数）を管理する。
+取り込み・コレクションのリセット・辞書の保存で世代を進め、チームのデータと同じ場所に保存する。
+検索結果キャッシュ・ETag・他のワーカーは、再読み込みの代わりに世代を比較して鮮度を確認できる。
+
+世代が進むと、プロセス内のリスナーに GenerationChange を通知し、直近の変更をフィードとして保持する
+（GET /generations/changes?since=<seq> でポーリング可能）。
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import config
+from storage import storage
+
+logger = logging.getLogger(__name__)
+
+# 世代を管理するリソース
+RESOURCES = ("index", "dictionary", "synonyms")
+
+
+@dataclass
+class GenerationChange:
+    """世代の変更イベント"""
+    seq: int  # プロセス内の通し番号（フィードのカーソル）
+    team_id: Optional[str]
+    resource: str  # "index" | "dictionary" | "synonyms"
+    generation: int
+    reason: str  # "ingest" | "reset" | "save" など
+    changed_at: str
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def _generations_path(team_id: Optional[str]) -> str:
+    if team_id:
+        return storage.get_team_path(team_id, 'generations')
+    return config.GENERATIONS_PATH
+
+
+def generations_etag(generations: Dict[str, int]) -> str:
+    """世代からETagを作成（いずれかの世代が進むと変わる）"""
+    payload = json.dumps(generations, sort_keys=True)
+    return '"' + hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16] + '"'
+
+
+class GenerationStore:
+    """チームごとの世代の保存・通知"""
+
+    def __init__(self, cache_ttl: Optional[float] = None, feed_size: Optional[int] = None):
+        """
+        Args:
+            cache_ttl: 保存済みの世代を再読み込みするまでの秒数（デフォルト: config.GENERATIONS_CACHE_TTL）
+            feed_size: 保持する変更イベント数（デフォルト: config.GENERATIONS_FEED_SIZE）
+        """
+        self.cache_ttl = config.GENERATIONS_CACHE_TTL if cache_ttl is None else cache_ttl
+        # {team_id: (state, loaded_at)}（state は {resource: {"generation", "updated_at", "reason"}}、loaded_at は time.monotonic）
+        self._states: Dict[Optional[str], Tuple[Dict, float]] = {}
+        self._feed: "deque[GenerationChange]" = deque(maxlen=feed_size or config.GENERATIONS_FEED_SIZE)
+        self._seq = 0
+        self._listeners: List[Callable[[GenerationChange], None]] = []
+        self._lock = threading.Lock()
+
+    def _load(self, team_id: Optional[str]) -> Dict:
+        """保存済みの世代を読み込み（未保存・読み込み失敗時は空）"""
+        path = _generations_path(team_id)
+        try:
+            if not storage.exists(path):
+                return {}
+            data = json.loads(storage.read_file(path))
+            return data.get("resources", {})
+        except Exception as e:
+            logger.warning("世代の読み込みに失敗: team=%s error=%s", team_id, e)
+            return {}
+
+    @staticmethod
+    def _dump(team_id: Optional[str], state: Dict) -> str:
+        return json.dumps({"team_id": team_id, "resources": state}, ensure_ascii=False, indent=2)
+
+    def _state(self, team_id: Optional[str], refresh: bool = False) -> Dict:
+        """チームの世代（TTL内はメモリから、他のワーカーの更新はTTL経過後に反映）。ロック内で呼ぶ"""
+        now = time.monotonic()
+        cached = self._states.get(team_id)
+        if cached is not None and not refresh and now - cached[1] < self.cache_ttl:
+            return cached[0]
+
+        state = self._load(team_id)
+        if cached is not None:
+            # 保存に失敗した更新や読み込み失敗で世代が戻らないよう、大きい方を採用
+            for resource, entry in cached[0].items():
+                if entry.get("generation", 0) > state.get(resource, {}).get("generation", 0):
+                    state[resource] = entry
+        self._states[team_id] = (state, now)
+        return state
+
+    def get(self, team_id: Optional[str]) -> Dict[str, int]:
+        """
+        チームの現在の世代
+
+        Returns:
+            {resource: generation}（一度も更新されていないリソースは0）
+        """
+        with self._lock:
+            state = self._state(team_id)
+            return {resource: state.get(resource, {}).get("generation", 0) for resource in RESOURCES}
+
+    def describe(self, team_id: Optional[str]) -> Dict[str, Dict]:
+        """チームの世代と最終更新情報（API用）"""
+        with self._lock:
+            state = self._state(team_id)
+            return {
+                resource: {
+                    "generation": state.get(resource, {}).get("generation", 0),
+                    "updated_at": state.get(resource, {}).get("updated_at"),
+                    "reason": state.get(resource, {}).get("reason"),
+                }
+                for resource in RESOURCES
+            }
+
+    def bump(self, team_id: Optional[str], resource: str, reason: str = "") -> int:
+        """
+        リソースの世代を進めて保存し、変更を通知
+
+        Args:
+            team_id: チームID（Noneはチーム未指定のグローバルデータ）
+            resource: "index" | "dictionary" | "synonyms"
+            reason: 変更理由（フィードとAPIに表示）
+
+        Returns:
+            新しい世代
+        """
+        if resource not in RESOURCES:
+            raise ValueError(f"不明なリソース: {resource}")
+
+        changed_at = datetime.now().isoformat()
+        written: Dict = {}
+        known = 0  # プロセス内で既に使った世代（保存に失敗した更新を含む）
+
+        def advance(content: Optional[str]) -> str:
+            # 他のワーカーの更新を取りこぼさないよう、保存済みの値を条件付き書き込みの中で読み直して進める
+            state = json.loads(content).get("resources", {}) if content else {}
+            generation = max(state.get(resource, {}).get("generation", 0), known) + 1
+            state[resource] = {"generation": generation, "updated_at": changed_at, "reason": reason}
+            written.clear()
+            written.update(state)
+            return self._dump(team_id, state)
+
+        with self._lock:
+            cached = self._states.get(team_id)
+            if cached is not None:
+                known = cached[0].get(resource, {}).get("generation", 0)
+            try:
+                storage.update_file(_generations_path(team_id), advance)
+                state = written
+            except Exception as e:
+                # 保存できなくてもプロセス内では世代を進める（キャッシュの無効化を優先）
+                logger.warning("世代の保存に失敗: team=%s resource=%s error=%s", team_id, resource, e)
+                state = dict(self._state(team_id))
+                generation = state.get(resource, {}).get("generation", 0) + 1
+                state[resource] = {"generation": generation, "updated_at": changed_at, "reason": reason}
+            generation = state[resource]["generation"]
+            # 保存した値でキャッシュを置き換える（TTL内でも古い世代を返さない）
+            if cached is not None:
+                for other, entry in cached[0].items():
+                    if entry.get("generation", 0) > state.get(other, {}).get("generation", 0):
+                        state[other] = entry
+            self._states[team_id] = (state, time.monotonic())
+
+            self._seq += 1
+            change = GenerationChange(
+                seq=self._seq,
+                team_id=team_id,
+                resource=resource,
+                generation=generation,
+                reason=reason,
+                changed_at=changed_at
+            )
+            self._feed.append(change)
+            listeners = list(self._listeners)
+
+        logger.info("世代を更新: team=%s resource=%s generation=%s reason=%s", team_id, resource, generation, reason)
+        for listener in listeners:
+            try:
+                listener(change)
+            except Exception:
+                logger.exception("世代変更リスナーでエラー: %s", listener)
+        return generation
+
+    def changes(self, team_id: Optional[str], since: int = 0) -> Tuple[List[GenerationChange], int]:
+        """
+        since より後のチームの変更イベント
+
+        Returns:
+            (イベントのリスト, 現在の通し番号)（次回は現在の通し番号を since に指定）
+        """
+        with self._lock:
+            events = [change for change in self._feed if change.seq > since and change.team_id == team_id]
+            return events, self._seq
+
+    def add_listener(self, listener: Callable[[GenerationChange], None]) -> None:
+        """変更イベントを受け取るリスナーを登録（世代を更新したスレッドで呼ばれる）"""
+        with self._lock:
+            if listener not in self._listeners:
+                self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[GenerationChange], None]) -> None:
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+
+_generation_store = None
+_generation_store_lock = threading.Lock()
+
+
+def get_generation_store() -> GenerationStore:
+    """世代ストアのシングルトン"""
+    global _generation_store
+    if _generation_store is None:
+        with _generation_store_lock:
+            if _generation_store is None:
+                _generation_store = GenerationStore()
+    return _generation_store
+
+
+def get_generations(team_id: Optional[str]) -> Dict[str, int]:
+    """チームの現在の世代 {resource: generation}"""
+    return get_generation_store().get(team_id)
+
+
+def bump_generation(team_id: Optional[str], resource: str, reason: str = "") -> int:
+    """リソースの世代を進める（取り込み・リセット・辞書の保存から呼ぶ）"""
+    return get_generation_store().bump(team_id, resource, reason)
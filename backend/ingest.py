@@ -5,21 +5,32 @@ Ingest notes into vector database
 """
 import os
 import re
-from typing import Dict, List, Tuple
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from pathlib import Path
 
 from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
 from langchain_core.documents import Document
 
 from config import config
 from utils import load_master_dict, normalize_text
 from storage import storage
+from chroma_pool import get_chroma_pool
+from generations import bump_generation
+import metrics
+from providers import create_chat_model, create_embeddings
 from chroma_sync import (
     get_chroma_vectorstore,
     get_team_chroma_vectorstore,
     get_team_multi_collection_vectorstores,
-    sync_chroma_to_gcs
+    hold_team_chroma,
+    mark_team_chroma_dirty,
+    sync_chroma_to_gcs,
+    sync_team_chroma_to_gcs
 )
 from term_extractor import TermExtractor
 from dictionary import get_dictionary_manager
@@ -31,6 +42,9 @@ from experimenter_profile import (
 )
 
 
+logger = logging.getLogger(__name__)
+
+
 def extract_sections(content: str) -> Dict[str, str]:
     """
     マークダウンノートから材料・方法セクションを抽出する（v3.1.1新規）
@@ -118,10 +132,22 @@ def parse_markdown_note(file_path: str, norm_map: dict) -> Dict:
     }
 
 
-def get_existing_ids(vectorstore) -> List[str]:
-    """ChromaDBに既に登録されているドキュメントのソースID一覧を取得"""
+def get_existing_ids(vectorstore, note_ids: Optional[List[str]] = None) -> List[str]:
+    """
+    ChromaDBに既に登録されているドキュメントのソースID一覧を取得
+
+    Args:
+        vectorstore: 対象のvectorstore
+        note_ids: 指定した場合はこのノートIDのうち登録済みのものだけを確認（v3.3.0）
+    """
     try:
-        data = vectorstore.get()
+        # v3.3.0: 本文は不要なのでメタデータのみ取得
+        if note_ids is not None:
+            if not note_ids:
+                return []
+            data = vectorstore.get(where={"source": {"$in": list(note_ids)}}, include=["metadatas"])
+        else:
+            data = vectorstore.get(include=["metadatas"])
         existing_ids = []
         if data and data['metadatas']:
             for meta in data['metadatas']:
@@ -132,6 +158,532 @@ def get_existing_ids(vectorstore) -> List[str]:
         return []
 
 
+# ============================================
+# ストリーミング取り込みパイプライン（v3.3.0）
+# scan → parse → normalize → embed → write → post-action
+# ============================================
+
+# 書き込み順序（combinedは既存IDチェックに使うため最後）
+COLLECTION_WRITE_ORDER = ("materials", "methods", "combined")
+
+# Embedding APIの同時リクエスト数の上限（プロセス全体、全取り込みジョブで共有）
+_embedding_slots = threading.BoundedSemaphore(max(1, config.INGEST_MAX_IN_FLIGHT))
+
+
+@dataclass
+class PreparedNote:
+    """パース・正規化済みのノート（コレクションごとの登録ドキュメントを保持）"""
+    note_id: str
+    file_path: str
+    documents: Dict[str, List[Document]] = field(default_factory=dict)  # {"materials": [...], "methods": [...], "combined": [...]}
+
+
+@dataclass
+class EmbeddedBatch:
+    """Embedding済みのノートバッチ"""
+    notes: List[PreparedNote]
+    # {collection_key: (documents, vectors)}
+    collections: Dict[str, Tuple[List[Document], List[List[float]]]] = field(default_factory=dict)
+    error: Optional[str] = None  # Embedding失敗時のエラーメッセージ
+
+
+class _StageError:
+    """バックグラウンドステージで発生した例外を受け渡すためのラッパー"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_STAGE_DONE = object()
+
+
+def _run_stage_in_background(iterable: Iterable, maxsize: int) -> Iterator:
+    """
+    上流ステージを別スレッドで実行し、有界キュー経由で結果を受け渡す
+
+    キューが満杯の間は上流が待機するため、メモリ使用量はmaxsize件分で頭打ちになる。
+    下流が途中で終了した場合は上流スレッドも停止する。
+    """
+    buffer: queue.Queue = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_STAGE_DONE)
+        except BaseException as e:
+            put(_StageError(e))
+        finally:
+            # 上流がジェネレータの場合は連鎖的に停止させる
+            _close_upstream(iterable)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            item = buffer.get()
+            if item is _STAGE_DONE:
+                break
+            if isinstance(item, _StageError):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+
+def _close_upstream(iterable: Iterable) -> None:
+    """上流がジェネレータの場合は閉じる（_run_stage_in_background の上流スレッドまで停止を伝える）"""
+    close = getattr(iterable, "close", None)
+    if close:
+        close()
+
+
+def _batched(iterable: Iterable, size: int) -> Iterator[List]:
+    """イテラブルをsize件ずつのリストにまとめる（途中で閉じられた場合は上流も閉じる）"""
+    try:
+        batch = []
+        for item in iterable:
+            batch.append(item)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        _close_upstream(iterable)
+
+
+# 進捗コールバックの型: callback(event, data)
+#   event: "scanned" | "embedded" | "written" | "error"
+#   data: {"note_ids": [...], "message": "..."}
+ProgressCallback = Callable[[str, Dict], None]
+
+
+def _notify(progress_callback: Optional[ProgressCallback], event: str, **data) -> None:
+    """進捗コールバックを呼び出す（コールバック側の例外で取り込みを止めない）"""
+    if not progress_callback:
+        return
+    try:
+        progress_callback(event, data)
+    except Exception as e:
+        logger.warning("進捗通知エラー (%s): %s", event, e)
+
+
+def scan_note_files(
+    source_folder: str,
+    existing_ids: Set[str],
+    skipped_ids: List[str],
+    checkpoint_ids: Optional[Set[str]] = None,
+    progress_callback: Optional[ProgressCallback] = None,
+    files: Optional[List[str]] = None
+) -> Iterator[str]:
+    """
+    取り込み対象のノートファイルを列挙する（scanステージ）
+
+    Args:
+        source_folder: スキャン対象フォルダ
+        existing_ids: 登録済みノートID（スキップ対象）
+        skipped_ids: スキップしたノートIDの追記先
+        checkpoint_ids: 前回の実行で書き込み済みのノートID（再開時にスキップ）
+        progress_callback: 進捗コールバック
+        files: 取り込むファイルパスの明示指定（指定時はフォルダをスキャンしない）
+
+    Yields:
+        取り込み対象のファイルパス
+    """
+    checkpoint_ids = checkpoint_ids or set()
+
+    if files is None:
+        candidates = storage.list_files(prefix=source_folder, pattern="*.md")
+    else:
+        # 明示指定時は、既に移動・削除されたファイルを除外する
+        candidates = [f for f in files if f.endswith('.md') and storage.exists(f)]
+
+    for file in candidates:
+        note_id = file.split('/')[-1].replace('.md', '')
+
+        # 既にDBにあるIDならスキップ（再構築モードではexisting_idsは空）
+        if note_id in existing_ids:
+            logger.debug("Skip: %s (既に存在します)", note_id)
+            skipped_ids.append(note_id)
+            continue
+
+        # チェックポイント済みのノートは再処理しない
+        if note_id in checkpoint_ids:
+            continue
+
+        _notify(progress_callback, "scanned", note_ids=[note_id])
+        yield file
+
+
+def prepare_note(
+    file_path: str,
+    norm_map: dict,
+    multi_collection: bool,
+    profile_manager: Optional[ExperimenterProfileManager] = None,
+    shortcut_llm=None,
+    expand_shortcuts: bool = True
+) -> PreparedNote:
+    """
+    ノートをパース・正規化し、コレクションごとの登録ドキュメントを作成する（parse/normalizeステージ）
+
+    Args:
+        file_path: ノートファイルのパス
+        norm_map: 正規化辞書
+        multi_collection: 3コレクションモードかどうか
+        profile_manager: 実験者プロファイルマネージャー（サフィックスマッピング用）
+        shortcut_llm: 省略形展開用LLM
+        expand_shortcuts: 省略形展開を行うかどうか
+
+    Returns:
+        PreparedNote
+    """
+    note_id = file_path.split('/')[-1].replace('.md', '')
+
+    # 新規ファイルのパース
+    data = parse_markdown_note(file_path, norm_map)
+    content = data["full_content"]
+
+    base_metadata = {
+        "source": data["id"],
+        "note_id": data["id"],  # v3.1.1: note_idでマージするため追加
+        "materials": ", ".join(data["search_keywords"])
+    }
+
+    logger.debug("Processing New File: %s -> Keywords: %s", data['id'], base_metadata['materials'])
+
+    if not multi_collection:
+        # 従来モード: ノート全体のみ
+        # v3.2.1: 辞書正規化済みのテキストを使用
+        return PreparedNote(
+            note_id=note_id,
+            file_path=file_path,
+            documents={"combined": [Document(
+                page_content=normalize_text(content, norm_map),
+                metadata=base_metadata
+            )]}
+        )
+
+    # v3.1.1: セクション抽出
+    sections = extract_sections(content)
+
+    # v3.2.1: 辞書による名寄せ（材料・方法セクションを正規化）
+    materials_normalized = normalize_text(sections["materials"], norm_map) if sections["materials"] else ""
+    methods_normalized = normalize_text(sections["methods"], norm_map) if sections["methods"] else ""
+    combined_normalized = normalize_text(sections["combined"], norm_map) if sections["combined"] else ""
+
+    # v3.2.0: サフィックスマッピングの適用（実験者プロファイルに基づく）
+    materials_text_for_embedding = materials_normalized
+    suffix_conventions = []
+    if profile_manager:
+        experimenter_id = profile_manager.get_experimenter_id(note_id)
+        if experimenter_id:
+            profile = profile_manager.get_profile(experimenter_id)
+            if profile and profile.suffix_conventions:
+                suffix_conventions = profile.suffix_conventions
+                # 材料セクションにサフィックスマッピングを適用
+                materials_text_for_embedding = apply_suffix_mapping(
+                    sections["materials"],
+                    suffix_conventions
+                )
+                if materials_text_for_embedding != sections["materials"]:
+                    logger.debug("サフィックス正規化: %s (実験者%s)", note_id, experimenter_id)
+
+    # v3.2.0: 省略形展開処理（ノートごとに材料セクションから動的解析）
+    methods_text_for_embedding = methods_normalized
+    if expand_shortcuts and shortcut_llm and sections["materials"] and sections["methods"]:
+        try:
+            # 材料セクションから省略形マッピングを動的に抽出
+            shortcuts = extract_shortcuts_from_materials(sections["materials"], shortcut_llm)
+
+            if shortcuts:
+                # 抽出した省略形で方法セクションを展開
+                methods_text_for_embedding = expand_shortcuts_in_text(
+                    sections["methods"],
+                    shortcuts
+                )
+                if methods_text_for_embedding != sections["methods"]:
+                    logger.debug("省略形展開: %s (%s件のマッピング)", note_id, len(shortcuts))
+        except Exception as e:
+            logger.warning("省略形展開エラー (%s): %s", note_id, e)
+
+    # v3.2.0: 方法セクションにもサフィックスマッピングを適用
+    if suffix_conventions and methods_text_for_embedding:
+        methods_text_for_embedding = apply_suffix_mapping(
+            methods_text_for_embedding,
+            suffix_conventions
+        )
+
+    documents = {"materials": [], "methods": [], "combined": []}
+
+    # 材料セクション（空でない場合のみ）
+    # v3.2.0: サフィックス正規化済みのテキストを使用
+    if materials_text_for_embedding:
+        documents["materials"].append(Document(
+            page_content=materials_text_for_embedding,
+            metadata={**base_metadata, "section_type": "materials"}
+        ))
+    else:
+        logger.warning("警告: %s - 材料セクションが見つかりません", data['id'])
+
+    # 方法セクション（空でない場合のみ）
+    # v3.2.0: 省略形展開済みのテキストを使用
+    if methods_text_for_embedding:
+        documents["methods"].append(Document(
+            page_content=methods_text_for_embedding,
+            metadata={**base_metadata, "section_type": "methods"}
+        ))
+    else:
+        logger.warning("警告: %s - 方法セクションが見つかりません", data['id'])
+
+    # 総合（ノート全体）
+    # v3.2.1: 辞書正規化済みのテキストを使用
+    documents["combined"].append(Document(
+        page_content=combined_normalized,
+        metadata={**base_metadata, "section_type": "combined"}
+    ))
+
+    return PreparedNote(note_id=note_id, file_path=file_path, documents=documents)
+
+
+def prepare_notes(
+    files: Iterable[str],
+    failed_ids: List[str],
+    progress_callback: Optional[ProgressCallback] = None,
+    **kwargs
+) -> Iterator[PreparedNote]:
+    """prepare_noteを順に適用する（パースに失敗したノートは記録してスキップ）"""
+    for file in files:
+        try:
+            yield prepare_note(file, **kwargs)
+        except Exception as e:
+            note_id = file.split('/')[-1].replace('.md', '')
+            logger.warning("パースエラー (%s): %s", note_id, e)
+            failed_ids.append(note_id)
+            _notify(progress_callback, "error", note_ids=[note_id], message=f"パースエラー: {e}")
+
+
+def _embed_documents(embeddings, docs: List[Document]) -> List[List[float]]:
+    """同時実行数の上限内でEmbeddingを取得"""
+    with _embedding_slots:
+        return embeddings.embed_documents([doc.page_content for doc in docs])
+
+
+def embed_note_batch(
+    notes: List[PreparedNote],
+    embeddings,
+    executor: Optional[ThreadPoolExecutor] = None
+) -> EmbeddedBatch:
+    """
+    ノートバッチのドキュメントをコレクションごとにEmbeddingする（embedステージ）
+
+    Args:
+        notes: PreparedNoteのリスト
+        embeddings: Embedding関数
+        executor: 指定した場合はコレクションごとのEmbeddingを並行実行
+
+    Returns:
+        EmbeddedBatch
+    """
+    batch = EmbeddedBatch(notes=notes)
+    docs_by_key = {}
+    for key in COLLECTION_WRITE_ORDER:
+        docs = [doc for note in notes for doc in note.documents.get(key, [])]
+        if docs:
+            docs_by_key[key] = docs
+
+    if executor is None or len(docs_by_key) <= 1:
+        for key, docs in docs_by_key.items():
+            batch.collections[key] = (docs, _embed_documents(embeddings, docs))
+        return batch
+
+    futures = {key: executor.submit(_embed_documents, embeddings, docs) for key, docs in docs_by_key.items()}
+    for key, docs in docs_by_key.items():
+        batch.collections[key] = (docs, futures[key].result())
+    return batch
+
+
+def embed_note_batches(
+    batches: Iterable[List[PreparedNote]],
+    embeddings,
+    progress_callback: Optional[ProgressCallback] = None,
+    executor: Optional[ThreadPoolExecutor] = None
+) -> Iterator[EmbeddedBatch]:
+    """
+    embed_note_batchを順に適用する（失敗したバッチはerrorを設定して下流に渡す）
+
+    途中で閉じられた場合は上流（scan → parse ステージ）も閉じ、そのスレッドを停止させる。
+    """
+    try:
+        for notes in batches:
+            try:
+                batch = embed_note_batch(notes, embeddings, executor=executor)
+            except Exception as e:
+                yield EmbeddedBatch(notes=notes, error=str(e))
+                continue
+            _notify(progress_callback, "embedded", note_ids=[note.note_id for note in notes])
+            yield batch
+    finally:
+        _close_upstream(batches)
+
+
+def _document_ids(key: str, docs: List[Document]) -> List[str]:
+    """ノートID・コレクション・ノート内の順番から決まるドキュメントID（再試行で同じIDになる）"""
+    ids = []
+    counts: Dict[str, int] = {}
+    for doc in docs:
+        note_id = doc.metadata.get("note_id") or doc.metadata.get("source")
+        index = counts.get(note_id, 0)
+        counts[note_id] = index + 1
+        ids.append(f"{note_id}:{key}:{index}")
+    return ids
+
+
+def _write_collection(key: str, vectorstore: Chroma, docs: List[Document], vectors: List[List[float]]) -> None:
+    # 固定IDでupsertするため、途中で失敗したバッチを再試行しても重複しない
+    vectorstore._collection.upsert(
+        ids=_document_ids(key, docs),
+        embeddings=vectors,
+        metadatas=[doc.metadata for doc in docs],
+        documents=[doc.page_content for doc in docs]
+    )
+
+
+def write_embedded_batch(
+    batch: EmbeddedBatch,
+    vectorstores: Dict[str, Chroma],
+    executor: Optional[ThreadPoolExecutor] = None
+) -> None:
+    """
+    Embedding済みバッチをChromaDBに書き込む（writeステージ）
+
+    executorを指定した場合、全コレクションを並行して書き込む（所要時間は最も遅いコレクション分）。
+    ドキュメントIDはノートIDから決まるため、一部のコレクションだけ書き込まれたバッチを
+    再試行しても重複しない（既存IDチェックはcombinedのみを参照する）。
+    """
+    keys = [key for key in COLLECTION_WRITE_ORDER if key in batch.collections]
+
+    if executor is None or len(keys) <= 1:
+        for key in keys:
+            _write_collection(key, vectorstores[key], *batch.collections[key])
+        return
+
+    futures = [executor.submit(_write_collection, key, vectorstores[key], *batch.collections[key]) for key in keys]
+    # 全件の完了を待ってから例外を送出する
+    errors = [f.exception() for f in futures]
+    for error in errors:
+        if error is not None:
+            raise error
+
+
+def finalize_notes(
+    notes: List[PreparedNote],
+    post_action: str,
+    processed_folder: str,
+    archive_folder: str
+) -> None:
+    """
+    書き込みが完了したノートの後処理を行う（post-actionステージ）
+
+    Args:
+        notes: 書き込み完了したノート
+        post_action: 取り込み後のアクション ('move_to_processed', 'delete', 'archive', 'keep')
+        processed_folder: 処理済みフォルダ
+        archive_folder: アーカイブフォルダ
+    """
+    if post_action == 'move_to_processed':
+        storage.mkdir(processed_folder)
+        dest_folder = processed_folder
+    elif post_action == 'archive':
+        # アーカイブフォルダ作成（後方互換性のため残す）
+        storage.mkdir(archive_folder)
+        dest_folder = archive_folder
+    else:
+        dest_folder = None
+
+    if dest_folder is not None:
+        # v3.3.0: バッチ単位で一括移動（GCS/Google Driveではバッチリクエスト）
+        pairs = [(note.file_path, f"{dest_folder}/{note.note_id}.md") for note in notes]
+        try:
+            failed = storage.move_files(pairs)
+        except Exception as e:
+            failed = {src: str(e) for src, _ in pairs}
+        moved = len(pairs) - len(failed)
+        label = "Moved to processed" if post_action == 'move_to_processed' else "Archived"
+        logger.info("%s: %s件 -> %s", label, moved, dest_folder)
+        for src, error in failed.items():
+            logger.warning("後処理エラー (%s): %s", src, error)
+        return
+
+    for note in notes:
+        file_path = note.file_path
+
+        try:
+            if post_action == 'delete':
+                storage.delete_file(file_path)
+                logger.debug("Deleted: %s", file_path)
+
+            elif post_action == 'keep':
+                logger.debug("Kept: %s", file_path)
+
+        except Exception as e:
+            logger.warning("後処理エラー (%s): %s", note.note_id, e)
+
+
+def _write_embedded_batches(
+    embedded_batches: Iterable[EmbeddedBatch],
+    vectorstores: Dict[str, Chroma],
+    executor: ThreadPoolExecutor,
+    new_ids: List[str],
+    failed_ids: List[str],
+    post_action: str,
+    processed_folder: str,
+    archive_folder: str,
+    progress_callback: Optional[ProgressCallback] = None
+) -> None:
+    """Embedding済みバッチを順に書き込み、バッチの書き込み完了ごとにノートを確定する（write → post-actionステージ）"""
+    for batch_num, batch in enumerate(embedded_batches, start=1):
+        batch_ids = [note.note_id for note in batch.notes]
+
+        if batch.error:
+            logger.warning("バッチ %s: Embeddingエラー - %s", batch_num, batch.error)
+            metrics.INGEST_NOTES.inc(len(batch_ids), status="failed")
+            failed_ids.extend(batch_ids)
+            _notify(progress_callback, "error", note_ids=batch_ids, message=f"Embeddingエラー: {batch.error}")
+            continue
+
+        logger.info("バッチ %s: %s件を書き込み中...", batch_num, len(batch_ids))
+
+        try:
+            with metrics.INGEST_BATCH_SECONDS.time():
+                write_embedded_batch(batch, vectorstores, executor=executor)
+        except Exception as e:
+            logger.warning("バッチ %s: エラー - %s", batch_num, e)
+            metrics.INGEST_NOTES.inc(len(batch_ids), status="failed")
+            failed_ids.extend(batch_ids)
+            _notify(progress_callback, "error", note_ids=batch_ids, message=f"書き込みエラー: {e}")
+            continue
+
+        logger.info("バッチ %s: 完了", batch_num)
+        get_chroma_pool().invalidate_counts()
+        metrics.INGEST_NOTES.inc(len(batch_ids), status="written")
+        finalize_notes(batch.notes, post_action, processed_folder, archive_folder)
+        new_ids.extend(batch_ids)
+        _notify(progress_callback, "written", note_ids=batch_ids)
+
+
 def ingest_notes(
     api_key: str,
     source_folder: str = None,
@@ -141,11 +693,19 @@ def ingest_notes(
     rebuild_mode: bool = False,
     team_id: str = None,  # v3.0: マルチテナント対応
     multi_collection: bool = True,  # v3.1.1: 3コレクション対応（デフォルト: True）
-    expand_shortcuts: bool = True  # v3.2.0: 省略形展開機能（デフォルト: True）
+    expand_shortcuts: bool = True,  # v3.2.0: 省略形展開機能（デフォルト: True）
+    checkpoint_ids: Optional[Set[str]] = None,  # v3.3.0: 再開時にスキップする書き込み済みノートID
+    progress_callback: Optional[ProgressCallback] = None,  # v3.3.0: 進捗コールバック
+    files: Optional[List[str]] = None  # v3.3.0: 取り込むファイルの明示指定（フォルダ監視から使用）
 ) -> Tuple[List[str], List[str]]:
     """
     ノートをデータベースに取り込む（増分更新）
 
+    v3.3.0: ストリーミングパイプライン化
+        scan → parse → normalize → embed → write → post-action の各ステージを
+        有界キューでつなぎ、ノートはバッチの書き込み完了ごとに後処理（移動等）される。
+        メモリ使用量はコーパスサイズに依存せず、途中で失敗しても完了分は確定済みとなる。
+
     Args:
         api_key: OpenAI APIキー
         source_folder: 新規ノートフォルダパス（デフォルト: notes/new）
@@ -160,6 +720,11 @@ def ingest_notes(
         expand_shortcuts: 省略形展開機能（v3.2.0）
             - True: 方法セクションの省略形（①②③等）を材料名に展開
             - False: 展開せずにそのまま登録
+        checkpoint_ids: 前回の実行で書き込み済みのノートID（v3.3.0、ジョブ再開用）
+        progress_callback: 進捗コールバック（v3.3.0）
+            callback(event, data) の形式で "scanned" / "embedded" / "written" / "error" を通知
+        files: 取り込むファイルパスのリスト（v3.3.0）
+            指定時はsource_folderをスキャンせず、既存IDの確認もこのファイル分のみ行う
 
     Returns:
         (new_notes, skipped_notes): 取り込んだノートIDと既存のノートID
@@ -195,31 +760,30 @@ def ingest_notes(
 
     # 正規化辞書のロード
     norm_map, _ = load_master_dict()
-    print(f"正規化辞書ロード: {len(norm_map)} エントリ")
+    logger.info("正規化辞書ロード: %s エントリ", len(norm_map))
 
     # v3.2.0: 実験者プロファイルマネージャーの初期化（サフィックスマッピング用）
     profile_manager = None
     if team_id:
         try:
             profile_manager = ExperimenterProfileManager(team_id=team_id)
-            print(f"実験者プロファイルをロード: {len(profile_manager.experimenters)}件")
+            logger.info("実験者プロファイルをロード: %s件", len(profile_manager.experimenters))
         except Exception as e:
-            print(f"プロファイルロードエラー: {e}")
+            logger.warning("プロファイルロードエラー: %s", e)
             profile_manager = None
 
     # v3.2.0: 省略形展開用のLLMを初期化（expand_shortcutsが有効な場合）
     shortcut_llm = None
     if expand_shortcuts:
         try:
-            from langchain_openai import ChatOpenAI
-            shortcut_llm = ChatOpenAI(model="gpt-4o-mini", api_key=api_key, temperature=0)
-            print("省略形展開: LLMを初期化しました")
+            shortcut_llm = create_chat_model("gpt-4o-mini", api_key, temperature=0)
+            logger.info("省略形展開: LLMを初期化しました")
         except Exception as e:
-            print(f"省略形展開LLM初期化エラー: {e}")
+            logger.warning("省略形展開LLM初期化エラー: %s", e)
             shortcut_llm = None
 
     # ChromaDBの初期化（v3.1.1: 3コレクション対応）
-    embeddings = OpenAIEmbeddings(model=embedding_model, api_key=api_key)
+    embeddings = create_embeddings(embedding_model, api_key)
 
     if team_id and multi_collection:
         # v3.1.1: 3コレクションモード
@@ -230,227 +794,115 @@ def ingest_notes(
         )
         # 既存IDチェックはcombinedコレクションを使用
         primary_vectorstore = vectorstores["combined"]
-        print("3コレクションモード: materials, methods, combinedに登録します")
-    elif team_id:
-        vectorstores = None
-        primary_vectorstore = get_team_chroma_vectorstore(
-            team_id=team_id,
-            embeddings=embeddings,
-            embedding_model=embedding_model
-        )
+        logger.info("3コレクションモード: materials, methods, combinedに登録します")
     else:
-        vectorstores = None
-        primary_vectorstore = get_chroma_vectorstore(embeddings, embedding_model=embedding_model)
+        # 単一コレクションモードではcombinedキーに従来のvectorstoreを割り当てる
+        multi_collection = False
+        if team_id:
+            primary_vectorstore = get_team_chroma_vectorstore(
+                team_id=team_id,
+                embeddings=embeddings,
+                embedding_model=embedding_model
+            )
+        else:
+            primary_vectorstore = get_chroma_vectorstore(embeddings, embedding_model=embedding_model)
+        vectorstores = {"combined": primary_vectorstore}
 
     # 既存データの確認（増分更新のため）
     if rebuild_mode:
         # 再構築モード：既存IDのチェックをスキップ（全て取り込む）
-        existing_ids = []
-        print("再構築モード: 全てのノートを取り込みます")
+        existing_ids = set()
+        logger.info("再構築モード: 全てのノートを取り込みます")
+    elif files is not None:
+        # ファイル明示指定時は対象ノートのみ確認（全件取得を避ける）
+        target_ids = [f.split('/')[-1].replace('.md', '') for f in files]
+        existing_ids = set(get_existing_ids(primary_vectorstore, target_ids))
+        logger.info("指定ファイル %s件のうち登録済み: %s件", len(files), len(existing_ids))
     else:
-        existing_ids = get_existing_ids(primary_vectorstore)
-        print(f"既存の登録ノート数: {len(existing_ids)}")
+        existing_ids = set(get_existing_ids(primary_vectorstore))
+        logger.info("既存の登録ノート数: %s", len(existing_ids))
 
-    # ファイルスキャンと新規判定
-    files = storage.list_files(prefix=source_folder, pattern="*.md")
-
-    # 3コレクション用のドキュメントリスト
-    materials_docs = []
-    methods_docs = []
-    combined_docs = []
     skipped_ids = []
     new_ids = []
+    failed_ids = []
+
+    # v3.3.0: コレクションごとのEmbedding・書き込みを並行実行するワーカー
+    # （Embeddingの同時リクエスト数は_embedding_slotsで全体制限）
+    embed_executor = ThreadPoolExecutor(max_workers=len(COLLECTION_WRITE_ORDER), thread_name_prefix="ingest-embed")
+    write_executor = ThreadPoolExecutor(max_workers=len(COLLECTION_WRITE_ORDER), thread_name_prefix="ingest-write")
+
+    # scan → parse → normalize（バックグラウンドスレッド、有界キュー）
+    prepared_notes = _run_stage_in_background(
+        prepare_notes(
+            scan_note_files(
+                source_folder,
+                existing_ids,
+                skipped_ids,
+                checkpoint_ids=checkpoint_ids,
+                progress_callback=progress_callback,
+                files=files
+            ),
+            failed_ids,
+            progress_callback=progress_callback,
+            norm_map=norm_map,
+            multi_collection=multi_collection,
+            profile_manager=profile_manager,
+            shortcut_llm=shortcut_llm,
+            expand_shortcuts=expand_shortcuts
+        ),
+        maxsize=config.INGEST_QUEUE_MAXSIZE
+    )
 
-    for file in files:
-        note_id = file.split('/')[-1].replace('.md', '')
-
-        # 既にDBにあるIDならスキップ（再構築モードではスキップしない）
-        if not rebuild_mode and note_id in existing_ids:
-            print(f"Skip: {note_id} (既に存在します)")
-            skipped_ids.append(note_id)
-            continue
-
-        # 新規ファイルのパース
-        data = parse_markdown_note(file, norm_map)
-        content = data["full_content"]
-
-        # v3.1.1: セクション抽出
-        sections = extract_sections(content)
-
-        # v3.2.1: 辞書による名寄せ（材料・方法セクションを正規化）
-        materials_normalized = normalize_text(sections["materials"], norm_map) if sections["materials"] else ""
-        methods_normalized = normalize_text(sections["methods"], norm_map) if sections["methods"] else ""
-        combined_normalized = normalize_text(sections["combined"], norm_map) if sections["combined"] else ""
-
-        # v3.2.0: サフィックスマッピングの適用（実験者プロファイルに基づく）
-        materials_text_for_embedding = materials_normalized
-        suffix_conventions = []
-        if profile_manager:
-            experimenter_id = profile_manager.get_experimenter_id(note_id)
-            if experimenter_id:
-                profile = profile_manager.get_profile(experimenter_id)
-                if profile and profile.suffix_conventions:
-                    suffix_conventions = profile.suffix_conventions
-                    # 材料セクションにサフィックスマッピングを適用
-                    materials_text_for_embedding = apply_suffix_mapping(
-                        sections["materials"],
-                        suffix_conventions
-                    )
-                    if materials_text_for_embedding != sections["materials"]:
-                        print(f"  サフィックス正規化: {note_id} (実験者{experimenter_id})")
-
-        # v3.2.0: 省略形展開処理（ノートごとに材料セクションから動的解析）
-        methods_text_for_embedding = methods_normalized
-        if expand_shortcuts and shortcut_llm and sections["materials"] and sections["methods"]:
-            try:
-                # 材料セクションから省略形マッピングを動的に抽出
-                shortcuts = extract_shortcuts_from_materials(sections["materials"], shortcut_llm)
-
-                if shortcuts:
-                    # 抽出した省略形で方法セクションを展開
-                    methods_text_for_embedding = expand_shortcuts_in_text(
-                        sections["methods"],
-                        shortcuts
-                    )
-                    if methods_text_for_embedding != sections["methods"]:
-                        print(f"  省略形展開: {note_id} ({len(shortcuts)}件のマッピング)")
-            except Exception as e:
-                print(f"  省略形展開エラー ({note_id}): {e}")
+    # embed（バックグラウンドスレッド、Embedding済みバッチは最大2件まで先行）
+    embedded_batches = _run_stage_in_background(
+        embed_note_batches(
+            _batched(prepared_notes, config.INGEST_BATCH_SIZE),
+            embeddings,
+            progress_callback=progress_callback,
+            executor=embed_executor
+        ),
+        maxsize=2
+    )
 
-        # v3.2.0: 方法セクションにもサフィックスマッピングを適用
-        if suffix_conventions and methods_text_for_embedding:
-            methods_text_for_embedding = apply_suffix_mapping(
-                methods_text_for_embedding,
-                suffix_conventions
+    # v3.3.0: 書き込み・アップロードが終わるまでチームのChromaDBをローカルから退避させない
+    with hold_team_chroma(team_id):
+        try:
+            _write_embedded_batches(
+                embedded_batches,
+                vectorstores,
+                write_executor,
+                new_ids,
+                failed_ids,
+                post_action,
+                processed_folder,
+                archive_folder,
+                progress_callback
             )
-
-        base_metadata = {
-            "source": data["id"],
-            "note_id": data["id"],  # v3.1.1: note_idでマージするため追加
-            "materials": ", ".join(data["search_keywords"])
-        }
-
-        print(f"Processing New File: {data['id']} -> Keywords: {base_metadata['materials']}")
-
-        if multi_collection and vectorstores:
-            # 3コレクションモード: 各セクションを別々のドキュメントとして追加
-            # 材料セクション（空でない場合のみ）
-            # v3.2.0: サフィックス正規化済みのテキストを使用
-            if materials_text_for_embedding:
-                materials_docs.append(Document(
-                    page_content=materials_text_for_embedding,
-                    metadata={**base_metadata, "section_type": "materials"}
-                ))
-            else:
-                print(f"  警告: {data['id']} - 材料セクションが見つかりません")
-
-            # 方法セクション（空でない場合のみ）
-            # v3.2.0: 省略形展開済みのテキストを使用
-            if methods_text_for_embedding:
-                methods_docs.append(Document(
-                    page_content=methods_text_for_embedding,
-                    metadata={**base_metadata, "section_type": "methods"}
-                ))
+        finally:
+            embedded_batches.close()
+            embed_executor.shutdown(wait=True)
+            write_executor.shutdown(wait=True)
+            # 途中で失敗しても書き込み済みのノートがあればインデックスの世代を進める
+            if new_ids:
+                mark_team_chroma_dirty(team_id)
+                bump_generation(team_id, "index", reason="ingest")
+
+        if new_ids:
+            logger.info("登録完了: %s件", len(new_ids))
+
+            # GCSに同期（本番環境のみ、v3.3.0: チームはチーム単位で同期）
+            if team_id:
+                sync_team_chroma_to_gcs(team_id)
             else:
-                print(f"  警告: {data['id']} - 方法セクションが見つかりません")
-
-            # 総合（ノート全体）
-            # v3.2.1: 辞書正規化済みのテキストを使用
-            combined_docs.append(Document(
-                page_content=combined_normalized,
-                metadata={**base_metadata, "section_type": "combined"}
-            ))
+                sync_chroma_to_gcs()
         else:
-            # 従来モード: ノート全体のみ
-            # v3.2.1: 辞書正規化済みのテキストを使用
-            combined_docs.append(Document(
-                page_content=normalize_text(content, norm_map),
-                metadata=base_metadata
-            ))
-
-        new_ids.append(note_id)
-
-    # DBへの追加登録（バッチ処理）
-    if new_ids:
-        print(f"{len(new_ids)} 件の新規ノートをデータベースに追加しています...")
-
-        # バッチサイズ（トークン制限を考慮して50件ずつ処理）
-        BATCH_SIZE = 50
-
-        if multi_collection and vectorstores:
-            # v3.1.1: 3コレクションに登録
-            for collection_name, docs, vectorstore in [
-                ("materials", materials_docs, vectorstores["materials"]),
-                ("methods", methods_docs, vectorstores["methods"]),
-                ("combined", combined_docs, vectorstores["combined"])
-            ]:
-                if not docs:
-                    print(f"  {collection_name}: 登録するドキュメントなし")
-                    continue
+            logger.info("新規に追加すべきノートはありませんでした。")
 
-                print(f"\n  {collection_name}コレクション: {len(docs)}件を登録中...")
-                total_batches = (len(docs) + BATCH_SIZE - 1) // BATCH_SIZE
-
-                for i in range(0, len(docs), BATCH_SIZE):
-                    batch = docs[i:i + BATCH_SIZE]
-                    batch_num = (i // BATCH_SIZE) + 1
-                    print(f"    バッチ {batch_num}/{total_batches}: {len(batch)}件を処理中...")
-
-                    try:
-                        vectorstore.add_documents(documents=batch)
-                        print(f"    バッチ {batch_num}/{total_batches}: 完了")
-                    except Exception as e:
-                        print(f"    バッチ {batch_num}/{total_batches}: エラー - {str(e)}")
-                        continue
-
-        else:
-            # 従来モード: 単一コレクションに登録
-            total_batches = (len(combined_docs) + BATCH_SIZE - 1) // BATCH_SIZE
-
-            for i in range(0, len(combined_docs), BATCH_SIZE):
-                batch = combined_docs[i:i + BATCH_SIZE]
-                batch_num = (i // BATCH_SIZE) + 1
-                print(f"  バッチ {batch_num}/{total_batches}: {len(batch)}件を処理中...")
-
-                try:
-                    primary_vectorstore.add_documents(documents=batch)
-                    print(f"  バッチ {batch_num}/{total_batches}: 完了")
-                except Exception as e:
-                    print(f"  バッチ {batch_num}/{total_batches}: エラー - {str(e)}")
-                    continue
+    if failed_ids:
+        logger.warning("登録に失敗したノート: %s件（元のフォルダに残しています）", len(failed_ids))
 
-        print("\n登録完了。")
-
-        # GCSに同期（本番環境のみ）
-        sync_chroma_to_gcs()
-
-        # ファイル処理（post_action に応じて）
-        for note_id in new_ids:
-            file_path = f"{source_folder}/{note_id}.md"
-
-            if post_action == 'move_to_processed':
-                # processedフォルダに移動（デフォルト動作）
-                storage.mkdir(processed_folder)
-                dest_path = f"{processed_folder}/{note_id}.md"
-                storage.move_file(file_path, dest_path)
-                print(f"  Moved to processed: {file_path} -> {dest_path}")
-
-            elif post_action == 'delete':
-                storage.delete_file(file_path)
-                print(f"  Deleted: {file_path}")
-
-            elif post_action == 'archive':
-                # アーカイブフォルダ作成（後方互換性のため残す）
-                storage.mkdir(archive_folder)
-                dest_path = f"{archive_folder}/{note_id}.md"
-                storage.move_file(file_path, dest_path)
-                print(f"  Archived: {file_path} -> {dest_path}")
-
-            elif post_action == 'keep':
-                print(f"  Kept: {file_path}")
-
-    else:
-        print("新規に追加すべきノートはありませんでした。")
+    if skipped_ids:
+        metrics.INGEST_NOTES.inc(len(skipped_ids), status="skipped")
 
     return new_ids, skipped_ids
 
@@ -497,7 +949,7 @@ def ingest_notes_with_auto_dictionary(
 
     # 辞書自動更新が有効で、新規ノートがある場合
     if auto_update_dictionary and new_ids:
-        print("\n=== 新出単語抽出と辞書自動更新を開始 ===")
+        logger.info("=== 新出単語抽出と辞書自動更新を開始 ===")
 
         try:
             # 辞書マネージャーとTerm Extractorを初期化
@@ -519,7 +971,7 @@ def ingest_notes_with_auto_dictionary(
                     note_path = f"{source_folder}/{note_id}.md"
 
                 if not storage.exists(note_path):
-                    print(f"警告: ノートが見つかりません: {note_path}")
+                    logger.warning("警告: ノートが見つかりません: %s", note_path)
                     continue
 
                 # ノート内容を読み込み
@@ -532,16 +984,16 @@ def ingest_notes_with_auto_dictionary(
                     # 用語を抽出（複数パターン生成）
                     patterns = term_extractor.extract_terms_from_text(materials_section)
                     all_patterns.update(patterns)
-                    print(f"  {note_id}: {len(patterns)}個のパターンを抽出")
+                    logger.debug("%s: %s個のパターンを抽出", note_id, len(patterns))
 
             # パターンを辞書に追加
             if all_patterns:
                 result = dict_manager.auto_update_from_patterns(list(all_patterns))
                 dictionary_result['patterns_added'] = result['added']
-                print(f"\n新規パターンを辞書に追加: {result['added']}個")
+                logger.info("新規パターンを辞書に追加: %s個", result['added'])
 
                 # 表記揺れを自動検出
-                print("\n表記揺れを検出中...")
+                logger.info("表記揺れを検出中...")
                 all_terms = list(all_patterns)
                 variant_candidates = term_extractor.auto_detect_variants(
                     all_terms,
@@ -549,7 +1001,7 @@ def ingest_notes_with_auto_dictionary(
                 )
 
                 if variant_candidates:
-                    print(f"表記揺れ候補を{len(variant_candidates)}個検出しました")
+                    logger.info("表記揺れ候補を%s個検出しました", len(variant_candidates))
                     dictionary_result['variants_detected'] = len(variant_candidates)
                     dictionary_result['variant_candidates'] = variant_candidates
 
@@ -567,13 +1019,13 @@ def ingest_notes_with_auto_dictionary(
 
                     if auto_approved:
                         update_result = dict_manager.apply_variant_updates(auto_approved)
-                        print(f"表記揺れを自動反映: {update_result['updated']}個更新")
+                        logger.info("表記揺れを自動反映: %s個更新", update_result['updated'])
                         dictionary_result['auto_updated'] = True
 
-                print("\n辞書を保存しました")
+                logger.info("辞書を保存しました")
 
         except Exception as e:
-            print(f"辞書自動更新エラー: {e}")
+            logger.warning("辞書自動更新エラー: %s", e)
             import traceback
             traceback.print_exc()
 
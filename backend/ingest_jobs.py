@@ -0,0 +1,396 @@
+"""
+取り込みジョブ管理モジュール（v3.3.0）
+
+機能:
+- ノート取り込みをジョブとしてバックグラウンドで実行
+- 進捗（スキャン/Embedding/書き込み件数、エラー、スループット）の記録
+- チェックポイント（書き込み済みノートID）による中断ジョブの再開
+- 実行中のジョブは実行インスタンスとハートビートを保存し、途絶えたものだけを中断扱いにする（複数インスタンス対応）
+- storage抽象化レイヤー経由でのJSON永続化（インスタンス再起動後も参照可能）
+"""
+
+import contextvars
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict, field, fields
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import config
+from storage import storage
+from ingest import ingest_notes
+
+logger = logging.getLogger(__name__)
+
+
+# ジョブステータス
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_INTERRUPTED = "interrupted"  # 実行中にプロセスが終了したジョブ
+
+# 実行中（実行インスタンスのハートビートが有効な間は他のインスタンスから再開できない）
+ACTIVE_STATUSES = (JOB_QUEUED, JOB_RUNNING)
+
+# 再開可能なステータス
+RESUMABLE_STATUSES = (JOB_FAILED, JOB_INTERRUPTED)
+
+# ジョブに記録するエラーの上限件数
+MAX_RECORDED_ERRORS = 100
+
+
+@dataclass
+class IngestJob:
+    """取り込みジョブ"""
+    id: str
+    team_id: Optional[str]
+    params: Dict  # {"source_folder", "post_action", "archive_folder", "embedding_model", "rebuild_mode", "multi_collection", "expand_shortcuts", "files"}
+    status: str = JOB_QUEUED
+    created_at: str = ""
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    attempts: int = 0  # 実行回数（再開ごとに加算）
+    notes_scanned: int = 0
+    notes_embedded: int = 0
+    notes_written: int = 0
+    notes_skipped: int = 0
+    notes_failed: int = 0
+    errors: List[Dict] = field(default_factory=list)  # [{"note_ids": [...], "message": "..."}, ...]
+    committed_note_ids: List[str] = field(default_factory=list)  # チェックポイント
+    elapsed_seconds: float = 0.0  # 累積実行時間（再開前の実行分を含む）
+    message: str = ""
+    owner: Optional[str] = None  # 実行インスタンス（ホスト名:PID:ランダム値）
+    heartbeat_at: Optional[float] = None  # 実行インスタンスが最後に保存した時刻（UNIX時間）
+
+    @property
+    def throughput(self) -> float:
+        """書き込みスループット（ノート/秒）"""
+        if self.elapsed_seconds <= 0:
+            return 0.0
+        return self.notes_written / self.elapsed_seconds
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data["throughput"] = round(self.throughput, 2)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "IngestJob":
+        names = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in data.items() if k in names})
+
+
+class IngestJobManager:
+    """取り込みジョブマネージャー"""
+
+    def __init__(self, max_workers: Optional[int] = None):
+        """
+        Args:
+            max_workers: ジョブの同時実行数（デフォルト: config.INGEST_JOB_WORKERS）
+        """
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or config.INGEST_JOB_WORKERS,
+            thread_name_prefix="ingest-job"
+        )
+        # このプロセスで投入したジョブ（実行中・完了済み）
+        self._jobs: Dict[str, IngestJob] = {}
+        # 実行中ジョブの開始時刻（time.monotonic）と開始時点の累積実行時間
+        self._run_clock: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        # このプロセスの識別子（ジョブのowner）
+        self.owner_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_seconds = config.INGEST_JOB_LEASE_SECONDS
+        self.checkpoint_interval = config.INGEST_JOB_CHECKPOINT_INTERVAL
+        # ジョブを最後に保存した時刻（time.monotonic）
+        self._saved_at: Dict[str, float] = {}
+        # 実行中・待機中のジョブのハートビート（書き込みがない間もリースを延長する）
+        threading.Thread(target=self._heartbeat_loop, name="ingest-job-heartbeat", daemon=True).start()
+
+    # === 永続化 ===
+
+    def _job_folder(self, team_id: Optional[str]) -> str:
+        if team_id:
+            return storage.get_team_path(team_id, 'ingest_jobs')
+        return config.INGEST_JOBS_FOLDER
+
+    def _job_path(self, team_id: Optional[str], job_id: str) -> str:
+        return f"{self._job_folder(team_id)}/{job_id}.json"
+
+    def _save(self, job: IngestJob) -> None:
+        """ジョブ状態を保存（保存失敗で取り込みを止めない）"""
+        with self._lock:
+            self._update_elapsed(job)
+            if job.status in ACTIVE_STATUSES:
+                job.owner = self.owner_id
+                job.heartbeat_at = time.time()
+            self._saved_at[job.id] = time.monotonic()
+            content = json.dumps(job.to_dict(), ensure_ascii=False)
+        try:
+            storage.write_file(self._job_path(job.team_id, job.id), content)
+        except Exception as e:
+            logger.warning("ジョブ状態の保存に失敗 (%s): %s", job.id, e)
+
+    def _load(self, team_id: Optional[str], job_id: str) -> Optional[IngestJob]:
+        path = self._job_path(team_id, job_id)
+        try:
+            if not storage.exists(path):
+                return None
+            job = IngestJob.from_dict(json.loads(storage.read_file(path)))
+        except Exception as e:
+            logger.warning("ジョブ状態の読み込みに失敗 (%s): %s", job_id, e)
+            return None
+
+        # 実行中のまま保存されているが、実行インスタンスのハートビートが途絶えた → 中断扱い
+        if job.status in ACTIVE_STATUSES and not self._lease_alive(job):
+            job.status = JOB_INTERRUPTED
+            job.message = "ジョブ実行中にサーバーが停止しました。再開できます。"
+        return job
+
+    def _lease_alive(self, job: IngestJob) -> bool:
+        """実行インスタンスのハートビートがリース期間内か（このプロセスが保持していないジョブ用）"""
+        if job.owner is None or job.heartbeat_at is None:
+            return False
+        if job.owner == self.owner_id:
+            # このプロセスのジョブなら self._jobs にある（ない場合は以前の状態が残ったもの）
+            return False
+        return time.time() - job.heartbeat_at < self.lease_seconds
+
+    def _heartbeat_loop(self) -> None:
+        """リース期間の1/3ごとに、このプロセスの実行中・待機中のジョブを保存"""
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            with self._lock:
+                active = [job for job in self._jobs.values() if job.status in ACTIVE_STATUSES]
+            for job in active:
+                self._save(job)
+
+    def _update_elapsed(self, job: IngestJob) -> None:
+        clock = self._run_clock.get(job.id)
+        if clock:
+            started, base = clock
+            job.elapsed_seconds = round(base + (time.monotonic() - started), 3)
+
+    # === 実行 ===
+
+    def _on_progress(self, job: IngestJob, event: str, data: Dict) -> None:
+        """ingest_notesからの進捗通知を反映"""
+        note_ids = data.get("note_ids", [])
+
+        with self._lock:
+            if event == "scanned":
+                job.notes_scanned += len(note_ids)
+            elif event == "embedded":
+                job.notes_embedded += len(note_ids)
+            elif event == "written":
+                job.notes_written += len(note_ids)
+                job.committed_note_ids.extend(note_ids)
+            elif event == "error":
+                job.notes_failed += len(note_ids)
+                if len(job.errors) < MAX_RECORDED_ERRORS:
+                    job.errors.append({"note_ids": note_ids, "message": data.get("message", "")})
+            self._update_elapsed(job)
+            # チェックポイント（書き込み済みノートID）は件数に比例して大きくなるため、
+            # 書き込み完了ごとではなく一定間隔で保存する（間隔内に中断した分は再開時に再取り込み、upsertのため重複しない）
+            checkpoint_due = (
+                event == "written"
+                and time.monotonic() - self._saved_at.get(job.id, 0.0) >= self.checkpoint_interval
+            )
+
+        if checkpoint_due:
+            self._save(job)
+
+    def _run(self, job: IngestJob, api_key: str) -> None:
+        with self._lock:
+            job.status = JOB_RUNNING
+            job.started_at = datetime.now().isoformat()
+            job.attempts += 1
+            self._run_clock[job.id] = (time.monotonic(), job.elapsed_seconds)
+        self._save(job)
+
+        params = job.params
+        try:
+            new_ids, skipped_ids = ingest_notes(
+                api_key=api_key,
+                source_folder=params.get("source_folder"),
+                post_action=params.get("post_action", "move_to_processed"),
+                archive_folder=params.get("archive_folder"),
+                embedding_model=params.get("embedding_model"),
+                rebuild_mode=params.get("rebuild_mode", False),
+                team_id=job.team_id,
+                multi_collection=params.get("multi_collection", True),
+                expand_shortcuts=params.get("expand_shortcuts", True),
+                files=params.get("files"),
+                checkpoint_ids=set(job.committed_note_ids),
+                progress_callback=lambda event, data: self._on_progress(job, event, data)
+            )
+            with self._lock:
+                job.notes_skipped = len(skipped_ids)
+                job.status = JOB_COMPLETED
+                job.message = f"{job.notes_written}件のノートを取り込みました。{len(skipped_ids)}件はスキップされました。"
+                if job.notes_failed:
+                    job.message += f"{job.notes_failed}件は失敗しました。"
+
+        except Exception as e:
+            logger.exception("取り込みジョブエラー (%s): %s", job.id, e)
+            with self._lock:
+                job.status = JOB_FAILED
+                job.message = f"ノート取り込みエラー: {e}"
+
+        finally:
+            with self._lock:
+                job.finished_at = datetime.now().isoformat()
+                self._update_elapsed(job)
+                self._run_clock.pop(job.id, None)
+            self._save(job)
+            with self._lock:
+                self._saved_at.pop(job.id, None)
+
+    def submit(self, api_key: str, team_id: Optional[str], params: Dict) -> IngestJob:
+        """
+        取り込みジョブを投入
+
+        Args:
+            api_key: OpenAI APIキー（永続化しない）
+            team_id: チームID
+            params: ingest_notesに渡すパラメータ
+
+        Returns:
+            投入したジョブ
+        """
+        job = IngestJob(
+            id=str(uuid.uuid4()),
+            team_id=team_id,
+            params=params,
+            created_at=datetime.now().isoformat()
+        )
+        with self._lock:
+            self._jobs[job.id] = job
+        self._save(job)
+
+        # 投入元のログコンテキスト（リクエストID・チームID）を引き継ぐ
+        self._executor.submit(contextvars.copy_context().run, self._run, job, api_key)
+        return job
+
+    def resume(self, job_id: str, team_id: Optional[str], api_key: str) -> IngestJob:
+        """
+        失敗・中断したジョブをチェックポイントから再開
+
+        同時に再開された場合は1つだけが実行される（プロセス内はロック、インスタンス間は
+        ジョブファイルの条件付き書き込みで判定）。
+
+        Raises:
+            KeyError: ジョブが存在しない
+            ValueError: 再開できないステータス（実行中・待機中を含む）
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        loaded = None
+        if job is None:
+            loaded = self._load(team_id, job_id)
+
+        with self._lock:
+            # 読み込み中に同じプロセスで再開された場合はそちらを優先
+            job = self._jobs.get(job_id) or loaded
+            if job is None or job.team_id != team_id:
+                raise KeyError(job_id)
+            if job.status not in RESUMABLE_STATUSES:
+                raise ValueError(f"ステータスが {job.status} のジョブは再開できません")
+            previous = (job.status, job.message)
+            job.status = JOB_QUEUED
+            job.finished_at = None
+            job.message = ""
+            # 今回の実行分の件数をチェックポイント基準で数え直す
+            job.notes_scanned = len(job.committed_note_ids)
+            job.notes_embedded = len(job.committed_note_ids)
+            job.notes_written = len(job.committed_note_ids)
+            job.notes_failed = 0
+            job.errors = []
+            self._jobs[job.id] = job
+
+        try:
+            self._claim(job)
+        except Exception:
+            with self._lock:
+                job.status, job.message = previous
+                if loaded is not None and self._jobs.get(job.id) is job:
+                    del self._jobs[job.id]
+            raise
+
+        # 投入元のログコンテキスト（リクエストID・チームID）を引き継ぐ
+        self._executor.submit(contextvars.copy_context().run, self._run, job, api_key)
+        return job
+
+    def _claim(self, job: IngestJob) -> None:
+        """
+        保存済みのジョブが他のインスタンスで実行中でないことを確認して待機中として保存
+
+        Raises:
+            ValueError: 他のインスタンスが実行中・再開済み
+        """
+        def claim(content: Optional[str]) -> str:
+            if content:
+                stored = IngestJob.from_dict(json.loads(content))
+                if stored.status in ACTIVE_STATUSES and stored.owner != self.owner_id and self._lease_alive(stored):
+                    raise ValueError(f"ジョブ {job.id} は他のインスタンスで実行中です")
+            with self._lock:
+                self._update_elapsed(job)
+                job.owner = self.owner_id
+                job.heartbeat_at = time.time()
+                self._saved_at[job.id] = time.monotonic()
+                return json.dumps(job.to_dict(), ensure_ascii=False)
+
+        storage.update_file(self._job_path(job.team_id, job.id), claim)
+
+    # === 参照 ===
+
+    def get_job(self, job_id: str, team_id: Optional[str]) -> Optional[IngestJob]:
+        """ジョブを取得（他チームのジョブは返さない）"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._update_elapsed(job)
+        if job is None:
+            job = self._load(team_id, job_id)
+        if job is None or job.team_id != team_id:
+            return None
+        return job
+
+    def list_jobs(self, team_id: Optional[str]) -> List[IngestJob]:
+        """ジョブ一覧を取得（新しい順）"""
+        jobs: Dict[str, IngestJob] = {}
+        try:
+            for path in storage.list_files(prefix=self._job_folder(team_id), pattern="*.json"):
+                job_id = path.split('/')[-1].replace('.json', '')
+                job = self._load(team_id, job_id)
+                if job is not None and job.team_id == team_id:
+                    jobs[job.id] = job
+        except Exception as e:
+            logger.warning("ジョブ一覧の取得に失敗: %s", e)
+
+        # このプロセスで実行中のジョブは最新状態で上書き
+        with self._lock:
+            for job in self._jobs.values():
+                if job.team_id == team_id:
+                    self._update_elapsed(job)
+                    jobs[job.id] = job
+
+        return sorted(jobs.values(), key=lambda j: j.created_at, reverse=True)
+
+
+# シングルトンインスタンス
+_ingest_job_manager = None
+
+
+def get_ingest_job_manager() -> IngestJobManager:
+    """取り込みジョブマネージャーのシングルトンインスタンスを取得"""
+    global _ingest_job_manager
+    if _ingest_job_manager is None:
+        _ingest_job_manager = IngestJobManager()
+    return _ingest_job_manager
@@ -0,0 +1,125 @@
+"""
+ロギング設定モジュール（v3.3.0）
+
+機能:
+- モジュールごとのログレベル（LOG_LEVEL / LOG_LEVELS）
+- QueueHandler + QueueListener による非同期出力（ワーカースレッドが標準出力の書き込みで待たない）
+- JSON形式の出力（request_id / team_id をコンテキスト変数から付与）
+
+使用例:
+    LOG_LEVEL=INFO LOG_LEVELS="agent=DEBUG,ingest=WARNING" LOG_FORMAT=json
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from config import config
+
+
+# リクエスト単位のコンテキスト（ミドルウェアで設定、asyncio.to_thread 先にも引き継がれる）
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+team_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("team_id", default=None)
+
+# LogRecordの標準属性（JSONの追加フィールドから除外する）
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class ContextFilter(logging.Filter):
+    """ログレコードに request_id / team_id を付与"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_var.get()
+        if not hasattr(record, "team_id"):
+            record.team_id = team_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """1レコード1行のJSONに整形"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "team_id": getattr(record, "team_id", None),
+        }
+        # extra={"...": ...} で渡された項目
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and key not in data:
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """開発用のテキスト形式"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s %(team_id)s] %(message)s")
+
+
+def parse_log_levels(value: str) -> Dict[str, str]:
+    """
+    "agent=DEBUG,ingest=WARNING" 形式のモジュール別レベル指定を解析
+
+    Returns:
+        {logger名: レベル名}
+    """
+    levels = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging() -> None:
+    """ロギングを初期化（複数回呼ばれても一度だけ設定）"""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if config.LOG_FORMAT == "json" else TextFormatter())
+
+    # コンテキストは呼び出し元スレッドで付与してからキューに積む
+    log_queue: queue.Queue = queue.Queue(-1)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(config.LOG_LEVEL.upper())
+
+    for name, level in parse_log_levels(config.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """キューに残ったログを書き出して停止"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,296 @@
+"""
+メトリクスモジュール（v3.3.0）
+
+機能:
+- Counter / Histogram のレジストリ（Prometheusテキスト形式で /metrics に出力）
+- 検索グラフのノード別・外部呼び出し別（OpenAI / Cohere / Chroma / storage）のレイテンシ
+- エンドポイント別のリクエスト数・エラー数・レイテンシ（middleware.MetricsMiddleware から記録）
+- 取り込みスループット（書き込み・失敗ノート数、バッチ書き込み時間）
+
+外部ライブラリに依存しない最小実装。ラベルの組み合わせ数が増えないよう、
+エンドポイントはパスではなくルートのテンプレート（例: /ingest/jobs/{job_id}）で集計する。
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+# レイテンシ用のバケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """単調増加カウンター"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """累積バケット付きヒストグラム"""
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # {labels: ([バケットごとの件数], 合計, 件数)}
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """with ブロックの所要時間を記録"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {bucket_count}"
+                )
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """メトリクスのレジストリ"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheusテキスト形式（version 0.0.4）で出力"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# === 検索 ===
+
+SEARCH_NODE_SECONDS = registry.histogram(
+    "search_node_duration_seconds", "Latency of each SearchAgent graph node", ["node"]
+)
+SEARCH_NODE_ERRORS = registry.counter(
+    "search_node_errors_total", "Unhandled errors raised by SearchAgent graph nodes", ["node"]
+)
+SEARCH_CACHE_REQUESTS = registry.counter(
+    "search_cache_requests_total", "Search result cache lookups", ["result"]
+)
+
+# === 外部呼び出し ===
+# call: openai_chat | openai_embeddings | cohere_rerank | chroma_query | storage_read
+
+EXTERNAL_CALL_SECONDS = registry.histogram(
+    "external_call_duration_seconds", "Latency of calls to external services", ["call"]
+)
+EXTERNAL_CALL_ERRORS = registry.counter(
+    "external_call_errors_total", "Failed calls to external services", ["call"]
+)
+
+# === HTTP ===
+
+HTTP_REQUESTS = registry.counter(
+    "http_requests_total", "HTTP requests by endpoint and status", ["method", "route", "status"]
+)
+HTTP_REQUEST_ERRORS = registry.counter(
+    "http_request_errors_total", "HTTP requests that returned 5xx or raised", ["method", "route"]
+)
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by endpoint", ["method", "route"]
+)
+
+# === 取り込み ===
+
+INGEST_NOTES = registry.counter(
+    "ingest_notes_total", "Notes processed by ingest", ["status"]
+)
+INGEST_BATCH_SECONDS = registry.histogram(
+    "ingest_batch_write_duration_seconds", "Time to write one embedded batch to Chroma"
+)
+
+
+# 外部呼び出しの計測フック（トレース等、計測結果を受け取る側が登録する）
+# hook(call, duration_seconds, result, error)
+_call_hooks: List[Callable] = []
+
+
+def add_call_hook(hook: Callable) -> None:
+    """外部呼び出しの計測結果を受け取るフックを登録"""
+    if hook not in _call_hooks:
+        _call_hooks.append(hook)
+
+
+def _notify_call(call: str, duration: float, result=None, error: Optional[BaseException] = None) -> None:
+    for hook in _call_hooks:
+        try:
+            hook(call, duration, result, error)
+        except Exception:
+            pass
+
+
+@contextmanager
+def track_call(call: str) -> Iterator[None]:
+    """外部呼び出しのブロックを計測（戻り値を扱わない場合用）"""
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = e
+        EXTERNAL_CALL_ERRORS.inc(call=call)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        EXTERNAL_CALL_SECONDS.observe(duration, call=call)
+        _notify_call(call, duration, error=error)
+
+
+def timed_call(call: str, fn: Callable, *args, **kwargs):
+    """
+    外部呼び出しを計測して実行
+
+    Args:
+        call: 呼び出し種別（openai_chat, cohere_rerank など）
+        fn: 呼び出す関数
+
+    Returns:
+        fn の戻り値
+    """
+    start = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    except BaseException as e:
+        duration = time.perf_counter() - start
+        EXTERNAL_CALL_ERRORS.inc(call=call)
+        EXTERNAL_CALL_SECONDS.observe(duration, call=call)
+        _notify_call(call, duration, error=e)
+        raise
+    duration = time.perf_counter() - start
+    EXTERNAL_CALL_SECONDS.observe(duration, call=call)
+    _notify_call(call, duration, result=result)
+    return result
+
+
+def timed_node(node: str, fn: Callable) -> Callable:
+    """グラフノード関数をレイテンシ計測付きでラップ"""
+    def wrapper(state):
+        start = time.perf_counter()
+        try:
+            return fn(state)
+        except BaseException:
+            SEARCH_NODE_ERRORS.inc(node=node)
+            raise
+        finally:
+            SEARCH_NODE_SECONDS.observe(time.perf_counter() - start, node=node)
+    wrapper.__name__ = getattr(fn, "__name__", node)
+    return wrapper
@@ -2,12 +2,30 @@
 認証ミドルウェア
 
 全APIエンドポイントでFirebase ID Tokenを検証します。
+
+v3.3.0: BaseHTTPMiddleware をやめ、純粋なASGIミドルウェアとして実装。
+- リクエストごとのタスク生成・ストリームのラップがなく、ストリーミングレスポンスはそのまま通過
+- スキップ対象パスは起動時に前方一致用タプルへ変換
+- ログは logging 経由（成功・スキップはDEBUG、拒否はWARNING）
+- RequestContextMiddleware でリクエストID・チームIDをログに付与
+- MetricsMiddleware でエンドポイント別のリクエスト数・レイテンシを記録
 """
 
-from fastapi import Request, HTTPException
+import asyncio
+import logging
+import time
+import uuid
+
+from fastapi import HTTPException
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
 from auth import verify_firebase_token
+from logging_config import request_id_var, team_id_var
+import metrics
+
+
+logger = logging.getLogger(__name__)
 
 
 # 認証をスキップするエンドポイント
@@ -18,10 +36,104 @@ SKIP_AUTH_PATHS = [
     "/openapi.json",
     "/prompts",  # デフォルトプロンプト取得（GET /prompts）のみ認証不要
     "/chroma",  # ChromaDB情報・管理は認証不要
+    "/metrics",  # Prometheusメトリクス（v3.3.0）
 ]
 
+# /prompts はexact match（GETのみ）、その他は前方一致でスキップ
+_AUTH_SKIP_PREFIXES = tuple(p for p in SKIP_AUTH_PATHS if p != "/prompts")
+_TEAM_SKIP_PREFIXES = _AUTH_SKIP_PREFIXES + ("/teams",)
+
+
+def _should_skip(scope: Scope, skip_prefixes: tuple) -> bool:
+    """認証・チーム確認をスキップするリクエストか"""
+    path = scope["path"]
+    method = scope["method"]
+    if path == "/prompts" and method == "GET":
+        return True
+    # CORS プリフライトリクエスト（OPTIONS）もスキップ
+    return method == "OPTIONS" or path.startswith(skip_prefixes)
+
+
+def _request_state(scope: Scope) -> dict:
+    """request.state の実体（Starlette は scope["state"] を request.state として参照する）"""
+    return scope.setdefault("state", {})
+
 
-class AuthMiddleware(BaseHTTPMiddleware):
+async def _reject(scope: Scope, receive: Receive, send: Send, status_code: int, detail: str) -> None:
+    await JSONResponse(status_code=status_code, content={"detail": detail})(scope, receive, send)
+
+
+class MetricsMiddleware:
+    """エンドポイント別のリクエスト数・エラー数・レイテンシを記録するASGIミドルウェア"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        except BaseException:
+            status_code = 500
+            raise
+        finally:
+            # マッチしたルートのテンプレートで集計（未マッチは1つにまとめる）
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            metrics.HTTP_REQUESTS.inc(method=method, route=route_path, status=str(status_code))
+            metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=method, route=route_path)
+            if status_code >= 500:
+                metrics.HTTP_REQUEST_ERRORS.inc(method=method, route=route_path)
+
+
+class RequestContextMiddleware:
+    """
+    リクエストIDをログのコンテキストに設定するミドルウェア（v3.3.0）
+
+    X-Request-IDヘッダーがあればその値を、なければ新しいIDを使用し、
+    レスポンスのX-Request-IDヘッダーにも付与します。
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = Headers(scope=scope).get("X-Request-ID") or uuid.uuid4().hex
+        _request_state(scope)["request_id"] = request_id
+
+        async def send_with_request_id(message) -> None:
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        request_token = request_id_var.set(request_id)
+        team_token = team_id_var.set(None)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            team_id_var.reset(team_token)
+            request_id_var.reset(request_token)
+
+
+class AuthMiddleware:
     """
     Firebase ID Token検証ミドルウェア
 
@@ -29,40 +141,28 @@ class AuthMiddleware(BaseHTTPMiddleware):
     検証に成功した場合はrequest.state.userに認証情報を設定します。
     """
 
-    async def dispatch(self, request: Request, call_next):
-        # /prompts のみexact matchでスキップ（デフォルトプロンプト取得のみ認証不要）
-        if request.url.path == "/prompts" and request.method == "GET":
-            print(f"✅ AuthMiddleware: Skipping auth for path: {request.url.path}")
-            return await call_next(request)
-
-        # その他のSKIP_AUTH_PATHSはprefix matchでスキップ
-        skip_paths_without_prompts = [p for p in SKIP_AUTH_PATHS if p != "/prompts"]
-        if any(request.url.path.startswith(path) for path in skip_paths_without_prompts):
-            print(f"✅ AuthMiddleware: Skipping auth for path: {request.url.path}")
-            return await call_next(request)
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-        # CORS プリフライトリクエスト（OPTIONS）をスキップ
-        if request.method == "OPTIONS":
-            return await call_next(request)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or _should_skip(scope, _AUTH_SKIP_PREFIXES):
+            await self.app(scope, receive, send)
+            return
 
-        print(f"🔒 AuthMiddleware: Checking auth for path: {request.url.path}")
+        path = scope["path"]
 
         # Authorizationヘッダーの取得
-        auth_header = request.headers.get("Authorization")
+        auth_header = Headers(scope=scope).get("Authorization")
 
         if not auth_header:
-            print(f"❌ AuthMiddleware: Missing Authorization header for {request.url.path}")
-            return JSONResponse(
-                status_code=401,
-                content={"detail": "Missing Authorization header"}
-            )
+            logger.warning("Missing Authorization header for %s", path)
+            await _reject(scope, receive, send, 401, "Missing Authorization header")
+            return
 
         if not auth_header.startswith("Bearer "):
-            print(f"❌ AuthMiddleware: Invalid Authorization header format for {request.url.path}")
-            return JSONResponse(
-                status_code=401,
-                content={"detail": "Invalid Authorization header format. Expected: Bearer <token>"}
-            )
+            logger.warning("Invalid Authorization header format for %s", path)
+            await _reject(scope, receive, send, 401, "Invalid Authorization header format. Expected: Bearer <token>")
+            return
 
         # トークン抽出
         id_token = auth_header.split("Bearer ")[1]
@@ -70,27 +170,24 @@ class AuthMiddleware(BaseHTTPMiddleware):
         # トークン検証
         try:
             decoded_token = await verify_firebase_token(id_token)
-            # 認証情報をrequest.stateに設定
-            request.state.user = decoded_token
-            print(f"✅ AuthMiddleware: Token verified for user: {decoded_token.get('uid')}")
         except HTTPException as e:
-            print(f"❌ AuthMiddleware: Token verification failed: {e.detail}")
-            return JSONResponse(
-                status_code=e.status_code,
-                content={"detail": e.detail}
-            )
+            logger.warning("Token verification failed for %s: %s", path, e.detail)
+            await _reject(scope, receive, send, e.status_code, e.detail)
+            return
         except Exception as e:
-            print(f"❌ AuthMiddleware: Unexpected error: {str(e)}")
-            return JSONResponse(
-                status_code=401,
-                content={"detail": f"Authentication error: {str(e)}"}
-            )
+            logger.exception("Unexpected authentication error for %s", path)
+            await _reject(scope, receive, send, 401, f"Authentication error: {str(e)}")
+            return
+
+        # 認証情報をrequest.stateに設定
+        _request_state(scope)["user"] = decoded_token
+        logger.debug("Token verified for user %s on %s", decoded_token.get("uid"), path)
 
         # 次の処理へ
-        return await call_next(request)
+        await self.app(scope, receive, send)
 
 
-class TeamMiddleware(BaseHTTPMiddleware):
+class TeamMiddleware:
     """
     チームID検証ミドルウェア
 
@@ -100,62 +197,56 @@ class TeamMiddleware(BaseHTTPMiddleware):
     注意: チーム管理系のエンドポイント（/teams/*）はスキップします。
     """
 
-    async def dispatch(self, request: Request, call_next):
-        # /prompts のみexact matchでスキップ（デフォルトプロンプト取得のみチーム不要）
-        if request.url.path == "/prompts" and request.method == "GET":
-            print(f"✅ TeamMiddleware: Skipping team check for path: {request.url.path}")
-            return await call_next(request)
-
-        # その他のskip pathsはprefix matchでスキップ
-        skip_paths = [p for p in SKIP_AUTH_PATHS if p != "/prompts"] + ["/teams"]
-        if any(request.url.path.startswith(path) for path in skip_paths):
-            print(f"✅ TeamMiddleware: Skipping team check for path: {request.url.path}")
-            return await call_next(request)
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-        # CORS プリフライトリクエスト（OPTIONS）をスキップ
-        if request.method == "OPTIONS":
-            return await call_next(request)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or _should_skip(scope, _TEAM_SKIP_PREFIXES):
+            await self.app(scope, receive, send)
+            return
 
-        print(f"🔒 TeamMiddleware: Checking team for path: {request.url.path}")
+        path = scope["path"]
 
         # X-Team-IDヘッダーの取得
-        team_id = request.headers.get("X-Team-ID")
+        team_id = Headers(scope=scope).get("X-Team-ID")
 
         if not team_id:
-            print(f"❌ TeamMiddleware: Missing X-Team-ID header for {request.url.path}")
-            return JSONResponse(
-                status_code=400,
-                content={"detail": "Missing X-Team-ID header"}
-            )
+            logger.warning("Missing X-Team-ID header for %s", path)
+            await _reject(scope, receive, send, 400, "Missing X-Team-ID header")
+            return
+
+        state = _request_state(scope)
+        user = state.get("user")
+        if user is None:
+            # request.state.user が未設定の場合（認証ミドルウェアが未実行）
+            logger.warning("request.state.user not set for %s (auth middleware not run)", path)
+            await _reject(scope, receive, send, 401, "Authentication required")
+            return
 
         # ユーザーがチームのメンバーか確認
         try:
-            from teams import is_team_member
-            user_id = request.state.user.get("uid")
-
-            if not is_team_member(user_id, team_id):
-                print(f"❌ TeamMiddleware: User {user_id} is not a member of team {team_id}")
-                return JSONResponse(
-                    status_code=403,
-                    content={"detail": "User is not a member of this team"}
-                )
-            print(f"✅ TeamMiddleware: User {user_id} is a member of team {team_id}")
-        except AttributeError:
-            # request.state.user が未設定の場合（認証ミドルウェアが未実行）
-            print(f"❌ TeamMiddleware: request.state.user not set (auth middleware not run)")
-            return JSONResponse(
-                status_code=401,
-                content={"detail": "Authentication required"}
-            )
+            from teams import cached_membership, is_team_member
+            user_id = user.get("uid")
+
+            # キャッシュミス時のFirestore呼び出しはイベントループを塞がないようスレッドで実行
+            is_member = cached_membership(user_id, team_id)
+            if is_member is None:
+                is_member = await asyncio.to_thread(is_team_member, user_id, team_id)
+
+            if not is_member:
+                logger.warning("User %s is not a member of team %s", user_id, team_id)
+                await _reject(scope, receive, send, 403, "User is not a member of this team")
+                return
         except Exception as e:
-            print(f"❌ TeamMiddleware: Team verification error: {str(e)}")
-            return JSONResponse(
-                status_code=500,
-                content={"detail": f"Team verification error: {str(e)}"}
-            )
+            logger.exception("Team verification error for %s", path)
+            await _reject(scope, receive, send, 500, f"Team verification error: {str(e)}")
+            return
+
+        logger.debug("User %s is a member of team %s", user_id, team_id)
 
-        # チームIDをrequest.stateに設定
-        request.state.team_id = team_id
+        # チームIDをrequest.stateとログのコンテキストに設定
+        state["team_id"] = team_id
+        team_id_var.set(team_id)
 
         # 次の処理へ
-        return await call_next(request)
+        await self.app(scope, receive, send)
@@ -0,0 +1,484 @@
+"""
+ノートフォルダ監視モジュール（v3.3.0）
+
+機能:
+- チームごとの notes_new フォルダを監視し、新着ノート（.md）を自動取り込み
+- ローカル: ファイルシステムイベント（watchdog、未インストール時はポーリング）
+- GCS: 保存済みカーソル（最終更新時刻）以降のオブジェクトのみを拾うポーリング
+- 到着が落ち着いたタイミングでマイクロバッチとして取り込みジョブに投入（デバウンス）
+"""
+
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from config import config
+from storage import storage, LocalStorage
+from ingest_jobs import get_ingest_job_manager
+
+logger = logging.getLogger(__name__)
+
+
+# 投入済みファイルを再検出しても無視する期間（秒）
+# アップロード通知とファイルイベントの二重検出を防ぐ
+RECENT_SUBMISSION_TTL = 60.0
+
+# ジョブ投入に失敗したバッチを再投入するまでの秒数
+SUBMIT_RETRY_INTERVAL = 10.0
+
+
+class NoteWatcher:
+    """notes_new フォルダの監視と自動取り込み"""
+
+    def __init__(
+        self,
+        team_id: Optional[str],
+        api_key: str,
+        embedding_model: Optional[str] = None,
+        debounce_seconds: Optional[float] = None,
+        max_batch_size: Optional[int] = None,
+        poll_interval: Optional[float] = None
+    ):
+        """
+        Args:
+            team_id: チームID（Noneの場合はグローバルフォルダ）
+            api_key: OpenAI APIキー（メモリ上のみで保持）
+            embedding_model: Embeddingモデル
+            debounce_seconds: 最後の到着からこの秒数新着がなければ取り込む
+            max_batch_size: マイクロバッチの最大ノート数（到達したら即取り込む）
+            poll_interval: ポーリング間隔（秒）
+        """
+        self.team_id = team_id
+        self.api_key = api_key
+        self.embedding_model = embedding_model
+        self.debounce_seconds = debounce_seconds if debounce_seconds is not None else config.INGEST_WATCH_DEBOUNCE_SECONDS
+        self.max_batch_size = max_batch_size or config.INGEST_WATCH_MAX_BATCH
+        self.poll_interval = poll_interval or config.INGEST_WATCH_POLL_INTERVAL
+
+        if team_id:
+            self.folder = storage.get_team_path(team_id, 'notes_new')
+            self.cursor_path = storage.get_team_path(team_id, 'ingest_watch')
+        else:
+            self.folder = config.NOTES_NEW_FOLDER
+            self.cursor_path = config.INGEST_WATCH_CURSOR_PATH
+
+        self.mode: Optional[str] = None  # "local_events" | "gcs_polling" | "polling"
+        self.started_at: Optional[str] = None
+        self.batches_submitted = 0
+        self.notes_submitted = 0
+        self.last_job_id: Optional[str] = None
+        self.last_error: Optional[str] = None
+
+        # 取り込み待ちのファイル（到着順、dictで重複排除）
+        self._pending: Dict[str, None] = {}
+        self._last_arrival = 0.0
+        self._retry_after = 0.0  # ジョブ投入に失敗した場合、この時刻（time.monotonic）まで再投入しない
+        self._recent: Dict[str, float] = {}
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._observer = None
+
+        # ポーリング用の状態
+        self._seen: set = set()
+        self._cursor: Dict = {}  # 一覧済みの位置（メモリ上、次回の一覧の起点）
+        # GCS: 保存済みカーソルはジョブ投入が済んだノートまでしか進めない（停止・再起動で取りこぼさない）
+        self._saved_cursor: Dict = {}
+        self._gcs_listed: Dict[str, datetime] = {}  # 保存済みカーソルより新しい一覧済みノート {name: 更新時刻}
+        self._gcs_unsubmitted: set = set()  # そのうちジョブ投入が済んでいないノート
+        self._cursor_save_lock = threading.Lock()
+
+    # === 公開API ===
+
+    def start(self, backfill: bool = False) -> None:
+        """
+        監視を開始
+
+        Args:
+            backfill: Trueの場合、開始時点で既にフォルダにあるノートも取り込む
+        """
+        storage.mkdir(self.folder)
+        self.started_at = datetime.now().isoformat()
+
+        if isinstance(storage.backend, LocalStorage) and self._start_local_events():
+            self.mode = "local_events"
+            if backfill:
+                self.add(self._list_folder())
+        elif storage.bucket is not None:
+            self.mode = "gcs_polling"
+            self._init_gcs_cursor(backfill)
+            self._spawn(self._poll_loop, "gcs-poll")
+        else:
+            self.mode = "polling"
+            existing = self._list_folder()
+            if backfill:
+                self.add(existing)
+            else:
+                self._seen = set(existing)
+            self._spawn(self._poll_loop, "poll")
+
+        self._spawn(self._flush_loop, "flush")
+        logger.info("フォルダ監視を開始: %s (mode=%s)", self.folder, self.mode)
+
+    def stop(self) -> None:
+        """
+        監視を停止
+
+        取り込み待ちのノートは破棄する。ファイルは notes_new に残るため次回の取り込みで拾い、
+        GCSでは保存済みカーソルがジョブ投入済みのノートまでしか進まないため次回の監視開始時にも拾う。
+        """
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._observer is not None:
+            try:
+                self._observer.stop()
+                self._observer.join(timeout=5)
+            except Exception as e:
+                logger.warning("ファイル監視の停止エラー: %s", e)
+        for thread in self._threads:
+            thread.join(timeout=5)
+        logger.info("フォルダ監視を停止: %s", self.folder)
+
+    def add(self, paths: List[str]) -> List[str]:
+        """
+        新着ファイルを取り込み待ちに追加
+
+        Returns:
+            取り込み待ちに追加したファイル（対象外・投入直後のものを除く）
+        """
+        now = time.monotonic()
+        with self._cond:
+            added = []
+            for path in paths:
+                if not self._is_direct_note(path):
+                    continue
+                submitted_at = self._recent.get(path)
+                if submitted_at is not None and now - submitted_at < RECENT_SUBMISSION_TTL:
+                    continue
+                self._pending[path] = None
+                added.append(path)
+            if added:
+                self._last_arrival = now
+                self._cond.notify_all()
+            return added
+
+    def status(self) -> Dict:
+        """監視状態を取得"""
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            "team_id": self.team_id,
+            "folder": self.folder,
+            "mode": self.mode,
+            "started_at": self.started_at,
+            "debounce_seconds": self.debounce_seconds,
+            "max_batch_size": self.max_batch_size,
+            "pending_notes": pending,
+            "batches_submitted": self.batches_submitted,
+            "notes_submitted": self.notes_submitted,
+            "last_job_id": self.last_job_id,
+            "last_error": self.last_error
+        }
+
+    # === 内部処理 ===
+
+    def _spawn(self, target, name: str) -> None:
+        thread = threading.Thread(target=target, name=f"note-watcher-{name}", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _is_direct_note(self, path: str) -> bool:
+        """監視フォルダ直下の.mdファイルか（archive等のサブフォルダは対象外）"""
+        if not path.endswith('.md'):
+            return False
+        parent = path.rsplit('/', 1)[0] if '/' in path else ""
+        return parent.rstrip('/') == self.folder.rstrip('/')
+
+    def _list_folder(self) -> List[str]:
+        try:
+            return [f for f in storage.list_files(prefix=self.folder, pattern="*.md") if self._is_direct_note(f)]
+        except Exception as e:
+            self.last_error = f"フォルダ一覧の取得エラー: {e}"
+            return []
+
+    def _flush_loop(self) -> None:
+        """デバウンス後にマイクロバッチを取り込みジョブとして投入"""
+        while not self._stop.is_set():
+            with self._cond:
+                if not self._pending:
+                    self._cond.wait(timeout=1.0)
+                    continue
+
+                retry_in = self._retry_after - time.monotonic()
+                if retry_in > 0:
+                    self._cond.wait(timeout=retry_in)
+                    continue
+
+                quiet_for = time.monotonic() - self._last_arrival
+                if quiet_for < self.debounce_seconds and len(self._pending) < self.max_batch_size:
+                    self._cond.wait(timeout=self.debounce_seconds - quiet_for)
+                    continue
+
+                batch = list(self._pending)[:self.max_batch_size]
+                for path in batch:
+                    del self._pending[path]
+
+                now = time.monotonic()
+                for path in batch:
+                    self._recent[path] = now
+                self._recent = {p: t for p, t in self._recent.items() if now - t < RECENT_SUBMISSION_TTL}
+
+            if not self._submit(batch):
+                # 投入に失敗したバッチは取り込み待ちの先頭に戻し、一定時間後に再投入する
+                with self._cond:
+                    self._pending = {**dict.fromkeys(batch), **self._pending}
+                    for path in batch:
+                        self._recent.pop(path, None)
+                    self._retry_after = time.monotonic() + SUBMIT_RETRY_INTERVAL
+
+    def _submit(self, batch: List[str]) -> bool:
+        """バッチを取り込みジョブとして投入（成功時のみGCSのカーソルを進める）"""
+        try:
+            job = get_ingest_job_manager().submit(
+                api_key=self.api_key,
+                team_id=self.team_id,
+                params={
+                    "source_folder": self.folder,
+                    "post_action": "move_to_processed",
+                    "embedding_model": self.embedding_model,
+                    "rebuild_mode": False,
+                    "files": batch
+                }
+            )
+            self.batches_submitted += 1
+            self.notes_submitted += len(batch)
+            self.last_job_id = job.id
+            logger.info("自動取り込み: %s件をジョブ %s に投入", len(batch), job.id)
+        except Exception as e:
+            self.last_error = f"ジョブ投入エラー: {e}"
+            logger.exception("自動取り込みのジョブ投入に失敗: %s", e)
+            return False
+
+        if self.mode == "gcs_polling":
+            with self._cond:
+                self._gcs_unsubmitted.difference_update(batch)
+            self._advance_gcs_cursor()
+        return True
+
+    # --- ローカル: ファイルシステムイベント ---
+
+    def _start_local_events(self) -> bool:
+        """watchdogでイベント監視を開始（未インストールの場合はFalse）"""
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            logger.info("watchdogが未インストールのため、ポーリングで監視します")
+            return False
+
+        base_path = storage.backend.base_path
+        watch_dir = base_path / self.folder
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def _to_storage_path(self, path: str) -> Optional[str]:
+                try:
+                    from pathlib import Path
+                    return Path(path).relative_to(base_path).as_posix()
+                except ValueError:
+                    return None
+
+            def on_created(self, event):
+                if not event.is_directory:
+                    rel = self._to_storage_path(event.src_path)
+                    if rel:
+                        watcher.add([rel])
+
+            def on_moved(self, event):
+                if not event.is_directory:
+                    rel = self._to_storage_path(event.dest_path)
+                    if rel:
+                        watcher.add([rel])
+
+        try:
+            watch_dir.mkdir(parents=True, exist_ok=True)
+            self._observer = Observer()
+            self._observer.schedule(_Handler(), str(watch_dir), recursive=False)
+            self._observer.daemon = True
+            self._observer.start()
+            return True
+        except Exception as e:
+            logger.warning("ファイルイベント監視の開始に失敗（ポーリングで監視します）: %s", e)
+            self._observer = None
+            return False
+
+    # --- GCS: カーソル付きポーリング ---
+
+    def _load_gcs_cursor(self) -> Dict:
+        try:
+            if storage.exists(self.cursor_path):
+                return json.loads(storage.read_file(self.cursor_path))
+        except Exception as e:
+            logger.warning("監視カーソルの読み込みエラー: %s", e)
+        return {}
+
+    def _save_gcs_cursor(self, cursor: Dict) -> None:
+        try:
+            storage.write_file(self.cursor_path, json.dumps(cursor, ensure_ascii=False))
+        except Exception as e:
+            self.last_error = f"監視カーソルの保存エラー: {e}"
+            logger.warning("監視カーソルの保存エラー: %s", e)
+
+    def _init_gcs_cursor(self, backfill: bool) -> None:
+        """カーソルが未保存の場合、backfillしないなら現時点の最新を起点にする"""
+        self._cursor = self._load_gcs_cursor()
+        self._saved_cursor = dict(self._cursor)
+        if self._cursor or backfill:
+            return
+        self._poll_gcs(enqueue=False)
+
+    def _poll_gcs(self, enqueue: bool = True) -> None:
+        """カーソル（最終更新時刻と、その時刻のオブジェクト名）より新しい.mdのみ拾う"""
+        cursor_updated = self._cursor.get("updated")
+        cursor_ts = datetime.fromisoformat(cursor_updated) if cursor_updated else None
+        cursor_names = set(self._cursor.get("names", []))
+
+        newest_ts = cursor_ts
+        newest_names = set(cursor_names)
+        arrived = {}  # {name: 更新時刻}
+
+        # 直下のオブジェクトのみ、名前と更新時刻だけを取得
+        blobs = storage.bucket.list_blobs(
+            prefix=f"{self.folder.rstrip('/')}/",
+            delimiter="/",
+            fields="items(name,updated),nextPageToken"
+        )
+        for blob in blobs:
+            if not blob.name.endswith('.md') or blob.updated is None:
+                continue
+            ts = blob.updated
+            if cursor_ts is not None and (ts < cursor_ts or (ts == cursor_ts and blob.name in cursor_names)):
+                continue
+
+            arrived[blob.name] = ts
+            if newest_ts is None or ts > newest_ts:
+                newest_ts = ts
+                newest_names = {blob.name}
+            elif ts == newest_ts:
+                newest_names.add(blob.name)
+
+        if newest_ts is None or (newest_ts == cursor_ts and newest_names == cursor_names):
+            return
+        cursor = {"updated": newest_ts.isoformat(), "names": sorted(newest_names)}
+
+        if not enqueue:
+            # 取り込まずに起点だけ決める場合はそのまま保存
+            self._cursor = cursor
+            with self._cursor_save_lock:
+                self._saved_cursor = dict(cursor)
+                self._save_gcs_cursor(cursor)
+            return
+
+        with self._cond:
+            # 一覧位置の更新と未投入の記録を同時に行う（投入完了側がその間のカーソルを保存しないよう）
+            self._cursor = cursor
+            self._gcs_listed.update(arrived)
+            self._gcs_unsubmitted.update(arrived)
+            added = set(self.add(list(arrived)))
+            # 投入直後の再検出などで追加しなかったノートは投入済みとして扱う
+            self._gcs_unsubmitted.difference_update(name for name in arrived if name not in added)
+        self._advance_gcs_cursor()
+
+    def _advance_gcs_cursor(self) -> None:
+        """保存済みカーソルを、最も古い未投入ノートの直前（全て投入済みなら一覧位置）まで進める"""
+        with self._cursor_save_lock:
+            with self._cond:
+                if not self._gcs_listed:
+                    return
+                if not self._gcs_unsubmitted:
+                    cursor = dict(self._cursor)
+                    self._gcs_listed.clear()
+                else:
+                    oldest = min(self._gcs_listed[name] for name in self._gcs_unsubmitted)
+                    # 同じ更新時刻で投入済みのノートはカーソルの names に含めて再検出しない
+                    names = {
+                        name for name, ts in self._gcs_listed.items()
+                        if ts == oldest and name not in self._gcs_unsubmitted
+                    }
+                    saved_updated = self._saved_cursor.get("updated")
+                    if saved_updated and datetime.fromisoformat(saved_updated) == oldest:
+                        names.update(self._saved_cursor.get("names", []))
+                    cursor = {"updated": oldest.isoformat(), "names": sorted(names)}
+                    self._gcs_listed = {name: ts for name, ts in self._gcs_listed.items() if ts >= oldest}
+                if cursor == self._saved_cursor:
+                    return
+                self._saved_cursor = cursor
+            self._save_gcs_cursor(cursor)
+
+    # --- 汎用ポーリング（watchdog未導入のローカル、Google Drive） ---
+
+    def _poll_listing(self) -> None:
+        current = set(self._list_folder())
+        arrived = [path for path in sorted(current) if path not in self._seen]
+        # 取り込み済み（移動済み）のファイルは忘れる
+        self._seen = current
+        if arrived:
+            self.add(arrived)
+
+    def _poll_loop(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                if self.mode == "gcs_polling":
+                    self._poll_gcs()
+                else:
+                    self._poll_listing()
+            except Exception as e:
+                self.last_error = f"ポーリングエラー: {e}"
+                logger.exception("フォルダ監視のポーリングエラー: %s", e)
+
+
+# === チームごとの監視インスタンス管理 ===
+
+_watchers: Dict[Optional[str], NoteWatcher] = {}
+_watchers_lock = threading.Lock()
+
+
+def start_watcher(team_id: Optional[str], api_key: str, backfill: bool = False, **kwargs) -> NoteWatcher:
+    """チームの監視を開始（既に監視中の場合は設定を更新して再起動）"""
+    with _watchers_lock:
+        existing = _watchers.pop(team_id, None)
+    if existing is not None:
+        existing.stop()
+
+    watcher = NoteWatcher(team_id=team_id, api_key=api_key, **kwargs)
+    watcher.start(backfill=backfill)
+    with _watchers_lock:
+        _watchers[team_id] = watcher
+    return watcher
+
+
+def stop_watcher(team_id: Optional[str]) -> bool:
+    """チームの監視を停止（監視していなかった場合はFalse）"""
+    with _watchers_lock:
+        watcher = _watchers.pop(team_id, None)
+    if watcher is None:
+        return False
+    watcher.stop()
+    return True
+
+
+def get_watcher(team_id: Optional[str]) -> Optional[NoteWatcher]:
+    """チームの監視インスタンスを取得"""
+    with _watchers_lock:
+        return _watchers.get(team_id)
+
+
+def notify_notes_uploaded(team_id: Optional[str], paths: List[str]) -> None:
+    """アップロードAPIからの新着通知（監視中の場合のみ取り込み待ちに追加）"""
+    watcher = get_watcher(team_id)
+    if watcher is not None:
+        watcher.add(paths)
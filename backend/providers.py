@@ -0,0 +1,122 @@
+"""
+外部モデルプロバイダーモジュール（v3.3.0）
+
+Embedding・チャットLLM・リランカーの生成をここに集約する。
+SearchAgent・取り込み・用語抽出はこのモジュールの create_* 関数経由でクライアントを生成するため、
+set_providers() で実装を差し替えると、APIキーなしで検索・取り込みを実行できる
+（ベンチマーク用のスタブは benchmarks/stub_providers.py）。
+
+PROVIDER_MODE=record / replay の場合は、生成したクライアントをカセット（cassette.py）で包み、
+呼び出しを記録・再生する（評価・ベンチマークをオフラインで同じ結果のまま再実行するため）。
+"""
+
+from typing import List, Optional
+
+import cohere
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+from cassette import RecordingProviders, get_cassette
+from config import config
+from metrics import track_call
+
+
+# temperatureパラメータをサポートしないモデル
+NO_TEMPERATURE_MODELS = ['o1', 'o1-mini', 'o1-preview', 'o3-mini', 'gpt-5-mini', 'gpt-5-nano']
+
+
+def supports_temperature(model_name: str) -> bool:
+    """temperatureパラメータをサポートするモデルかどうか判定"""
+    return not any(m in model_name for m in NO_TEMPERATURE_MODELS)
+
+
+class InstrumentedOpenAIEmbeddings(OpenAIEmbeddings):
+    """Embedding API呼び出しのレイテンシを計測するOpenAIEmbeddings"""
+
+    def embed_documents(self, texts: List[str], chunk_size: Optional[int] = None) -> List[List[float]]:
+        with track_call("openai_embeddings"):
+            return super().embed_documents(texts, chunk_size=chunk_size)
+
+    def embed_query(self, text: str) -> List[float]:
+        with track_call("openai_embeddings"):
+            return super().embed_query(text)
+
+
+class OpenAIProviders:
+    """本番用プロバイダー（OpenAI / Cohere）"""
+
+    def embeddings(self, model: str, api_key: str):
+        return InstrumentedOpenAIEmbeddings(model=model, api_key=api_key)
+
+    def chat_model(self, model: str, api_key: str, temperature: Optional[float] = None):
+        kwargs = {"model": model, "api_key": api_key}
+        if temperature is not None and supports_temperature(model):
+            kwargs["temperature"] = temperature
+        return ChatOpenAI(**kwargs)
+
+    def rerank_client(self, api_key: str):
+        return cohere.Client(api_key)
+
+
+_providers = OpenAIProviders()
+
+
+def get_providers():
+    """現在のプロバイダーを取得"""
+    return _providers
+
+
+def set_providers(providers) -> object:
+    """
+    プロバイダーを差し替える
+
+    Args:
+        providers: embeddings / chat_model / rerank_client メソッドを持つオブジェクト
+            （None の場合は本番用に戻す）
+
+    Returns:
+        差し替え前のプロバイダー（元に戻す場合に使用）
+    """
+    global _providers
+    previous = _providers
+    _providers = providers if providers is not None else OpenAIProviders()
+    return previous
+
+
+def _active_providers():
+    """PROVIDER_MODE に応じて記録・再生のラッパーを適用したプロバイダー"""
+    if config.PROVIDER_MODE in ("record", "replay"):
+        return RecordingProviders(_providers, get_cassette(config.PROVIDER_CASSETTE), config.PROVIDER_MODE)
+    return _providers
+
+
+def create_embeddings(model: str, api_key: str):
+    """
+    Embedding関数を生成（LangChain Embeddings互換）
+
+    Args:
+        model: Embeddingモデル名
+        api_key: OpenAI APIキー
+    """
+    return _active_providers().embeddings(model, api_key)
+
+
+def create_chat_model(model: str, api_key: str, temperature: Optional[float] = None):
+    """
+    チャットLLMを生成（.invoke() を持つLangChain ChatModel互換）
+
+    Args:
+        model: LLMモデル名
+        api_key: OpenAI APIキー
+        temperature: 温度（サポートしないモデルでは無視）
+    """
+    return _active_providers().chat_model(model, api_key, temperature)
+
+
+def create_rerank_client(api_key: str):
+    """
+    リランククライアントを生成（cohere.Client互換の .rerank() を持つ）
+
+    Args:
+        api_key: Cohere APIキー
+    """
+    return _active_providers().rerank_client(api_key)
@@ -0,0 +1,269 @@
+"""
+検索結果キャッシュ（v3.3.0）
+
+同じチーム・同じ入力・同じ検索設定・同じプロンプトの検索結果（要約を含むレスポンス全体）を再利用する。
+キーにはチームの世代（generations.py: インデックス・正規化辞書・同義語辞書）を含め、
+取り込み・コレクションのリセット・辞書の保存で世代が進むことで、古い結果を明示的に削除せずに無効化する
+（古いエントリはLRU/TTLで自然に消える）。チームの検索もグローバルのマスター辞書で正規化するため、
+グローバル（チーム未指定）の世代も常にキーに含める。
+
+バックエンド（config.SEARCH_CACHE_BACKEND）:
+- "memory": プロセス内のLRU（ワーカーごとに独立）
+- "redis": Redis互換ストア（複数ワーカー・複数インスタンスで共有。redisパッケージが必要）
+- "off": キャッシュしない
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import metrics
+from config import config
+from generations import get_generations
+from tracing import record_cache
+
+logger = logging.getLogger(__name__)
+
+# キーの形式を変えた場合は更新する（古い形式のエントリを参照しないため）
+KEY_VERSION = 3
+
+# 入力の正規化対象（キーに含める入力フィールド）
+INPUT_FIELDS = ("type", "purpose", "materials", "methods", "instruction")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class MemoryCacheBackend:
+    """プロセス内のキャッシュ（LRU、エントリごとのTTL）"""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        """
+        Args:
+            max_entries: 最大保持数（デフォルト: config.SEARCH_CACHE_MAX_ENTRIES）
+        """
+        self.max_entries = max_entries or config.SEARCH_CACHE_MAX_ENTRIES
+        # {key: (value, expires_at)}（expires_at は time.monotonic、None は無期限）
+        self._entries: "OrderedDict[str, Tuple[str, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and now >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class RedisCacheBackend:
+    """Redis互換ストアのキャッシュ（件数上限はサーバー側のmaxmemory-policyに任せる）"""
+
+    def __init__(self, url: Optional[str] = None):
+        """
+        Args:
+            url: 接続先（デフォルト: config.SEARCH_CACHE_REDIS_URL）
+        """
+        import redis
+
+        self._client = redis.Redis.from_url(url or config.SEARCH_CACHE_REDIS_URL)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._client.get(key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self._client.set(key, value, ex=int(ttl) if ttl else None)
+
+    def clear(self) -> None:
+        # 共有ストアのため自分のプレフィックスのエントリのみ削除
+        for key in self._client.scan_iter(match=f"{config.SEARCH_CACHE_PREFIX}:result:*"):
+            self._client.delete(key)
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+def _create_backend(name: str):
+    """設定名からバックエンドを作成（"off" はNone、redisが使えない場合はメモリにフォールバック）"""
+    if name == "off":
+        return None
+    if name == "redis":
+        try:
+            return RedisCacheBackend()
+        except ImportError:
+            logger.warning("redisパッケージが未インストールのため、検索結果キャッシュはプロセス内で保持します")
+        except Exception as e:
+            logger.warning("Redisに接続できないため、検索結果キャッシュはプロセス内で保持します: %s", e)
+        return MemoryCacheBackend()
+    if name != "memory":
+        logger.warning("不明な検索結果キャッシュのバックエンド: %s（memoryを使用）", name)
+    return MemoryCacheBackend()
+
+
+def normalize_input(input_data: Dict) -> Dict[str, str]:
+    """キー用に入力を正規化（前後の空白を除去し、連続する空白を1つにまとめる）"""
+    return {
+        field: _WHITESPACE.sub(" ", str(input_data.get(field) or "")).strip()
+        for field in INPUT_FIELDS
+    }
+
+
+def prompts_hash(custom_prompts: Optional[Dict[str, str]]) -> str:
+    """カスタムプロンプトとデフォルトプロンプトのハッシュ（デプロイでデフォルトが変わった場合も別キーになる）"""
+    from prompts import DEFAULT_PROMPTS
+
+    payload = json.dumps(
+        {"custom": custom_prompts or {}, "default": DEFAULT_PROMPTS},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def search_config_settings() -> Dict:
+    """リクエストでは指定できないが検索結果に影響する設定"""
+    return {
+        "vector_search_k": config.VECTOR_SEARCH_K,
+        "rerank_top_n": config.RERANK_TOP_N,
+        "rrf_k": config.RRF_K,
+        "rerank_model": config.DEFAULT_RERANK_MODEL,
+    }
+
+
+class SearchCache:
+    """検索結果キャッシュ（チームの世代で無効化）"""
+
+    def __init__(self, backend=None, ttl: Optional[float] = None, prefix: Optional[str] = None):
+        """
+        Args:
+            backend: MemoryCacheBackend / RedisCacheBackend（None: config.SEARCH_CACHE_BACKEND から作成）
+            ttl: エントリの有効秒数（デフォルト: config.SEARCH_CACHE_TTL、0: 無期限）
+            prefix: キーのプレフィックス（デフォルト: config.SEARCH_CACHE_PREFIX）
+        """
+        self.backend = backend if backend is not None else _create_backend(config.SEARCH_CACHE_BACKEND)
+        self.ttl = config.SEARCH_CACHE_TTL if ttl is None else ttl
+        self.prefix = prefix or config.SEARCH_CACHE_PREFIX
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def generation(self, team_id: Optional[str]) -> Dict[str, Dict[str, int]]:
+        """
+        検索結果に影響する世代
+
+        Returns:
+            {"global": {resource: generation}, "team": {resource: generation}}
+            （"team" はチーム指定時のみ。グローバルのマスター辞書はチームの検索でも使われる）
+        """
+        if not self.enabled:
+            return {}
+        generation = {"global": get_generations(None)}
+        if team_id:
+            generation["team"] = get_generations(team_id)
+        return generation
+
+    def make_key(
+        self,
+        team_id: Optional[str],
+        input_data: Dict,
+        settings: Dict,
+        custom_prompts: Optional[Dict[str, str]] = None,
+        evaluation_mode: bool = False,
+        generation: Optional[Dict[str, Dict[str, int]]] = None
+    ) -> str:
+        """
+        キャッシュキーを作成
+
+        Args:
+            team_id: チームID
+            input_data: 検索入力（type/purpose/materials/methods/instruction）
+            settings: SearchAgent.resolve_settings() の戻り値（既定値適用済みの検索設定）
+            custom_prompts: カスタムプロンプト
+            evaluation_mode: 評価モード
+            generation: generation() の戻り値（None: 現在の世代を取得）
+
+        Returns:
+            キー（APIキーは含めない）
+        """
+        if generation is None:
+            generation = self.generation(team_id)
+        payload = json.dumps({
+            "version": KEY_VERSION,
+            "team": team_id,
+            "generation": generation,
+            "input": normalize_input(input_data),
+            "settings": settings,
+            "config": search_config_settings(),
+            "prompts": prompts_hash(custom_prompts),
+            "evaluation_mode": bool(evaluation_mode),
+        }, sort_keys=True, ensure_ascii=False, default=str)
+        digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return f"{self.prefix}:result:{digest}"
+
+    def get(self, key: str) -> Optional[Dict]:
+        """キャッシュ済みの検索結果（ミス・無効時はNone）"""
+        if not self.enabled:
+            return None
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning("検索結果キャッシュを参照できません: %s", e)
+            value = None
+        hit = value is not None
+        record_cache("search_result", hit)
+        metrics.SEARCH_CACHE_REQUESTS.inc(result="hit" if hit else "miss")
+        return json.loads(value) if hit else None
+
+    def put(self, key: str, result: Dict) -> None:
+        """検索結果を保存（JSONに変換できる値のみ）"""
+        if not self.enabled:
+            return
+        try:
+            self.backend.set(key, json.dumps(result, ensure_ascii=False), ttl=self.ttl)
+        except Exception as e:
+            logger.warning("検索結果キャッシュに保存できません: %s", e)
+
+    def clear(self) -> None:
+        if self.enabled:
+            self.backend.clear()
+
+
+_search_cache = None
+_search_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> SearchCache:
+    """検索結果キャッシュのシングルトン"""
+    global _search_cache
+    if _search_cache is None:
+        with _search_cache_lock:
+            if _search_cache is None:
+                _search_cache = SearchCache()
+    return _search_cache
+
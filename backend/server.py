@@ -4,29 +4,45 @@ FastAPI Server for Experiment Notes Search System
 """
 from fastapi import FastAPI, HTTPException, File, UploadFile, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List, Dict
 import os
 import json
 import re
+import asyncio
+import logging
+import time
 
 from config import config
+from logging_config import setup_logging
 from agent import SearchAgent
 from prompts import get_all_default_prompts
 from ingest import ingest_notes
+from chroma_sync import ensure_chroma_synced
+from ingest_jobs import get_ingest_job_manager
+import note_watcher
 from dictionary import get_dictionary_manager
 from term_extractor import TermExtractor
 from history import get_history_manager
 from evaluation import get_evaluator
+import evaluation_artifacts
+import evaluation_runs
 from storage import storage
 from prompt_manager import PromptManager
-from middleware import AuthMiddleware, TeamMiddleware
-from auth import verify_firebase_token
+from middleware import AuthMiddleware, TeamMiddleware, RequestContextMiddleware, MetricsMiddleware
+import metrics
+from tracing import search_trace
+from search_cache import get_search_cache
+from generations import get_generation_store, generations_etag
+from auth import verify_firebase_token, refresh_public_keys_periodically
 from experimenter_profile import get_experimenter_profile_manager
 from synonym_dictionary import get_synonym_dictionary
 import teams
 
+setup_logging()
+logger = logging.getLogger(__name__)
+
 app = FastAPI(
     title="実験ノート検索システム API",
     version="3.0.0",
@@ -37,6 +53,10 @@ app = FastAPI(
 # 注意: ミドルウェアは逆順で実行されるため、CORSミドルウェアを最後に追加
 app.add_middleware(TeamMiddleware)
 app.add_middleware(AuthMiddleware)
+# ログ用のリクエストIDを設定（v3.3.0、認証より先に実行）
+app.add_middleware(RequestContextMiddleware)
+# エンドポイント別のリクエスト数・レイテンシ（v3.3.0、認証エラーも含めて計測）
+app.add_middleware(MetricsMiddleware)
 
 # CORS設定（最後に追加することで、OPTIONSリクエストが最初に処理される）
 # 環境変数からCORS originsを取得（カンマ区切り）
@@ -52,6 +72,18 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def sync_chroma_on_startup():
+    """起動時にChromaDBをGCSから一度だけ同期（v3.3.0、以降の取得ではバージョン確認のみ）"""
+    await asyncio.to_thread(ensure_chroma_synced)
+
+
+@app.on_event("startup")
+async def start_firebase_key_refresh():
+    """Firebase公開鍵のバックグラウンド更新を開始（v3.3.0）"""
+    app.state.firebase_key_refresh_task = asyncio.create_task(refresh_public_keys_periodically())
+
+
 # === Request/Response Models ===
 
 class HealthResponse(BaseModel):
@@ -96,6 +128,7 @@ class SearchRequest(BaseModel):
     axis_weights: Optional[Dict[str, float]] = None  # {"material": 0.3, "method": 0.4, "combined": 0.3}
     rerank_position: Optional[str] = None  # "per_axis" | "after_fusion"
     rerank_enabled: Optional[bool] = None  # リランキングの有効/無効
+    trace: bool = False  # v3.3.0: 検索トレースをレスポンスに含める
 
 
 class SearchResponse(BaseModel):
@@ -104,6 +137,7 @@ class SearchResponse(BaseModel):
     retrieved_docs: List[str]
     normalized_materials: Optional[str] = None
     search_query: Optional[str] = None
+    trace: Optional[Dict] = None  # v3.3.0: trace=True の場合のみ（ノード時間・外部呼び出し・候補・統合スコア・キャッシュ）
 
 
 class PromptsResponse(BaseModel):
@@ -118,6 +152,8 @@ class IngestRequest(BaseModel):
     archive_folder: Optional[str] = None
     embedding_model: Optional[str] = None
     rebuild_mode: bool = False  # ChromaDBリセット後の再構築モード
+    multi_collection: bool = True  # v3.1.1: 3コレクションモード
+    expand_shortcuts: bool = True  # v3.2.0: 省略形展開機能
 
 
 class IngestResponse(BaseModel):
@@ -127,6 +163,34 @@ class IngestResponse(BaseModel):
     skipped_notes: List[str]
 
 
+class IngestJobResumeRequest(BaseModel):
+    openai_api_key: str  # APIキーはジョブに保存しないため再開時に再指定
+
+
+class IngestJobResponse(BaseModel):
+    success: bool
+    job: Dict
+
+
+class IngestJobListResponse(BaseModel):
+    success: bool
+    jobs: List[Dict]
+
+
+class IngestWatchRequest(BaseModel):
+    openai_api_key: str
+    embedding_model: Optional[str] = None
+    debounce_seconds: Optional[float] = None
+    max_batch_size: Optional[int] = None
+    backfill: bool = False  # True: 監視開始時にフォルダ内の既存ノートも取り込む
+
+
+class IngestWatchResponse(BaseModel):
+    success: bool
+    watching: bool
+    watcher: Optional[Dict] = None
+
+
 class UploadNotesResponse(BaseModel):
     success: bool
     message: str
@@ -318,12 +382,35 @@ class BatchEvaluateRequest(BaseModel):
     axis_weights: Optional[Dict[str, float]] = None  # {"material": 0.3, "method": 0.4, "combined": 0.3}
     rerank_position: Optional[str] = None  # "per_axis" | "after_fusion"
     rerank_enabled: Optional[bool] = None  # リランキングの有効/無効
+    # v3.3.0: 並列実行・ストリーミング
+    concurrency: Optional[int] = None  # 同時に実行するテストケース数（未指定: config.EVALUATION_CONCURRENCY）
+    stream: bool = False  # True: 完了したケースから NDJSON で逐次返却
+    save_artifacts: bool = False  # True: ケースごとの中間結果を保存（/evaluate/replay 用、3軸検索のみ）
+    run_label: Optional[str] = None  # v3.3.0: 評価実行の記録に付けるラベル
+
+
+class EvaluationReplayRequest(BaseModel):
+    test_case_ids: Optional[List[str]] = None  # 未指定: アーティファクトを保存済みの全ケース
+    grid: Dict[str, List] = {}  # {"fusion_method": ["rrf", "linear"], "rrf_k": [20, 60], ...}
+    base: Optional[Dict] = None  # グリッド以外のパラメータ（未指定の項目は config の既定値）
+    include_cases: bool = False  # True: 各点のケース別指標も返す
+
+
+class EvaluationReplayResponse(BaseModel):
+    success: bool
+    points: List[Dict]  # [{"params": {...}, "average_metrics": {...}}]
+    best: Optional[Dict] = None  # nDCG@10 が最大の点
+    evaluated_cases: List[str]
+    missing_cases: List[str]  # アーティファクトが未保存のケース
+    elapsed_ms: float
 
 
 class BatchEvaluateResponse(BaseModel):
     success: bool
     average_metrics: Dict
     individual_results: List[Dict]
+    failed_cases: List[Dict] = []  # v3.3.0: 検索に失敗したケース [{"test_case_id": ..., "error": ...}]
+    run_id: Optional[str] = None  # v3.3.0: 評価実行の記録ID（/evaluate/runs）
 
 
 # === チーム管理 Request/Response Models（v3.0新規） ===
@@ -582,6 +669,12 @@ async def health_check():
     )
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus形式のメトリクス（v3.3.0）"""
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.post("/config/folders", response_model=FolderPathsResponse)
 async def update_folder_paths(request: FolderPathsRequest):
     """フォルダパス設定を更新"""
@@ -632,57 +725,98 @@ async def search_experiments(req_obj: Request, request: SearchRequest):
         # チームIDを取得（v3.0）
         team_id = getattr(req_obj.state, 'team_id', None)
 
-        # エージェント初期化（v3.1.0: 3軸分離検索対応）
-        agent = SearchAgent(
-            openai_api_key=request.openai_api_key,
-            cohere_api_key=request.cohere_api_key,
-            embedding_model=request.embedding_model,
-            llm_model=request.llm_model,  # 後方互換性
-            search_llm_model=request.search_llm_model,  # v3.0: 検索・判定用LLM
-            summary_llm_model=request.summary_llm_model,  # v3.0: 要約生成用LLM
-            search_mode=request.search_mode,  # v3.0.1: 検索モード
-            hybrid_alpha=request.hybrid_alpha,  # v3.0.1: ハイブリッド検索の重み
-            prompts=request.custom_prompts,
-            team_id=team_id,  # v3.0: チームID指定
-            # v3.1.0: 3軸分離検索設定
-            multi_axis_enabled=request.multi_axis_enabled,
-            fusion_method=request.fusion_method,
-            axis_weights=request.axis_weights,
-            rerank_position=request.rerank_position,
-            rerank_enabled=request.rerank_enabled
-        )
-
-        # 検索実行
-        input_data = {
-            "type": request.type,
-            "purpose": request.purpose,
-            "materials": request.materials,
-            "methods": request.methods,
-            "instruction": request.instruction
-        }
-
-        result = agent.run(input_data, evaluation_mode=request.evaluation_mode)
+        # v3.3.0: エージェント初期化・検索はブロッキング処理のため、スレッドで実行してイベントループを止めない
+        # （trace=True の場合はエージェント初期化から検索完了までをトレース）
+        def run_search():
+            with search_trace(request.trace) as trace:
+                input_data = {
+                    "type": request.type,
+                    "purpose": request.purpose,
+                    "materials": request.materials,
+                    "methods": request.methods,
+                    "instruction": request.instruction
+                }
+
+                # v3.3.0: 同じ入力・設定・プロンプト・インデックス世代の結果があれば再利用
+                cache = get_search_cache()
+                cache_key = None
+                if cache.enabled:
+                    settings = SearchAgent.resolve_settings(
+                        embedding_model=request.embedding_model,
+                        llm_model=request.llm_model,
+                        search_llm_model=request.search_llm_model,
+                        summary_llm_model=request.summary_llm_model,
+                        search_mode=request.search_mode,
+                        hybrid_alpha=request.hybrid_alpha,
+                        multi_axis_enabled=request.multi_axis_enabled,
+                        fusion_method=request.fusion_method,
+                        axis_weights=request.axis_weights,
+                        rerank_position=request.rerank_position,
+                        rerank_enabled=request.rerank_enabled
+                    )
+                    # 世代は検索前に取得（検索中に取り込みがあれば、この結果は次の世代では参照されない）
+                    cache_key = cache.make_key(
+                        team_id, input_data, settings,
+                        custom_prompts=request.custom_prompts,
+                        evaluation_mode=request.evaluation_mode
+                    )
+                    cached = cache.get(cache_key)
+                    if cached is not None:
+                        return cached, (trace.to_dict() if trace else None)
+
+                # エージェント初期化（v3.1.0: 3軸分離検索対応）
+                agent = SearchAgent(
+                    openai_api_key=request.openai_api_key,
+                    cohere_api_key=request.cohere_api_key,
+                    embedding_model=request.embedding_model,
+                    llm_model=request.llm_model,  # 後方互換性
+                    search_llm_model=request.search_llm_model,  # v3.0: 検索・判定用LLM
+                    summary_llm_model=request.summary_llm_model,  # v3.0: 要約生成用LLM
+                    search_mode=request.search_mode,  # v3.0.1: 検索モード
+                    hybrid_alpha=request.hybrid_alpha,  # v3.0.1: ハイブリッド検索の重み
+                    prompts=request.custom_prompts,
+                    team_id=team_id,  # v3.0: チームID指定
+                    # v3.1.0: 3軸分離検索設定
+                    multi_axis_enabled=request.multi_axis_enabled,
+                    fusion_method=request.fusion_method,
+                    axis_weights=request.axis_weights,
+                    rerank_position=request.rerank_position,
+                    rerank_enabled=request.rerank_enabled
+                )
 
-        # 結果から最後のメッセージを取得
-        final_message = ""
-        if result.get("messages"):
-            last_msg = result["messages"][-1]
-            if hasattr(last_msg, "content"):
-                final_message = last_msg.content
-            else:
-                final_message = str(last_msg)
+                # 検索実行
+                result = agent.run(input_data, evaluation_mode=request.evaluation_mode)
+
+                # 結果から最後のメッセージを取得
+                final_message = ""
+                if result.get("messages"):
+                    last_msg = result["messages"][-1]
+                    if hasattr(last_msg, "content"):
+                        final_message = last_msg.content
+                    else:
+                        final_message = str(last_msg)
+
+                response_fields = {
+                    "message": final_message,
+                    "retrieved_docs": result.get("retrieved_docs", []),
+                    "normalized_materials": result.get("normalized_materials", ""),
+                    "search_query": result.get("search_query", "")
+                }
+                if cache_key is not None:
+                    cache.put(cache_key, response_fields)
+                return response_fields, (trace.to_dict() if trace else None)
+
+        response_fields, trace_dict = await asyncio.to_thread(run_search)
 
         return SearchResponse(
             success=True,
-            message=final_message,
-            retrieved_docs=result.get("retrieved_docs", []),
-            normalized_materials=result.get("normalized_materials", ""),
-            search_query=result.get("search_query", "")
+            **response_fields,
+            trace=trace_dict
         )
 
     except Exception as e:
         error_str = str(e)
-        print(f"Error in search: {error_str}")
+        logger.exception("Error in search: %s", error_str)
 
         # OpenAI APIキーエラーを検出
         if "401" in error_str or "invalid_api_key" in error_str or "Incorrect API key" in error_str:
@@ -748,6 +882,9 @@ async def upload_notes(
 
             uploaded_files.append(file.filename)
 
+            # v3.3.0: フォルダ監視中なら即座に取り込み待ちに追加
+            note_watcher.notify_notes_uploaded(team_id, [file_path])
+
         return UploadNotesResponse(
             success=True,
             message=f"{len(uploaded_files)}件のファイルをアップロードしました",
@@ -757,7 +894,7 @@ async def upload_notes(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in upload_notes: {str(e)}")
+        logger.exception("Error in upload_notes: %s", e)
         raise HTTPException(status_code=500, detail=f"ファイルアップロードエラー: {str(e)}")
 
 
@@ -768,14 +905,18 @@ async def ingest_notes_endpoint(req_obj: Request, request: IngestRequest):
         # チームIDを取得（v3.0）
         team_id = getattr(req_obj.state, 'team_id', None)
 
-        new_notes, skipped_notes = ingest_notes(
+        # v3.3.0: 取り込み中も他のリクエストを処理できるようスレッドで実行
+        new_notes, skipped_notes = await asyncio.to_thread(
+            ingest_notes,
             api_key=request.openai_api_key,
             source_folder=request.source_folder,
             post_action=request.post_action,
             archive_folder=request.archive_folder,
             embedding_model=request.embedding_model,
             rebuild_mode=request.rebuild_mode,
-            team_id=team_id  # v3.0: チームID指定
+            team_id=team_id,  # v3.0: チームID指定
+            multi_collection=request.multi_collection,
+            expand_shortcuts=request.expand_shortcuts
         )
 
         if request.rebuild_mode:
@@ -791,10 +932,110 @@ async def ingest_notes_endpoint(req_obj: Request, request: IngestRequest):
         )
 
     except Exception as e:
-        print(f"Error in ingest: {str(e)}")
+        logger.exception("Error in ingest: %s", e)
         raise HTTPException(status_code=500, detail=f"ノート取り込みエラー: {str(e)}")
 
 
+# === 取り込みジョブ（v3.3.0） ===
+
+@app.post("/ingest/jobs", response_model=IngestJobResponse)
+async def create_ingest_job(req_obj: Request, request: IngestRequest):
+    """ノート取り込みをバックグラウンドジョブとして投入（v3.3.0）"""
+    try:
+        team_id = getattr(req_obj.state, 'team_id', None)
+
+        job = get_ingest_job_manager().submit(
+            api_key=request.openai_api_key,
+            team_id=team_id,
+            params={
+                "source_folder": request.source_folder,
+                "post_action": request.post_action,
+                "archive_folder": request.archive_folder,
+                "embedding_model": request.embedding_model,
+                "rebuild_mode": request.rebuild_mode,
+                "multi_collection": request.multi_collection,
+                "expand_shortcuts": request.expand_shortcuts
+            }
+        )
+
+        return IngestJobResponse(success=True, job=job.to_dict())
+
+    except Exception as e:
+        logger.exception("Error in create_ingest_job: %s", e)
+        raise HTTPException(status_code=500, detail=f"取り込みジョブ投入エラー: {str(e)}")
+
+
+@app.get("/ingest/jobs", response_model=IngestJobListResponse)
+async def list_ingest_jobs(req_obj: Request):
+    """取り込みジョブ一覧を取得（v3.3.0）"""
+    team_id = getattr(req_obj.state, 'team_id', None)
+    jobs = get_ingest_job_manager().list_jobs(team_id)
+    return IngestJobListResponse(success=True, jobs=[job.to_dict() for job in jobs])
+
+
+@app.get("/ingest/jobs/{job_id}", response_model=IngestJobResponse)
+async def get_ingest_job(req_obj: Request, job_id: str):
+    """取り込みジョブの進捗を取得（v3.3.0）"""
+    team_id = getattr(req_obj.state, 'team_id', None)
+    job = get_ingest_job_manager().get_job(job_id, team_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"ジョブが見つかりません: {job_id}")
+    return IngestJobResponse(success=True, job=job.to_dict())
+
+
+@app.post("/ingest/jobs/{job_id}/resume", response_model=IngestJobResponse)
+async def resume_ingest_job(req_obj: Request, job_id: str, request: IngestJobResumeRequest):
+    """失敗・中断した取り込みジョブをチェックポイントから再開（v3.3.0）"""
+    team_id = getattr(req_obj.state, 'team_id', None)
+    try:
+        job = get_ingest_job_manager().resume(job_id, team_id, request.openai_api_key)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"ジョブが見つかりません: {job_id}")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return IngestJobResponse(success=True, job=job.to_dict())
+
+
+# === フォルダ監視による自動取り込み（v3.3.0） ===
+
+@app.post("/ingest/watch", response_model=IngestWatchResponse)
+async def start_ingest_watch(req_obj: Request, request: IngestWatchRequest):
+    """notes_new フォルダの監視を開始（新着ノートをマイクロバッチで自動取り込み）"""
+    try:
+        team_id = getattr(req_obj.state, 'team_id', None)
+        watcher = note_watcher.start_watcher(
+            team_id=team_id,
+            api_key=request.openai_api_key,
+            backfill=request.backfill,
+            embedding_model=request.embedding_model,
+            debounce_seconds=request.debounce_seconds,
+            max_batch_size=request.max_batch_size
+        )
+        return IngestWatchResponse(success=True, watching=True, watcher=watcher.status())
+
+    except Exception as e:
+        logger.exception("Error in start_ingest_watch: %s", e)
+        raise HTTPException(status_code=500, detail=f"フォルダ監視の開始エラー: {str(e)}")
+
+
+@app.get("/ingest/watch", response_model=IngestWatchResponse)
+async def get_ingest_watch(req_obj: Request):
+    """フォルダ監視の状態を取得"""
+    team_id = getattr(req_obj.state, 'team_id', None)
+    watcher = note_watcher.get_watcher(team_id)
+    if watcher is None:
+        return IngestWatchResponse(success=True, watching=False)
+    return IngestWatchResponse(success=True, watching=True, watcher=watcher.status())
+
+
+@app.delete("/ingest/watch", response_model=IngestWatchResponse)
+async def stop_ingest_watch(req_obj: Request):
+    """フォルダ監視を停止"""
+    team_id = getattr(req_obj.state, 'team_id', None)
+    stopped = note_watcher.stop_watcher(team_id)
+    return IngestWatchResponse(success=stopped, watching=False)
+
+
 @app.get("/notes/{note_id}", response_model=NoteResponse)
 async def get_note(req_obj: Request, note_id: str):
     """実験ノートを取得（v3.0: マルチテナント対応）"""
@@ -865,7 +1106,7 @@ async def get_note(req_obj: Request, note_id: str):
         )
 
     except Exception as e:
-        print(f"Error in get_note: {str(e)}")
+        logger.exception("Error in get_note: %s", e)
         return NoteResponse(
             success=False,
             error=f"ノート読み込みエラー: {str(e)}"
@@ -934,7 +1175,7 @@ async def analyze_new_terms(req_obj: Request, request: AnalyzeRequest):
         )
 
     except Exception as e:
-        print(f"Error in analyze: {str(e)}")
+        logger.exception("Error in analyze: %s", e)
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"新出単語分析エラー: {str(e)}")
@@ -959,7 +1200,7 @@ async def get_dictionary(request: Request):
         )
 
     except Exception as e:
-        print(f"Error in get_dictionary: {str(e)}")
+        logger.exception("Error in get_dictionary: %s", e)
         raise HTTPException(status_code=500, detail=f"辞書取得エラー: {str(e)}")
 
 
@@ -1005,7 +1246,7 @@ async def update_dictionary(http_request: Request, request: DictionaryUpdateRequ
         )
 
     except Exception as e:
-        print(f"Error in update_dictionary: {str(e)}")
+        logger.exception("Error in update_dictionary: %s", e)
         raise HTTPException(status_code=500, detail=f"辞書更新エラー: {str(e)}")
 
 
@@ -1042,7 +1283,7 @@ async def export_dictionary(request: Request, format: str = "yaml"):
         )
 
     except Exception as e:
-        print(f"Error in export_dictionary: {str(e)}")
+        logger.exception("Error in export_dictionary: %s", e)
         raise HTTPException(status_code=500, detail=f"辞書エクスポートエラー: {str(e)}")
 
 
@@ -1076,7 +1317,7 @@ async def import_dictionary(request: Request, file: UploadFile = File(...)):
             raise HTTPException(status_code=500, detail="辞書のインポートに失敗しました")
 
     except Exception as e:
-        print(f"Error in import_dictionary: {str(e)}")
+        logger.exception("Error in import_dictionary: %s", e)
         raise HTTPException(status_code=500, detail=f"辞書インポートエラー: {str(e)}")
 
 
@@ -1133,7 +1374,7 @@ async def edit_dictionary_entry(request: Request, edit_request: DictionaryEditRe
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in edit_dictionary_entry: {str(e)}")
+        logger.exception("Error in edit_dictionary_entry: %s", e)
         raise HTTPException(status_code=500, detail=f"エントリ編集エラー: {str(e)}")
 
 
@@ -1164,7 +1405,7 @@ async def delete_dictionary_entry(request: Request, delete_request: DictionaryDe
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in delete_dictionary_entry: {str(e)}")
+        logger.exception("Error in delete_dictionary_entry: %s", e)
         raise HTTPException(status_code=500, detail=f"エントリ削除エラー: {str(e)}")
 
 
@@ -1203,7 +1444,7 @@ async def add_suffix_equivalent(request: Request, req: SuffixEquivalentRequest):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in add_suffix_equivalent: {str(e)}")
+        logger.exception("Error in add_suffix_equivalent: %s", e)
         raise HTTPException(status_code=500, detail=f"サフィックスグループ追加エラー: {str(e)}")
 
 
@@ -1238,7 +1479,7 @@ async def update_suffix_equivalent(request: Request, req: SuffixEquivalentUpdate
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in update_suffix_equivalent: {str(e)}")
+        logger.exception("Error in update_suffix_equivalent: %s", e)
         raise HTTPException(status_code=500, detail=f"サフィックスグループ更新エラー: {str(e)}")
 
 
@@ -1269,7 +1510,7 @@ async def delete_suffix_equivalent(request: Request, req: SuffixEquivalentDelete
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in delete_suffix_equivalent: {str(e)}")
+        logger.exception("Error in delete_suffix_equivalent: %s", e)
         raise HTTPException(status_code=500, detail=f"サフィックスグループ削除エラー: {str(e)}")
 
 
@@ -1294,7 +1535,7 @@ async def get_experimenter_profiles(request: Request):
         )
 
     except Exception as e:
-        print(f"Error in get_experimenter_profiles: {str(e)}")
+        logger.exception("Error in get_experimenter_profiles: %s", e)
         raise HTTPException(status_code=500, detail=f"プロファイル取得エラー: {str(e)}")
 
 
@@ -1320,7 +1561,7 @@ async def get_experimenter_profile(request: Request, experimenter_id: str):
         )
 
     except Exception as e:
-        print(f"Error in get_experimenter_profile: {str(e)}")
+        logger.exception("Error in get_experimenter_profile: %s", e)
         raise HTTPException(status_code=500, detail=f"プロファイル取得エラー: {str(e)}")
 
 
@@ -1358,7 +1599,7 @@ async def create_experimenter_profile(request: Request, req: CreateExperimenterP
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in create_experimenter_profile: {str(e)}")
+        logger.exception("Error in create_experimenter_profile: %s", e)
         raise HTTPException(status_code=500, detail=f"プロファイル作成エラー: {str(e)}")
 
 
@@ -1400,7 +1641,7 @@ async def update_experimenter_profile(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in update_experimenter_profile: {str(e)}")
+        logger.exception("Error in update_experimenter_profile: %s", e)
         raise HTTPException(status_code=500, detail=f"プロファイル更新エラー: {str(e)}")
 
 
@@ -1433,7 +1674,7 @@ async def delete_experimenter_profile(request: Request, experimenter_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in delete_experimenter_profile: {str(e)}")
+        logger.exception("Error in delete_experimenter_profile: %s", e)
         raise HTTPException(status_code=500, detail=f"プロファイル削除エラー: {str(e)}")
 
 
@@ -1458,7 +1699,7 @@ async def update_id_pattern(request: Request, req: UpdateIdPatternRequest):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in update_id_pattern: {str(e)}")
+        logger.exception("Error in update_id_pattern: %s", e)
         raise HTTPException(status_code=500, detail=f"IDパターン更新エラー: {str(e)}")
 
 
@@ -1506,7 +1747,7 @@ async def get_synonym_groups(request: Request):
         )
 
     except Exception as e:
-        print(f"Error in get_synonym_groups: {str(e)}")
+        logger.exception("Error in get_synonym_groups: %s", e)
         raise HTTPException(status_code=500, detail=f"同義語辞書取得エラー: {str(e)}")
 
 
@@ -1529,7 +1770,7 @@ async def get_synonym_group(canonical: str, request: Request):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in get_synonym_group: {str(e)}")
+        logger.exception("Error in get_synonym_group: %s", e)
         raise HTTPException(status_code=500, detail=f"グループ取得エラー: {str(e)}")
 
 
@@ -1557,7 +1798,7 @@ async def add_synonym_group(req: SynonymGroupRequest, request: Request):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in add_synonym_group: {str(e)}")
+        logger.exception("Error in add_synonym_group: %s", e)
         raise HTTPException(status_code=500, detail=f"グループ追加エラー: {str(e)}")
 
 
@@ -1586,7 +1827,7 @@ async def update_synonym_group(canonical: str, req: SynonymGroupUpdateRequest, r
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in update_synonym_group: {str(e)}")
+        logger.exception("Error in update_synonym_group: %s", e)
         raise HTTPException(status_code=500, detail=f"グループ更新エラー: {str(e)}")
 
 
@@ -1611,7 +1852,7 @@ async def delete_synonym_group(canonical: str, request: Request):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in delete_synonym_group: {str(e)}")
+        logger.exception("Error in delete_synonym_group: %s", e)
         raise HTTPException(status_code=500, detail=f"グループ削除エラー: {str(e)}")
 
 
@@ -1636,7 +1877,7 @@ async def add_synonym_variant(canonical: str, req: SynonymVariantRequest, reques
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in add_synonym_variant: {str(e)}")
+        logger.exception("Error in add_synonym_variant: %s", e)
         raise HTTPException(status_code=500, detail=f"バリアント追加エラー: {str(e)}")
 
 
@@ -1661,7 +1902,7 @@ async def delete_synonym_variant(canonical: str, variant: str, request: Request)
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in delete_synonym_variant: {str(e)}")
+        logger.exception("Error in delete_synonym_variant: %s", e)
         raise HTTPException(status_code=500, detail=f"バリアント削除エラー: {str(e)}")
 
 
@@ -1684,7 +1925,7 @@ async def add_search_history(request: HistoryRequest):
         )
 
     except Exception as e:
-        print(f"Error in add_history: {str(e)}")
+        logger.exception("Error in add_history: %s", e)
         raise HTTPException(status_code=500, detail=f"履歴追加エラー: {str(e)}")
 
 
@@ -1708,7 +1949,7 @@ async def get_search_histories(limit: int = 50, offset: int = 0, keyword: Option
         )
 
     except Exception as e:
-        print(f"Error in get_histories: {str(e)}")
+        logger.exception("Error in get_histories: %s", e)
         raise HTTPException(status_code=500, detail=f"履歴取得エラー: {str(e)}")
 
 
@@ -1731,7 +1972,7 @@ async def get_search_history(history_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in get_history: {str(e)}")
+        logger.exception("Error in get_history: %s", e)
         raise HTTPException(status_code=500, detail=f"履歴取得エラー: {str(e)}")
 
 
@@ -1750,7 +1991,7 @@ async def delete_search_history(history_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in delete_history: {str(e)}")
+        logger.exception("Error in delete_history: %s", e)
         raise HTTPException(status_code=500, detail=f"履歴削除エラー: {str(e)}")
 
 
@@ -1767,7 +2008,7 @@ async def get_test_cases():
         )
 
     except Exception as e:
-        print(f"Error in get_test_cases: {str(e)}")
+        logger.exception("Error in get_test_cases: %s", e)
         raise HTTPException(status_code=500, detail=f"テストケース取得エラー: {str(e)}")
 
 
@@ -1803,10 +2044,133 @@ async def import_test_cases(file: UploadFile = File(...)):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in import_test_cases: {str(e)}")
+        logger.exception("Error in import_test_cases: %s", e)
         raise HTTPException(status_code=500, detail=f"テストケースインポートエラー: {str(e)}")
 
 
+def _create_evaluation_agent(request, team_id: Optional[str], **overrides) -> SearchAgent:
+    """評価リクエスト（EvaluateRequest / BatchEvaluateRequest）の設定でSearchAgentを作成（overridesで上書き）"""
+    settings = dict(
+        openai_api_key=request.openai_api_key,
+        cohere_api_key=request.cohere_api_key,
+        embedding_model=request.embedding_model,
+        llm_model=request.llm_model,
+        search_llm_model=request.search_llm_model,
+        summary_llm_model=request.summary_llm_model,
+        search_mode=request.search_mode,
+        hybrid_alpha=request.hybrid_alpha,
+        prompts=request.custom_prompts,
+        team_id=team_id,  # v3.0: チームID指定
+        # v3.1.0: 3軸分離検索設定
+        multi_axis_enabled=request.multi_axis_enabled,
+        fusion_method=request.fusion_method,
+        axis_weights=request.axis_weights,
+        rerank_position=request.rerank_position,
+        rerank_enabled=request.rerank_enabled
+    )
+    settings.update(overrides)
+    return SearchAgent(**settings)
+
+
+def _evaluation_input(test_case) -> Dict:
+    """テストケースのクエリをエージェントの入力に変換"""
+    return {
+        "type": "initial_search",
+        "purpose": test_case.query.get('purpose', ''),
+        "materials": test_case.query.get('materials', ''),
+        "methods": test_case.query.get('methods', ''),
+        "instruction": ""
+    }
+
+
+def _retrieved_results(result: Dict) -> List[Dict]:
+    """エージェントの検索結果を評価用のランキング（上位10件）に整形"""
+    note_ids = []
+
+    for i, doc in enumerate(result.get("retrieved_docs", [])[:10]):
+        # ノートIDを抽出（例: "# 実験ノート ID3-14" から "ID3-14" を抽出）
+        note_id_match = re.search(r'ID[\d-]+', doc)
+        note_ids.append(note_id_match.group(0) if note_id_match else f"unknown_{i+1}")
+
+    return evaluation_artifacts.ranking_results(note_ids)
+
+
+async def _record_evaluation_run(
+    team_id: Optional[str],
+    settings: Dict,
+    completed: List,
+    failed_cases: List[Dict],
+    evaluator,
+    wall_seconds: float,
+    concurrency: int,
+    label: Optional[str]
+) -> Optional[str]:
+    """評価実行を記録して記録IDを返す（保存に失敗しても評価結果は返す）"""
+    try:
+        cases = [entry for _, entry in sorted(completed, key=lambda item: item[0])]
+        run = evaluation_runs.build_run(
+            team_id=team_id,
+            settings=settings,
+            cases=cases,
+            failed_cases=failed_cases,
+            average_metrics=evaluator.average_metrics(cases),
+            wall_seconds=wall_seconds,
+            concurrency=concurrency,
+            label=label
+        )
+        await asyncio.to_thread(evaluation_runs.get_evaluation_run_store().save, run)
+        return run.id
+    except Exception as e:
+        logger.warning("Failed to record evaluation run: %s", e)
+        return None
+
+
+async def _run_evaluation_cases(search_case, evaluator, test_cases: List, concurrency: int):
+    """
+    テストケースを最大 concurrency 件ずつスレッドで検索・評価し、完了順に返す（v3.3.0）
+
+    Args:
+        search_case: テストケースを受け取り評価用の検索結果を返す関数（スレッドで実行）
+        evaluator: Evaluator
+        test_cases: テストケースのリスト
+        concurrency: 同時実行数
+
+    Yields:
+        (テストケースの位置, 結果)。結果は evaluator.individual_result() に検索時間（latency_ms）・
+        ノード別の所要時間（stages）・外部呼び出しの回数とトークン数（calls）を加えたもので、
+        検索に失敗した場合は {"test_case_id", "test_case_name", "error"}
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def traced_search(test_case):
+        # スレッドごとにコンテキストがコピーされるため、トレースはケースごとに分かれる
+        start = time.perf_counter()
+        with search_trace() as trace:
+            retrieved_results = search_case(test_case)
+        return retrieved_results, (time.perf_counter() - start) * 1000, trace.to_dict()
+
+    async def run_case(index: int, test_case):
+        async with semaphore:
+            try:
+                retrieved_results, latency_ms, trace = await asyncio.to_thread(traced_search, test_case)
+                entry = evaluator.individual_result(test_case, retrieved_results)
+                entry['latency_ms'] = round(latency_ms, 3)
+                entry.update(evaluation_runs.summarize_trace(trace))
+                return index, entry
+            except Exception as e:
+                logger.exception("Evaluation failed for test case %s", test_case.id)
+                return index, {'test_case_id': test_case.id, 'test_case_name': test_case.name, 'error': str(e)}
+
+    tasks = [asyncio.create_task(run_case(i, test_case)) for i, test_case in enumerate(test_cases)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # クライアント切断時などに未開始のケースを取り消す
+        for task in tasks:
+            task.cancel()
+
+
 @app.post("/evaluate", response_model=EvaluateResponse)
 async def evaluate_rag(req_obj: Request, request: EvaluateRequest):
     """RAG性能を評価（v3.0: マルチテナント対応、v3.1.0: 3軸分離検索対応）"""
@@ -1821,53 +2185,15 @@ async def evaluate_rag(req_obj: Request, request: EvaluateRequest):
         if not test_case:
             raise HTTPException(status_code=404, detail="テストケースが見つかりません")
 
-        # 検索を実行（v3.1.0: 3軸分離検索対応）
-        agent = SearchAgent(
-            openai_api_key=request.openai_api_key,
-            cohere_api_key=request.cohere_api_key,
-            embedding_model=request.embedding_model,
-            llm_model=request.llm_model,
-            search_llm_model=request.search_llm_model,
-            summary_llm_model=request.summary_llm_model,
-            search_mode=request.search_mode,
-            hybrid_alpha=request.hybrid_alpha,
-            prompts=request.custom_prompts,
-            team_id=team_id,  # v3.0: チームID指定
-            # v3.1.0: 3軸分離検索設定
-            multi_axis_enabled=request.multi_axis_enabled,
-            fusion_method=request.fusion_method,
-            axis_weights=request.axis_weights,
-            rerank_position=request.rerank_position,
-            rerank_enabled=request.rerank_enabled
-        )
-
-        input_data = {
-            "type": "initial_search",
-            "purpose": test_case.query.get('purpose', ''),
-            "materials": test_case.query.get('materials', ''),
-            "methods": test_case.query.get('methods', ''),
-            "instruction": ""
-        }
-
-        result = agent.run(input_data)
-
-        # 検索結果を整形
-        retrieved_docs = result.get("retrieved_docs", [])
-        retrieved_results = []
-
-        for i, doc in enumerate(retrieved_docs[:10]):
-            # ノートIDを抽出（例: "# 実験ノート ID3-14" から "ID3-14" を抽出）
-            note_id_match = re.search(r'ID[\d-]+', doc)
-            note_id = note_id_match.group(0) if note_id_match else f"unknown_{i+1}"
+        # 検索を実行（v3.1.0: 3軸分離検索対応、v3.3.0: 比較ノードを省略）
+        def run_evaluation_search():
+            agent = _create_evaluation_agent(request, team_id)
+            return agent.run(_evaluation_input(test_case), evaluation_mode=True)
 
-            retrieved_results.append({
-                'note_id': note_id,
-                'score': 1.0 - (i * 0.05),  # スコアは仮の値
-                'rank': i + 1
-            })
+        result = await asyncio.to_thread(run_evaluation_search)
 
         # 評価
-        eval_result = evaluator.evaluate(test_case, retrieved_results)
+        eval_result = evaluator.evaluate(test_case, _retrieved_results(result))
 
         from dataclasses import asdict
         return EvaluateResponse(
@@ -1880,85 +2206,306 @@ async def evaluate_rag(req_obj: Request, request: EvaluateRequest):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in evaluate: {str(e)}")
+        logger.exception("Error in evaluate: %s", e)
         raise HTTPException(status_code=500, detail=f"評価エラー: {str(e)}")
 
 
 @app.post("/evaluate/batch", response_model=BatchEvaluateResponse)
 async def batch_evaluate_rag(req_obj: Request, request: BatchEvaluateRequest):
-    """バッチ評価（v3.0: マルチテナント対応、v3.1.0: 3軸分離検索対応）"""
+    """
+    バッチ評価（v3.0: マルチテナント対応、v3.1.0: 3軸分離検索対応）
+
+    v3.3.0: 1つのSearchAgentを全ケースで共有し、最大 concurrency 件を並列に実行する。
+    stream=True の場合は完了したケースから1行1件のNDJSON（application/x-ndjson）で返し、
+    最終行に集計（"type": "summary"）を返す。
+    save_artifacts=True の場合はケースごとの中間結果を保存し、指標はリクエストの設定でリプレイした値を返す。
+    """
     try:
         # チームIDを取得（v3.0）
         team_id = getattr(req_obj.state, 'team_id', None)
 
         evaluator = get_evaluator()
-        results = []
 
+        # テストケースを取得
+        test_cases = []
         for test_case_id in request.test_case_ids:
-            # テストケースを取得
             test_case = evaluator.get_test_case(test_case_id)
             if not test_case:
-                print(f"テストケースが見つかりません: {test_case_id}")
+                logger.warning("テストケースが見つかりません: %s", test_case_id)
                 continue
-
-            # 検索を実行（v3.1.0: 3軸分離検索対応）
-            agent = SearchAgent(
-                openai_api_key=request.openai_api_key,
-                cohere_api_key=request.cohere_api_key,
-                embedding_model=request.embedding_model,
-                llm_model=request.llm_model,
-                search_llm_model=request.search_llm_model,
-                summary_llm_model=request.summary_llm_model,
+            test_cases.append(test_case)
+
+        # 検索設定は全ケース共通のため、エージェント（ベクトルストア・辞書・LLMクライアント）は1回だけ作成
+        if request.save_artifacts:
+            multi_axis_enabled = request.multi_axis_enabled if request.multi_axis_enabled is not None else config.MULTI_AXIS_ENABLED
+            if not multi_axis_enabled:
+                raise HTTPException(status_code=400, detail="アーティファクトの保存は3軸検索（multi_axis_enabled）でのみ利用できます")
+            replay_params = evaluation_artifacts.default_replay_params(
                 search_mode=request.search_mode,
                 hybrid_alpha=request.hybrid_alpha,
-                prompts=request.custom_prompts,
-                team_id=team_id,  # v3.0: チームID指定
-                # v3.1.0: 3軸分離検索設定
-                multi_axis_enabled=request.multi_axis_enabled,
                 fusion_method=request.fusion_method,
                 axis_weights=request.axis_weights,
                 rerank_position=request.rerank_position,
                 rerank_enabled=request.rerank_enabled
             )
+            # 軸ごとの候補はリランク前のスコアで収集し、リランクは収集時に全候補へまとめて行う
+            agent = await asyncio.to_thread(_create_evaluation_agent, request, team_id, rerank_enabled=False)
+            run_settings = evaluation_runs.agent_settings(
+                agent, extra={"rerank_enabled": replay_params["rerank_enabled"], "save_artifacts": True}
+            )
 
-            input_data = {
-                "type": "initial_search",
-                "purpose": test_case.query.get('purpose', ''),
-                "materials": test_case.query.get('materials', ''),
-                "methods": test_case.query.get('methods', ''),
-                "instruction": ""
+            def search_case(test_case):
+                artifact = evaluation_artifacts.capture_case_artifact(agent, test_case.id, _evaluation_input(test_case))
+                evaluation_artifacts.save_artifact(team_id, artifact)
+                return evaluation_artifacts.ranking_results(evaluation_artifacts.replay_ranking(artifact, replay_params))
+        else:
+            agent = await asyncio.to_thread(_create_evaluation_agent, request, team_id)
+            run_settings = evaluation_runs.agent_settings(agent, extra={"save_artifacts": False})
+
+            def search_case(test_case):
+                # 評価では要約を使わないため、比較ノードは常に省略
+                return _retrieved_results(agent.run(_evaluation_input(test_case), evaluation_mode=True))
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception("Error in batch_evaluate: %s", e)
+        raise HTTPException(status_code=500, detail=f"バッチ評価エラー: {str(e)}")
+
+    concurrency = max(1, min(request.concurrency or config.EVALUATION_CONCURRENCY, config.EVALUATION_MAX_CONCURRENCY))
+    started = time.perf_counter()
+    cases = _run_evaluation_cases(search_case, evaluator, test_cases, concurrency)
+
+    async def record_run(completed, failed_cases):
+        return await _record_evaluation_run(
+            team_id, run_settings, completed, failed_cases, evaluator,
+            wall_seconds=time.perf_counter() - started, concurrency=concurrency, label=request.run_label
+        )
+
+    if request.stream:
+        async def stream_results():
+            completed = []
+            failed_cases = []
+            async for index, entry in cases:
+                if 'error' in entry:
+                    failed_cases.append(entry)
+                    line = {"type": "error", "index": index, **entry}
+                else:
+                    completed.append((index, entry))
+                    line = {"type": "case", "index": index, **entry}
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+
+            summary = {
+                "type": "summary",
+                "success": True,
+                "total": len(test_cases),
+                "completed": len(completed),
+                "failed": len(failed_cases),
+                "average_metrics": evaluator.average_metrics([entry for _, entry in completed]),
+                "run_id": await record_run(completed, failed_cases),
             }
+            yield json.dumps(summary, ensure_ascii=False) + "\n"
+
+        return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+    completed = []
+    failed_cases = []
+    async for index, entry in cases:
+        if 'error' in entry:
+            failed_cases.append(entry)
+        else:
+            completed.append((index, entry))
+
+    # レスポンスはリクエストのテストケース順に並べる
+    individual_results = [entry for _, entry in sorted(completed, key=lambda item: item[0])]
+
+    return BatchEvaluateResponse(
+        success=True,
+        average_metrics=evaluator.average_metrics(individual_results),
+        individual_results=individual_results,
+        failed_cases=failed_cases,
+        run_id=await record_run(completed, failed_cases)
+    )
+
+
+@app.get("/evaluate/runs")
+async def list_evaluation_runs(req_obj: Request, limit: int = 50):
+    """評価実行の一覧（新しい順、ケース別の結果を除く）（v3.3.0）"""
+    try:
+        team_id = getattr(req_obj.state, 'team_id', None)
+        runs = await asyncio.to_thread(evaluation_runs.get_evaluation_run_store().list, team_id, limit)
+        return {"success": True, "runs": [run.summary() for run in runs]}
+
+    except Exception as e:
+        logger.exception("Error in list_evaluation_runs: %s", e)
+        raise HTTPException(status_code=500, detail=f"評価実行の取得エラー: {str(e)}")
+
+
+@app.get("/evaluate/runs/diff")
+async def diff_evaluation_runs(
+    req_obj: Request,
+    base: str,
+    target: str,
+    metric: str = evaluation_runs.DEFAULT_QUALITY_METRIC,
+    tolerance: float = evaluation_runs.DEFAULT_CASE_TOLERANCE
+):
+    """
+    2つの評価実行を比較（target - base）（v3.3.0）
+
+    設定の差分、平均指標・レイテンシ・ノード別所要時間・API使用量の増減と、
+    metric が tolerance を超えて悪化・改善したケースを返す。
+    """
+    try:
+        team_id = getattr(req_obj.state, 'team_id', None)
+        store = evaluation_runs.get_evaluation_run_store()
+        base_run = await asyncio.to_thread(store.get, team_id, base)
+        target_run = await asyncio.to_thread(store.get, team_id, target)
+        if base_run is None or target_run is None:
+            raise HTTPException(status_code=404, detail="評価実行が見つかりません")
+
+        return {
+            "success": True,
+            "diff": evaluation_runs.diff_runs(base_run, target_run, quality_metric=metric, case_tolerance=tolerance)
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error in diff_evaluation_runs: %s", e)
+        raise HTTPException(status_code=500, detail=f"評価実行の比較エラー: {str(e)}")
+
+
+@app.get("/evaluate/runs/pareto")
+async def evaluation_runs_pareto(
+    req_obj: Request,
+    metric: str = evaluation_runs.DEFAULT_QUALITY_METRIC,
+    latency: str = evaluation_runs.DEFAULT_LATENCY_METRIC,
+    limit: Optional[int] = None
+):
+    """評価実行の品質（metric）とレイテンシ（latency: mean_ms / p50_ms / p95_ms / max_ms）のパレート分析（v3.3.0）"""
+    try:
+        team_id = getattr(req_obj.state, 'team_id', None)
+        runs = await asyncio.to_thread(evaluation_runs.get_evaluation_run_store().list, team_id, limit)
+        points = evaluation_runs.pareto_front(runs, quality_metric=metric, latency_metric=latency)
+        return {
+            "success": True,
+            "quality_metric": metric,
+            "latency_metric": latency,
+            "points": points,
+            "front": [p["run_id"] for p in points if p["pareto"]]
+        }
+
+    except Exception as e:
+        logger.exception("Error in evaluation_runs_pareto: %s", e)
+        raise HTTPException(status_code=500, detail=f"パレート分析エラー: {str(e)}")
+
+
+@app.get("/evaluate/runs/{run_id}")
+async def get_evaluation_run(req_obj: Request, run_id: str):
+    """評価実行の詳細（ケース別の指標・レイテンシ・API使用量を含む）（v3.3.0）"""
+    try:
+        team_id = getattr(req_obj.state, 'team_id', None)
+        run = await asyncio.to_thread(evaluation_runs.get_evaluation_run_store().get, team_id, run_id)
+        if run is None:
+            raise HTTPException(status_code=404, detail="評価実行が見つかりません")
+        return {"success": True, "run": run.to_dict()}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error in get_evaluation_run: %s", e)
+        raise HTTPException(status_code=500, detail=f"評価実行の取得エラー: {str(e)}")
 
-            result = agent.run(input_data)
 
-            # 検索結果を整形
-            retrieved_docs = result.get("retrieved_docs", [])
-            retrieved_results = []
+@app.delete("/evaluate/runs/{run_id}")
+async def delete_evaluation_run(req_obj: Request, run_id: str):
+    """評価実行の記録を削除（v3.3.0）"""
+    try:
+        team_id = getattr(req_obj.state, 'team_id', None)
+        deleted = await asyncio.to_thread(evaluation_runs.get_evaluation_run_store().delete, team_id, run_id)
+        if not deleted:
+            raise HTTPException(status_code=404, detail="評価実行が見つかりません")
+        return {"success": True, "message": "評価実行を削除しました"}
 
-            for i, doc in enumerate(retrieved_docs[:10]):
-                note_id_match = re.search(r'ID[\d-]+', doc)
-                note_id = note_id_match.group(0) if note_id_match else f"unknown_{i+1}"
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error in delete_evaluation_run: %s", e)
+        raise HTTPException(status_code=500, detail=f"評価実行の削除エラー: {str(e)}")
 
-                retrieved_results.append({
-                    'note_id': note_id,
-                    'score': 1.0 - (i * 0.05),
-                    'rank': i + 1
-                })
 
-            results.append((test_case, retrieved_results))
+@app.get("/evaluate/artifacts")
+async def get_evaluation_artifacts(req_obj: Request):
+    """保存済みの評価アーティファクト一覧（v3.3.0）"""
+    try:
+        team_id = getattr(req_obj.state, 'team_id', None)
+        artifacts = await asyncio.to_thread(evaluation_artifacts.list_artifacts, team_id)
+        return {"success": True, "artifacts": artifacts}
 
-        # バッチ評価
-        batch_result = evaluator.batch_evaluate(results)
+    except Exception as e:
+        logger.exception("Error in get_evaluation_artifacts: %s", e)
+        raise HTTPException(status_code=500, detail=f"アーティファクト取得エラー: {str(e)}")
 
-        return BatchEvaluateResponse(
+
+@app.post("/evaluate/replay", response_model=EvaluationReplayResponse)
+async def replay_evaluation(req_obj: Request, request: EvaluationReplayRequest):
+    """
+    保存済みアーティファクトからパラメータグリッドの評価指標を再計算（v3.3.0）
+
+    LLM・Embedding・リランクAPIを呼ばずに、grid の全組み合わせについて
+    スコア統合・リランクの並べ替え・評価指標をローカルで計算する。
+    """
+    try:
+        team_id = getattr(req_obj.state, 'team_id', None)
+        evaluator = get_evaluator()
+
+        points = evaluation_artifacts.expand_grid(request.grid, request.base)
+        if len(points) > config.EVALUATION_REPLAY_MAX_POINTS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"グリッドの組み合わせ数が上限を超えています: {len(points)} > {config.EVALUATION_REPLAY_MAX_POINTS}"
+            )
+
+        if request.test_case_ids is not None:
+            test_case_ids = request.test_case_ids
+        else:
+            listed = await asyncio.to_thread(evaluation_artifacts.list_artifacts, team_id)
+            test_case_ids = [a["test_case_id"] for a in listed if a.get("test_case_id")]
+
+        cases = []
+        missing_cases = []
+        for test_case_id in test_case_ids:
+            test_case = evaluator.get_test_case(test_case_id)
+            artifact = await asyncio.to_thread(evaluation_artifacts.load_artifact, team_id, test_case_id) if test_case else None
+            if artifact is None:
+                missing_cases.append(test_case_id)
+                continue
+            cases.append((test_case, artifact))
+
+        surface = await asyncio.to_thread(
+            evaluation_artifacts.replay_grid, cases, points, evaluator, request.include_cases
+        )
+        scored = [p for p in surface["points"] if p["average_metrics"]]
+        best = max(scored, key=lambda p: p["average_metrics"].get("ndcg_10", 0)) if scored else None
+
+        return EvaluationReplayResponse(
             success=True,
-            average_metrics=batch_result['average_metrics'],
-            individual_results=batch_result['individual_results']
+            points=surface["points"],
+            best=best,
+            evaluated_cases=[test_case.id for test_case, _ in cases],
+            missing_cases=missing_cases,
+            elapsed_ms=surface["elapsed_ms"]
         )
 
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print(f"Error in batch_evaluate: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"バッチ評価エラー: {str(e)}")
+        logger.exception("Error in replay_evaluation: %s", e)
+        raise HTTPException(status_code=500, detail=f"リプレイエラー: {str(e)}")
 
 
 # === Prompt Management Endpoints ===
@@ -1994,7 +2541,7 @@ async def list_prompts(request: Request):
             "count": len(prompts)
         }
     except Exception as e:
-        print(f"Error in list_prompts: {str(e)}")
+        logger.exception("Error in list_prompts: %s", e)
         raise HTTPException(status_code=500, detail=f"プロンプト一覧取得エラー: {str(e)}")
 
 
@@ -2021,7 +2568,7 @@ async def save_prompt(http_request: Request, request: SavePromptRequest):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in save_prompt: {str(e)}")
+        logger.exception("Error in save_prompt: %s", e)
         raise HTTPException(status_code=500, detail=f"プロンプト保存エラー: {str(e)}")
 
 
@@ -2047,7 +2594,7 @@ async def load_prompt(request: Request, name: str):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in load_prompt: {str(e)}")
+        logger.exception("Error in load_prompt: %s", e)
         raise HTTPException(status_code=500, detail=f"プロンプト読み込みエラー: {str(e)}")
 
 
@@ -2070,7 +2617,7 @@ async def delete_prompt(request: Request, name: str):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in delete_prompt: {str(e)}")
+        logger.exception("Error in delete_prompt: %s", e)
         raise HTTPException(status_code=500, detail=f"プロンプト削除エラー: {str(e)}")
 
 
@@ -2097,7 +2644,7 @@ async def update_prompt(http_request: Request, request: UpdatePromptRequest):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error in update_prompt: {str(e)}")
+        logger.exception("Error in update_prompt: %s", e)
         raise HTTPException(status_code=500, detail=f"プロンプト更新エラー: {str(e)}")
 
 
@@ -2142,7 +2689,7 @@ async def get_chroma_info():
         )
 
     except Exception as e:
-        print(f"Error in get_chroma_info: {str(e)}")
+        logger.exception("Error in get_chroma_info: %s", e)
         raise HTTPException(status_code=500, detail=f"ChromaDB情報取得エラー: {str(e)}")
 
 
@@ -2168,7 +2715,7 @@ async def reset_chroma_db_endpoint(
 
         if team_id:
             # v3.1.1: チームの3コレクションをリセット
-            print(f"チーム {team_id} のコレクションをリセット中...")
+            logger.info("チーム %s のコレクションをリセット中...", team_id)
             success = reset_team_collections(team_id)
             message = f"チーム {team_id} のコレクション（materials, methods, combined）をリセットしました。「ChromaDBを再構築」ボタンをクリックして、既存ノートからデータベースを再構築してください。"
         else:
@@ -2185,10 +2732,59 @@ async def reset_chroma_db_endpoint(
             raise HTTPException(status_code=500, detail="ChromaDBのリセットに失敗しました")
 
     except Exception as e:
-        print(f"Error in reset_chroma_db: {str(e)}")
+        logger.exception("Error in reset_chroma_db: %s", e)
         raise HTTPException(status_code=500, detail=f"ChromaDBリセットエラー: {str(e)}")
 
 
+
+# === インデックス・辞書の世代（v3.3.0） ===
+
+@app.get("/generations")
+async def get_team_generations(
+    req_obj: Request,
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match")
+):
+    """
+    チームのインデックス・正規化辞書・同義語辞書の世代（v3.3.0）
+
+    世代から作ったETagを返す。If-None-Match が一致する場合は304（変更なし）。
+    """
+    try:
+        team_id = getattr(req_obj.state, 'team_id', None)
+        resources = await asyncio.to_thread(get_generation_store().describe, team_id)
+        etag = generations_etag({resource: entry["generation"] for resource, entry in resources.items()})
+        if if_none_match == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+
+        body = {"success": True, "team_id": team_id, "generations": resources, "etag": etag}
+        return Response(
+            content=json.dumps(body, ensure_ascii=False),
+            media_type="application/json",
+            headers={"ETag": etag}
+        )
+
+    except Exception as e:
+        logger.exception("Error in get_team_generations: %s", e)
+        raise HTTPException(status_code=500, detail=f"世代の取得エラー: {str(e)}")
+
+
+@app.get("/generations/changes")
+async def get_generation_changes(req_obj: Request, since: int = 0):
+    """
+    チームの世代の変更イベント（このプロセスで発生したもの、since より後）（v3.3.0）
+
+    レスポンスの seq を次回の since に指定してポーリングする。
+    """
+    try:
+        team_id = getattr(req_obj.state, 'team_id', None)
+        events, seq = get_generation_store().changes(team_id, since)
+        return {"success": True, "changes": [event.to_dict() for event in events], "seq": seq}
+
+    except Exception as e:
+        logger.exception("Error in get_generation_changes: %s", e)
+        raise HTTPException(status_code=500, detail=f"世代の変更イベントの取得エラー: {str(e)}")
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -4,10 +4,39 @@ Storage abstraction layer
 """
 import os
 from pathlib import Path
-from typing import List, Optional
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import tempfile
 import shutil
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from metrics import timed_call
+
+
+# 一括移動の並列ワーカー数（v3.3.0）
+MOVE_WORKERS = int(os.getenv("STORAGE_MOVE_WORKERS", "16"))
+# バッチリクエスト1回あたりの最大操作数（GCS・Google Drive共通の上限）
+BATCH_REQUEST_LIMIT = 100
+# ストリーミング転送のチャンクサイズ（GCSの制約により256KBの倍数）
+STREAM_CHUNK_SIZE = 8 * 1024 * 1024
+# 条件付き書き込みが競合した場合の再試行回数（v3.3.0）
+UPDATE_ATTEMPTS = 10
+
+
+class StorageConflict(Exception):
+    """条件付き書き込みが再試行後も競合した（v3.3.0）"""
+
+
+def _chunks(items: List, size: int) -> List[List]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
 
 
 class StorageBackend(ABC):
@@ -43,6 +72,66 @@ class StorageBackend(ABC):
         """ファイルの存在確認"""
         pass
 
+    def get_version(self, path: str) -> Optional[str]:
+        """
+        ファイルのバージョン識別子を取得（v3.3.0、内容が変わると値が変わる）
+
+        Returns:
+            バージョン文字列（ファイルが存在しない、または取得できない場合はNone）
+        """
+        return None
+
+    @contextmanager
+    def open_writer(self, path: str) -> Iterator[BinaryIO]:
+        """
+        書き込み用のバイナリストリームを開く（v3.3.0）
+
+        既定の実装は一時ファイルに書き出し、閉じる時にアップロードする。
+        """
+        with tempfile.NamedTemporaryFile(delete=False) as tmp:
+            tmp_path = tmp.name
+        try:
+            with open(tmp_path, 'wb') as f:
+                yield f
+            self.upload_from_local(tmp_path, path)
+        finally:
+            os.remove(tmp_path)
+
+    @contextmanager
+    def open_reader(self, path: str) -> Iterator[BinaryIO]:
+        """
+        読み込み用のバイナリストリームを開く（v3.3.0）
+
+        既定の実装は一時ファイルにダウンロードしてから開く。
+        """
+        with tempfile.NamedTemporaryFile(delete=False) as tmp:
+            tmp_path = tmp.name
+        try:
+            self.download_to_local(path, tmp_path)
+            with open(tmp_path, 'rb') as f:
+                yield f
+        finally:
+            os.remove(tmp_path)
+
+    def update_file(self, path: str, update: Callable[[Optional[str]], str]) -> str:
+        """
+        ファイルを読み込み、update の戻り値で書き換える（v3.3.0）
+
+        LocalStorage / GCSStorage は他のプロセスの更新と競合しない（アトミックな読み込み・書き込み）。
+        それ以外のバックエンドは読み込みと書き込みの間に他の更新が入り得る。
+
+        Args:
+            path: ファイルパス
+            update: 現在の内容（未作成はNone）から新しい内容を返す関数（競合時は再度呼ばれる）
+
+        Returns:
+            書き込んだ内容
+        """
+        current = self.read_file(path) if self.exists(path) else None
+        content = update(current)
+        self.write_file(path, content)
+        return content
+
     @abstractmethod
     def delete_file(self, path: str) -> None:
         """ファイルを削除"""
@@ -53,6 +142,43 @@ class StorageBackend(ABC):
         """ファイルを移動"""
         pass
 
+    def move_files(self, pairs: List[Tuple[str, str]]) -> Dict[str, str]:
+        """
+        複数ファイルを一括移動（v3.3.0）
+
+        Args:
+            pairs: (移動元, 移動先) のリスト
+
+        Returns:
+            移動に失敗したファイル {移動元: エラーメッセージ}
+        """
+        failed = {}
+        for src, dst in pairs:
+            try:
+                self.move_file(src, dst)
+            except Exception as e:
+                failed[src] = str(e)
+        return failed
+
+    def _move_files_parallel(self, pairs: List[Tuple[str, str]]) -> Dict[str, str]:
+        """move_fileを並列ワーカーで実行"""
+        failed = {}
+        if not pairs:
+            return failed
+
+        def move(pair):
+            try:
+                self.move_file(*pair)
+                return None
+            except Exception as e:
+                return str(e)
+
+        with ThreadPoolExecutor(max_workers=min(MOVE_WORKERS, len(pairs))) as executor:
+            for (src, _), error in zip(pairs, executor.map(move, pairs)):
+                if error is not None:
+                    failed[src] = error
+        return failed
+
     @abstractmethod
     def mkdir(self, path: str) -> None:
         """ディレクトリを作成"""
@@ -69,6 +195,10 @@ class StorageBackend(ABC):
         pass
 
 
+# 同一プロセス内のupdate_fileを直列化（fcntlが使えない環境でもスレッド間は排他する）
+_local_update_lock = threading.Lock()
+
+
 class LocalStorage(StorageBackend):
     """ローカルファイルシステムのストレージバックエンド"""
 
@@ -122,6 +252,53 @@ class LocalStorage(StorageBackend):
         """ファイルの存在確認"""
         return self._get_path(path).exists()
 
+    def get_version(self, path: str) -> Optional[str]:
+        """更新時刻（ナノ秒）とサイズをバージョンとして返す"""
+        try:
+            stat = self._get_path(path).stat()
+        except FileNotFoundError:
+            return None
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+    @contextmanager
+    def open_writer(self, path: str) -> Iterator[BinaryIO]:
+        """ファイルに直接書き込む（完了後にリネームして差し替え）"""
+        file_path = self._get_path(path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = file_path.with_name(f".{file_path.name}.partial")
+        try:
+            with open(tmp_path, 'wb') as f:
+                yield f
+            os.replace(tmp_path, file_path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    @contextmanager
+    def open_reader(self, path: str) -> Iterator[BinaryIO]:
+        """ファイルを直接読み込む"""
+        with open(self._get_path(path), 'rb') as f:
+            yield f
+
+    def update_file(self, path: str, update: Callable[[Optional[str]], str]) -> str:
+        """隣接するロックファイルを排他ロック（flock）して読み込み・書き込み"""
+        file_path = self._get_path(path)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = file_path.with_name(f".{file_path.name}.lock")
+        with _local_update_lock, open(lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                current = file_path.read_text(encoding='utf-8') if file_path.exists() else None
+                content = update(current)
+                tmp_path = file_path.with_name(f".{file_path.name}.partial")
+                tmp_path.write_text(content, encoding='utf-8')
+                os.replace(tmp_path, file_path)
+                return content
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
     def delete_file(self, path: str) -> None:
         """ファイルを削除"""
         file_path = self._get_path(path)
@@ -201,6 +378,45 @@ class GCSStorage(StorageBackend):
         blob = self._get_blob(path)
         return blob.exists()
 
+    def get_version(self, path: str) -> Optional[str]:
+        """オブジェクトのgenerationを返す（メタデータ取得1回のみ）"""
+        blob = self.bucket.get_blob(path)
+        if blob is None:
+            return None
+        return str(blob.generation)
+
+    @contextmanager
+    def open_writer(self, path: str) -> Iterator[BinaryIO]:
+        """レジューマブルアップロードにチャンク単位で直接書き込む"""
+        with self._get_blob(path).open("wb", chunk_size=STREAM_CHUNK_SIZE, ignore_flush=True) as f:
+            yield f
+
+    @contextmanager
+    def open_reader(self, path: str) -> Iterator[BinaryIO]:
+        """チャンク単位のRangeリクエストでストリーミング読み込み"""
+        with self._get_blob(path).open("rb", chunk_size=STREAM_CHUNK_SIZE) as f:
+            yield f
+
+    def update_file(self, path: str, update: Callable[[Optional[str]], str]) -> str:
+        """読み込んだgenerationを条件に書き込み（if_generation_match、他の更新と競合したら読み直して再試行）"""
+        from google.api_core.exceptions import PreconditionFailed
+
+        for attempt in range(UPDATE_ATTEMPTS):
+            blob = self.bucket.get_blob(path)
+            current = blob.download_as_text(encoding='utf-8') if blob is not None else None
+            content = update(current)
+            try:
+                # generation 0 は「オブジェクトが存在しないこと」を条件にする
+                self._get_blob(path).upload_from_string(
+                    content,
+                    content_type='text/plain',
+                    if_generation_match=blob.generation if blob is not None else 0
+                )
+                return content
+            except PreconditionFailed:
+                time.sleep(0.05 * (attempt + 1))
+        raise StorageConflict(f"{path} was updated concurrently {UPDATE_ATTEMPTS} times")
+
     def delete_file(self, path: str) -> None:
         """ファイルを削除"""
         blob = self._get_blob(path)
@@ -217,6 +433,30 @@ class GCSStorage(StorageBackend):
         # 元を削除
         src_blob.delete()
 
+    def move_files(self, pairs: List[Tuple[str, str]]) -> Dict[str, str]:
+        """
+        複数ファイルを一括移動（v3.3.0）
+
+        100件単位のバッチリクエストでコピー→削除を行う。
+        バッチが失敗したチャンクは並列ワーカーによる個別移動にフォールバックする。
+        """
+        failed = {}
+        for chunk in _chunks(pairs, BATCH_REQUEST_LIMIT):
+            try:
+                # コピーが全件成功してから元を削除する（途中失敗でファイルを失わない）
+                with self.client.batch():
+                    for src, dst in chunk:
+                        self.bucket.copy_blob(self._get_blob(src), self.bucket, dst)
+                with self.client.batch():
+                    for src, _ in chunk:
+                        self._get_blob(src).delete()
+            except Exception as e:
+                print(f"GCSバッチ移動に失敗、個別移動にフォールバック: {e}")
+                # コピー済みでも再コピーは上書きになるだけなので安全
+                remaining = [(src, dst) for src, dst in chunk if self.exists(src)]
+                failed.update(self._move_files_parallel(remaining))
+        return failed
+
     def mkdir(self, path: str) -> None:
         """GCSにはディレクトリの概念がないので何もしない"""
         pass
@@ -489,6 +729,14 @@ class GoogleDriveStorage(StorageBackend):
         """ファイルの存在確認"""
         return self._get_file_id(path) is not None
 
+    def get_version(self, path: str) -> Optional[str]:
+        """ファイルのmd5Checksum（なければmodifiedTime）を返す"""
+        file_id = self._get_file_id(path)
+        if not file_id:
+            return None
+        meta = self.service.files().get(fileId=file_id, fields='md5Checksum, modifiedTime').execute()
+        return meta.get('md5Checksum') or meta.get('modifiedTime')
+
     def delete_file(self, path: str) -> None:
         """ファイルを削除"""
         file_id = self._get_file_id(path)
@@ -528,6 +776,89 @@ class GoogleDriveStorage(StorageBackend):
             fields='id, parents'
         ).execute()
 
+    def _list_folder_children(self, folder_id: str) -> Dict[str, Dict]:
+        """フォルダ直下のファイルを {名前: {"id", "parents"}} で取得"""
+        children = {}
+        page_token = None
+        while True:
+            results = self.service.files().list(
+                q=f"'{folder_id}' in parents and trashed=false",
+                fields='nextPageToken, files(id, name, parents)',
+                pageSize=1000,
+                pageToken=page_token
+            ).execute()
+            for item in results.get('files', []):
+                children.setdefault(item['name'], item)
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return children
+
+    def move_files(self, pairs: List[Tuple[str, str]]) -> Dict[str, str]:
+        """
+        複数ファイルを一括移動（v3.3.0）
+
+        フォルダIDの解決とファイル一覧の取得はフォルダごとに1回だけ行い、
+        親フォルダの変更は100件単位のバッチリクエストで送信する。
+        """
+        failed = {}
+        dst_by_src = dict(pairs)
+        folder_ids: Dict[str, Optional[str]] = {}
+        children_cache: Dict[str, Dict[str, Dict]] = {}
+
+        def resolve_folder(path: str, create: bool) -> Optional[str]:
+            if path not in folder_ids:
+                if not path:
+                    folder_ids[path] = self.folder_id
+                elif create:
+                    folder_ids[path] = self._create_folder_path(path)
+                else:
+                    folder_ids[path] = self._get_file_id(path)
+            return folder_ids[path]
+
+        updates = []
+        for src, dst in pairs:
+            src_folder, _, src_name = src.rpartition('/')
+            dst_folder, _, dst_name = dst.rpartition('/')
+            try:
+                src_folder_id = resolve_folder(src_folder, create=False)
+                if not src_folder_id:
+                    raise FileNotFoundError(f"Source file not found: {src}")
+                if src_folder_id not in children_cache:
+                    children_cache[src_folder_id] = self._list_folder_children(src_folder_id)
+                item = children_cache[src_folder_id].get(src_name)
+                if not item:
+                    raise FileNotFoundError(f"Source file not found: {src}")
+                dst_folder_id = resolve_folder(dst_folder, create=True)
+            except Exception as e:
+                failed[src] = str(e)
+                continue
+            updates.append((src, item, dst_folder_id, dst_name))
+
+        for chunk in _chunks(updates, BATCH_REQUEST_LIMIT):
+            def callback(request_id, response, exception):
+                if exception is not None:
+                    failed[request_id] = str(exception)
+
+            batch = self.service.new_batch_http_request(callback=callback)
+            for src, item, dst_folder_id, dst_name in chunk:
+                batch.add(
+                    self.service.files().update(
+                        fileId=item['id'],
+                        addParents=dst_folder_id,
+                        removeParents=",".join(item.get('parents', [])),
+                        body={'name': dst_name},
+                        fields='id'
+                    ),
+                    request_id=src
+                )
+            try:
+                batch.execute()
+            except Exception as e:
+                # Drive APIクライアントはスレッドセーフではないため個別移動は逐次実行
+                print(f"Google Driveバッチ移動に失敗、個別移動にフォールバック: {e}")
+                failed.update(super().move_files([(src, dst_by_src[src]) for src, _, _, _ in chunk]))
+        return failed
+
     def mkdir(self, path: str) -> None:
         """ディレクトリを作成"""
         self._create_folder_path(path)
@@ -631,6 +962,12 @@ class Storage:
                 - 'prompts': 保存されたプロンプト
                 - 'dictionary': 正規化辞書
                 - 'chroma': ChromaDB永続化
+                - 'chroma_sync': ChromaDBの差分同期先（v3.3.0）
+                - 'ingest_jobs': 取り込みジョブの状態（v3.3.0）
+                - 'ingest_watch': フォルダ監視のカーソル（v3.3.0）
+                - 'evaluation_artifacts': 評価の中間結果（v3.3.0）
+                - 'evaluation_runs': 評価実行の記録（v3.3.0）
+                - 'generations': インデックス・辞書の世代（v3.3.0）
 
         Returns:
             チームスコープのパス
@@ -645,22 +982,28 @@ class Storage:
             'notes_processed': f"{base}/notes/processed",
             'prompts': f"{base}/saved_prompts",
             'dictionary': f"{base}/dictionary.yaml",
-            'chroma': f"{base}/chroma-db"
+            'chroma': f"{base}/chroma-db",
+            'chroma_sync': f"{base}/chroma_sync",
+            'ingest_jobs': f"{base}/ingest_jobs",
+            'ingest_watch': f"{base}/ingest_watch.json",
+            'evaluation_artifacts': f"{base}/evaluation_artifacts",
+            'evaluation_runs': f"{base}/evaluation_runs",
+            'generations': f"{base}/generations.json"
         }
 
         return paths.get(resource_type, base)
 
     def read_file(self, path: str) -> str:
-        """ファイルを読み込む"""
-        return self.backend.read_file(path)
+        """ファイルを読み込む（v3.3.0: レイテンシを計測）"""
+        return timed_call("storage_read", self.backend.read_file, path)
 
     def write_file(self, path: str, content: str) -> None:
         """ファイルに書き込む"""
         self.backend.write_file(path, content)
 
     def read_bytes(self, path: str) -> bytes:
-        """バイナリファイルを読み込む"""
-        return self.backend.read_bytes(path)
+        """バイナリファイルを読み込む（v3.3.0: レイテンシを計測）"""
+        return timed_call("storage_read", self.backend.read_bytes, path)
 
     def write_bytes(self, path: str, content: bytes) -> None:
         """バイナリファイルに書き込む"""
@@ -674,6 +1017,22 @@ class Storage:
         """ファイルの存在確認"""
         return self.backend.exists(path)
 
+    def get_version(self, path: str) -> Optional[str]:
+        """ファイルのバージョン識別子を取得（v3.3.0）"""
+        return self.backend.get_version(path)
+
+    def open_writer(self, path: str):
+        """書き込み用のバイナリストリームを開く（v3.3.0、withで使用）"""
+        return self.backend.open_writer(path)
+
+    def open_reader(self, path: str):
+        """読み込み用のバイナリストリームを開く（v3.3.0、withで使用）"""
+        return self.backend.open_reader(path)
+
+    def update_file(self, path: str, update: Callable[[Optional[str]], str]) -> str:
+        """ファイルを読み込み、update の戻り値で書き換える（v3.3.0、ローカル・GCSではアトミック）"""
+        return self.backend.update_file(path, update)
+
     def delete_file(self, path: str) -> None:
         """ファイルを削除"""
         self.backend.delete_file(path)
@@ -682,6 +1041,10 @@ class Storage:
         """ファイルを移動"""
         self.backend.move_file(src, dst)
 
+    def move_files(self, pairs: List[Tuple[str, str]]) -> Dict[str, str]:
+        """複数ファイルを一括移動（v3.3.0、失敗したファイルを {移動元: エラー} で返す）"""
+        return self.backend.move_files(pairs)
+
     def mkdir(self, path: str) -> None:
         """ディレクトリを作成"""
         self.backend.mkdir(path)
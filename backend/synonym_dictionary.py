@@ -19,6 +19,7 @@ from dataclasses import dataclass, field
 from datetime import datetime
 
 from storage import storage
+from generations import bump_generation
 
 
 @dataclass
@@ -143,6 +144,9 @@ class SynonymDictionary:
             storage.write_file(self.dict_path, yaml_content)
 
             print(f"同義語辞書を保存しました: {len(self.groups)}グループ")
+
+            # v3.3.0: 同義語展開の結果が変わるため同義語辞書の世代を進める
+            bump_generation(self.team_id, "synonyms", reason="save")
             return True
 
         except Exception as e:
@@ -6,11 +6,60 @@ Firestoreを使用したチーム管理機能を提供します。
 
 import random
 import string
+import threading
+import time
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from firebase_init import get_firestore_client
 from google.cloud.firestore_v1 import FieldFilter
 from storage import storage
+from config import config
+
+
+# === メンバーシップキャッシュ（v3.3.0） ===
+# {(user_id, team_id): (is_member, expires_at)}
+# 参加・脱退・削除時に更新し、他インスタンスでの変更はTTLで反映する
+_membership_cache: Dict[Tuple[str, str], Tuple[bool, float]] = {}
+_membership_lock = threading.Lock()
+
+
+def _cache_membership(user_id: str, team_id: str, is_member: bool) -> None:
+    ttl = config.TEAM_MEMBERSHIP_CACHE_TTL if is_member else config.TEAM_MEMBERSHIP_NEGATIVE_CACHE_TTL
+    if ttl <= 0:
+        return
+    with _membership_lock:
+        _membership_cache[(user_id, team_id)] = (is_member, time.monotonic() + ttl)
+
+
+def _cached_membership(user_id: str, team_id: str) -> Optional[bool]:
+    key = (user_id, team_id)
+    with _membership_lock:
+        entry = _membership_cache.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() >= entry[1]:
+            del _membership_cache[key]
+            return None
+        return entry[0]
+
+
+def cached_membership(user_id: str, team_id: str) -> Optional[bool]:
+    """キャッシュ済みのメンバーシップ（未キャッシュ・期限切れはNone。Firestoreは呼ばない）"""
+    return _cached_membership(user_id, team_id)
+
+
+def invalidate_membership(user_id: Optional[str] = None, team_id: Optional[str] = None) -> None:
+    """
+    メンバーシップキャッシュを無効化する
+
+    Args:
+        user_id: 対象ユーザー（未指定時は全ユーザー）
+        team_id: 対象チーム（未指定時は全チーム）
+    """
+    with _membership_lock:
+        for key in list(_membership_cache):
+            if (user_id is None or key[0] == user_id) and (team_id is None or key[1] == team_id):
+                del _membership_cache[key]
 
 
 def generate_invite_code() -> str:
@@ -116,6 +165,7 @@ def create_team(
         'role': 'member'
     }
     member_ref.set(member_data)
+    _cache_membership(user_id, team_ref.id, True)
 
     # GCSにチームフォルダ作成
     create_team_folders_in_gcs(team_ref.id)
@@ -129,6 +179,25 @@ def create_team(
     }
 
 
+def _team_summary(team_id: str, team_data: Dict, member_data: Dict) -> Dict:
+    return {
+        'id': team_id,
+        'name': team_data.get('name', ''),
+        'role': member_data.get('role', 'member'),
+        'createdAt': team_data.get('createdAt').isoformat() if team_data.get('createdAt') else None
+    }
+
+
+def _get_user_teams_by_scan(db, user_id: str) -> List[Dict]:
+    """全チームを走査してメンバーシップを確認する（collection group インデックス未作成時のフォールバック）"""
+    user_teams = []
+    for team_doc in db.collection('teams').stream():
+        member_doc = team_doc.reference.collection('members').document(user_id).get()
+        if member_doc.exists:
+            user_teams.append(_team_summary(team_doc.id, team_doc.to_dict(), member_doc.to_dict()))
+    return user_teams
+
+
 def get_user_teams(user_id: str) -> List[Dict]:
     """
     ユーザーが所属する全チームを取得する
@@ -138,30 +207,34 @@ def get_user_teams(user_id: str) -> List[Dict]:
 
     Returns:
         チーム一覧（id, name, role, createdAtを含む）
+
+    Note:
+        v3.3.0: members の collection group クエリでユーザーのメンバー文書だけを取得し、
+        親チームを get_all でまとめて読む（読み取り数は所属チーム数に比例）。
+        members.userId の collection group インデックスが必要。未作成の場合は全チーム走査にフォールバック。
     """
     db = get_firestore_client()
 
-    # 全チームを取得し、ユーザーがメンバーかチェック
-    teams_ref = db.collection('teams')
-    all_teams = teams_ref.stream()
-
-    user_teams = []
-    for team_doc in all_teams:
-        team_id = team_doc.id
-        team_data = team_doc.to_dict()
-
-        # メンバーシップチェック
-        member_ref = team_doc.reference.collection('members').document(user_id)
-        member_doc = member_ref.get()
-
-        if member_doc.exists:
-            member_data = member_doc.to_dict()
-            user_teams.append({
-                'id': team_id,
-                'name': team_data.get('name', ''),
-                'role': member_data.get('role', 'member'),
-                'createdAt': team_data.get('createdAt').isoformat() if team_data.get('createdAt') else None
-            })
+    try:
+        member_query = db.collection_group('members').where(filter=FieldFilter('userId', '==', user_id))
+        member_docs = [doc for doc in member_query.stream() if doc.reference.parent.parent is not None]
+    except Exception as e:
+        print(f"[get_user_teams] collection group query failed, falling back to scan: {e}")
+        user_teams = _get_user_teams_by_scan(db, user_id)
+    else:
+        members_by_team = {doc.reference.parent.parent.id: doc.to_dict() for doc in member_docs}
+        team_refs = [doc.reference.parent.parent for doc in member_docs]
+
+        user_teams = []
+        for team_doc in db.get_all(team_refs):
+            # メンバー文書だけが残っている削除済みチームは除外
+            if team_doc.exists:
+                user_teams.append(_team_summary(team_doc.id, team_doc.to_dict(), members_by_team[team_doc.id]))
+        # 従来の全チーム走査と同じ順序（ドキュメントID順）に揃える
+        user_teams.sort(key=lambda team: team['id'])
+
+    for team in user_teams:
+        _cache_membership(user_id, team['id'], True)
 
     return user_teams
 
@@ -238,6 +311,7 @@ def join_team(
             'role': 'member'
         }
         member_ref.set(member_data)
+        _cache_membership(user_id, team_doc.id, True)
         print(f"[join_team] Successfully added user to team")
 
         return {
@@ -284,6 +358,7 @@ def leave_team(user_id: str, team_id: str) -> Dict:
         raise ValueError("User is not a member of this team")
 
     member_ref.delete()
+    invalidate_membership(user_id, team_id)
 
     return {
         'success': True,
@@ -321,6 +396,7 @@ def delete_team(team_id: str) -> Dict:
 
     # チームドキュメントを削除
     team_ref.delete()
+    invalidate_membership(team_id=team_id)
 
     # GCSからチームフォルダを削除
     if storage.storage_type == 'gcs':
@@ -350,10 +426,19 @@ def is_team_member(user_id: str, team_id: str) -> bool:
 
     Returns:
         メンバーの場合True、それ以外False
+
+    Note:
+        v3.3.0: 結果をTEAM_MEMBERSHIP_CACHE_TTL秒キャッシュ（参加・脱退・削除時に更新）
     """
+    cached = _cached_membership(user_id, team_id)
+    if cached is not None:
+        return cached
+
     db = get_firestore_client()
 
     team_ref = db.collection('teams').document(team_id)
     member_ref = team_ref.collection('members').document(user_id)
 
-    return member_ref.get().exists
+    is_member = member_ref.get().exists
+    _cache_membership(user_id, team_id, is_member)
+    return is_member
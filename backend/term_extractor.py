@@ -9,10 +9,10 @@
 
 import re
 from typing import List, Dict, Optional, Tuple
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 import numpy as np
 
 from dictionary import DictionaryManager
+from providers import create_chat_model, create_embeddings
 
 
 class TermExtractor:
@@ -26,15 +26,8 @@ class TermExtractor:
         """
         self.dictionary_manager = dictionary_manager
         self.openai_api_key = openai_api_key
-        self.llm = ChatOpenAI(
-            api_key=openai_api_key,
-            model="gpt-4o-mini",
-            temperature=0
-        )
-        self.embeddings = OpenAIEmbeddings(
-            api_key=openai_api_key,
-            model="text-embedding-3-small"
-        )
+        self.llm = create_chat_model("gpt-4o-mini", openai_api_key, temperature=0)
+        self.embeddings = create_embeddings("text-embedding-3-small", openai_api_key)
 
     def extract_materials_section(self, note_content: str) -> Optional[str]:
         """
@@ -0,0 +1,218 @@
+"""
+検索トレースモジュール（v3.3.0）
+
+SearchRequest.trace=True の場合に、1リクエスト分の構造化トレースを収集する。
+
+収集内容:
+- ノードごとの開始・終了時刻（トレース開始からのミリ秒）
+- 外部呼び出し（OpenAI / Cohere / Chroma / storage）の所要時間とトークン数
+- 軸ごとの候補リストと生スコア
+- スコア統合後・リランク後のスコア
+- キャッシュのヒット/ミス
+
+トレースはコンテキスト変数で保持する。LangGraphはノードをコンテキストを引き継いだ
+スレッドで実行するため、ノード内の記録も同じトレースに集まる。
+トレースが有効でない場合、各記録関数は何もしない。
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from metrics import add_call_hook
+
+
+# 候補リストとして記録する最大件数（レスポンスサイズを抑えるため）
+MAX_TRACE_CANDIDATES = 50
+
+
+class SearchTrace:
+    """1リクエスト分の検索トレース"""
+
+    def __init__(self):
+        self.started_at = datetime.now().isoformat()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self.nodes: List[Dict] = []
+        self.calls: List[Dict] = []
+        self.candidates: Dict[str, Dict] = {}  # {軸 or "search": {"query", "results"}}
+        self.fusion: Dict = {}
+        self.cache: List[Dict] = []
+
+    def offset_ms(self, at: Optional[float] = None) -> float:
+        """トレース開始からの経過ミリ秒"""
+        return round(((at if at is not None else time.perf_counter()) - self._origin) * 1000, 3)
+
+    def add_node(self, node: str, start: float, end: float, error: Optional[str] = None) -> None:
+        entry = {
+            "node": node,
+            "start_ms": self.offset_ms(start),
+            "end_ms": self.offset_ms(end),
+            "duration_ms": round((end - start) * 1000, 3),
+        }
+        if error:
+            entry["error"] = error
+        with self._lock:
+            self.nodes.append(entry)
+
+    def add_call(self, call: str, duration: float, tokens: Optional[Dict] = None, error: Optional[str] = None) -> None:
+        end = time.perf_counter()
+        entry = {
+            "call": call,
+            "start_ms": self.offset_ms(end - duration),
+            "duration_ms": round(duration * 1000, 3),
+        }
+        if tokens:
+            entry["tokens"] = tokens
+        if error:
+            entry["error"] = error
+        with self._lock:
+            self.calls.append(entry)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "total_ms": self.offset_ms(),
+                "nodes": list(self.nodes),
+                "calls": list(self.calls),
+                "candidates": dict(self.candidates),
+                "fusion": dict(self.fusion),
+                "cache": list(self.cache),
+            }
+
+
+_current_trace: contextvars.ContextVar[Optional[SearchTrace]] = contextvars.ContextVar("search_trace", default=None)
+
+
+def current_trace() -> Optional[SearchTrace]:
+    """実行中のトレース（トレース無効時はNone）"""
+    return _current_trace.get()
+
+
+@contextmanager
+def search_trace(enabled: bool = True) -> Iterator[Optional[SearchTrace]]:
+    """
+    with ブロック内の検索処理をトレースする
+
+    Args:
+        enabled: Falseの場合はトレースせずNoneを返す
+    """
+    if not enabled:
+        yield None
+        return
+    trace = SearchTrace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def traced_node(node: str, fn: Callable) -> Callable:
+    """グラフノード関数をトレース記録付きでラップ"""
+    def wrapper(state):
+        trace = _current_trace.get()
+        if trace is None:
+            return fn(state)
+        start = time.perf_counter()
+        try:
+            result = fn(state)
+        except Exception as e:
+            trace.add_node(node, start, time.perf_counter(), error=str(e))
+            raise
+        trace.add_node(node, start, time.perf_counter())
+        return result
+    wrapper.__name__ = getattr(fn, "__name__", node)
+    return wrapper
+
+
+def _doc_id(doc) -> str:
+    metadata = getattr(doc, "metadata", {}) or {}
+    return metadata.get('note_id', metadata.get('source', 'unknown'))
+
+
+def _scored(results, limit: int = MAX_TRACE_CANDIDATES) -> List[Dict]:
+    """[(doc, score, ...)] → [{"note_id", "score"}]"""
+    return [{"note_id": _doc_id(item[0]), "score": float(item[1])} for item in results[:limit]]
+
+
+def record_candidates(key: str, query: str, results: List[Tuple], reranked: Optional[List[Tuple]] = None) -> None:
+    """
+    軸（material / method / combined）または単一検索（search）の候補を記録
+
+    Args:
+        key: 軸名
+        query: 検索クエリ
+        results: 検索結果 [(doc, score)]（リランク前の生スコア）
+        reranked: リランク後の結果 [(doc, score)]
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    entry = {"query": query, "results": _scored(results)}
+    if reranked is not None:
+        entry["reranked"] = _scored(reranked)
+    with trace._lock:
+        trace.candidates[key] = entry
+
+
+def record_fusion(method: str, fused: List[Tuple], reranked: Optional[List[Tuple]] = None) -> None:
+    """
+    スコア統合結果を記録
+
+    Args:
+        method: 統合方式（rrf / linear）
+        fused: 統合後の結果 [(doc, score, note_id)]（リランク前）
+        reranked: リランク後の結果 [(doc, score, note_id)]
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    with trace._lock:
+        trace.fusion = {
+            "method": method,
+            "fused": _scored(fused),
+            "reranked": _scored(reranked) if reranked is not None else None,
+        }
+
+
+def record_cache(name: str, hit: bool) -> None:
+    """キャッシュのヒット/ミスを記録"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    with trace._lock:
+        trace.cache.append({"cache": name, "hit": hit})
+
+
+def _token_usage(result) -> Optional[Dict]:
+    """外部呼び出しの戻り値からトークン数（課金単位）を取り出す"""
+    if result is None:
+        return None
+    # LangChain AIMessage
+    usage = getattr(result, "usage_metadata", None)
+    if usage:
+        return {
+            "input": usage.get("input_tokens"),
+            "output": usage.get("output_tokens"),
+            "total": usage.get("total_tokens"),
+        }
+    # Cohere rerank
+    billed = getattr(getattr(result, "meta", None), "billed_units", None)
+    if billed is not None and getattr(billed, "search_units", None) is not None:
+        return {"search_units": billed.search_units}
+    return None
+
+
+def _on_call(call: str, duration: float, result, error: Optional[BaseException]) -> None:
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    trace.add_call(call, duration, tokens=_token_usage(result), error=str(error) if error else None)
+
+
+add_call_hook(_on_call)
@@ -7,11 +7,11 @@ import re
 import unicodedata
 import json
 from typing import Dict, Set, List, Tuple, Optional
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
 
 from config import config
 from storage import storage
+from providers import create_chat_model
 
 
 def load_master_dict(path: str = None) -> Tuple[Dict[str, str], Set[str]]:
@@ -170,7 +170,7 @@ def extract_unknown_terms(text: str, known_terms: Set[str], api_key: str, model:
     if not text or len(text) < 5:
         return []
 
-    llm = ChatOpenAI(model=model, temperature=0, api_key=api_key)
+    llm = create_chat_model(model, api_key, temperature=0)
 
     prompt = f"""
     あなたは化学・実験データの専門家です。
@@ -213,7 +213,7 @@ def find_similar_terms(new_terms: List[str], existing_canonicals: List[str], api
     if not new_terms or not existing_canonicals:
         return {term: None for term in new_terms}
 
-    llm = ChatOpenAI(model=model, temperature=0, api_key=api_key)
+    llm = create_chat_model(model, api_key, temperature=0)
 
     prompt = f"""
     タスク: 新しい専門用語が、既存の用語リストにある単語の「表記ゆれ」「略語」「同義語」であるかを判定してください。